@@ -0,0 +1,76 @@
+import os
+import sys
+
+# Configuración de gunicorn para kontify-brain (Procfile: gunicorn -c gunicorn.conf.py tools.server:app).
+# La carga es de E/S: casi todo el tiempo de una solicitud es espera a Gemini, Sheets, Slack y SendGrid
+# (el PDF se renderiza en el pool de procesos de pdf_service). Por eso el worker por defecto es gthread
+# (hilos sobre pocos procesos) y no sync (un proceso bloqueado por solicitud).
+# Valores por defecto medidos con tools/bench_gunicorn.py; todos se pueden sobreescribir por entorno
+# o con las opciones de línea de comandos de gunicorn (-w, --threads, -k), que tienen prioridad.
+tools_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools")
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+# gthread (por defecto) | gevent (si está instalado) | sync | asgi (worker asyncio de gunicorn, solo con
+# la variante ASGI: GUNICORN_WORKER_CLASS=asgi gunicorn -c gunicorn.conf.py tools.asgi_app:app)
+GUNICORN_WORKER_CLASS = os.getenv("GUNICORN_WORKER_CLASS", "gthread").lower()
+if GUNICORN_WORKER_CLASS == "gevent":
+    try:
+        from gevent import monkey
+        # Antes de importar la app (preload_app): sockets, hilos y locks cooperativos en todo el proceso
+        monkey.patch_all()
+        # gRPC no coopera con greenlets sin grpc.experimental.gevent: Gemini por HTTP/JSON
+        os.environ.setdefault("GEMINI_TRANSPORT", "rest")
+    except ImportError:
+        print("⚠️ gunicorn: gevent no está instalado, se usa gthread")
+        GUNICORN_WORKER_CLASS = "gthread"
+
+worker_class = GUNICORN_WORKER_CLASS
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+# bench_gunicorn.py (1 núcleo, 240 req/min, Gemini ~1.5 s): sync 3x1 atiende 90/min con p95 de 48 s;
+# gthread 1x16 atiende 229/min con p95 de 3.2 s y 213 MB. Más procesos no suben el throughput (la espera
+# es de red) y cuestan ~80 MB cada uno; se usa un proceso por núcleo con mínimo 2 para que un worker
+# reciclado o caído no deje al servicio sin atender.
+# WEB_CONCURRENCY es la convención de Render/Heroku para el número de procesos
+workers = int(os.getenv("WEB_CONCURRENCY", os.getenv("GUNICORN_WORKERS", max(2, os.cpu_count() or 1))))
+# Hilos por worker (gthread): cada uno espera E/S, no CPU. El worker asgi no usa hilos
+threads = 1 if worker_class == "asgi" else int(os.getenv("GUNICORN_THREADS", 16))
+# Conexiones simultáneas por worker (gevent / asgi)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+# Gemini con reintentos + Sheets puede tardar decenas de segundos
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Reciclar workers de vez en cuando acota cualquier fuga (0 = nunca)
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+
+# La app se importa una vez en el master: cuestionarios, prefijos SOP y el render de PDF (fuentes,
+# plantilla) se compilan una sola vez y cada worker nace (o renace tras max_requests) ya caliente.
+# No se midió ahorro de RAM (2x16: 291 MB con preload, 281 MB sin él): el refcount de CPython ensucia
+# las páginas compartidas por copy-on-write; la ganancia es de arranque, no de memoria.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+# tools/boot.py deja en estos hooks lo que no debe ocurrir en el master (hilos, pools, clientes)
+os.environ["KONTIFY_BOOT_HOOKS"] = "1"
+
+def on_starting(server):
+    # Snapshots de métricas de una ejecución anterior: los pids ya no existen
+    from metrics import metrics
+    metrics.clear_snapshots()
+
+def when_ready(server):
+    # Una sola prueba de credenciales de Sheets por despliegue, no una por worker
+    from boot import boot_check
+    boot_check()
+
+def post_fork(server, worker):
+    # Canales gRPC, sesiones HTTP, hilos y pools no sobreviven un fork: se crean ya en el worker,
+    # antes de aceptar solicitudes, para que la primera no pague el arranque
+    # Cada worker tiene su pool de PDF: el número real de workers (conf, -w o WEB_CONCURRENCY) reparte los
+    # PDF_HOST_WORKERS procesos de render del host entre ellos (ver pdf_service.pool_size_for)
+    from boot import start_process_services
+    start_process_services(web_workers=server.cfg.workers)
+
+def worker_exit(server, worker):
+    from metrics import metrics
+    metrics.flush()
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import asyncio
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pytest
+import pipeline
+import job_queue
+import asgi_app
+import async_http
+import notificator
+from ai_providers import StubProvider, set_provider
+from result_cache import result_cache
+from report_store import report_store
+from fake_services import FakeServices, build_profiles
+
+PAYLOAD = {
+    "lead_metadata": {
+        "company_name": "Constructora Peña",
+        "niche_id": "constructora",
+        "billing_range": "50M - 100M",
+        "rfc": "ASG010203XY1",
+        "main_activity": "Construcción"
+    },
+    "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO"} for i in range(12)]
+}
+
+async def _call(method, path, body=None, headers=None):
+    """Cliente ASGI mínimo: retorna (status, headers, cuerpo)."""
+    from asgi_app import app
+    path, _, query = path.partition("?")
+    raw = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http", "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "root_path": "", "query_string": query.encode(),
+        "headers": [(b"host", b"testserver"), (b"content-type", b"application/json")] +
+                   [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "server": ("testserver", 80), "client": ("127.0.0.1", 5000)
+    }
+    received = [{"type": "http.request", "body": raw, "more_body": False}]
+    start, chunks = {}, []
+
+    async def receive():
+        return received.pop(0) if received else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(status=message["status"], headers={k.decode(): v.decode() for k, v in message["headers"]})
+        else:
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return start["status"], start["headers"], b"".join(chunks)
+
+@pytest.fixture
+def stub_pipeline(tmp_path, monkeypatch):
+    async def anotify(diagnostic, url, request_id=None):
+        return True
+    monkeypatch.setattr(pipeline, "REPORTS_DIR", str(tmp_path))
+    monkeypatch.setattr(pipeline, "anotify_all", anotify)
+    set_provider(StubProvider(latency=0.2))
+    result_cache.clear()
+    yield tmp_path
+    set_provider(None)
+    result_cache.clear()
+
+def test_submit_runs_pipeline_on_event_loop(stub_pipeline):
+    status, headers, body = asyncio.run(_call("POST", "/api/submit", PAYLOAD))
+    assert status == 200 and headers["content-type"] == "application/json"
+    result = json.loads(body)
+    assert result["status"] == "success"
+    assert os.path.exists(report_store.ensure_pdf(str(stub_pipeline), os.path.basename(result["report_url"])))
+
+def test_submit_concurrent_leads_share_one_thread(stub_pipeline):
+    async def burst():
+        leads = []
+        for i in range(8):
+            lead = json.loads(json.dumps(PAYLOAD))
+            lead["lead_metadata"]["company_name"] = f"Constructora {i}"
+            leads.append(_call("POST", "/api/submit", lead))
+        return await asyncio.gather(*leads)
+    assert [status for status, _, _ in asyncio.run(burst())] == [200] * 8
+
+def test_stream_emits_same_events_as_flask(stub_pipeline):
+    status, headers, body = asyncio.run(_call("POST", "/api/submit/stream", PAYLOAD))
+    assert status == 200 and headers["content-type"].startswith("text/event-stream")
+    events = _events(body)
+    stages = [e[1]["stage"] for e in events if e[0] == "stage"]
+    assert stages == ["validated", "ai_scoring", "crm_sync", "crm_synced", "pdf_render", "pdf_ready"]
+    assert events[-1][0] == "result" and events[-1][1]["status"] == "success"
+
+def _events(body):
+    events = []
+    for raw in body.decode("utf-8").split("\n\n"):
+        if raw and not raw.startswith(":"):
+            lines = dict(line.split(": ", 1) for line in raw.split("\n"))
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_stream_async_mode_follows_queued_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(asgi_app, "SUBMIT_MODE", "async")
+    monkeypatch.setattr(asgi_app, "SSE_JOB_POLL_SECONDS", 0.01)
+
+    async def worker():
+        # Un worker que reclama el trabajo, reporta una etapa y lo termina
+        job = None
+        while job is None:
+            await asyncio.sleep(0.01)
+            job = job_queue.claim_next_job()
+        job_queue.update_job_stage(job['id'], "ai_scoring", job['attempts'])
+        await asyncio.sleep(0.05)
+        job_queue.finish_job(job['id'], {"status": "success", "report_url": "/reports/x.pdf"}, job['attempts'])
+
+    async def run():
+        return (await asyncio.gather(_call("POST", "/api/submit/stream", PAYLOAD), worker()))[0]
+
+    status, _, body = asyncio.run(run())
+    events = _events(body)
+    assert status == 200
+    assert [e[1]["stage"] for e in events if e[0] == "stage"] == ["validated", "queued", "ai_scoring"]
+    assert events[-1][0] == "result" and events[-1][1]["report_url"] == "/reports/x.pdf"
+
+    # Si el worker no termina a tiempo, 'result' trae el cuerpo 202 para seguir con status_url
+    monkeypatch.setattr(asgi_app, "SSE_JOB_WAIT_SECONDS", 0.05)
+    status, _, body = asyncio.run(_call("POST", "/api/submit/stream", PAYLOAD))
+    assert _events(body)[-1][1]["status"] == "accepted"
+
+def test_oversized_body_returns_413(monkeypatch):
+    monkeypatch.setattr(asgi_app, "ASGI_MAX_BODY", 16)
+    for path in ("/api/submit", "/api/submit/stream"):
+        status, _, body = asyncio.run(_call("POST", path, PAYLOAD))
+        assert status == 413 and json.loads(body)["message"] == "Solicitud demasiado grande."
+
+def test_validation_and_delegated_routes():
+    status, _, body = asyncio.run(_call("POST", "/api/submit", {"lead_metadata": {}}))
+    assert status == 400 and json.loads(body)["status"] == "error"
+
+    # El resto de las rutas las atiende la app Flask por el puente WSGI
+    status, headers, body = asyncio.run(_call("GET", "/api/questions/holding"))
+    assert status == 200 and "etag" in headers and json.loads(body)
+    status, _, _ = asyncio.run(_call("GET", "/api/questions/holding", headers={"If-None-Match": headers["etag"]}))
+    assert status == 304
+
+def test_async_channels_against_fake_services(monkeypatch):
+    fake = FakeServices(build_profiles(["slack:latency=0", "sendgrid:latency=0"])).start()
+    try:
+        for key, value in fake.env().items():
+            monkeypatch.setenv(key, value)
+
+        async def deliver():
+            await notificator.async_send_webhook_notifications([{"text": "lead 1"}, {"text": "lead 2"}])
+            await notificator.async_send_courtesy_emails([
+                {"email": "dir@pena.mx", "name": "Dirección", "company": "Constructora Peña", "pdf_url": "http://x/r.pdf"}
+            ])
+            stats = async_http.client().stats()
+            await async_http.client().aclose()
+            return stats
+
+        stats = asyncio.run(deliver())
+        services = fake.stats()["services"]
+        assert services["slack"]["requests"] == 2 and services["sendgrid"]["requests"] == 1
+        assert stats["requests"] == 3
+    finally:
+        fake.stop()
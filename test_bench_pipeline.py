@@ -0,0 +1,28 @@
+import os
+import sys
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from bench_pipeline import run_suite, percentile, compare
+
+def test_percentile_nearest_rank():
+    values = sorted(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50, 95, 99)
+    assert percentile([7], 99) == 7 and percentile([], 50) == 0.0
+
+def test_offline_suite_runs_every_niche_without_network():
+    results = {r["name"]: r for r in run_suite(iterations=5, concurrency=2)}
+    assert set(results) == {"get_questions", "parse_submission", "run_diagnostic", "generate_pdf_final", "submit_quiz"}
+    submit = results["submit_quiz"]
+    assert submit["statuses"] == {"200": 5}
+    assert submit["side_effects"] == 15 # Slack + Sheets + email por lead, todos en fakes
+    for r in results.values():
+        assert r["iterations"] == 5 and 0 < r["p50_ms"] <= r["p95_ms"] <= r["p99_ms"]
+        assert r["peak_rss_mb"] > 0
+
+def test_compare_flags_p95_regressions():
+    report = {"results": [{"name": "submit_quiz", "p95_ms": 300.0}, {"name": "run_diagnostic", "p95_ms": 2.0}]}
+    baseline = {"results": [{"name": "submit_quiz", "p95_ms": 200.0}, {"name": "run_diagnostic", "p95_ms": 2.0}]}
+    rows = {row["name"]: row for row in compare(report, baseline, 1.25)}
+    assert rows["submit_quiz"]["regression"] and not rows["run_diagnostic"]["regression"]
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pytest
+import requests
+import sheets_client as sheets_module
+from fake_services import FakeServices, parse_profile, build_profiles
+from sheets_writer import make_append_rows_handler
+from outbox import DeferDelivery
+
+@pytest.fixture
+def fake():
+    services = FakeServices(build_profiles([
+        "gemini:latency=0", "sheets:latency=0,rpm=2", "slack:latency=0,throttle=1,retry_after=7", "sendgrid:latency=0"
+    ]), seed=3).start()
+    yield services
+    services.stop()
+
+def test_parse_profile():
+    assert parse_profile("sheets:latency=300,rpm=60,errors=0.01") == ("sheets", {"latency_ms": 300.0, "rpm": 60.0, "error_rate": 0.01})
+    with pytest.raises(ValueError):
+        parse_profile("twilio:latency=1")
+
+def test_gemini_generate_and_stream(fake):
+    body = {"contents": [{"parts": [{"text": "Lead Constructora Peña"}], "role": "user"}]}
+    res = requests.post(f"{fake.url}/v1beta/models/gemini-2.0-flash:generateContent", json=body)
+    text = res.json()["candidates"][0]["content"]["parts"][0]["text"]
+    assert json.loads(text)["risk_assessment"]["overall_risk_score"] > 0
+
+    chunks = requests.post(f"{fake.url}/v1beta/models/gemini-2.0-flash:streamGenerateContent", json=body).json()
+    assert len(chunks) > 1 and "".join(c["candidates"][0]["content"]["parts"][0]["text"] for c in chunks) == text
+
+    created = requests.post(f"{fake.url}/v1beta/cachedContents", json={"displayName": "kontify-x", "ttl": "600s"}).json()
+    listed = requests.get(f"{fake.url}/v1beta/cachedContents").json()["cachedContents"]
+    assert [c["name"] for c in listed] == [created["name"]]
+
+def test_sheets_client_appends_through_endpoint_until_quota(fake, monkeypatch):
+    monkeypatch.setattr(sheets_module, "SHEETS_API_ENDPOINT", fake.url)
+    cache = sheets_module.SheetsClientCache()
+    monkeypatch.setattr(sheets_module, "sheets_client", cache)
+    assert cache.has_credentials()
+    append_rows = make_append_rows_handler(open_sheet=cache.worksheet)
+    append_rows([["17/10/2026", "Empresa A"], ["17/10/2026", "Empresa B"]])
+    append_rows([["17/10/2026", "Empresa C"]]) # Dos escrituras: la cuota por minuto se agota
+    assert fake.sheet_rows == 3
+    with pytest.raises(DeferDelivery):
+        append_rows([["17/10/2026", "Empresa D"]])
+    assert fake.stats()["services"]["sheets"]["throttled"] == 1
+
+def test_slack_throttle_and_sendgrid_host(fake):
+    res = requests.post(f"{fake.url}/slack/webhook", json={"text": "lead"})
+    assert res.status_code == 429 and res.headers["Retry-After"] == "7"
+
+    from sendgrid import SendGridAPIClient
+    from sendgrid.helpers.mail import Mail
+    client = SendGridAPIClient("SG.fake", host=fake.url)
+    response = client.send(Mail(from_email="a@example.com", to_emails="b@example.com", subject="x", html_content="<p>x</p>"))
+    assert response.status_code == 202
+    assert fake.stats()["services"]["sendgrid"]["requests"] == 1
@@ -0,0 +1,82 @@
+import os
+import sys
+import types
+import runpy
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from ai_providers import StubProvider, set_provider
+from bench_gunicorn import parse_matrix, recommend
+
+CONFIG_PATH = os.path.join(os.getcwd(), 'gunicorn.conf.py')
+
+def _load_config(monkeypatch, **env):
+    # El módulo de configuración escribe KONTIFY_BOOT_HOOKS: monkeypatch lo restaura al terminar
+    monkeypatch.setenv("KONTIFY_BOOT_HOOKS", "0")
+    for key in ("WEB_CONCURRENCY", "GUNICORN_WORKERS", "GUNICORN_THREADS", "GUNICORN_WORKER_CLASS", "GUNICORN_PRELOAD"):
+        monkeypatch.delenv(key, raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    return runpy.run_path(CONFIG_PATH)
+
+def test_defaults_are_threaded_and_preloaded(monkeypatch):
+    config = _load_config(monkeypatch)
+    assert config["worker_class"] == "gthread"
+    assert config["workers"] >= 2 and config["threads"] == 16
+    assert config["preload_app"] is True
+    assert os.environ["KONTIFY_BOOT_HOOKS"] == "1"
+
+def test_env_overrides_and_gevent_fallback(monkeypatch):
+    monkeypatch.setitem(sys.modules, "gevent", None) # gevent no instalado
+    config = _load_config(monkeypatch, WEB_CONCURRENCY="3", GUNICORN_THREADS="4",
+                          GUNICORN_WORKER_CLASS="gevent", GUNICORN_PRELOAD="0")
+    assert (config["workers"], config["threads"]) == (3, 4)
+    assert config["worker_class"] == "gthread"
+    assert config["preload_app"] is False
+
+def test_hooks_split_boot_between_master_and_workers(monkeypatch):
+    calls = []
+    fake_boot = types.SimpleNamespace(boot_check=lambda: calls.append("boot_check"),
+                                      start_process_services=lambda web_workers=None: calls.append(("start_process_services", web_workers)))
+    monkeypatch.setitem(sys.modules, "boot", fake_boot)
+    config = _load_config(monkeypatch)
+    arbiter = types.SimpleNamespace(cfg=types.SimpleNamespace(workers=3))
+    config["when_ready"](arbiter)
+    config["post_fork"](arbiter, None)
+    config["post_fork"](arbiter, None)
+    assert calls == ["boot_check", ("start_process_services", 3), ("start_process_services", 3)]
+
+def test_pdf_pool_is_sized_per_host(monkeypatch):
+    import pdf_service
+    monkeypatch.setattr(pdf_service, "PDF_POOL_WORKERS", None)
+    monkeypatch.setattr(pdf_service, "PDF_HOST_WORKERS", 4)
+    # Total del host = workers web x procesos por pool
+    assert [w * pdf_service.pool_size_for(w) for w in (1, 2, 4, 8)] == [4, 4, 4, 8]
+    monkeypatch.setattr(pdf_service, "PDF_POOL_WORKERS", 2)
+    assert pdf_service.pool_size_for(4) == 2
+
+def test_start_process_services_warms_clients(monkeypatch):
+    import boot
+    opened = []
+    fake_sheets = types.SimpleNamespace(has_credentials=lambda: True, worksheet=lambda: opened.append(True))
+    monkeypatch.setattr(boot, "PDF_POOL_ENABLED", False)
+    monkeypatch.setattr(boot, "OUTBOX_ENABLED", False)
+    monkeypatch.setattr(boot, "sheets_client", fake_sheets)
+    set_provider(StubProvider())
+    try:
+        boot.start_process_services()
+    finally:
+        set_provider(None)
+    assert opened == [True]
+
+def test_bench_matrix_and_recommendation():
+    assert parse_matrix("sync:3x1,2x8") == [("sync", 3, 1), ("gthread", 2, 8)]
+    runs = [
+        {"worker_class": "sync", "workers": 3, "threads": 1, "throughput_per_min": 90, "p95_ms": 47000, "memory_mb": 360, "statuses": {"200": 10}},
+        {"worker_class": "gthread", "workers": 2, "threads": 16, "throughput_per_min": 225, "p95_ms": 3300, "memory_mb": 290, "statuses": {"200": 10}},
+        {"worker_class": "gthread", "workers": 1, "threads": 16, "throughput_per_min": 229, "p95_ms": 3200, "memory_mb": 210, "statuses": {"200": 10}},
+        {"worker_class": "gthread", "workers": 4, "threads": 8, "throughput_per_min": 240, "p95_ms": 3000, "memory_mb": 430, "statuses": {"200": 9, "503": 1}}
+    ]
+    choice = recommend(runs)
+    assert (choice["workers"], choice["threads"]) == (1, 16)
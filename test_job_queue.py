@@ -0,0 +1,140 @@
+import os
+import sys
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import job_queue
+from job_queue import enqueue_job, claim_next_job, update_job_stage, finish_job, get_job, queue_depth
+
+def test_job_lifecycle(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    enqueue_job("abc12345", {"company_name": "Peña_SA", "host_url": "http://localhost"}, db_path=db)
+    assert queue_depth(db_path=db) == 1
+
+    job = claim_next_job(db_path=db)
+    assert job['id'] == "abc12345"
+    assert job['status'] == "running"
+    assert job['payload']['company_name'] == "Peña_SA"
+    # Un segundo worker no debe reclamar el mismo trabajo mientras el lease siga vigente
+    assert claim_next_job(db_path=db) is None
+
+    assert update_job_stage("abc12345", "pdf_render", job['attempts'], db_path=db)
+    assert get_job("abc12345", db_path=db)['stage'] == "pdf_render"
+
+    assert finish_job("abc12345", {"status": "success", "report_url": "/reports/x.pdf"}, job['attempts'], db_path=db)
+    job = get_job("abc12345", db_path=db)
+    assert job['status'] == "success"
+    assert job['result']['report_url'] == "/reports/x.pdf"
+    assert queue_depth(db_path=db) == 0
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    enqueue_job("lease001", {}, db_path=db)
+    assert claim_next_job(db_path=db, lease_seconds=-1)['attempts'] == 1
+    # El worker "murió": el lease vencido permite que otro worker lo retome
+    assert claim_next_job(db_path=db)['attempts'] == 2
+
+def test_stale_worker_cannot_finish_reclaimed_job(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    enqueue_job("lease002", {}, db_path=db)
+    first = claim_next_job(db_path=db, lease_seconds=-1)
+    second = claim_next_job(db_path=db)
+    # El primer intento perdió el lease: no renueva ni sobrescribe el resultado del segundo
+    assert not update_job_stage("lease002", "pdf_render", first['attempts'], db_path=db)
+    assert finish_job("lease002", {"status": "success"}, second['attempts'], db_path=db)
+    assert not finish_job("lease002", {"status": "error"}, first['attempts'], db_path=db)
+    assert get_job("lease002", db_path=db)['status'] == "success"
+
+def test_stage_updates_renew_lease(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    enqueue_job("lease003", {}, db_path=db)
+    job = claim_next_job(db_path=db, lease_seconds=-1)
+    assert update_job_stage("lease003", "ai_scoring", job['attempts'], db_path=db)
+    assert claim_next_job(db_path=db) is None
+
+def test_finished_jobs_are_pruned(tmp_path, monkeypatch):
+    db = str(tmp_path / "jobs.sqlite3")
+    enqueue_job("old00001", {}, db_path=db)
+    finish_job("old00001", {"status": "success"}, claim_next_job(db_path=db)['attempts'], db_path=db)
+    monkeypatch.setattr(job_queue, "JOB_RETENTION_HOURS", 0)
+    enqueue_job("new00001", {}, db_path=db)
+    finish_job("new00001", {"status": "success"}, claim_next_job(db_path=db)['attempts'], db_path=db)
+    assert get_job("old00001", db_path=db) is None
+
+def test_abandoned_job_is_closed(tmp_path, monkeypatch):
+    db = str(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 1)
+    enqueue_job("dead0001", {}, db_path=db)
+    claim_next_job(db_path=db, lease_seconds=-1)
+    assert claim_next_job(db_path=db) is None
+    assert get_job("dead0001", db_path=db)['status'] == "error"
+
+def test_worker_retries_only_the_render_when_queue_is_full(tmp_path, monkeypatch):
+    import worker
+    import pipeline
+    from pdf_service import RenderQueueFull
+    db = str(tmp_path / "jobs.sqlite3")
+    monkeypatch.setattr(job_queue, "JOBS_DB_PATH", db)
+    monkeypatch.setattr(worker.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(pipeline, "PDF_RENDER_MODE", "eager")
+    monkeypatch.setattr(pipeline, "REPORTS_DIR", str(tmp_path))
+    calls = {"ai": 0, "notify": 0, "render": 0}
+
+    def diagnostic(lead, on_partial=None, request_id=None):
+        calls["ai"] += 1
+        return {"risk_assessment": {"overall_risk_score": 80}}
+
+    def notify(diagnostic, url, request_id=None):
+        calls["notify"] += 1
+        return True
+
+    def fetch(reports_dir, filename):
+        calls["render"] += 1
+        if calls["render"] < 3:
+            raise RenderQueueFull("Cola de render llena", retry_after=1)
+
+    monkeypatch.setattr(pipeline, "run_diagnostic", diagnostic)
+    monkeypatch.setattr(pipeline, "notify_all", notify)
+    monkeypatch.setattr(pipeline.report_store, "save_record", lambda *args: None)
+    monkeypatch.setattr(pipeline.report_store, "fetch", fetch)
+
+    lead = {"lead_metadata": {"company_name": "Grupo Norte", "niche_id": "holding", "billing_range": "10M - 50M",
+                              "rfc": "GNO990101AB1", "main_activity": "Holding"},
+            "responses": [{"question": "¿REPSE vigente?", "answer": "NO"}]}
+    enqueue_job("render01", {"data_for_ai": lead, "company_name": "Grupo_Norte", "host_url": "http://localhost"})
+    result = worker.run_job(claim_next_job())
+    assert result["status"] == "success"
+    assert calls == {"ai": 1, "notify": 1, "render": 3}
+    assert get_job("render01")["status"] == "success"
+
+def test_async_submit_and_job_status(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    import server
+    monkeypatch.setattr(server, "SUBMIT_MODE", "async")
+    client = server.app.test_client()
+
+    payload = {
+        "lead_metadata": {
+            "company_name": "Constructora Peña",
+            "niche_id": "constructora",
+            "billing_range": "50M - 100M",
+            "rfc": "CPN010203-XYZ",
+            "main_activity": "Construcción"
+        },
+        "responses": [{"question": "¿REPSE vigente?", "answer": "NO"}]
+    }
+    res = client.post('/api/submit', json=payload)
+    assert res.status_code == 202
+    body = res.get_json()
+    assert body['status_url'] == f"/api/jobs/{body['jobId']}"
+
+    res = client.get(body['status_url'])
+    assert res.status_code == 200
+    assert res.get_json()['stage'] == "queued"
+
+    job = get_job(body['jobId'])
+    assert job['payload']['data_for_ai']['lead_metadata']['rfc'] == "CPN010203XYZ"
+    assert job['payload']['company_name'] == "Constructora_Peña"
+
+    assert client.get('/api/jobs/noexiste').status_code == 404
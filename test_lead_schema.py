@@ -0,0 +1,44 @@
+import os
+import sys
+import copy
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pytest
+from lead_schema import Lead, LeadValidationError, parse_submission, as_lead
+from bench_lead_schema import sample_payload, legacy_flow
+
+def test_single_pass_matches_previous_double_normalization():
+    for shape in ("canonical", "free_form"):
+        payload = sample_payload(120, shape)
+        lead = parse_submission(copy.deepcopy(payload))
+        company, responses, filled = legacy_flow(copy.deepcopy(payload))
+        assert (lead.file_token, lead.responses, lead.answered) == (company, responses, filled)
+        assert lead.rfc == "CPE010203XY1" and lead.lead_metadata["activity"] == "Construcción"
+        assert not hasattr(lead, "__dict__")
+
+def test_mixed_items_and_validation_errors():
+    payload = sample_payload(0)
+    payload["responses"] = ["¿Libre?", {"num": 7, "value": " SÍ "}, {"answer": ""}, 42, {"question": "¿Q?", "answer": "N/A"}]
+    lead = parse_submission(payload)
+    assert lead.responses == [
+        {"question": "¿Libre?", "answer": "N/A"},
+        {"question": "Q7", "answer": "SÍ"},
+        {"question": "¿Q?", "answer": "N/A"}
+    ]
+    assert lead.answered == 1
+
+    with pytest.raises(LeadValidationError) as err:
+        parse_submission({"lead_metadata": {"rfc": "ABC"}, "responses": []})
+    assert "Nicho" in err.value.missing and "RFC válido (min 12 caracteres)" in err.value.missing
+    with pytest.raises(LeadValidationError):
+        parse_submission(dict(sample_payload(0), responses=[]))
+
+def test_payload_round_trip_for_job_queue():
+    lead = parse_submission(dict(sample_payload(12), utm_source="ads"))
+    payload = lead.to_payload()
+    assert payload["utm_source"] == "ads"
+    again = as_lead(payload)
+    assert isinstance(again, Lead) and again.responses == lead.responses and again.rfc == lead.rfc
+    assert as_lead(lead) is lead
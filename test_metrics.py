@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from metrics import Metrics, STAGE_HISTOGRAM
+
+def test_histogram_buckets_and_prometheus_text(tmp_path):
+    m = Metrics(metrics_dir=str(tmp_path), flush_interval=3600, enabled=True)
+    for seconds in (0.0004, 0.02, 0.02, 3.0, 120):
+        m.observe("run_diagnostic", seconds)
+    m.inc("kontify_submissions_total", route="submit", status=422)
+    text = m.render()
+    assert f"# TYPE {STAGE_HISTOGRAM} histogram" in text
+    assert f'{STAGE_HISTOGRAM}_bucket{{stage="run_diagnostic",le="0.001"}} 1' in text
+    assert f'{STAGE_HISTOGRAM}_bucket{{stage="run_diagnostic",le="0.025"}} 3' in text
+    assert f'{STAGE_HISTOGRAM}_bucket{{stage="run_diagnostic",le="5"}} 4' in text
+    assert f'{STAGE_HISTOGRAM}_bucket{{stage="run_diagnostic",le="+Inf"}} 5' in text
+    assert f'{STAGE_HISTOGRAM}_count{{stage="run_diagnostic"}} 5' in text
+    assert 'kontify_submissions_total{route="submit",status="422"} 1' in text
+
+def test_snapshots_from_other_workers_are_summed(tmp_path):
+    m = Metrics(metrics_dir=str(tmp_path), flush_interval=3600, enabled=True)
+    m.observe("notify_channel", 0.2, channel="sheets")
+    m.inc("kontify_contingency_fallbacks_total")
+    m.flush()
+    # Snapshot de otro worker de gunicorn (mismo formato, otro pid)
+    other = m.snapshot()
+    other["pid"] = 999999
+    (tmp_path / "metrics-999999.json").write_text(json.dumps(other))
+    histograms, counters = m.collect()
+    assert counters[("kontify_contingency_fallbacks_total", ())] == 2
+    assert histograms[(STAGE_HISTOGRAM, (("channel", "sheets"), ("stage", "notify_channel")))].count == 2
+    m.clear_snapshots()
+    assert not [n for n in os.listdir(tmp_path) if n.startswith("metrics-")]
+
+def test_dead_worker_snapshots_are_archived(tmp_path):
+    m = Metrics(metrics_dir=str(tmp_path), flush_interval=3600, enabled=True)
+    m.inc("kontify_submissions_total", route="submit", status=200)
+    m.flush()
+    own = m.snapshot()
+    assert os.path.exists(tmp_path / f"metrics-{own['instance']}.json")
+    # Worker muerto cuyo pid ya reutiliza otro proceso (aquí, el propio): otro instante de arranque
+    for started in ("1", "2"):
+        dead = dict(own, started=started, instance=f"{own['pid']}-{started}")
+        (tmp_path / f"metrics-{dead['instance']}.json").write_text(json.dumps(dead))
+    key = ("kontify_submissions_total", (("route", "submit"), ("status", "200")))
+    assert m.collect()[1][key] == 3
+    assert sorted(n for n in os.listdir(tmp_path) if n.startswith("metrics-")) == sorted(["metrics-archive.json", f"metrics-{own['instance']}.json"])
+    # Los contadores archivados no retroceden ni se suman dos veces
+    assert m.collect()[1][key] == 3
+
+def test_submit_pipeline_exposes_stage_metrics(tmp_path, monkeypatch):
+    import server
+    import pipeline
+    m = Metrics(metrics_dir=str(tmp_path / "metrics"), flush_interval=3600, enabled=True)
+    for module in (server, pipeline):
+        monkeypatch.setattr(module, "metrics", m)
+    monkeypatch.setattr(pipeline, "PDF_RENDER_MODE", "lazy")
+    monkeypatch.setattr(pipeline, "REPORTS_DIR", str(tmp_path))
+    monkeypatch.setattr(pipeline, "run_diagnostic", lambda data, on_partial=None, request_id=None: {"error": "Gemini caído"})
+    monkeypatch.setattr(pipeline, "notify_all", lambda diagnostic, url, request_id=None: False)
+    client = server.app.test_client()
+    payload = {
+        "lead_metadata": {"company_name": "Grupo Norte", "niche_id": "holding", "billing_range": "10M - 50M",
+                          "rfc": "GNO990101AB1", "main_activity": "Holding"},
+        "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO"} for i in range(12)]
+    }
+    assert client.post('/api/submit', json=payload).status_code == 502
+    assert client.post('/api/submit', json={"lead_metadata": {}}).status_code == 400
+
+    res = client.get('/metrics')
+    assert res.status_code == 200 and res.mimetype == "text/plain"
+    text = res.get_data(as_text=True)
+    assert 'kontify_submissions_total{route="submit",status="502"} 1' in text
+    assert 'kontify_submissions_total{route="submit",status="400"} 1' in text
+    assert "kontify_contingency_fallbacks_total 1" in text
+    for stage in ("validation", "run_diagnostic", "notify_all"):
+        assert f'{STAGE_HISTOGRAM}_count{{stage="{stage}"}}' in text
+
+def test_disabled_metrics_are_noop(tmp_path):
+    m = Metrics(metrics_dir=str(tmp_path), enabled=False)
+    with m.timer("validation"):
+        pass
+    m.flush()
+    assert m.collect() == ({}, {})
+    assert os.listdir(tmp_path) == []
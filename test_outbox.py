@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import outbox
+import notificator
+from outbox import Outbox, Channel
+
+def _box(tmp_path, handler, **kwargs):
+    box = Outbox(db_path=str(tmp_path / "outbox.sqlite3"), base_backoff=0, **kwargs)
+    box.register(Channel("slack", handler))
+    return box
+
+def test_idempotency_key_deduplicates_side_effects(tmp_path):
+    sent = []
+    box = _box(tmp_path, sent.extend)
+    assert box.enqueue("slack", "slack:/reports/A.pdf", {"text": "lead A"}) == 1
+    assert box.enqueue("slack", "slack:/reports/A.pdf", {"text": "lead A"}) == 0
+    assert box.drain() == 1
+    assert sent == [{"text": "lead A"}]
+
+def test_failures_retry_then_dead_letter(tmp_path):
+    attempts = []
+
+    def flaky(messages):
+        attempts.append(messages)
+        raise ConnectionError("webhook caído")
+
+    box = _box(tmp_path, flaky, max_attempts=3)
+    box.enqueue("slack", "slack:1", {"text": "x"})
+    for _ in range(5):
+        box.deliver_channel("slack")
+    assert len(attempts) == 3
+    stats = box.stats()["channels"]["slack"]
+    assert stats["dead"] == 1 and stats["pending"] == 0
+
+    assert box.requeue_dead("slack") == 1
+    box.channels["slack"].handler = lambda messages: None
+    assert box.drain() == 1
+    assert box.stats()["channels"]["slack"]["delivered_last_minute"] == 1
+
+def test_old_delivered_and_dead_rows_are_pruned(tmp_path, monkeypatch):
+    box = _box(tmp_path, lambda messages: None)
+    box.enqueue("slack", "slack:old", {"text": "lead viejo", "rfc": "AAA010101AAA"})
+    assert box.drain() == 1
+    # Dead-letter reciente: dentro de su retención
+    box.channels["slack"].handler = lambda messages: (_ for _ in ()).throw(ConnectionError("caído"))
+    box.max_attempts = 1
+    box.enqueue("slack", "slack:dead", {"text": "x"})
+    box.drain()
+
+    monkeypatch.setattr(outbox, "OUTBOX_RETENTION_HOURS", 0)
+    box.enqueue("slack", "slack:new", {"text": "pendiente"})
+    assert box.prune() == 1
+    stats = box.stats()
+    assert stats["channels"]["slack"] == {"pending": 1, "delivered": 0, "dead": 1, "oldest_pending_seconds": stats["channels"]["slack"]["oldest_pending_seconds"]}
+    # La llave ya no existe: un reenvío del mismo lead se registraría de nuevo
+    assert box.enqueue("slack", "slack:old", {"text": "lead viejo"}) == 1
+
+    monkeypatch.setattr(outbox, "OUTBOX_DEAD_RETENTION_HOURS", 0)
+    assert box.prune() == 1 and box.stats()["channels"]["slack"]["dead"] == 0
+
+def test_notify_all_only_writes_outbox(tmp_path, monkeypatch):
+    box = Outbox(db_path=str(tmp_path / "outbox.sqlite3"))
+    notificator.register_channels(box)
+    monkeypatch.setattr(notificator, "outbox", box)
+    monkeypatch.setattr(box, "start", lambda: None)
+    monkeypatch.setattr(notificator, "NOTIFY_INLINE_DELIVERY", False)
+    monkeypatch.setattr(notificator.sheets_client, "has_credentials", lambda: True)
+    monkeypatch.setenv("SLACK_WEBHOOK_URL", "http://127.0.0.1:9/hook")
+    monkeypatch.setenv("SENDGRID_API_KEY", "SG.test")
+
+    diagnostic = {
+        "lead_metadata": {"company_name": "Empresa Test", "niche_id": "holding", "contact_email": "test@test.com", "rfc": "AAA010101AAA"},
+        "risk_assessment": {"overall_risk_score": 85, "risk_level": "RIESGO CRÍTICO"}
+    }
+    assert notificator.notify_all(diagnostic, "http://localhost/reports/KONTIFY_Test_abc.pdf")
+    assert notificator.notify_all(diagnostic, "http://localhost/reports/KONTIFY_Test_abc.pdf")
+    channels = box.stats()["channels"]
+    assert {name: c["pending"] for name, c in channels.items()} == {"slack": 1, "sheets": 1, "email": 1}
+
+def test_notify_all_fans_out_concurrently(tmp_path, monkeypatch):
+    box = Outbox(db_path=str(tmp_path / "outbox.sqlite3"))
+    notificator.register_channels(box)
+    sent = []
+
+    def slow(name):
+        def handler(payloads):
+            time.sleep(0.4)
+            sent.append(name)
+        return handler
+
+    box.register(Channel("slack", slow("slack")))
+    box.register(Channel("email", slow("email")))
+    monkeypatch.setattr(notificator, "outbox", box)
+    monkeypatch.setattr(box, "start", lambda: None)
+    monkeypatch.setattr(notificator.sheets_client, "has_credentials", lambda: True)
+    monkeypatch.setenv("SLACK_WEBHOOK_URL", "http://127.0.0.1:9/hook")
+    monkeypatch.setenv("SENDGRID_API_KEY", "SG.test")
+
+    diagnostic = {
+        "lead_metadata": {"company_name": "Empresa Test", "niche_id": "holding", "contact_email": "test@test.com"},
+        "risk_assessment": {"overall_risk_score": 40}
+    }
+    start = time.perf_counter()
+    result = notificator.notify_all(diagnostic, "http://localhost/reports/KONTIFY_Test_fan.pdf")
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.7 # el canal más lento, no la suma
+    assert sorted(sent) == ["email", "slack"]
+    statuses = {name: r["status"] for name, r in result.to_dict().items()}
+    assert statuses == {"slack": "delivered", "sheets": "queued", "email": "delivered"}
+    assert bool(result) is True
+
+def test_notify_all_without_outbox_bounds_hung_channel(tmp_path, monkeypatch):
+    box = Outbox(db_path=str(tmp_path / "outbox.sqlite3"))
+    notificator.register_channels(box)
+    box.register(Channel("slack", lambda payloads: time.sleep(2)))
+    box.register(Channel("sheets", lambda payloads: None))
+    box.register(Channel("email", lambda payloads: None))
+    monkeypatch.setattr(notificator, "outbox", box)
+    monkeypatch.setattr(notificator, "OUTBOX_ENABLED", False)
+    monkeypatch.setattr(notificator, "INLINE_TIMEOUTS", {"slack": 0.2, "sheets": 0.2, "email": 0.2})
+    monkeypatch.setattr(notificator.sheets_client, "has_credentials", lambda: True)
+    monkeypatch.setenv("SLACK_WEBHOOK_URL", "http://127.0.0.1:9/hook")
+    monkeypatch.setenv("SENDGRID_API_KEY", "SG.test")
+
+    diagnostic = {
+        "lead_metadata": {"company_name": "Empresa Test", "niche_id": "holding", "contact_email": "test@test.com"},
+        "risk_assessment": {"overall_risk_score": 40}
+    }
+    start = time.perf_counter()
+    result = notificator.notify_all(diagnostic, "http://localhost/reports/KONTIFY_Test_hung.pdf")
+    assert time.perf_counter() - start < 1.0 # no espera al Slack colgado
+    statuses = {name: r["status"] for name, r in result.to_dict().items()}
+    assert statuses == {"slack": "failed", "sheets": "delivered", "email": "delivered"}
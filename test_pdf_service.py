@@ -0,0 +1,58 @@
+import os
+import sys
+import threading
+from concurrent.futures import Future
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pytest
+from pdf_service import PDFRenderService, RenderQueueFull, count_pages
+
+DOC = {
+    "lead_metadata": {"company_name": "Transportes Logísticos", "rfc": "TLOG900101XYZ", "main_activity": "Autotransporte"},
+    "risk_assessment": {"overall_risk_score": 82},
+    "markdown_content": "- Falta de Holding",
+    "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO"} for i in range(40)]
+}
+
+@pytest.fixture(scope="module")
+def service():
+    svc = PDFRenderService(workers=1, max_queue=0, queue_wait=0)
+    svc.start()
+    yield svc
+    svc.shutdown()
+
+def test_pool_returns_bytes_and_paths(service, tmp_path):
+    pdf = service.submit(DOC).result(timeout=60)
+    assert pdf.startswith(b"%PDF") and count_pages(pdf) >= 2
+
+    path = str(tmp_path / "report.pdf")
+    assert service.render(DOC, path) == path
+    assert os.path.getsize(path) > 0
+    assert service.stats()["rendered"] == 2
+
+def test_bounded_queue_rejects_when_full(service):
+    first = service.submit(DOC)
+    with pytest.raises(RenderQueueFull):
+        service.submit(DOC)
+    first.result(timeout=60)
+    assert service.stats()["rejected"] == 1
+
+def test_stats_counters_are_thread_safe():
+    svc = PDFRenderService(workers=1, max_queue=800, queue_wait=0)
+    done = Future()
+    done.set_result(b"%PDF")
+
+    def callbacks():
+        # Los callbacks de fin de render llegan desde hilos del pool
+        for _ in range(100):
+            svc._slots.acquire()
+            svc._done(done)
+
+    threads = [threading.Thread(target=callbacks) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert svc.stats()["rendered"] == 800
@@ -0,0 +1,34 @@
+import os
+import sys
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from pdf_generator_v2 import render_pdf_bytes
+from pdf_service import count_pages
+from pdf_template import get_chrome, progress_arc_ops
+
+DOC = {
+    "lead_metadata": {"company_name": "Transportes Logísticos", "rfc": "TLOG900101XYZ", "main_activity": "Autotransporte"},
+    "risk_assessment": {"overall_risk_score": 82},
+    "markdown_content": "- Falta de Holding",
+    "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO"} for i in range(40)]
+}
+
+def test_template_matches_legacy_layout():
+    legacy = render_pdf_bytes(DOC, use_template=False)
+    template = render_pdf_bytes(DOC, use_template=True)
+    assert template.startswith(b"%PDF")
+    assert count_pages(template) == count_pages(legacy)
+    assert len(template) <= len(legacy)
+
+def test_chrome_is_built_once_per_process():
+    chrome = get_chrome((33, 37, 41), (249, 249, 249))
+    assert get_chrome((0, 0, 0), (0, 0, 0)) is chrome
+    assert chrome.gauge_background(170, 60) is chrome.gauge_background(170, 60)
+    assert chrome.header.startswith(b"q\n") and chrome.header.endswith(b"\nQ")
+
+def test_progress_arc_is_a_single_path():
+    ops = progress_arc_ops(170, 60, 82, (220, 53, 69))
+    assert ops.count(b" m") == 1 and ops.count(b" l") == 41 and ops.count(b"\nS") == 1
+    assert progress_arc_ops(170, 60, 0, (255, 215, 0)) == b""
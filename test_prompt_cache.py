@@ -0,0 +1,119 @@
+import os
+import sys
+import types
+import shutil
+import datetime
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pytest
+import prompt_builder
+import ai_providers
+from gemini_client import client_manager
+from ai_providers import StubProvider, set_provider
+from process_diagnostic import run_diagnostic
+
+def _payload(company, rfc, niche_id="constructora"):
+    return {
+        "lead_metadata": {
+            "company_name": company,
+            "niche_id": niche_id,
+            "billing_range": "50M - 100M",
+            "rfc": rfc,
+            "main_activity": "Construcción"
+        },
+        "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO" if i % 2 else "SÍ"} for i in range(12)]
+    }
+
+def test_prefix_rendered_once_and_sent_once(tmp_path, monkeypatch):
+    shutil.copytree('architecture', tmp_path / 'architecture')
+    monkeypatch.chdir(tmp_path)
+    prompt_builder.clear_prompt_cache()
+    stub = StubProvider()
+    set_provider(stub)
+    try:
+        first = run_diagnostic(_payload("Constructora Peña", "CPN010203XYZ"))
+        second = run_diagnostic(_payload("Grupo Norte", "GNO990101AB1"))
+        assert 31 <= first['risk_assessment']['overall_risk_score'] <= 90
+        assert 'error' not in second
+
+        # El SOP (prefijo) viaja una sola vez; cada solicitud solo envía el delta del lead
+        prefix = prompt_builder.get_prompt_prefix("constructora")
+        assert stub.calls == 2
+        assert list(stub.contexts) == [prefix.cache_key]
+        assert stub.prefix_chars_sent == len(prefix.text)
+        assert stub.delta_chars_sent < len(prefix.text)
+        assert prompt_builder.get_prompt_prefix("constructora") is prefix
+
+        # Cambiar el contenido del SOP invalida el prefijo (nuevo hash -> nuevo contexto)
+        sop_path = tmp_path / 'architecture' / 'constructora_sop.md'
+        sop_path.write_text(sop_path.read_text(encoding='utf-8') + "\n- Vector nuevo: REPSE.\n", encoding='utf-8')
+        updated = prompt_builder.get_prompt_prefix("constructora")
+        assert updated.sop_hash != prefix.sop_hash
+        assert "Vector nuevo: REPSE" in updated.text
+
+        run_diagnostic(_payload("Constructora Peña", "CPN010203XYZ"))
+        assert len(stub.contexts) == 2
+    finally:
+        set_provider(None)
+        prompt_builder.clear_prompt_cache()
+
+def test_unknown_niche_falls_back_to_holding_sop():
+    prefix = prompt_builder.get_prompt_prefix("inexistente")
+    assert prefix.sop_path.endswith(os.path.join('architecture', 'holding_sop.md'))
+
+class _APIError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+def _gemini_with(monkeypatch, create, generate):
+    caching = types.SimpleNamespace(CachedContent=types.SimpleNamespace(list=lambda: [], create=create))
+    monkeypatch.setattr(ai_providers, "genai", types.SimpleNamespace(caching=caching, types=types.SimpleNamespace(GenerationConfig=dict)))
+    model = types.SimpleNamespace(generate_content=generate)
+    monkeypatch.setattr(client_manager, "get_cached_model", lambda cached: model)
+    monkeypatch.setattr(client_manager, "get_model", lambda name: model)
+    monkeypatch.setattr(client_manager, "drop_model", lambda key: None)
+    return ai_providers.GeminiProvider(use_context_cache=True)
+
+def test_transient_cache_error_backs_off_instead_of_disabling(monkeypatch):
+    attempts = []
+
+    def create(**kwargs):
+        attempts.append(kwargs["display_name"])
+        if len(attempts) == 1:
+            raise _APIError(429)
+        return types.SimpleNamespace(name="cachedContents/x", expire_time=datetime.datetime.now() + datetime.timedelta(hours=1))
+
+    provider = _gemini_with(monkeypatch, create, lambda prompt, generation_config=None: types.SimpleNamespace(text=prompt))
+    prefix = prompt_builder.get_prompt_prefix("constructora")
+    assert provider._cached_context(prefix) is None
+    assert provider._cached_context(prefix) is None and len(attempts) == 1 # En backoff, sin llamar a la API
+    provider._backoff[prefix.cache_key] = (0, 30)
+    assert provider._cached_context(prefix) is not None
+    assert prefix.cache_key not in provider._unsupported
+
+    provider = _gemini_with(monkeypatch, lambda **kwargs: (_ for _ in ()).throw(_APIError(400)), None)
+    assert provider._cached_context(prefix) is None
+    assert prefix.cache_key in provider._unsupported
+
+def test_cached_call_only_resends_full_prompt_when_context_expired(monkeypatch):
+    calls = []
+    errors = [_APIError(429), _APIError(404)]
+
+    def generate(prompt, generation_config=None):
+        calls.append(len(prompt))
+        if errors and len(calls) % 2:
+            raise errors.pop(0)
+        return types.SimpleNamespace(text="ok")
+
+    create = lambda **kwargs: types.SimpleNamespace(name="cachedContents/x", expire_time=datetime.datetime.now() + datetime.timedelta(hours=1))
+    provider = _gemini_with(monkeypatch, create, generate)
+    prefix = prompt_builder.get_prompt_prefix("constructora")
+    with pytest.raises(_APIError):
+        provider.generate(prefix, "delta") # 429: no se duplica la llamada con el prompt completo
+    assert len(calls) == 1
+    calls.clear()
+    assert provider.generate(prefix, "delta") == "ok" # 404: contexto expirado, se reenvía completo
+    assert calls == [len("delta"), len(prefix.text) + len("delta")]
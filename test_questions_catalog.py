@@ -0,0 +1,63 @@
+import os
+import sys
+import gzip
+import json
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from questions_catalog import QuestionsCatalog, parse_questionnaire
+
+SAMPLE_MD = """# Cuestionario
+## I. Estructura Corporativa (Q1-Q2)
+1. ¿Bajo qué régimen tributario operan?
+   [OPTIONS: Régimen General | Régimen de Coordinados | RESICO]
+2. ¿Cuenta con REPSE vigente? [SÍ | NO]
+## II. Fiscal
+3. ¿Pregunta abierta?
+"""
+
+def test_parse_questionnaire_rules():
+    questions = parse_questionnaire(SAMPLE_MD)
+    assert [q['num'] for q in questions] == ['1', '2', '3']
+    assert questions[0]['options'] == ['Régimen General', 'Régimen de Coordinados', 'RESICO']
+    assert questions[0]['cat'] == 'Estructura Corporativa'
+    assert questions[1] == {"q": "¿Cuenta con REPSE vigente?", "num": "2", "cat": "Estructura Corporativa", "options": ["SÍ", "NO"]}
+    assert questions[2]['cat'] == 'Fiscal' and questions[2]['options'] == []
+
+def test_catalog_invalidated_by_mtime(tmp_path):
+    path = tmp_path / "constructora_diagnostico.md"
+    path.write_text(SAMPLE_MD, encoding='utf-8')
+    catalog = QuestionsCatalog(base_dir=str(tmp_path), check_interval=0)
+
+    entry = catalog.get('constructora')
+    assert len(entry.questions) == 3
+    assert catalog.get('holding') is None
+    assert catalog.get('constructora') is entry # Sin cambios: misma instancia pre-serializada
+
+    path.write_text(SAMPLE_MD + "## III. Sucesión\n4. ¿Nueva pregunta? [SÍ | NO]\n", encoding="utf-8")
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+    updated = catalog.get('constructora')
+    assert len(updated.questions) == 4
+    assert updated.etag != entry.etag
+    assert json.loads(gzip.decompress(catalog.bulk().body_gzip)) == {"constructora": json.loads(updated.body)}
+
+def test_questions_endpoint_etag_and_bulk():
+    import server
+    client = server.app.test_client()
+
+    res = client.get('/api/questions/autotransporte')
+    assert res.status_code == 200
+    questions = res.get_json()
+    assert "Régimen de Coordinados" in questions[0]['options']
+    assert res.headers['Cache-Control'].startswith('public')
+
+    res_304 = client.get('/api/questions/autotransporte', headers={'If-None-Match': res.headers['ETag']})
+    assert res_304.status_code == 304 and res_304.data == b''
+
+    bulk = client.get('/api/questions', headers={'Accept-Encoding': 'gzip'})
+    assert bulk.headers['Content-Encoding'] == 'gzip'
+    assert bulk.headers['ETag'] != res.headers['ETag']
+    assert json.loads(gzip.decompress(bulk.data))['autotransporte'] == questions
+
+    assert client.get('/api/questions/desconocido').status_code == 404
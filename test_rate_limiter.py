@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import threading
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pytest
+import process_diagnostic
+from rate_limiter import AdmissionController, AdmissionRejected
+from ai_providers import StubProvider, set_provider
+from gemini_client import client_manager, ConcurrencyLimitExceeded
+from result_cache import result_cache
+
+def test_token_bucket_shared_between_workers(tmp_path):
+    db = str(tmp_path / "limiter.sqlite3")
+    # Dos workers distintos (misma base) comparten 2 tokens de ráfaga a 60 RPM
+    worker_a = AdmissionController(db_path=db, rpm=60, burst=2, max_queue=0, max_wait=0)
+    worker_b = AdmissionController(db_path=db, rpm=60, burst=2, max_queue=0, max_wait=0)
+    worker_a.release(worker_a.acquire())
+    worker_b.release(worker_b.acquire())
+    with pytest.raises(AdmissionRejected) as exc:
+        worker_a.acquire()
+    assert exc.value.retry_after >= 1
+    assert worker_a.stats()["rejected"] == 1
+
+def test_in_flight_cap_and_bounded_queue(tmp_path):
+    db = str(tmp_path / "limiter.sqlite3")
+    limiter = AdmissionController(db_path=db, rpm=6000, burst=100, max_in_flight=1, max_queue=1, max_wait=2)
+    first = limiter.acquire()
+
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(limiter.acquire()))
+    waiter.start()
+    time.sleep(0.2)
+    assert limiter.stats()["waiting"] == 1
+
+    # Cola llena: el tercero recibe un rechazo inmediato en lugar de esperar
+    start = time.perf_counter()
+    with pytest.raises(AdmissionRejected):
+        limiter.acquire()
+    assert time.perf_counter() - start < 0.5
+
+    limiter.release(first)
+    waiter.join(timeout=3)
+    assert len(admitted) == 1
+    assert limiter.stats()["in_flight"] == 1
+
+def test_queue_deadline_and_crashed_lease(tmp_path):
+    db = str(tmp_path / "limiter.sqlite3")
+    limiter = AdmissionController(db_path=db, rpm=6000, burst=100, max_in_flight=1, max_queue=5, max_wait=0.3, lease_seconds=0.5)
+    limiter.acquire() # Worker "caído": nunca libera su lease
+    with pytest.raises(AdmissionRejected):
+        limiter.acquire()
+    time.sleep(0.5)
+    assert limiter.acquire(max_wait=1)
+
+def test_rejection_becomes_fast_429(tmp_path, monkeypatch):
+    rejecting = AdmissionController(db_path=str(tmp_path / "limiter.sqlite3"), rpm=60, burst=1, max_queue=0, max_wait=0)
+    rejecting.acquire()
+    monkeypatch.setattr(process_diagnostic, "admission", rejecting)
+    set_provider(StubProvider())
+    result_cache.clear()
+    try:
+        payload = {
+            "lead_metadata": {"niche_id": "holding", "rfc": "RAT010203XY1", "main_activity": "Holding"},
+            "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO"} for i in range(12)]
+        }
+        result = process_diagnostic.run_diagnostic(payload)
+        assert result["status_code"] == 429
+        assert result["retry_after"] >= 1
+    finally:
+        set_provider(None)
+
+def test_stats_counters_are_thread_safe(tmp_path):
+    limiter = AdmissionController(db_path=str(tmp_path / "limiter.sqlite3"), rpm=600000, burst=1000, max_in_flight=100)
+
+    def worker():
+        for _ in range(10):
+            limiter.release(limiter.acquire())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert limiter.stats()["admitted"] == 80
+
+def test_local_slot_timeout_does_not_hold_global_lease(tmp_path, monkeypatch):
+    limiter = AdmissionController(db_path=str(tmp_path / "limiter.sqlite3"), rpm=6000, burst=100)
+    monkeypatch.setattr(process_diagnostic, "admission", limiter)
+
+    class _BusySlot:
+        def __enter__(self):
+            # Mientras espera el slot local, este proceso no debe tener lease global
+            assert limiter.stats()["in_flight"] == 0
+            raise ConcurrencyLimitExceeded("sin slot")
+        def __exit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(client_manager, "slot", lambda timeout=None: _BusySlot())
+    set_provider(StubProvider())
+    result_cache.clear()
+    try:
+        payload = {
+            "lead_metadata": {"niche_id": "holding", "rfc": "SLT010203XY1", "main_activity": "Holding"},
+            "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO"} for i in range(12)]
+        }
+        assert process_diagnostic.run_diagnostic(payload)["status_code"] == 429
+        assert limiter.stats()["admitted"] == 0
+    finally:
+        set_provider(None)
+
+def test_concurrent_workers_never_exceed_queue_max(tmp_path):
+    db = str(tmp_path / "limiter.sqlite3")
+    holder = AdmissionController(db_path=db, rpm=6000, burst=100, max_in_flight=1)
+    lease = holder.acquire() # Sin lugar en vuelo: todos los demás deben formarse
+    conn = holder._connect()
+    conn.executescript("""
+        CREATE TABLE peak (n INTEGER);
+        CREATE TRIGGER waiters_peak AFTER INSERT ON waiters BEGIN
+            INSERT INTO peak SELECT COUNT(*) FROM waiters;
+        END;
+    """)
+    barrier = threading.Barrier(12)
+    outcomes = []
+
+    def worker():
+        # Una instancia por hilo: como workers de gunicorn distintos sobre la misma base
+        limiter = AdmissionController(db_path=db, rpm=6000, burst=100, max_in_flight=1, max_queue=3, max_wait=0.3)
+        barrier.wait()
+        try:
+            limiter.acquire()
+            outcomes.append("admitted")
+        except AdmissionRejected:
+            outcomes.append("rejected")
+
+    threads = [threading.Thread(target=worker) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert outcomes == ["rejected"] * 12
+    assert 0 < max(n for (n,) in conn.execute("SELECT n FROM peak")) <= 3
+    conn.close()
+    holder.release(lease)
+
+def test_admitted_call_renews_its_lease(tmp_path):
+    db = str(tmp_path / "limiter.sqlite3")
+    limiter = AdmissionController(db_path=db, rpm=6000, burst=100, max_in_flight=1, max_queue=0, max_wait=0, lease_seconds=0.3)
+    with limiter.admit():
+        # La llamada dura más que el lease: el lugar en vuelo sigue ocupado
+        time.sleep(0.8)
+        with pytest.raises(AdmissionRejected):
+            limiter.acquire()
+    assert limiter.stats()["in_flight"] == 0
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import gzip
+import threading
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import report_store as report_store_module
+from report_store import ReportStore, TIER_ARCHIVE, TIER_HOT
+from pdf_generator_v2 import render_pdf_bytes
+
+DOC = {
+    "lead_metadata": {"company_name": "Transportes Logísticos", "rfc": "TLOG900101XYZ", "main_activity": "Autotransporte"},
+    "risk_assessment": {"overall_risk_score": 82},
+    "markdown_content": "- Falta de Holding",
+    "responses": [{"question": "¿Pregunta?", "answer": "NO"}]
+}
+
+class SlowRenderer:
+    def __init__(self):
+        self.calls = 0
+
+    def render(self, json_data, output_path=None, timeout=None):
+        self.calls += 1
+        time.sleep(0.3) # Ventana para que las demás solicitudes lleguen durante el render
+        return render_pdf_bytes(json_data)
+
+def test_first_downloads_share_one_render(tmp_path, monkeypatch):
+    renderer = SlowRenderer()
+    monkeypatch.setattr(report_store_module, "pdf_service", renderer)
+    store = ReportStore()
+    digest = store.save_record(str(tmp_path), "abc", "KONTIFY_T_abc.pdf", DOC)
+    assert not os.path.exists(store.object_path(str(tmp_path), digest))
+
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(store.ensure_pdf(str(tmp_path), "KONTIFY_T_abc.pdf"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert renderer.calls == 1
+    assert paths == [store.object_path(str(tmp_path), digest)] * 5 and os.path.getsize(paths[0]) > 0
+    assert store.stats()["coalesced"] == 4
+    # Ya en disco: no se vuelve a renderizar
+    store.ensure_pdf(str(tmp_path), "KONTIFY_T_abc.pdf")
+    assert renderer.calls == 1
+
+def test_unknown_or_unsafe_names_are_not_rendered(tmp_path):
+    store = ReportStore()
+    assert store.ensure_pdf(str(tmp_path), "KONTIFY_missing.pdf") is None
+    assert store.ensure_pdf(str(tmp_path), "../secret.pdf") is None
+    assert store.ensure_pdf(str(tmp_path), "records/x.json") is None
+    assert store.ensure_pdf(str(tmp_path), "index.sqlite") is None
+
+def test_identical_reports_share_one_object(tmp_path, monkeypatch):
+    renderer = SlowRenderer()
+    monkeypatch.setattr(report_store_module, "pdf_service", renderer)
+    store = ReportStore()
+    first = store.save_record(str(tmp_path), "req1", "KONTIFY_T_req1.pdf", DOC)
+    second = store.save_record(str(tmp_path), "req2", "KONTIFY_T_req2.pdf", dict(DOC))
+    assert first == second and store.stats()["deduplicated"] == 1
+
+    assert store.ensure_pdf(str(tmp_path), "KONTIFY_T_req1.pdf") == store.ensure_pdf(str(tmp_path), "KONTIFY_T_req2.pdf")
+    assert renderer.calls == 1
+    assert store.lookup(str(tmp_path), request_id="req2")[:2] == (first, "KONTIFY_T_req2.pdf")
+    # Sharding: objects/ab/cd/<digest>.pdf
+    assert os.path.relpath(store.object_path(str(tmp_path), first), str(tmp_path)).split(os.sep)[:3] == ["objects", first[:2], first[2:4]]
+
+def test_retention_archives_restores_and_evicts(tmp_path, monkeypatch):
+    monkeypatch.setattr(report_store_module, "pdf_service", SlowRenderer())
+    store = ReportStore()
+    old = store.save_record(str(tmp_path), "old", "KONTIFY_T_old.pdf", DOC)
+    new = store.save_record(str(tmp_path), "new", "KONTIFY_T_new.pdf", dict(DOC, sales_pitch="Otro"))
+    original = open(store.ensure_pdf(str(tmp_path), "KONTIFY_T_old.pdf"), "rb").read()
+    store.ensure_pdf(str(tmp_path), "KONTIFY_T_new.pdf")
+
+    # Todo lo no accedido "ahora" pasa a archivo
+    summary = store.apply_retention(str(tmp_path), archive_after_days=-1, max_age_days=0, max_bytes=0)
+    assert summary["archived"] == 2
+    assert store.lookup(str(tmp_path), request_id="old")[2] == TIER_ARCHIVE
+    assert not os.path.exists(store.object_path(str(tmp_path), old))
+    assert gzip.open(store.archive_path(str(tmp_path), old)).read() == original
+
+    # Una descarga lo restaura al nivel caliente sin volver a renderizar
+    assert open(store.ensure_pdf(str(tmp_path), "KONTIFY_T_old.pdf"), "rb").read() == original
+    assert store.lookup(str(tmp_path), request_id="old")[2] == TIER_HOT
+    assert store.stats()["restored"] == 1
+
+    # Presupuesto de bytes: se elimina el de acceso más antiguo ("new", aún archivado)
+    summary = store.apply_retention(str(tmp_path), archive_after_days=30, max_age_days=0, max_bytes=len(original))
+    assert summary["evicted_for_size"] == 1
+    assert store.lookup(str(tmp_path), request_id="new") is None
+    assert store.ensure_pdf(str(tmp_path), "KONTIFY_T_new.pdf") is None
+    assert not os.path.exists(store.record_path(str(tmp_path), new))
+
+def test_lazy_mode_submit_skips_render_until_download(tmp_path, monkeypatch):
+    import pipeline
+    import server
+    renderer = SlowRenderer()
+    monkeypatch.setattr(report_store_module, "pdf_service", renderer)
+    monkeypatch.setattr(pipeline, "PDF_RENDER_MODE", "lazy")
+    monkeypatch.setattr(pipeline, "REPORTS_DIR", str(tmp_path))
+    monkeypatch.setattr(server, "REPORTS_DIR", str(tmp_path))
+    monkeypatch.setattr(pipeline, "run_diagnostic", lambda data, on_partial=None, request_id=None: dict(DOC))
+    monkeypatch.setattr(pipeline, "notify_all", lambda diagnostic, url, request_id=None: True)
+
+    result = pipeline.process_submission({"lead_metadata": {"rfc": "TLOG900101XYZ"}, "responses": []}, "req1", "http://x", "Transportes")
+    assert result["status"] == "success" and renderer.calls == 0
+
+    res = server.app.test_client().get(result["report_url"])
+    assert res.status_code == 200 and res.data.startswith(b"%PDF")
+    assert renderer.calls == 1
+    res.close()
+
+def test_download_serves_memory_then_disk_with_range_and_etag(tmp_path, monkeypatch):
+    import server
+    renderer = SlowRenderer()
+    monkeypatch.setattr(report_store_module, "pdf_service", renderer)
+    monkeypatch.setattr(server, "REPORTS_DIR", str(tmp_path))
+    store = server.report_store
+    digest = store.save_record(str(tmp_path), "rng", "KONTIFY_T_rng.pdf", dict(DOC, sales_pitch="Range"))
+    client = server.app.test_client()
+
+    # Primer GET: render a memoria, escritura diferida
+    res = client.get("/reports/KONTIFY_T_rng.pdf")
+    full = res.data
+    assert res.status_code == 200 and full.startswith(b"%PDF")
+    assert res.headers["ETag"] == f'"{digest}"' and res.headers["Accept-Ranges"] == "bytes"
+    res.close()
+    store.flush()
+    assert open(store.object_path(str(tmp_path), digest), "rb").read() == full
+
+    # Reanudación y revalidación desde disco
+    res = client.get("/reports/KONTIFY_T_rng.pdf", headers={"Range": "bytes=100-199"})
+    assert res.status_code == 206 and res.data == full[100:200]
+    res.close()
+    res = client.get("/reports/KONTIFY_T_rng.pdf", headers={"If-None-Match": f'"{digest}"'})
+    assert res.status_code == 304
+    res.close()
+    assert renderer.calls == 1
+
+def test_submit_can_return_pdf_in_the_response(tmp_path, monkeypatch):
+    import pipeline
+    import server
+    monkeypatch.setattr(report_store_module, "pdf_service", SlowRenderer())
+    monkeypatch.setattr(pipeline, "REPORTS_DIR", str(tmp_path))
+    monkeypatch.setattr(server, "REPORTS_DIR", str(tmp_path))
+    monkeypatch.setattr(server, "process_submission", lambda data, request_id, host, company: (
+        pipeline.report_store.save_record(str(tmp_path), request_id, f"KONTIFY_{company}_{request_id}.pdf", dict(DOC, sales_pitch=request_id)),
+        {"status": "success", "report_url": f"/reports/KONTIFY_{company}_{request_id}.pdf"}
+    )[1])
+    payload = {
+        "lead_metadata": {"company_name": "Peña", "niche_id": "constructora", "billing_range": "50M - 100M", "rfc": "PDF010203XY1", "main_activity": "Construcción"},
+        "responses": [{"question": "¿Pregunta?", "answer": "NO"}]
+    }
+    res = server.app.test_client().post("/api/submit", json=payload, headers={"Accept": "application/pdf"})
+    assert res.status_code == 200 and res.mimetype == "application/pdf" and res.data.startswith(b"%PDF")
+    assert res.headers["Content-Location"].startswith("/reports/KONTIFY_")
+    res.close()
+    server.report_store.flush()
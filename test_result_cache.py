@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from result_cache import ResultCache, diagnostic_cache_key, result_cache
+from ai_providers import StubProvider, set_provider
+from process_diagnostic import run_diagnostic
+
+RESPONSES = [{"question": "¿REPSE vigente?", "answer": "NO"}]
+
+def test_cache_key_is_stable_and_sensitive():
+    a = diagnostic_cache_key("constructora", RESPONSES, {"sales": "90M", "profit": "15M"}, "50M - 100M", "CPN010203XYZ", "sop1")
+    b = diagnostic_cache_key("constructora", RESPONSES, {"profit": "15M", "sales": "90M"}, "50M - 100M", "CPN010203XYZ", "sop1")
+    assert a == b
+    assert a != diagnostic_cache_key("constructora", RESPONSES, {"sales": "90M", "profit": "15M"}, "50M - 100M", "CPN010203XYZ", "sop2")
+    assert a != diagnostic_cache_key("constructora", [{"question": "¿REPSE vigente?", "answer": "SÍ"}], {"sales": "90M", "profit": "15M"}, "50M - 100M", "CPN010203XYZ", "sop1")
+
+def test_lru_and_ttl_eviction():
+    cache = ResultCache(max_entries=2, ttl=60, db_path="")
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1} # "a" pasa a ser el más reciente
+    cache.set("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+
+    cached = cache.get("c")
+    cached["v"] = 99 # Cada lectura entrega una copia independiente
+    assert cache.get("c") == {"v": 3}
+
+    short = ResultCache(max_entries=2, ttl=0.01, db_path="")
+    short.set("a", {"v": 1})
+    time.sleep(0.02)
+    assert short.get("a") is None
+    assert short.stats()["misses"] == 1
+
+def test_disk_tier_is_shared_between_workers(tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    worker_a = ResultCache(db_path=db)
+    worker_b = ResultCache(db_path=db)
+    worker_a.set("k", {"risk_assessment": {"overall_risk_score": 77}})
+    assert worker_b.get("k") == {"risk_assessment": {"overall_risk_score": 77}}
+    assert worker_b.stats()["disk_hits"] == 1
+    assert worker_b.get("k") is not None # Ahora desde memoria
+    assert worker_b.stats()["memory_hits"] == 1
+    assert worker_a.stats()["shared"] == {"hits": 2, "misses": 0}
+
+def test_resubmission_skips_model_call():
+    payload = {
+        "lead_metadata": {"niche_id": "holding", "rfc": "HOL010203XY1", "main_activity": "Holding", "billing_range": "10M - 50M"},
+        "responses": [{"question": f"¿Pregunta {i}?", "answer": "SÍ"} for i in range(12)]
+    }
+    stub = StubProvider()
+    set_provider(stub)
+    result_cache.clear()
+    try:
+        first = run_diagnostic(payload)
+        first['responses'] = "mutado por el pipeline"
+        second = run_diagnostic(payload)
+        assert stub.calls == 1
+        assert 'responses' not in second
+        assert second['risk_assessment'] == first['risk_assessment']
+    finally:
+        set_provider(None)
+        result_cache.clear()
+
+def test_shared_counters_are_buffered(tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    reader = ResultCache(db_path=db)
+    worker = ResultCache(db_path=db)
+    for _ in range(3):
+        assert worker.get("nada") is None
+    # Las consultas no escriben en SQLite hasta el siguiente flush
+    assert reader.stats()["shared"] == {"hits": 0, "misses": 0}
+    worker.flush_stats()
+    assert reader.stats()["shared"] == {"hits": 0, "misses": 3}
@@ -0,0 +1,63 @@
+import os
+import sys
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pipeline
+import process_diagnostic
+import risk_engine
+from questions_catalog import catalog
+from ai_providers import StubProvider, set_provider
+from result_cache import result_cache
+
+def _answers(niche_id, pick):
+    return [
+        {"q_index": q['num'], "question": q['q'], "answer": pick(q['options'] or ['SÍ', 'NO'])}
+        for q in catalog.get(niche_id).questions
+    ]
+
+def test_scores_are_deterministic_and_ordered():
+    risky = risk_engine.score_lead("constructora", _answers("constructora", lambda o: "NO" if "NO" in o else o[-1]))
+    safe = risk_engine.score_lead("constructora", _answers("constructora", lambda o: o[0]))
+    assert risky == risk_engine.score_lead("constructora", _answers("constructora", lambda o: "NO" if "NO" in o else o[-1]))
+    assert risky["overall_risk_score"] > 70 and risky["risk_level"] == "RIESGO CRÍTICO"
+    assert safe["overall_risk_score"] < 30
+    assert [c["category"] for c in risky["categories"]] == ["Estructura y Registro", "Gestión de Seguridad Social y Laboral", "Eficiencia Fiscal e IVA", "Blindaje y Activos", "Estrategia y Expansión"]
+
+def test_batch_matches_single_scores():
+    leads = [_answers("holding", lambda o: o[i % len(o)]) for i in range(50)]
+    scores = risk_engine.score_batch("holding", leads)
+    assert len(scores) == 50
+    for responses, score in zip(leads[:5], scores[:5]):
+        assert round(score) == risk_engine.score_lead("holding", responses)["overall_risk_score"]
+
+def test_unrecognized_answers_yield_no_score():
+    assert risk_engine.score_lead("holding", [{"question": "¿Pregunta libre?", "answer": "NO"}]) is None
+    assert risk_engine.score_lead("nicho_inexistente", _answers("holding", lambda o: o[0])) is None
+
+def test_contingency_uses_local_score():
+    responses = _answers("constructora", lambda o: "NO" if "NO" in o else o[-1])
+    result = pipeline._contingency_result("REQ-1", "timeout", "AAA010101AAA", "Construcción", responses, {"niche_id": "constructora"})
+    assert result["risk_assessment"]["overall_risk_score"] == risk_engine.score_lead("constructora", responses)["overall_risk_score"]
+    assert result["responses"] == responses
+
+def test_ai_score_is_checked_against_local(monkeypatch):
+    set_provider(StubProvider())
+    result_cache.clear()
+    try:
+        payload = {
+            "lead_metadata": {"niche_id": "constructora", "rfc": "CHK010203XY1", "main_activity": "Construcción"},
+            "responses": _answers("constructora", lambda o: o[0])
+        }
+        result = process_diagnostic.run_diagnostic(payload)
+        check = result["score_check"]
+        assert check["local_score"] == risk_engine.score_lead("constructora", payload["responses"])["overall_risk_score"]
+        assert check["delta"] == abs(result["risk_assessment"]["overall_risk_score"] - check["local_score"])
+
+        monkeypatch.setattr(process_diagnostic, "LOCAL_SCORING_MODE", "fast")
+        fast = process_diagnostic.run_diagnostic(payload)
+        assert fast["risk_assessment"]["overall_risk_score"] == check["local_score"]
+    finally:
+        set_provider(None)
+        result_cache.clear()
@@ -0,0 +1,95 @@
+import os
+import sys
+import datetime
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pytest
+import gspread
+import sheets_client as sheets_module
+from google.oauth2 import service_account
+
+class FakeCreds:
+    def __init__(self, minutes_left):
+        self.token = "tok"
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(minutes=minutes_left)
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+class FakeSpreadsheet:
+    title = "CRM"
+
+    def __init__(self, sheet):
+        self.sheet = sheet
+
+    def get_worksheet(self, index):
+        return self.sheet
+
+class FakeClient:
+    def __init__(self):
+        self.opened = 0
+        self.sheet = object()
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def open_by_key(self, key):
+        self.opened += 1
+        return FakeSpreadsheet(self.sheet)
+
+@pytest.fixture
+def fakes(monkeypatch):
+    state = {"creds": [], "clients": []}
+
+    def from_info(info, scopes=None):
+        creds = FakeCreds(minutes_left=state.get("minutes_left", 60))
+        state["creds"].append(creds)
+        return creds
+
+    def authorize(creds):
+        client = FakeClient()
+        state["clients"].append(client)
+        return client
+
+    monkeypatch.setenv("GOOGLE_CREDS_JSON", '{"client_email": "bot@kontify.iam"}')
+    monkeypatch.delenv("GOOGLE_CREDS_BASE64", raising=False)
+    monkeypatch.setattr(service_account.Credentials, "from_service_account_info", staticmethod(from_info))
+    monkeypatch.setattr(gspread, "authorize", authorize)
+    return state
+
+def test_client_and_worksheet_built_once_per_process(fakes):
+    cache = sheets_module.SheetsClientCache()
+    sheets = [cache.worksheet("SHEET") for _ in range(5)]
+    assert all(s is sheets[0] for s in sheets)
+    assert len(fakes["creds"]) == 1 and len(fakes["clients"]) == 1
+    assert fakes["clients"][0].opened == 1
+
+def test_token_is_refreshed_before_expiry(fakes):
+    fakes["minutes_left"] = 2
+    cache = sheets_module.SheetsClientCache(refresh_margin=300)
+    cache.worksheet("SHEET")
+    cache.worksheet("SHEET")
+    assert fakes["creds"][0].refreshes == 1
+    assert cache.stats()["token_refreshes"] == 1
+
+def test_reconnect_only_on_auth_or_not_found(fakes):
+    cache = sheets_module.SheetsClientCache()
+    calls = []
+
+    def write(sheet, error):
+        calls.append(sheet)
+        if len(calls) == 1:
+            raise Exception(error)
+        return "ok"
+
+    assert cache.run(lambda sheet: write(sheet, "APIError: [401]: invalid_grant"), sheet_id="SHEET") == "ok"
+    assert len(fakes["clients"]) == 2 and cache.stats()["reconnects"] == 1
+
+    calls.clear()
+    with pytest.raises(Exception):
+        cache.run(lambda sheet: write(sheet, "APIError: [500]: backend error"), sheet_id="SHEET")
+    assert len(fakes["clients"]) == 2
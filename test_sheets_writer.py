@@ -0,0 +1,67 @@
+import os
+import sys
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from outbox import Outbox
+from sheets_writer import sheets_channel
+
+class FakeWorksheet:
+    def __init__(self, fail_with=None):
+        self.calls = []
+        self.fail_with = fail_with
+
+    def append_rows(self, rows, value_input_option=None):
+        if self.fail_with:
+            raise Exception(self.fail_with)
+        self.calls.append(rows)
+
+def _outbox(tmp_path, sheet, **kwargs):
+    box = Outbox(db_path=str(tmp_path / "outbox.sqlite3"))
+    box.register(sheets_channel(open_sheet=lambda: sheet, **kwargs))
+    return box
+
+def test_rows_are_flushed_in_one_append_rows(tmp_path):
+    sheet = FakeWorksheet()
+    box = _outbox(tmp_path, sheet, batch_size=10, flush_interval=0, writes_per_minute=6000)
+    box.enqueue_many([("sheets", f"sheets:{i}", [f"Empresa {i}", "holding"]) for i in range(7)])
+    assert box.deliver_channel("sheets") == 7
+    assert len(sheet.calls) == 1 and sheet.calls[0][0] == ["Empresa 0", "holding"]
+    assert box.stats()["channels"]["sheets"]["pending"] == 0
+
+def test_partial_batch_waits_for_flush_interval(tmp_path):
+    sheet = FakeWorksheet()
+    box = _outbox(tmp_path, sheet, batch_size=10, flush_interval=3600, writes_per_minute=6000)
+    box.enqueue("sheets", "sheets:1", ["Empresa 1"])
+    assert box.deliver_channel("sheets") == 0
+    box.enqueue_many([("sheets", f"sheets:{i}", [f"Empresa {i}"]) for i in range(2, 11)])
+    assert box.deliver_channel("sheets") == 10
+
+def test_quota_schedule_spaces_writes(tmp_path):
+    sheet = FakeWorksheet()
+    box = _outbox(tmp_path, sheet, batch_size=2, flush_interval=0, writes_per_minute=1)
+    box.enqueue_many([("sheets", f"sheets:{i}", [f"Empresa {i}"]) for i in range(4)])
+    assert box.deliver_channel("sheets") == 2
+    # La siguiente escritura queda agendada a 60s: nada sale antes
+    assert box.deliver_channel("sheets") == 0
+    assert box.stats()["channels"]["sheets"]["pending"] == 2
+
+def test_quota_error_pauses_channel_without_spending_attempts(tmp_path):
+    db = str(tmp_path / "outbox.sqlite3")
+    broken = Outbox(db_path=db)
+    broken.register(sheets_channel(open_sheet=lambda: FakeWorksheet(fail_with="APIError: [429]: Quota exceeded"), flush_interval=0, writes_per_minute=6000))
+    broken.enqueue("sheets", "sheets:A", ["Empresa A"])
+    assert broken.deliver_channel("sheets") == 0
+
+    # Nuevo proceso con la misma base: la fila sigue pendiente y sale al vencer la pausa
+    sheet = FakeWorksheet()
+    restarted = Outbox(db_path=db)
+    restarted.register(sheets_channel(open_sheet=lambda: sheet, flush_interval=0, writes_per_minute=6000))
+    assert restarted.deliver_channel("sheets") == 0
+    conn = restarted._connect()
+    assert conn.execute("SELECT attempts FROM outbox").fetchone()[0] == 0
+    conn.execute("UPDATE channels SET next_run_at = 0")
+    conn.close()
+    assert restarted.deliver_channel("sheets") == 1
+    assert sheet.calls == [[["Empresa A"]]]
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import threading
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+import pipeline
+import job_queue
+from stream_parser import DiagnosticStreamParser
+from ai_providers import StubProvider, set_provider
+from result_cache import result_cache
+from report_store import report_store
+
+DOC = {
+    "risk_assessment": {
+        "overall_risk_score": 82,
+        "risk_level": "RIESGO CRÍTICO",
+        "critical_finding": "Activos sin \"PropCo\"",
+        "hallazgos_tecnicos": ["Sin REPSE", "Contratos a precio alzado, sin blindaje"]
+    },
+    "sales_pitch": "Urgente.",
+    "markdown_content": "### Análisis\n- Punto",
+    "admin_report": {"summary": "Resumen"}
+}
+
+def test_incremental_parser_any_chunking():
+    text = "```json\n" + json.dumps(DOC, ensure_ascii=False, indent=2) + "\n```"
+    expected = None
+    for size in (1, 2, 5, 13, len(text)):
+        parser = DiagnosticStreamParser()
+        partials = []
+        for i in range(0, len(text), size):
+            partials.extend(parser.feed(text[i:i + size]))
+        assert parser.result() == DOC
+        if expected is None:
+            expected = partials
+        assert partials == expected
+    assert expected[0] == {"field": "overall_risk_score", "value": 82}
+    assert [p["value"] for p in expected if p["field"] == "hallazgo"] == DOC["risk_assessment"]["hallazgos_tecnicos"]
+
+def test_partial_fields_arrive_before_document_ends():
+    parser = DiagnosticStreamParser()
+    text = json.dumps(DOC, ensure_ascii=False)
+    cut = text.index('"sales_pitch"')
+    partials = parser.feed(text[:cut])
+    assert {"field": "risk_level", "value": "RIESGO CRÍTICO"} in partials
+
+def _read_events(res):
+    events = []
+    first_event_at = None
+    start = time.perf_counter()
+    buffer = ""
+    for chunk in res.response:
+        if first_event_at is None:
+            first_event_at = time.perf_counter() - start
+        buffer += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buffer:
+            raw, buffer = buffer.split("\n\n", 1)
+            if raw.startswith(":"):
+                continue
+            lines = dict(line.split(": ", 1) for line in raw.split("\n"))
+            events.append((lines["event"], json.loads(lines["data"])))
+    return first_event_at, events
+
+def test_sse_submit_streams_stages_and_partials(tmp_path, monkeypatch):
+    import server
+    monkeypatch.setattr(pipeline, "REPORTS_DIR", str(tmp_path))
+    monkeypatch.setattr(pipeline, "notify_all", lambda diagnostic, url, request_id=None: True)
+    set_provider(StubProvider(latency=1.5))
+    result_cache.clear()
+    try:
+        payload = {
+            "lead_metadata": {
+                "company_name": "Constructora Peña",
+                "niche_id": "constructora",
+                "billing_range": "50M - 100M",
+                "rfc": "SSE010203XY1",
+                "main_activity": "Construcción"
+            },
+            "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO"} for i in range(12)]
+        }
+        res = server.app.test_client().post('/api/submit/stream', json=payload, buffered=False)
+        assert res.mimetype == 'text/event-stream'
+
+        first_event_at, events = _read_events(res)
+        assert first_event_at < 1.0
+
+        names = [e[0] for e in events]
+        stages = [e[1]["stage"] for e in events if e[0] == "stage"]
+        assert stages == ["validated", "ai_scoring", "crm_sync", "crm_synced", "pdf_render", "pdf_ready"]
+        assert names.index("partial") < names.index("result")
+
+        result = events[-1]
+        assert result[0] == "result" and result[1]["status"] == "success"
+        assert os.path.exists(report_store.ensure_pdf(str(tmp_path), os.path.basename(result[1]["report_url"])))
+    finally:
+        set_provider(None)
+        result_cache.clear()
+
+def test_sse_submit_validation_error_is_plain_json():
+    import server
+    res = server.app.test_client().post('/api/submit/stream', json={"lead_metadata": {}})
+    assert res.status_code == 400
+    assert res.get_json()["status"] == "error"
+
+def _lead_payload(rfc):
+    return {
+        "lead_metadata": {
+            "company_name": "Constructora Peña",
+            "niche_id": "constructora",
+            "billing_range": "50M - 100M",
+            "rfc": rfc,
+            "main_activity": "Construcción"
+        },
+        "responses": [{"question": f"¿Pregunta {i}?", "answer": "NO"} for i in range(12)]
+    }
+
+def test_sse_submit_async_mode_follows_queued_job(tmp_path, monkeypatch):
+    import server
+    monkeypatch.setattr(job_queue, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(server, "SUBMIT_MODE", "async")
+    monkeypatch.setattr(server, "SSE_JOB_POLL_SECONDS", 0.02)
+
+    def fake_worker():
+        # Un worker que reclama el trabajo, reporta una etapa y lo termina
+        job = None
+        while job is None:
+            job = job_queue.claim_next_job()
+            time.sleep(0.02)
+        job_queue.update_job_stage(job['id'], "ai_scoring", job['attempts'])
+        time.sleep(0.1)
+        job_queue.finish_job(job['id'], {"status": "success", "report_url": "/reports/x.pdf"}, job['attempts'])
+
+    worker = threading.Thread(target=fake_worker)
+    worker.start()
+    res = server.app.test_client().post('/api/submit/stream', json=_lead_payload("ASY010203XY1"), buffered=False)
+    _, events = _read_events(res)
+    worker.join()
+    stages = [e[1]["stage"] for e in events if e[0] == "stage"]
+    assert stages[0] == "validated" and "ai_scoring" in stages
+    assert events[-1] == ("result", {"status": "success", "version": "2.2.1", "report_url": "/reports/x.pdf", "requestId": events[0][1]["requestId"]})
+
+def test_sse_submit_async_mode_hands_off_to_polling(tmp_path, monkeypatch):
+    import server
+    monkeypatch.setattr(job_queue, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(server, "SUBMIT_MODE", "async")
+    monkeypatch.setattr(server, "SSE_JOB_WAIT_SECONDS", 0.05)
+    monkeypatch.setattr(server, "SSE_JOB_POLL_SECONDS", 0.01)
+    res = server.app.test_client().post('/api/submit/stream', json=_lead_payload("ASY010203XY2"), buffered=False)
+    _, events = _read_events(res)
+    assert events[-1][0] == "result" and events[-1][1]["status"] == "accepted"
+    assert events[-1][1]["status_url"] == f"/api/jobs/{events[-1][1]['jobId']}"
+
+def test_sse_submit_saturated_returns_429(monkeypatch):
+    import server
+    full = threading.BoundedSemaphore(1)
+    full.acquire()
+    monkeypatch.setattr(server, "_pipeline_executor", lambda: (None, full))
+    res = server.app.test_client().post('/api/submit/stream', json=_lead_payload("SAT010203XY1"))
+    assert res.status_code == 429 and res.headers["Retry-After"] == "5"
@@ -0,0 +1,69 @@
+import os
+import io
+import sys
+import json
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from structured_log import LogPipeline, truncate
+
+def _lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+def test_events_are_compact_json_lines_with_request_id():
+    stream = io.StringIO()
+    log = LogPipeline(stream=stream, sample_rate=0)
+    log.info("crm_synced", "✅ CRM", "abc12345", channels={"sheets": "queued"})
+    log.error("validation_error", "Falta RFC", "abc12345", missing=["RFC"])
+    log.flush()
+    first, second = _lines(stream)
+    assert first["event"] == "crm_synced" and first["requestId"] == "abc12345" and first["level"] == "info"
+    assert first["msg"] == "✅ CRM" and first["channels"] == {"sheets": "queued"}
+    assert second["level"] == "error" and second["missing"] == ["RFC"]
+    assert "\n" not in stream.getvalue().strip().split("\n")[0]
+    log.stop()
+
+def test_payload_sampling_is_stable_per_request_and_truncated():
+    stream = io.StringIO()
+    log = LogPipeline(stream=stream, sample_rate=0.5, max_chars=40)
+    payload = {"responses": [{"question": "¿Pregunta?", "answer": "SÍ"}] * 20}
+    ids = [f"{i:08x}" for i in range(200)]
+    chosen = [rid for rid in ids if log.sampled(rid)]
+    assert 0 < len(chosen) < len(ids)
+    assert chosen == [rid for rid in ids if log.sampled(rid)]
+    for rid in ids:
+        log.payload("payload_for_gemini", payload, rid)
+    log.flush()
+    entries = _lines(stream)
+    assert [e["requestId"] for e in entries] == chosen
+    assert entries[0]["payload"].endswith("chars)") and len(entries[0]["payload"]) < 80
+    stats = log.stats()
+    assert stats["payloads_logged"] == len(chosen)
+    assert stats["payloads_skipped"] == len(ids) - len(chosen)
+    log.stop()
+
+def test_level_filter_and_sample_rate_bounds():
+    stream = io.StringIO()
+    log = LogPipeline(stream=stream, level="WARNING", sample_rate=1)
+    log.info("ignored")
+    log.payload("ignored_payload", {"a": 1}, "r1")
+    log.warning("kept", request_id="r1")
+    log.flush()
+    assert [e["event"] for e in _lines(stream)] == ["kept"]
+    assert LogPipeline(sample_rate=1).sampled("x") and not LogPipeline(sample_rate=0).sampled("x")
+    log.stop()
+
+def test_full_queue_drops_instead_of_blocking():
+    stream = io.StringIO()
+    log = LogPipeline(stream=stream, max_queue=1)
+    log._ensure_started()
+    log._listener.stop() # Sin escritor: la cola se llena
+    log._listener = None
+    for i in range(5):
+        log.info("burst", request_id=str(i))
+    assert log.stats()["dropped"] == 4
+
+def test_truncate():
+    assert truncate("abc", 5) == "abc"
+    assert truncate("abcdefgh", 3) == "abc...(+5 chars)"
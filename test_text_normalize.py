@@ -0,0 +1,26 @@
+import os
+import sys
+import random
+
+# Añadir directorio de tools al path
+sys.path.append(os.path.join(os.getcwd(), 'tools'))
+
+from text_normalize import pdf_text, pdf_texts, sheets_cell, sheets_cells, filename_token
+from bench_text_normalize import legacy_safe_text, legacy_safe_str, legacy_filename
+
+def test_matches_previous_functions_on_random_text():
+    rng = random.Random(7)
+    pool = [chr(cp) for cp in range(0, 0x2100)] + ['😀', '\U000E0001', '_', '…', ' ', '﻿', '​']
+    for _ in range(3000):
+        text = "".join(rng.choice(pool) for _ in range(rng.randint(0, 24)))
+        assert pdf_text(text) == legacy_safe_text(text)
+        assert sheets_cell(text) == legacy_safe_str(text)
+        assert filename_token(text) == legacy_filename(text)
+
+def test_common_cases_and_batches():
+    assert pdf_text(None) == "N/A" and pdf_text(82) == "82"
+    assert pdf_text("“Blindaje” – SÍ… ✓") == '"Blindaje" - SÍ... ?'
+    assert pdf_text("x" * 1000) == "x" * 1000 # Textos largos no pasan por la caché
+    assert pdf_texts(["Peña", "• Punto"]) == ["Peña", "* Punto"]
+    assert sheets_cells([None, "  Peña\x00\x07 S.A.\n", 78]) == ["N/A", "Peña S.A.", "78"]
+    assert filename_token("Constructora Peña, S.A. de C.V.") == "Constructora_Peña_SA_de_CV"
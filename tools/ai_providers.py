@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import datetime
+import threading
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+from gemini_client import client_manager
+from structured_log import log
+
+# Proveedores de IA para run_diagnostic.
+# KONTIFY_AI_PROVIDER=gemini (producción) | stub (offline, determinista, sin cuota)
+AI_PROVIDER = os.getenv("KONTIFY_AI_PROVIDER", "gemini").lower()
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# El caching explícito de Gemini exige un modelo versionado
+GEMINI_CACHE_MODEL = os.getenv("GEMINI_CACHE_MODEL", "models/gemini-2.0-flash-001")
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1") == "1"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 3600))
+# Tras un fallo transitorio al registrar el contexto (red, 429, 5xx) se reintenta con backoff exponencial
+GEMINI_CONTEXT_CACHE_RETRY = float(os.getenv("GEMINI_CONTEXT_CACHE_RETRY", 30))
+GEMINI_CONTEXT_CACHE_RETRY_MAX = float(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_MAX", 900))
+
+def _error_code(error):
+    # google.api_core.exceptions.GoogleAPICallError expone el código HTTP (gRPC y REST)
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+def _is_definitive_cache_error(error):
+    """400 (modelo sin caching, prefijo bajo el mínimo de tokens) no cambia reintentando."""
+    return _error_code(error) == 400
+
+def _is_stale_context_error(error):
+    """El CachedContent expiró o fue borrado (404, o 403 'CachedContent not found or permission denied')."""
+    return _error_code(error) in (403, 404)
+
+class GeminiProvider:
+    """
+    Gemini con el prefijo estático del nicho registrado como CachedContent.
+    Cada solicitud solo envía el delta del lead; si el caching no está disponible
+    (modelo, tamaño mínimo de tokens, cuota) se envía el prompt completo.
+    """
+    name = "gemini"
+    requires_api_key = True
+    supports_context_cache = True
+
+    def __init__(self, model_name=None, use_context_cache=None, cache_ttl=None):
+        self.model_name = model_name or GEMINI_MODEL
+        self.use_context_cache = GEMINI_CONTEXT_CACHE if use_context_cache is None else use_context_cache
+        self.cache_ttl = cache_ttl or GEMINI_CONTEXT_CACHE_TTL
+        self._contexts = {}      # cache_key -> (CachedContent, expira_en)
+        self._unsupported = set() # cache_keys que el proveedor rechazó (no reintentar por SOP)
+        self._backoff = {}        # cache_key -> (reintentar_en, espera) tras un fallo transitorio
+        self._lock = threading.Lock()
+
+    def _find_remote_context(self, display_name):
+        # Otro worker pudo registrar ya el mismo prefijo
+        for cached in genai.caching.CachedContent.list():
+            if cached.display_name == display_name and cached.expire_time.timestamp() > time.time() + 60:
+                return cached
+        return None
+
+    def _cached_context(self, prefix):
+        key = prefix.cache_key
+        if key in self._unsupported:
+            return None
+        backoff = self._backoff.get(key)
+        if backoff and backoff[0] > time.time():
+            return None
+
+        entry = self._contexts.get(key)
+        if entry and entry[1] > time.time() + 60:
+            return entry[0]
+
+        with self._lock:
+            entry = self._contexts.get(key)
+            if entry and entry[1] > time.time() + 60:
+                return entry[0]
+            display_name = f"kontify-{key}"
+            try:
+                cached = self._find_remote_context(display_name)
+                if cached is None:
+                    cached = genai.caching.CachedContent.create(
+                        model=GEMINI_CACHE_MODEL,
+                        display_name=display_name,
+                        system_instruction=prefix.text,
+                        ttl=datetime.timedelta(seconds=self.cache_ttl)
+                    )
+                    log.info("context_cache_created", "🧠 Contexto cacheado en Gemini", context=display_name)
+                self._contexts[key] = (cached, cached.expire_time.timestamp())
+                self._backoff.pop(key, None)
+                return cached
+            except Exception as e:
+                if _is_definitive_cache_error(e):
+                    log.warning("context_cache_unsupported", "⚠️ Context caching no disponible: se envía prompt completo", context=display_name, error=str(e))
+                    self._unsupported.add(key)
+                    return None
+                # Fallo transitorio: prompt completo por ahora y nuevo intento tras el backoff
+                delay = min(backoff[1] * 2, GEMINI_CONTEXT_CACHE_RETRY_MAX) if backoff else GEMINI_CONTEXT_CACHE_RETRY
+                self._backoff[key] = (time.time() + delay, delay)
+                log.warning("context_cache_failed", "⚠️ Context caching falló, reintento con backoff", context=display_name, retry_in_s=round(delay), error=str(e))
+                return None
+
+    def _config(self, max_output_tokens, temperature):
+        return genai.types.GenerationConfig(
+            candidate_count=1,
+            max_output_tokens=max_output_tokens,
+            temperature=temperature
+        )
+
+    def _discard_context(self, prefix, cached, error):
+        # El contexto pudo expirar o borrarse: se descarta y se usa el prompt completo
+        log.warning("context_cache_stale", "⚠️ Contexto cacheado inválido", context=prefix.cache_key, error=str(error))
+        self._contexts.pop(prefix.cache_key, None)
+        client_manager.drop_model(f"cached:{cached.name}")
+
+    def generate(self, prefix, delta, max_output_tokens=1000, temperature=0.2):
+        """Retorna el texto crudo de la respuesta del modelo."""
+        config = self._config(max_output_tokens, temperature)
+        cached = self._cached_context(prefix) if self.use_context_cache else None
+        if cached is not None:
+            try:
+                model = client_manager.get_cached_model(cached)
+                return model.generate_content(delta, generation_config=config).text
+            except Exception as e:
+                # Solo un contexto expirado justifica reenviar el prompt completo; 429 o timeouts se propagan
+                if not _is_stale_context_error(e):
+                    raise
+                self._discard_context(prefix, cached, e)
+
+        model = client_manager.get_model(self.model_name)
+        return model.generate_content(prefix.text + delta, generation_config=config).text
+
+    def generate_stream(self, prefix, delta, max_output_tokens=1000, temperature=0.2):
+        """Igual que generate() pero entrega el texto por fragmentos conforme el modelo lo produce."""
+        config = self._config(max_output_tokens, temperature)
+        cached = self._cached_context(prefix) if self.use_context_cache else None
+        if cached is not None:
+            started = False
+            try:
+                model = client_manager.get_cached_model(cached)
+                for chunk in model.generate_content(delta, generation_config=config, stream=True):
+                    started = True
+                    yield chunk.text
+                return
+            except Exception as e:
+                if started or not _is_stale_context_error(e):
+                    raise # Ya se entregó texto (reintentar duplicaría la salida) o no es un contexto expirado
+                self._discard_context(prefix, cached, e)
+
+        model = client_manager.get_model(self.model_name)
+        for chunk in model.generate_content(prefix.text + delta, generation_config=config, stream=True):
+            yield chunk.text
+
+    async def agenerate(self, prefix, delta, max_output_tokens=1000, temperature=0.2):
+        """generate() con el cliente async del SDK (grpc_asyncio). Con transporte REST no hay uno: va en un hilo."""
+        if not client_manager.supports_async:
+            return await asyncio.to_thread(self.generate, prefix, delta, max_output_tokens, temperature)
+        config = self._config(max_output_tokens, temperature)
+        # Registrar el contexto es una llamada bloqueante (una vez por SOP); después es un dict
+        cached = await asyncio.to_thread(self._cached_context, prefix) if self.use_context_cache else None
+        if cached is not None:
+            try:
+                model = client_manager.get_cached_model(cached)
+                return (await model.generate_content_async(delta, generation_config=config)).text
+            except Exception as e:
+                if not _is_stale_context_error(e):
+                    raise
+                self._discard_context(prefix, cached, e)
+
+        model = client_manager.get_model(self.model_name)
+        return (await model.generate_content_async(prefix.text + delta, generation_config=config)).text
+
+    async def agenerate_stream(self, prefix, delta, max_output_tokens=1000, temperature=0.2):
+        """Variante async de generate_stream()."""
+        if not client_manager.supports_async:
+            async for chunk in iterate_in_thread(self.generate_stream, prefix, delta, max_output_tokens, temperature):
+                yield chunk
+            return
+        config = self._config(max_output_tokens, temperature)
+        cached = await asyncio.to_thread(self._cached_context, prefix) if self.use_context_cache else None
+        if cached is not None:
+            started = False
+            try:
+                model = client_manager.get_cached_model(cached)
+                async for chunk in await model.generate_content_async(delta, generation_config=config, stream=True):
+                    started = True
+                    yield chunk.text
+                return
+            except Exception as e:
+                if started or not _is_stale_context_error(e):
+                    raise
+                self._discard_context(prefix, cached, e)
+
+        model = client_manager.get_model(self.model_name)
+        async for chunk in await model.generate_content_async(prefix.text + delta, generation_config=config, stream=True):
+            yield chunk.text
+
+async def iterate_in_thread(generator_fn, *args):
+    """Consume un generador bloqueante en un hilo del executor y entrega sus elementos al event loop."""
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    finished = object()
+
+    def _pump():
+        try:
+            for item in generator_fn(*args):
+                loop.call_soon_threadsafe(items.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, (finished, e))
+            return
+        loop.call_soon_threadsafe(items.put_nowait, (finished, None))
+
+    pump = loop.run_in_executor(None, _pump)
+    while True:
+        item, error = await items.get()
+        if item is finished:
+            await pump
+            if error is not None:
+                raise error
+            return
+        yield item
+
+def stub_diagnostic_text(delta, niche_id, sop_hash, context_key):
+    """JSON de diagnóstico simulado (score estable por delta); lo usan StubProvider y el Gemini falso."""
+    score = 31 + int(hashlib.sha256(delta.encode('utf-8')).hexdigest()[:8], 16) % 60
+    return json.dumps({
+        "risk_assessment": {
+            "overall_risk_score": score,
+            "risk_level": "RIESGO CRÍTICO" if score > 70 else "VULNERABILIDAD MODERADA",
+            "critical_finding": f"Diagnóstico simulado para [{niche_id}].",
+            "hallazgos_tecnicos": [
+                f"SOP {sop_hash[:12]} evaluado.",
+                "Respuestas cruzadas con vectores de riesgo."
+            ]
+        },
+        "sales_pitch": "Diagnóstico generado por el proveedor local (stub).",
+        "markdown_content": "### Análisis de Vulnerabilidad\n- Resultado simulado sin llamada al modelo.",
+        "admin_report": {"summary": f"Stub {context_key}"}
+    }, ensure_ascii=False)
+
+class StubProvider:
+    """
+    Proveedor local determinista para pruebas y benchmarks (sin red ni cuota).
+    Emula el caching de contexto: el prefijo se "registra" una sola vez por hash de SOP.
+    """
+    name = "stub"
+    requires_api_key = False
+    supports_context_cache = True
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.contexts = {}
+        self.calls = 0
+        self.prefix_chars_sent = 0
+        self.delta_chars_sent = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prefix, delta, max_output_tokens=1000, temperature=0.2):
+        return ''.join(self.generate_stream(prefix, delta, max_output_tokens, temperature))
+
+    def _chunks(self, prefix, delta, chunk_size):
+        with self._lock:
+            if prefix.cache_key not in self.contexts:
+                self.contexts[prefix.cache_key] = len(prefix.text)
+                self.prefix_chars_sent += len(prefix.text)
+            self.calls += 1
+            self.delta_chars_sent += len(delta)
+
+        text = stub_diagnostic_text(delta, prefix.niche_id, prefix.sop_hash, prefix.cache_key)
+        return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+    def generate_stream(self, prefix, delta, max_output_tokens=1000, temperature=0.2, chunk_size=24):
+        chunks = self._chunks(prefix, delta, chunk_size)
+        # La latencia configurada se reparte entre los fragmentos, como un stream real
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield chunk
+
+    async def agenerate(self, prefix, delta, max_output_tokens=1000, temperature=0.2):
+        return ''.join([chunk async for chunk in self.agenerate_stream(prefix, delta, max_output_tokens, temperature)])
+
+    async def agenerate_stream(self, prefix, delta, max_output_tokens=1000, temperature=0.2, chunk_size=24):
+        chunks = self._chunks(prefix, delta, chunk_size)
+        for chunk in chunks:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    """Instancia única por proceso (conserva los contextos cacheados entre solicitudes)."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if AI_PROVIDER == "stub":
+                    _provider = StubProvider(latency=float(os.getenv("KONTIFY_STUB_LATENCY_MS", 0)) / 1000)
+                else:
+                    _provider = GeminiProvider()
+    return _provider
+
+def set_provider(provider):
+    """Permite inyectar un proveedor (pruebas, benchmarks)."""
+    global _provider
+    _provider = provider
@@ -0,0 +1,383 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from server import (
+    app as flask_app, _prepare_submission, _enqueue_submission, _sse, _stream_result, _job_poll,
+    SUBMIT_MODE, SSE_HEARTBEAT_SECONDS, SSE_JOB_POLL_SECONDS, SSE_JOB_WAIT_SECONDS
+)
+from pipeline import aprocess_submission
+from structured_log import log
+from metrics import metrics
+import async_http
+
+# Variante ASGI del API (mismas rutas que tools/server.py), servida por el worker asyncio de gunicorn:
+#   GUNICORN_WORKER_CLASS=asgi gunicorn -c gunicorn.conf.py tools.asgi_app:app
+# /api/submit y /api/submit/stream corren en el event loop: la espera a Gemini, Slack y SendGrid es
+# una corrutina y no un hilo, así un proceso sostiene cientos de diagnósticos en vuelo. El registro y
+# el PDF van a un executor (ver pipeline.aprocess_submission).
+# El resto de las rutas (catálogo, reportes con ETag/Range, jobs, health, métricas, estáticos) son
+# lecturas cortas: se atienden con la app Flask existente en un pool de hilos (puente WSGI), así su
+# lógica vive en un solo lugar.
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 8))
+ASGI_MAX_BODY = int(os.getenv("ASGI_MAX_BODY", 1024 * 1024))
+# Executor por defecto del loop (asyncio.to_thread): SQLite del limitador/outbox y Gemini con transporte
+# REST, que no tiene cliente asíncrono. El default de asyncio (núcleos + 4) se queda corto en E/S
+ASGI_BLOCKING_THREADS = int(os.getenv("ASGI_BLOCKING_THREADS", 64))
+
+_CORS = [(b"access-control-allow-origin", b"*")]
+
+_bridge = {"pid": None, "executor": None}
+_bridge_lock = threading.Lock()
+# Pipelines de /api/submit/stream que siguen aunque el navegador se desconecte
+_streams = set()
+
+def _wsgi_executor():
+    if _bridge["pid"] != os.getpid():
+        with _bridge_lock:
+            if _bridge["pid"] != os.getpid():
+                _bridge.update(
+                    executor=ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix="wsgi"),
+                    pid=os.getpid()
+                )
+    return _bridge["executor"]
+
+def _header(scope, name, default=""):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return default
+
+async def _read_body(receive):
+    """Cuerpo completo de la petición o None si supera ASGI_MAX_BODY."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > ASGI_MAX_BODY:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+async def _send_response(send, status, body, content_type, headers=None):
+    raw_headers = [(b"content-type", content_type.encode("latin-1")), (b"content-length", str(len(body)).encode())]
+    raw_headers += [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in (headers or {}).items()]
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers + _CORS})
+    await send({"type": "http.response.body", "body": body})
+    return status
+
+async def _send_json(send, status, body, headers=None):
+    return await _send_response(send, status, json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json", headers)
+
+def _host_url(scope):
+    host = _header(scope, b"host")
+    if not host and scope.get("server"):
+        host = "%s:%s" % tuple(scope["server"])
+    return f"{scope.get('scheme', 'http')}://{host}"
+
+def _wants_pdf(scope):
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("format") == ["pdf"]:
+        return True
+    # Mismo criterio que server._wants_pdf: con "*/*" gana JSON
+    accept = parse_accept_header(_header(scope, b"accept"), MIMEAccept)
+    return accept.best_match(['application/json', 'application/pdf']) == 'application/pdf'
+
+def _environ(scope, body, path=None, method=None):
+    """Entorno WSGI (PEP 3333) equivalente a la petición ASGI."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": method or scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": (path or scope["path"]).encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": "" if path else scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(body)) if body else ""
+    }
+    for key, value in scope["headers"]:
+        name = key.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+            continue
+        if name == "CONTENT_LENGTH":
+            continue
+        name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+def _call_wsgi(environ):
+    """Ejecuta la app Flask (en un hilo del puente). Retorna (status, headers, body)."""
+    started = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+        return chunks.append
+
+    result = flask_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return started["status"], started["headers"], b"".join(chunks)
+
+async def _send_wsgi_result(send, status, headers, body):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+    })
+    await send({"type": "http.response.body", "body": body})
+    return status
+
+async def _too_large(send, request_id=None):
+    body = {"status": "error", "message": "Solicitud demasiado grande."}
+    if request_id:
+        body["requestId"] = request_id
+    return await _send_json(send, 413, body)
+
+async def _wsgi(scope, receive, send):
+    body = await _read_body(receive)
+    if body is None:
+        return await _too_large(send)
+    loop = asyncio.get_running_loop()
+    status, headers, payload = await loop.run_in_executor(_wsgi_executor(), _call_wsgi, _environ(scope, body))
+    return await _send_wsgi_result(send, status, headers, payload)
+
+def _parse_json(body):
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+async def _submit(scope, receive, send):
+    request_id = str(uuid.uuid4())[:8]
+    status = 500
+    try:
+        body = await _read_body(receive)
+        if body is None:
+            status = await _too_large(send, request_id)
+            return
+        data = _parse_json(body)
+        if not data:
+            status = await _send_json(send, 400, {"status": "error", "message": "Solicitud JSON vacía.", "requestId": request_id})
+            return
+
+        lead, error_msg = _prepare_submission(data, request_id)
+        if error_msg:
+            status = await _send_json(send, 400, {"status": "error", "message": error_msg, "requestId": request_id})
+            return
+
+        host_url = _host_url(scope)
+
+        # MODO ASÍNCRONO: encolar y responder de inmediato (el worker drena la cola)
+        if SUBMIT_MODE == "async":
+            accepted = await asyncio.to_thread(_enqueue_submission, lead, request_id, host_url)
+            status = await _send_json(send, 202, accepted)
+            return
+
+        result = await aprocess_submission(lead, request_id, host_url, lead.file_token)
+        if result.get("status") != "success":
+            status_code = result.get("status_code", 500)
+            headers = {"Retry-After": str(result.get("retry_after", 5))} if status_code == 429 else {}
+            status = await _send_json(send, status_code, {
+                "status": "error",
+                "message": result.get("message"),
+                "requestId": request_id
+            }, headers)
+            return
+
+        # El cliente puede pedir el PDF en la misma respuesta: lo sirve la ruta de reportes de Flask
+        if _wants_pdf(scope):
+            environ = _environ(scope, b"", path=result["report_url"], method="GET")
+            loop = asyncio.get_running_loop()
+            status, headers, payload = await loop.run_in_executor(_wsgi_executor(), _call_wsgi, environ)
+            headers = headers + [("X-Request-Id", request_id), ("Content-Location", result["report_url"])]
+            await _send_wsgi_result(send, status, headers, payload)
+            return
+
+        status = await _send_json(send, 200, {
+            "status": "success",
+            "version": "2.2.1",
+            "report_url": result["report_url"],
+            "requestId": request_id
+        })
+    except Exception as e:
+        log.error("critical_error", "🛑 Error Crítico", request_id, error=str(e))
+        status = await _send_json(send, 500, {"status": "error", "message": "Fallo interno de sistema.", "requestId": request_id})
+    finally:
+        metrics.inc("kontify_submissions_total", route="submit", status=status)
+
+async def _start_stream(send):
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream; charset=utf-8"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no") # Evita que un proxy acumule el stream
+    ] + _CORS})
+
+async def _send_chunk(send, chunk):
+    """Envía un fragmento del stream SSE. Retorna False si el cliente se desconectó."""
+    try:
+        await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    except OSError:
+        return False
+    return True
+
+async def _job_stream(send, request_id, accepted):
+    """Modo async (como server._job_stream): sondea el trabajo sin ocupar un hilo entre vistazos."""
+    deadline = time.monotonic() + SSE_JOB_WAIT_SECONDS
+    last_event = time.monotonic()
+    stage = None
+    while time.monotonic() < deadline:
+        event, stage = await asyncio.to_thread(_job_poll, request_id, stage)
+        chunk = None
+        if event:
+            chunk = _sse(*event)
+            last_event = time.monotonic()
+        elif time.monotonic() - last_event >= SSE_HEARTBEAT_SECONDS:
+            chunk = ": keep-alive\n\n"
+            last_event = time.monotonic()
+        if chunk and not await _send_chunk(send, chunk):
+            return # Cliente desconectado: el trabajo sigue en la cola
+        if event and event[0] == "result":
+            break
+        await asyncio.sleep(SSE_JOB_POLL_SECONDS)
+    else:
+        # El trabajo sigue en la cola: el cliente continúa con status_url
+        if not await _send_chunk(send, _sse("result", accepted)):
+            return
+    await send({"type": "http.response.body", "body": b""})
+
+async def _submit_stream(scope, receive, send):
+    """Misma secuencia de eventos SSE que server.submit_quiz_stream ('stage', 'partial', 'result')."""
+    request_id = str(uuid.uuid4())[:8]
+    body = await _read_body(receive)
+    if body is None:
+        status = await _too_large(send, request_id)
+        metrics.inc("kontify_submissions_total", route="stream", status=status)
+        return
+    data = _parse_json(body)
+    if not data:
+        status = await _send_json(send, 400, {"status": "error", "message": "Solicitud JSON vacía.", "requestId": request_id})
+        metrics.inc("kontify_submissions_total", route="stream", status=status)
+        return
+
+    lead, error_msg = _prepare_submission(data, request_id)
+    if error_msg:
+        status = await _send_json(send, 400, {"status": "error", "message": error_msg, "requestId": request_id})
+        metrics.inc("kontify_submissions_total", route="stream", status=status)
+        return
+
+    host_url = _host_url(scope)
+
+    if SUBMIT_MODE == "async":
+        # El pipeline lo corre tools.worker: el stream sigue las etapas del trabajo en job_queue
+        accepted = await asyncio.to_thread(_enqueue_submission, lead, request_id, host_url)
+        metrics.inc("kontify_submissions_total", route="stream", status=202)
+        await _start_stream(send)
+        if await _send_chunk(send, _sse("stage", {"stage": "validated", "requestId": request_id})):
+            await _job_stream(send, request_id, accepted)
+        return
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def _emit(item):
+        # on_stage del PDF llega desde un hilo del executor
+        loop.call_soon_threadsafe(events.put_nowait, item)
+
+    async def _run_pipeline():
+        # El pipeline es su propia tarea: si el navegador se desconecta, el lead se procesa igual
+        try:
+            result = await aprocess_submission(
+                lead, request_id, host_url, lead.file_token,
+                on_stage=lambda stage: _emit(("stage", {"stage": stage, "requestId": request_id})),
+                on_partial=lambda partial: _emit(("partial", partial))
+            )
+        except Exception as e:
+            log.error("critical_error", "🛑 Error Crítico", request_id, error=str(e))
+            result = {"status": "error", "message": "Fallo interno de sistema.", "status_code": 500}
+
+        metrics.inc("kontify_submissions_total", route="stream", status=result.get("status_code", 200))
+        _emit(("result", _stream_result(result, request_id)))
+        _emit(None)
+
+    task = asyncio.ensure_future(_run_pipeline())
+    _streams.add(task)
+    task.add_done_callback(_streams.discard)
+
+    await _start_stream(send)
+    chunk = _sse("stage", {"stage": "validated", "requestId": request_id})
+    while chunk is not None:
+        if not await _send_chunk(send, chunk):
+            return # Cliente desconectado: la tarea del pipeline sigue
+        try:
+            item = await asyncio.wait_for(events.get(), SSE_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            chunk = ": keep-alive\n\n"
+            continue
+        chunk = _sse(*item) if item is not None else None
+    await send({"type": "http.response.body", "body": b""})
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=ASGI_BLOCKING_THREADS, thread_name_prefix="asyncio")
+            )
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_http.client().aclose()
+            metrics.flush()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+_NATIVE_ROUTES = {
+    ("POST", "/api/submit"): _submit,
+    ("POST", "/api/submit/stream"): _submit_stream
+}
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    handler = _NATIVE_ROUTES.get((scope["method"], scope["path"]), _wsgi)
+    await handler(scope, receive, send)
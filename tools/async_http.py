@@ -0,0 +1,177 @@
+import os
+import ssl
+import json
+import asyncio
+import weakref
+from urllib.parse import urlsplit
+
+# Cliente HTTP/1.1 mínimo sobre asyncio (streams) para los canales de notificación de la variante
+# ASGI: conexiones keep-alive por host reutilizadas entre solicitudes, sin dependencias nuevas
+# (aiohttp/httpx no están en requirements.txt). Cubre lo que usan Slack y SendGrid: POST/GET con
+# cuerpo JSON y respuestas con Content-Length, chunked o hasta cierre.
+ASYNC_HTTP_MAX_IDLE_PER_HOST = int(os.getenv("ASYNC_HTTP_MAX_IDLE_PER_HOST", 8))
+_MAX_HEADER_LINES = 100
+
+class AsyncHTTPError(Exception):
+    def __init__(self, status, body):
+        super().__init__(f"HTTP {status}: {body[:200]!r}")
+        self.status = status
+        self.body = body
+
+class _StaleConnection(Exception):
+    """Conexión keep-alive reutilizada que el servidor ya había cerrado (nada se procesó)."""
+
+class AsyncResponse:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers # nombres en minúsculas
+        self.body = body
+
+    @property
+    def status_code(self):
+        return self.status
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise AsyncHTTPError(self.status, self.body)
+
+async def _read_body(reader, headers):
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        parts = []
+        while True:
+            size = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Trailers opcionales hasta la línea vacía
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(parts), True
+            parts.append(await reader.readexactly(size))
+            await reader.readline()
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"])), True
+    return await reader.read(), False # Sin longitud: el servidor cierra al terminar
+
+class AsyncHTTPClient:
+    def __init__(self, max_idle_per_host=None):
+        self.max_idle_per_host = max_idle_per_host or ASYNC_HTTP_MAX_IDLE_PER_HOST
+        self._idle = {} # (scheme, host, port) -> [(reader, writer)]
+        self._ssl = None
+        self.connects = 0
+        self.requests = 0
+
+    async def _open(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        context = None
+        if scheme == "https":
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            context = self._ssl
+        reader, writer = await asyncio.open_connection(host, port, ssl=context)
+        self.connects += 1
+        return reader, writer, False
+
+    def _release(self, key, reader, writer, reusable):
+        idle = self._idle.setdefault(key, [])
+        if reusable and len(idle) < self.max_idle_per_host:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def _exchange(self, key, request, method):
+        reader, writer, reused = await self._open(key)
+        try:
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+            except (ConnectionResetError, BrokenPipeError):
+                if reused:
+                    raise _StaleConnection()
+                raise
+            if not status_line:
+                if reused:
+                    raise _StaleConnection()
+                raise ConnectionResetError("El servidor cerró la conexión")
+            status = int(status_line.split()[1])
+            headers = {}
+            for _ in range(_MAX_HEADER_LINES):
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if method == "HEAD" or status in (204, 304):
+                body, framed = b"", True
+            else:
+                body, framed = await _read_body(reader, headers)
+        except BaseException:
+            writer.close()
+            raise
+        self._release(key, reader, writer, framed and headers.get("connection", "").lower() != "close")
+        return AsyncResponse(status, headers, body)
+
+    async def request(self, method, url, json_body=None, headers=None, timeout=10):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        body = b""
+        all_headers = {"Host": parts.netloc, "User-Agent": "kontify-brain", "Accept": "*/*"}
+        if json_body is not None:
+            body = json.dumps(json_body, ensure_ascii=False).encode("utf-8")
+            all_headers["Content-Type"] = "application/json"
+        all_headers.update(headers or {})
+        all_headers["Content-Length"] = str(len(body))
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+        head = f"{method} {target} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in all_headers.items()) + "\r\n"
+        request = head.encode("latin-1") + body
+        self.requests += 1
+        try:
+            return await asyncio.wait_for(self._exchange(key, request, method), timeout)
+        except _StaleConnection:
+            # El servidor cerró la conexión ociosa antes de leer la petición: se repite con una nueva
+            self._drop_idle(key)
+            return await asyncio.wait_for(self._exchange(key, request, method), timeout)
+
+    async def post(self, url, json=None, headers=None, timeout=10):
+        return await self.request("POST", url, json_body=json, headers=headers, timeout=timeout)
+
+    async def get(self, url, headers=None, timeout=10):
+        return await self.request("GET", url, headers=headers, timeout=timeout)
+
+    def _drop_idle(self, key):
+        for _, writer in self._idle.pop(key, []):
+            writer.close()
+
+    async def aclose(self):
+        for key in list(self._idle):
+            self._drop_idle(key)
+
+    def stats(self):
+        return {
+            "connects": self.connects,
+            "requests": self.requests,
+            "idle": sum(len(conns) for conns in self._idle.values())
+        }
+
+_clients = weakref.WeakKeyDictionary()
+
+def client():
+    """Cliente del event loop en curso (las conexiones pertenecen a un loop y no sobreviven un fork)."""
+    loop = asyncio.get_running_loop()
+    instance = _clients.get(loop)
+    if instance is None:
+        instance = _clients[loop] = AsyncHTTPClient()
+    return instance
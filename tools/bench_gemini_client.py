@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import threading
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+import google.generativeai as genai
+from google.generativeai import client as genai_client
+from dotenv import load_dotenv
+
+from gemini_client import GeminiClientManager
+from ai_providers import StubProvider
+from prompt_builder import get_prompt_prefix
+
+# Benchmark offline (sin red): costo de preparar el cliente por solicitud y efecto del tope de concurrencia.
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def bench_setup_overhead(iterations):
+    """Patrón anterior (load_dotenv + configure + GenerativeModel + cliente nuevo) vs handle tibio."""
+    os.environ.setdefault("GEMINI_API_KEY", "bench-fake-key")
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        load_dotenv()
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+        genai.GenerativeModel('gemini-2.0-flash')
+        genai_client.get_default_generative_client() # Se crea el cliente/canal que usaría generate_content
+    legacy_us = (time.perf_counter() - start) / iterations * 1e6
+
+    manager = GeminiClientManager()
+    manager.ensure_configured()
+    manager.get_model('gemini-2.0-flash')
+    genai_client.get_default_generative_client()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        manager.ensure_configured()
+        manager.get_model('gemini-2.0-flash')
+        genai_client.get_default_generative_client()
+    warm_us = (time.perf_counter() - start) / iterations * 1e6
+
+    return {"iterations": iterations, "legacy_us_per_request": round(legacy_us, 2), "warm_us_per_request": round(warm_us, 2)}
+
+def bench_concurrency(caps, clients, requests_per_client, latency_ms):
+    """Dispara `clients` hilos contra un proveedor falso con latencia fija, para cada tope de concurrencia."""
+    prefix = get_prompt_prefix("constructora")
+    results = []
+    for cap in caps:
+        manager = GeminiClientManager(max_concurrency=cap, slot_timeout=600)
+        provider = StubProvider(latency=latency_ms / 1000)
+        latencies = []
+        lock = threading.Lock()
+
+        def _client(idx):
+            for n in range(requests_per_client):
+                t0 = time.perf_counter()
+                with manager.slot():
+                    provider.generate(prefix, f"lead {idx}-{n}")
+                with lock:
+                    latencies.append(time.perf_counter() - t0)
+
+        threads = [threading.Thread(target=_client, args=(i,)) for i in range(clients)]
+        start = time.perf_counter()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        elapsed = time.perf_counter() - start
+
+        stats = manager.stats()
+        results.append({
+            "max_concurrency": cap,
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+            "avg_slot_wait_ms": stats["avg_wait_ms"]
+        })
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del cliente Gemini compartido contra un proveedor falso.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--caps", default="1,2,4,8,16")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=5, help="Solicitudes por cliente.")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON (para comparar entre commits).")
+    args = parser.parse_args()
+
+    report = {
+        "setup_overhead": bench_setup_overhead(args.iterations),
+        "concurrency": bench_concurrency([int(c) for c in args.caps.split(',')], args.clients, args.requests, args.latency_ms)
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        s = report["setup_overhead"]
+        print(f"🔌 Preparación por solicitud: anterior={s['legacy_us_per_request']}µs | cliente tibio={s['warm_us_per_request']}µs")
+        for r in report["concurrency"]:
+            print(f"⚙️ cap={r['max_concurrency']:>3} | {r['throughput_rps']:>8} req/s | p50={r['p50_ms']}ms | p95={r['p95_ms']}ms | espera slot={r['avg_slot_wait_ms']}ms")
@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import argparse
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from fake_services import FakeServices, build_profiles
+from load_generator import run_config, parse_configs
+
+# Benchmark de la configuración de gunicorn (gunicorn.conf.py): misma carga de /api/submit contra
+# servicios falsos con latencias realistas, variando la clase de worker, workers x hilos y preload_app.
+# Recomienda la configuración de menor memoria cuyo throughput queda dentro de --tolerance del mejor
+# sin errores; de aquí salen los valores por defecto de gunicorn.conf.py.
+# "asgi" es la variante asyncio (tools/asgi_app.py, worker asgi de gunicorn): los hilos no aplican
+DEFAULT_MATRIX = "sync:3x1,gthread:1x16,gthread:2x8,gthread:2x16,gthread:4x8,asgi:1x1"
+# Latencias de producción aproximadas: Gemini domina, Sheets y Slack en cientos de ms
+DEFAULT_PROFILES = ["gemini:latency=1500", "sheets:latency=300", "slack:latency=150", "sendgrid:latency=200"]
+
+def parse_matrix(spec):
+    """'sync:3x1,2x8' -> [('sync', 3, 1), ('gthread', 2, 8)]"""
+    matrix = []
+    for item in spec.split(","):
+        worker_class, _, shape = item.rpartition(":")
+        (workers, threads), = parse_configs(shape)
+        matrix.append((worker_class or "gthread", workers, threads))
+    return matrix
+
+def recommend(runs, tolerance=0.97):
+    """La de menor memoria entre las que no fallaron y rinden al menos `tolerance` del mejor throughput."""
+    clean = [r for r in runs if set(r["statuses"]) == {"200"}] or runs
+    best = max(r["throughput_per_min"] for r in clean)
+    candidates = [r for r in clean if r["throughput_per_min"] >= best * tolerance]
+    return min(candidates, key=lambda r: (r["memory_mb"] or 0, r["p95_ms"]))
+
+def run_matrix(matrix, rpm, duration, concurrency, profiles, compare_preload=True):
+    fake = FakeServices(build_profiles(profiles)).start()
+    try:
+        runs = [run_config(w, t, fake, rpm, duration, concurrency, worker_class=k) for k, w, t in matrix]
+        choice = recommend(runs)
+        preload = None
+        if compare_preload:
+            # Misma configuración sin preload_app: cuánto ahorra cargar los activos una vez en el master
+            off = run_config(choice["workers"], choice["threads"], fake, rpm, duration, concurrency,
+                             extra_env={"GUNICORN_PRELOAD": "0"}, worker_class=choice["worker_class"])
+            preload = {"on_mb": choice["memory_mb"], "off_mb": off["memory_mb"],
+                       "off_p95_ms": off["p95_ms"], "off_statuses": off["statuses"]}
+        return {"cores": os.cpu_count(), "rpm": rpm, "duration": duration, "profiles": profiles,
+                "runs": runs, "recommended": choice, "preload": preload, "fake_services": fake.stats()}
+    finally:
+        fake.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara clases de worker y workers x hilos de gunicorn.conf.py.")
+    parser.add_argument("--matrix", default=DEFAULT_MATRIX, help="Configuraciones clase:workersxhilos separadas por coma.")
+    parser.add_argument("--rpm", type=int, default=240, help="Peticiones por minuto.")
+    parser.add_argument("--duration", type=float, default=45, help="Segundos de carga por configuración.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Peticiones en vuelo máximas del cliente.")
+    parser.add_argument("--profile", action="append", default=None, help="Perfil de servicio falso (ver fake_services.py).")
+    parser.add_argument("--no-preload-compare", action="store_true", help="Omite la corrida sin preload_app.")
+    parser.add_argument("--json", action="store_true", help="Salida JSON.")
+    args = parser.parse_args()
+
+    report = run_matrix(parse_matrix(args.matrix), args.rpm, args.duration, args.concurrency,
+                        args.profile or DEFAULT_PROFILES, not args.no_preload_compare)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"🦄 gunicorn: {args.rpm} req/min durante {args.duration:g}s ({report['cores']} núcleo(s))")
+        for r in report["runs"]:
+            label = f"{r['worker_class']}:{r['workers']}x{r['threads']}"
+            print(f"   {label:<14} {r['throughput_per_min']:>7}/min  p50={r['p50_ms']:>8} ms  p95={r['p95_ms']:>8} ms"
+                  f"  p99={r['p99_ms']:>8} ms  mem={r['memory_mb']} MB  {r['statuses']}")
+        choice = report["recommended"]
+        print(f"   ✅ Recomendada: {choice['worker_class']}:{choice['workers']}x{choice['threads']}")
+        if report["preload"]:
+            p = report["preload"]
+            print(f"   preload_app: {p['on_mb']} MB con preload vs {p['off_mb']} MB sin preload")
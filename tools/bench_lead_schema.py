@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import time
+import copy
+import argparse
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from lead_schema import parse_submission
+
+# Benchmark de validación del submit: flujo anterior (normalización en server.py, dict(data) y otra
+# normalización en process_diagnostic.py + conteo de respondidas) vs parse_submission en una pasada.
+
+def legacy_normalize(raw_responses):
+    normalized = []
+    if isinstance(raw_responses, list):
+        for item in raw_responses:
+            if isinstance(item, dict):
+                q = item.get('question') or item.get('q') or item.get('text')
+                if not q:
+                    q_index = item.get('q_index') or item.get('num') or item.get('id')
+                    if q_index is not None:
+                        q = f"Q{q_index}"
+                a = item.get('answer') or item.get('a') or item.get('response') or item.get('value')
+                if q or a is not None:
+                    entry = {
+                        "question": str(q).strip() if q else "N/A",
+                        "answer": str(a).strip() if a is not None else "N/A"
+                    }
+                    if item.get('q_index') is not None:
+                        entry["q_index"] = item.get('q_index')
+                    if item.get('category_id') or item.get('cat'):
+                        entry["category_id"] = item.get('category_id') or item.get('cat')
+                    normalized.append(entry)
+            elif isinstance(item, str):
+                normalized.append({"question": item.strip(), "answer": "N/A"})
+    return normalized
+
+def legacy_flow(data):
+    lead_meta = data.get('lead_metadata') or data.get('leadMetadata', {})
+    rfc_raw = None
+    for key in ['rfc', 'RFC']:
+        rfc_raw = lead_meta.get(key)
+        if rfc_raw: break
+    if not rfc_raw: rfc_raw = data.get('rfc')
+    rfc = str(rfc_raw).replace('-', '').replace(' ', '').upper() if rfc_raw else None
+    giro = lead_meta.get('main_activity') or lead_meta.get('activity')
+    company_name_raw = lead_meta.get('company_name', 'Lead_Report')
+    company_name = "".join(c for c in str(company_name_raw) if c.isalnum() or c == ' ').strip().replace(' ', '_')
+    lead_meta['company'] = company_name_raw
+    lead_meta['rfc'] = rfc
+    lead_meta['activity'] = giro
+    responses = legacy_normalize(data.get('responses', []))
+    data_for_ai = dict(data)
+    data_for_ai['responses'] = responses
+    data_for_ai['lead_metadata'] = lead_meta
+    # process_diagnostic.run_diagnostic
+    responses = legacy_normalize(data_for_ai.get('responses', []))
+    filled = [r for r in responses if str(r.get("answer", "")).strip() and str(r.get("answer", "")).strip().upper() != "N/A"]
+    return company_name, responses, len(filled)
+
+def sample_payload(responses, shape="canonical"):
+    if shape == "canonical":
+        items = [{"question": f"¿Control interno {i} documentado ante el SAT?", "answer": "NO" if i % 3 else "SÍ",
+                  "q_index": i, "category_id": f"cat{i % 6}"} for i in range(responses)]
+    else: # Forma libre: llaves cortas del cuestionario antiguo
+        items = [{"q": f"¿Control interno {i}?", "a": "NO" if i % 3 else "SÍ", "cat": f"cat{i % 6}"} for i in range(responses)]
+    return {
+        "lead_metadata": {
+            "company_name": "Constructora Peña, S.A. de C.V.", "niche_id": "constructora", "billing_range": "50M - 100M",
+            "rfc": "CPE-010203-XY1", "main_activity": "Construcción",
+            "financial_data": {"sales": "90M", "profit": "15M", "assets": "50,000,000", "liabilities": "10,000,000"}
+        },
+        "responses": items
+    }
+
+def _timeit(fn, payload, rounds):
+    copies = [copy.deepcopy(payload) for _ in range(rounds)] # Ambos flujos reciben un payload recién parseado
+    start = time.perf_counter()
+    for data in copies:
+        fn(data)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validación/normalización del submit: flujo anterior vs lead_schema.")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--responses", default="100,300", help="Lista separada por comas.")
+    parser.add_argument("--json", action="store_true", help="Salida JSON.")
+    args = parser.parse_args()
+
+    results = []
+    for count in [int(n) for n in args.responses.split(',')]:
+        for shape in ("canonical", "free_form"):
+            payload = sample_payload(count, shape)
+            lead = parse_submission(copy.deepcopy(payload))
+            company, responses, filled = legacy_flow(copy.deepcopy(payload))
+            assert (lead.file_token, lead.responses, lead.answered) == (company, responses, filled)
+            legacy_us = _timeit(legacy_flow, payload, args.rounds)
+            single_us = _timeit(parse_submission, payload, args.rounds)
+            results.append({"responses": count, "shape": shape, "legacy_us": round(legacy_us, 1),
+                            "single_pass_us": round(single_us, 1), "speedup": round(legacy_us / single_us, 2)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"🧾 Validación del submit ({args.rounds} rondas)")
+        for r in results:
+            print(f"   {r['responses']:>4} respuestas {r['shape']:<10} {r['legacy_us']:>9} µs -> {r['single_pass_us']:>8} µs  x{r['speedup']}")
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from pdf_generator_v2 import render_pdf_bytes
+from pdf_service import PDFRenderService, count_pages
+
+# Benchmark de render de PDF: en línea (un proceso, como antes) vs pool de procesos por número de workers.
+
+def sample_report(responses=66):
+    return {
+        "lead_metadata": {
+            "company_name": "Constructora Peña S.A.",
+            "rfc": "CPE010203XY1",
+            "main_activity": "Construcción",
+            "billing_range": "50M - 100M",
+            "financial_data": {"sales": "90M", "profit": "15M", "assets": "50,000,000", "liabilities": "10,000,000"}
+        },
+        "risk_assessment": {"overall_risk_score": 78, "risk_level": "RIESGO CRÍTICO"},
+        "sales_pitch": "Se recomienda blindaje patrimonial inmediato mediante PropCo y REPSE.",
+        "markdown_content": "### Hallazgos\n" + "\n".join(f"- Hallazgo técnico {i}: exposición fiscal y laboral." for i in range(12)),
+        "responses": [
+            {"question": f"¿Cuenta con el control interno número {i} documentado y vigente ante el SAT?", "answer": "NO" if i % 3 else "SÍ"}
+            for i in range(responses)
+        ]
+    }
+
+def bench_inline(reports, doc):
+    start = time.perf_counter()
+    pages = sum(count_pages(render_pdf_bytes(doc)) for _ in range(reports))
+    elapsed = time.perf_counter() - start
+    return {"mode": "inline", "workers": 1, "reports": reports, "seconds": round(elapsed, 3),
+            "reports_per_sec": round(reports / elapsed, 2), "pages_per_sec": round(pages / elapsed, 2)}
+
+def bench_pool(workers, reports, doc):
+    service = PDFRenderService(workers=workers, max_queue=reports)
+    service.start() # Arranque y calentamiento fuera de la medición
+    start = time.perf_counter()
+    futures = [service.submit(doc) for _ in range(reports)]
+    pages = sum(count_pages(f.result()) for f in futures)
+    elapsed = time.perf_counter() - start
+    service.shutdown()
+    return {"mode": "pool", "workers": workers, "reports": reports, "seconds": round(elapsed, 3),
+            "reports_per_sec": round(reports / elapsed, 2), "pages_per_sec": round(pages / elapsed, 2)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Páginas/seg de render de PDF en línea vs pool de procesos.")
+    parser.add_argument("--reports", type=int, default=40)
+    parser.add_argument("--responses", type=int, default=66, help="Respuestas por reporte (define el número de páginas).")
+    parser.add_argument("--workers", default=None, help="Lista separada por comas (default: 1,2,4,... hasta los núcleos).")
+    parser.add_argument("--json", action="store_true", help="Salida JSON.")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(',')]
+    else:
+        worker_counts = sorted({1, cores} | {2 ** i for i in range(1, 6) if 2 ** i < cores})
+
+    doc = sample_report(args.responses)
+    results = {"cores": cores, "runs": [bench_inline(args.reports, doc)] + [bench_pool(w, args.reports, doc) for w in worker_counts]}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"🖨️ Render de PDF ({args.reports} reportes, {args.responses} respuestas c/u, {cores} núcleo(s))")
+        for run in results["runs"]:
+            print(f"   {run['mode']:<7} workers={run['workers']:<3} {run['pages_per_sec']:>8} páginas/s  {run['reports_per_sec']:>7} reportes/s")
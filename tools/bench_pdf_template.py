@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from pdf_generator_v2 import DiagnosticPDF, render_pdf_bytes
+from pdf_service import count_pages
+from bench_pdf_pool import sample_report
+
+# Benchmark del chrome precalculado (pdf_template): tiempo por reporte y tamaño del PDF,
+# dibujo clásico (rect/line por página y por segmento del gauge) vs plantilla.
+
+def bench(use_template, reports, doc):
+    render_pdf_bytes(doc, use_template) # Calentamiento (imports, fuentes, chrome del proceso)
+    timings = []
+    for _ in range(reports):
+        start = time.perf_counter()
+        pdf = render_pdf_bytes(doc, use_template)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "mode": "template" if use_template else "legacy",
+        "reports": reports,
+        "pages": count_pages(pdf),
+        "bytes": len(pdf),
+        "avg_ms": round(sum(timings) / reports * 1000, 2),
+        "p50_ms": round(timings[reports // 2] * 1000, 2),
+        "p95_ms": round(timings[min(reports - 1, int(reports * 0.95))] * 1000, 2)
+    }
+
+def bench_chrome(use_template, pages):
+    """Solo el chrome: header + gauge + footer por página, sin el contenido del lead."""
+    pdf = DiagnosticPDF(use_template=use_template)
+    pdf.alias_nb_pages()
+    start = time.perf_counter()
+    for _ in range(pages):
+        pdf.add_page() # Cierra la página anterior (footer) y dibuja el header
+        pdf.draw_gauge(170, 60, 78)
+    return round((time.perf_counter() - start) / pages * 1000, 3)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render de PDF con chrome clásico vs plantilla precalculada.")
+    parser.add_argument("--reports", type=int, default=50)
+    parser.add_argument("--responses", type=int, default=66, help="Respuestas por reporte (define el número de páginas).")
+    parser.add_argument("--json", action="store_true", help="Salida JSON.")
+    args = parser.parse_args()
+
+    doc = sample_report(args.responses)
+    legacy = bench(False, args.reports, doc)
+    template = bench(True, args.reports, doc)
+    legacy["chrome_ms_per_page"] = bench_chrome(False, args.reports * 5)
+    template["chrome_ms_per_page"] = bench_chrome(True, args.reports * 5)
+    results = {
+        "runs": [legacy, template],
+        "speedup": round(legacy["avg_ms"] / template["avg_ms"], 2),
+        "bytes_saved": legacy["bytes"] - template["bytes"]
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"🖨️ Chrome de PDF ({args.reports} reportes, {args.responses} respuestas c/u)")
+        for run in results["runs"]:
+            print(f"   {run['mode']:<9} {run['avg_ms']:>8} ms/reporte (p95 {run['p95_ms']} ms)  {run['bytes']:>8} bytes  {run['pages']} páginas  (chrome {run['chrome_ms_per_page']} ms/página)")
+        print(f"⚡ Speedup: x{results['speedup']} | 📦 Ahorro: {results['bytes_saved']} bytes por reporte")
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import resource
+import tempfile
+import platform
+import argparse
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+# Suite de benchmarks offline del submit completo: ningún servicio externo se toca.
+# Gemini -> StubProvider, Slack/Sheets/SendGrid -> handlers en proceso con latencia fija, limitador y
+# outbox en SQLite temporales. Leads sintéticos para los cinco nichos con el tamaño real de cada
+# cuestionario. Reporta p50/p95/p99, throughput y RSS pico en JSON para comparar entre commits
+# (--output guarda la corrida, --baseline compara contra una anterior).
+
+BENCHMARKS = ("get_questions", "parse_submission", "run_diagnostic", "generate_pdf_final", "submit_quiz")
+
+def percentile(sorted_values, pct):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss: KB en Linux, bytes en macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def summarize(name, latencies, wall_seconds, **extra):
+    ordered = sorted(latencies)
+    result = {
+        "name": name,
+        "iterations": len(ordered),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "throughput_per_s": round(len(ordered) / wall_seconds, 2) if wall_seconds else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+        "children_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    }
+    result.update(extra)
+    return result
+
+def synthetic_lead(niche_id, questions, rng):
+    """Lead con la forma que envía el frontend: datos maestros + una respuesta por pregunta del catálogo."""
+    rfc = "".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(3)) + f"{rng.randrange(10 ** 6):06d}" + "XY1"
+    return {
+        "lead_metadata": {
+            "company_name": f"Empresa {niche_id.title()} {rng.randrange(10 ** 6)} S.A. de C.V.",
+            "contact_name": "Ing. Ana Pérez", "contact_role": "Directora de Finanzas",
+            "contact_email": "ana.perez@example.com", "contact_phone": "5512345678",
+            "niche_id": niche_id, "billing_range": rng.choice(["10M - 50M", "50M - 100M", "100M+"]),
+            "rfc": rfc, "main_activity": f"Actividad principal de {niche_id}",
+            "financial_data": {"sales": "90M", "profit": "15M", "assets": "50,000,000", "liabilities": "10,000,000"}
+        },
+        "responses": [
+            {"question": q["q"], "answer": rng.choice(q.get("options") or ["SÍ", "NO"]), "q_index": q.get("num"), "category_id": q.get("cat")}
+            for q in questions
+        ]
+    }
+
+class _Patches:
+    def __init__(self):
+        self._undo = []
+
+    def set(self, obj, attr, value):
+        self._undo.append((obj, attr, getattr(obj, attr)))
+        setattr(obj, attr, value)
+
+    def setenv(self, name, value):
+        self._undo.append((os.environ, name, os.environ.get(name)))
+        os.environ[name] = value
+
+    def restore(self):
+        for obj, attr, value in reversed(self._undo):
+            if obj is os.environ:
+                if value is None:
+                    os.environ.pop(attr, None)
+                else:
+                    os.environ[attr] = value
+            else:
+                setattr(obj, attr, value)
+        self._undo = []
+
+def _fake_channel(latency, sent):
+    def handler(payloads):
+        if latency:
+            time.sleep(latency)
+        sent.append(len(payloads))
+    return handler
+
+@contextlib.contextmanager
+def offline_environment(workdir, ai_latency=0.0, channel_latency=0.0):
+    """Sustituye en caliente todo lo externo (se puede usar en el mismo proceso que las pruebas)."""
+    import server
+    import pipeline
+    import notificator
+    import process_diagnostic
+    from ai_providers import StubProvider, set_provider
+    from outbox import Outbox, Channel
+    from rate_limiter import AdmissionController
+    from metrics import metrics
+    from structured_log import log
+
+    patches = _Patches()
+    sent = []
+    box = Outbox(db_path=os.path.join(workdir, "outbox.sqlite3"))
+    for name in ("slack", "sheets", "email"):
+        box.register(Channel(name, _fake_channel(channel_latency, sent)))
+    # Sin hilo despachador: Slack/email se entregan en línea (NOTIFY_INLINE_DELIVERY) y Sheets con drain()
+    box.start = lambda: None
+    reports_dir = os.path.join(workdir, "reports")
+    log_level = log.logger.level
+    try:
+        set_provider(StubProvider(latency=ai_latency))
+        patches.set(process_diagnostic, "admission", AdmissionController(
+            db_path=os.path.join(workdir, "limiter.sqlite3"), rpm=10 ** 6, burst=10 ** 6, max_in_flight=1000
+        ))
+        patches.set(notificator, "outbox", box)
+        patches.set(notificator.sheets_client, "has_credentials", lambda: True)
+        patches.setenv("SLACK_WEBHOOK_URL", "http://fake.invalid/hook")
+        patches.setenv("SENDGRID_API_KEY", "SG.fake")
+        patches.set(pipeline, "REPORTS_DIR", reports_dir)
+        patches.set(server, "REPORTS_DIR", reports_dir)
+        patches.set(metrics, "metrics_dir", os.path.join(workdir, "metrics"))
+        log.logger.setLevel("ERROR") # Los eventos por lead no deben llenar la salida del benchmark
+        yield {"server": server, "outbox": box, "sent": sent, "reports_dir": reports_dir}
+    finally:
+        patches.restore()
+        log.logger.setLevel(log_level)
+        set_provider(None)
+
+def _timed_loop(fn, items):
+    latencies = []
+    start = time.perf_counter()
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - start
+
+def run_suite(iterations=20, concurrency=4, ai_latency=0.0, channel_latency=0.0, only=None, seed=7):
+    from questions_catalog import catalog, NICHE_FILES
+    from lead_schema import parse_submission, as_lead
+    from process_diagnostic import run_diagnostic
+    from pdf_generator_v2 import generate_pdf_final
+    from result_cache import result_cache
+
+    selected = [b for b in BENCHMARKS if not only or b in only]
+    rng = random.Random(seed)
+    niches = list(NICHE_FILES)
+    questions = {niche: catalog.get(niche).questions for niche in niches}
+    leads = [synthetic_lead(niches[i % len(niches)], questions[niches[i % len(niches)]], rng) for i in range(iterations)]
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="kontify-bench-") as workdir, \
+            offline_environment(workdir, ai_latency, channel_latency) as env:
+        client = env["server"].app.test_client()
+        result_cache.clear()
+
+        if "get_questions" in selected:
+            def _get(niche):
+                assert client.get(f"/api/questions/{niche}").status_code == 200
+            latencies, wall = _timed_loop(_get, [niches[i % len(niches)] for i in range(iterations)])
+            results.append(summarize("get_questions", latencies, wall))
+
+        if "parse_submission" in selected:
+            # Sustituye a _normalize_responses: validación + normalización en una pasada (lead_schema)
+            latencies, wall = _timed_loop(parse_submission, [json.loads(json.dumps(lead)) for lead in leads])
+            results.append(summarize("parse_submission", latencies, wall))
+
+        if "run_diagnostic" in selected:
+            parsed = [parse_submission(json.loads(json.dumps(lead))) for lead in leads]
+            latencies, wall = _timed_loop(run_diagnostic, parsed)
+            results.append(summarize("run_diagnostic", latencies, wall))
+            result_cache.clear()
+
+        if "generate_pdf_final" in selected:
+            docs = []
+            for lead in leads:
+                parsed = as_lead(lead)
+                doc = run_diagnostic(parsed)
+                doc.update(responses=parsed.responses, lead_metadata=parsed.lead_metadata)
+                docs.append(doc)
+            pdf_path = os.path.join(workdir, "bench.pdf")
+            latencies, wall = _timed_loop(lambda doc: generate_pdf_final(doc, pdf_path), docs)
+            results.append(summarize("generate_pdf_final", latencies, wall, pdf_bytes=os.path.getsize(pdf_path)))
+            result_cache.clear()
+
+        if "submit_quiz" in selected:
+            def _submit(lead):
+                t0 = time.perf_counter()
+                res = client.post("/api/submit", json=lead)
+                return time.perf_counter() - t0, res.status_code
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(_submit, leads))
+            wall = time.perf_counter() - start
+            statuses = {}
+            for _, status in outcomes:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            env["outbox"].drain()
+            results.append(summarize("submit_quiz", [o[0] for o in outcomes], wall,
+                                     concurrency=concurrency, statuses=statuses, side_effects=sum(env["sent"])))
+            result_cache.clear()
+
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(tools_dir), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def compare(report, baseline, max_regression):
+    """Razón p95 actual / p95 base por benchmark; regresión si supera max_regression."""
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    rows = []
+    for r in report["results"]:
+        base = previous.get(r["name"])
+        if not base or not base["p95_ms"]:
+            continue
+        ratio = round(r["p95_ms"] / base["p95_ms"], 2)
+        rows.append({"name": r["name"], "baseline_p95_ms": base["p95_ms"], "p95_ms": r["p95_ms"],
+                     "ratio": ratio, "regression": ratio > max_regression})
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks offline del submit (IA, CRM y correo simulados).")
+    parser.add_argument("--iterations", type=int, default=20, help="Leads sintéticos por benchmark (rotan entre los 5 nichos).")
+    parser.add_argument("--concurrency", type=int, default=4, help="Hilos cliente para submit_quiz.")
+    parser.add_argument("--ai-latency-ms", type=float, default=0, help="Latencia simulada del modelo.")
+    parser.add_argument("--channel-latency-ms", type=float, default=0, help="Latencia simulada de Slack/Sheets/SendGrid.")
+    parser.add_argument("--only", default=None, help=f"Lista separada por comas de: {','.join(BENCHMARKS)}.")
+    parser.add_argument("--output", default=None, help="Guarda el reporte JSON en este archivo.")
+    parser.add_argument("--baseline", default=None, help="Reporte JSON previo para comparar p95.")
+    parser.add_argument("--max-regression", type=float, default=1.25, help="Razón p95 a partir de la cual se marca regresión.")
+    parser.add_argument("--json", action="store_true", help="Salida JSON.")
+    args = parser.parse_args()
+
+    # Los prints de los módulos (catálogo, pool de PDF, outbox) no se mezclan con el reporte
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = run_suite(
+            args.iterations, args.concurrency, args.ai_latency_ms / 1000, args.channel_latency_ms / 1000,
+            args.only.split(',') if args.only else None
+        )
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {"iterations": args.iterations, "concurrency": args.concurrency,
+                   "ai_latency_ms": args.ai_latency_ms, "channel_latency_ms": args.channel_latency_ms},
+        "results": results
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.max_regression)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"🧪 Pipeline offline ({args.iterations} leads, commit {report['commit']}, {report['cpu_count']} núcleo(s))")
+        for r in results:
+            print(f"   {r['name']:<19} p50={r['p50_ms']:>9} ms  p95={r['p95_ms']:>9} ms  p99={r['p99_ms']:>9} ms"
+                  f"  {r['throughput_per_s']:>8}/s  RSS {r['peak_rss_mb']} MB")
+        for row in report.get("comparison", []):
+            flag = "🔴" if row["regression"] else "🟢"
+            print(f"   {flag} {row['name']:<19} p95 {row['baseline_p95_ms']} -> {row['p95_ms']} ms (x{row['ratio']})")
+    if any(row["regression"] for row in report.get("comparison", [])):
+        sys.exit(1)
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from structured_log import LogPipeline
+from bench_lead_schema import sample_payload
+
+# Benchmark del costo de logging en el hilo de la solicitud: flujo anterior (print síncrono del payload
+# completo + last_payload.json reescrito en cada lead + prints por etapa) vs LogPipeline con muestreo.
+
+STAGE_EVENTS = ("lead_validated", "crm_sync_started", "outbox_enqueued", "notified", "crm_synced")
+
+def legacy_request(payload, request_id, out, workdir):
+    print(json.dumps({"requestId": request_id, "payload_for_gemini": payload}, ensure_ascii=False), file=out)
+    with open(os.path.join(workdir, 'last_payload.json'), 'w', encoding='utf-8') as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    for event in STAGE_EVENTS:
+        print(f"[{request_id}] {event}", file=out)
+    out.flush()
+
+def structured_request(log, payload, request_id):
+    log.payload("payload_for_gemini", payload, request_id)
+    log.payload("gemini_prompt", payload, request_id)
+    for event in STAGE_EVENTS:
+        log.info(event, "", request_id)
+
+def run(requests=2000, responses=100, sample_rate=0.05):
+    payload = sample_payload(responses)
+    with open(os.devnull, 'w', encoding='utf-8') as out, tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        for i in range(requests):
+            legacy_request(payload, f"{i:08x}", out, workdir)
+        legacy_us = (time.perf_counter() - start) / requests * 1e6
+
+        log = LogPipeline(stream=out, sample_rate=sample_rate)
+        start = time.perf_counter()
+        for i in range(requests):
+            structured_request(log, payload, f"{i:08x}")
+        structured_us = (time.perf_counter() - start) / requests * 1e6
+        log.flush()
+        drained_us = (time.perf_counter() - start) / requests * 1e6
+        stats = log.stats()
+        log.stop()
+    return {
+        "requests": requests, "responses": responses, "sample_rate": sample_rate,
+        "legacy_us": round(legacy_us, 1), "request_path_us": round(structured_us, 1),
+        "incl_writer_us": round(drained_us, 1), "speedup": round(legacy_us / structured_us, 2),
+        "payloads_logged": stats["payloads_logged"], "dropped": stats["dropped"]
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Costo de logging por solicitud: prints síncronos vs structured_log.")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--responses", type=int, default=100)
+    parser.add_argument("--sample-rate", default="0.05,1", help="Lista separada por comas.")
+    parser.add_argument("--json", action="store_true", help="Salida JSON.")
+    args = parser.parse_args()
+
+    results = [run(args.requests, args.responses, float(rate)) for rate in args.sample_rate.split(',')]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"📝 Logging por solicitud ({args.requests} solicitudes, {args.responses} respuestas)")
+        for r in results:
+            print(f"   muestra {r['sample_rate']:<5} {r['legacy_us']:>8} µs -> {r['request_path_us']:>7} µs en la solicitud"
+                  f" ({r['incl_writer_us']} µs con escritura)  x{r['speedup']}  payloads={r['payloads_logged']}")
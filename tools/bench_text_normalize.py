@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from text_normalize import pdf_texts, sheets_cells, filename_token, _pdf_text
+from bench_pdf_pool import sample_report
+
+# Micro-benchmark de normalización de texto: funciones anteriores (str.replace x11, filtros carácter
+# por carácter) vs text_normalize (str.translate precompilado + caché), sobre el texto de un reporte real.
+
+def legacy_safe_text(txt):
+    if txt is None: return "N/A"
+    if not isinstance(txt, str): txt = str(txt)
+    replacements = {
+        '\u2013': '-', '\u2014': '-', '\u201c': '"', '\u201d': '"',
+        '\u2018': "'", '\u2019': "'", '\u2022': '*', '\u2026': '...',
+        '\u00a0': ' ', '\ufeff': '', '\u200b': ''
+    }
+    for k, v in replacements.items():
+        txt = txt.replace(k, v)
+    try:
+        return txt.encode('latin-1', 'replace').decode('latin-1')
+    except:
+        return txt.encode('ascii', 'ignore').decode('ascii')
+
+def legacy_safe_str(val):
+    if val is None: return "N/A"
+    s = str(val).strip()
+    return "".join(c for c in s if c.isprintable() or c.isspace())
+
+def legacy_filename(raw):
+    return "".join(c for c in str(raw) if c.isalnum() or c == ' ').strip().replace(' ', '_')
+
+def _timeit(fn, rounds):
+    fn() # Calentamiento (tablas y caché)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+def run(rounds, responses):
+    doc = sample_report(responses)
+    # Lo que un reporte pasa por safe_text: títulos fijos, preguntas, respuestas y hallazgos
+    pdf_items = ["DIAGNÓSTICO ESTRATÉGICO", "ESTRATEGIA RECOMENDADA (PITCH)", "DETALLE DE RESPUESTAS TÉCNICAS",
+                 f'"{doc["sales_pitch"]}"', doc["markdown_content"]]
+    pdf_items += [r["question"] for r in doc["responses"]] + [r["answer"] for r in doc["responses"]]
+    row = ["2026-10-18 10:00:00", "Constructora Peña S.A.", "constructora", "Ana López (Directora)", "ana@pena.mx",
+           "+52 55 1234 5678", 78, "Activos sin PropCo – exposición fiscal “crítica”…", "Blindaje", "https://x/r.pdf",
+           "CPE010203XY1", "Construcción"]
+    company = "Constructora Peña, S.A. de C.V. (Grupo Norte)"
+
+    cases = [
+        ("pdf_text", lambda: [legacy_safe_text(t) for t in pdf_items], lambda: pdf_texts(pdf_items)),
+        ("sheets_row", lambda: [legacy_safe_str(v) for v in row], lambda: sheets_cells(row)),
+        ("filename", lambda: legacy_filename(company), lambda: filename_token(company)),
+    ]
+    results = []
+    for name, legacy, compiled in cases:
+        assert legacy() == compiled(), name
+        legacy_us = _timeit(legacy, rounds)
+        compiled_us = _timeit(compiled, rounds)
+        results.append({"case": name, "items": len(pdf_items) if name == "pdf_text" else len(row) if name == "sheets_row" else 1,
+                        "legacy_us": round(legacy_us, 2), "compiled_us": round(compiled_us, 2),
+                        "speedup": round(legacy_us / compiled_us, 2)})
+    # Sin caché (textos nunca vistos): solo el efecto de str.translate
+    legacy_us = _timeit(lambda: [legacy_safe_text(t) for t in pdf_items], rounds)
+    compiled_us = _timeit(lambda: [_pdf_text(t) for t in pdf_items], rounds)
+    results.append({"case": "pdf_text_uncached", "items": len(pdf_items), "legacy_us": round(legacy_us, 2),
+                    "compiled_us": round(compiled_us, 2), "speedup": round(legacy_us / compiled_us, 2)})
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Normalización de texto: funciones anteriores vs text_normalize.")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--responses", type=int, default=66)
+    parser.add_argument("--json", action="store_true", help="Salida JSON.")
+    args = parser.parse_args()
+
+    results = run(args.rounds, args.responses)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"🔤 Normalización de texto ({args.rounds} rondas)")
+        for r in results:
+            print(f"   {r['case']:<18} {r['items']:>4} textos  {r['legacy_us']:>9} µs -> {r['compiled_us']:>8} µs  x{r['speedup']}")
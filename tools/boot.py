@@ -0,0 +1,80 @@
+import os
+
+from pipeline import REPORTS_DIR
+from outbox import outbox, OUTBOX_ENABLED
+from pdf_service import pdf_service, pool_size_for, PDF_POOL_ENABLED, WARMUP_DOC
+from pdf_generator_v2 import render_pdf_bytes
+from prompt_builder import get_prompt_prefix
+from ai_providers import get_provider
+from gemini_client import client_manager
+from sheets_client import sheets_client
+from questions_catalog import catalog as questions_catalog, NICHE_FILES
+from sheets_connection_test import run_boot_test
+
+# Arranque compartido por tools/server.py (WSGI), tools/asgi_app.py (ASGI) y gunicorn.conf.py.
+# Con gunicorn.conf.py (preload_app) se reparte en hooks: los activos de solo lectura se cargan una
+# vez en el master y los recursos por proceso se crean en post_fork.
+BOOT_HOOKS = os.getenv("KONTIFY_BOOT_HOOKS") == "1"
+
+def load_shared_assets():
+    """
+    Activos de solo lectura: cuestionarios compilados, prefijos SOP por nicho y el render de PDF
+    (fpdf, métricas de fuentes, plantilla). Cargados antes del fork los heredan todos los workers.
+    """
+    os.makedirs('.tmp', exist_ok=True)
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    try:
+        questions_catalog.refresh(force=True)
+    except Exception as e:
+        print(f"⚠️ Catálogo de cuestionarios no disponible: {e}")
+    for niche_id in NICHE_FILES:
+        try:
+            get_prompt_prefix(niche_id)
+        except OSError as e:
+            print(f"⚠️ SOP de {niche_id} no disponible: {e}")
+    try:
+        render_pdf_bytes(WARMUP_DOC)
+    except Exception as e:
+        print(f"⚠️ Precarga del render de PDF falló: {e}")
+
+def warm_provider_clients():
+    """Clientes de IA y de Sheets del proceso actual (ninguno sobrevive un fork)."""
+    provider = get_provider()
+    if provider.requires_api_key:
+        try:
+            if client_manager.ensure_configured():
+                client_manager.get_model(provider.model_name)
+        except Exception as e:
+            print(f"⚠️ Cliente de IA no disponible: {e}")
+    if sheets_client.has_credentials():
+        try:
+            sheets_client.worksheet()
+        except Exception as e:
+            print(f"⚠️ Cliente de Sheets no disponible: {e}")
+
+def start_process_services(web_workers=None):
+    """
+    Recursos por proceso: pool de PDF, despachador del outbox y clientes calientes.
+    web_workers (gunicorn) reparte los procesos de render del host entre los pools de cada worker.
+    """
+    # Procesos de render de PDF arrancados y calentados antes de la primera solicitud
+    if PDF_POOL_ENABLED:
+        if web_workers:
+            pdf_service.resize(pool_size_for(web_workers))
+        try:
+            pdf_service.start()
+        except Exception as e:
+            print(f"⚠️ Pool de PDF no disponible: {e}")
+
+    # Entregar efectos (Slack / Sheets / email) que quedaron pendientes de una ejecución anterior
+    if OUTBOX_ENABLED:
+        outbox.start()
+
+    warm_provider_clients()
+
+def boot_check():
+    try:
+        run_boot_test()
+        print("✅ BOOT-TEST: Google Sheets conectado y A1 actualizado.")
+    except Exception as e:
+        print(f"🛑 CRITICAL ERROR: ERROR DE CREDENCIALES GOOGLE: {e}")
@@ -1,23 +1,19 @@
 import os
-import gspread
-from google.oauth2.service_account import Credentials
 from dotenv import load_dotenv
 
+from sheets_client import sheets_client
+from report_store import report_store
+
 def cleanup_production():
     load_dotenv()
     print("🧹 INICIANDO LIMPIEZA DE AUDITORÍA (PROD READY)...")
     
     # 1. Limpiar Google Sheet
     sheets_id = os.getenv("GOOGLE_SHEETS_ID")
-    creds_path = 'google_creds.json'
     
-    if sheets_id and os.path.exists(creds_path):
+    if sheets_id and sheets_client.has_credentials():
         try:
-            scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-            creds = Credentials.from_service_account_file(creds_path, scopes=scope)
-            client = gspread.authorize(creds)
-            ss = client.open_by_key(sheets_id)
-            sheet = ss.sheet1
+            sheet = sheets_client.worksheet(sheets_id)
             
             # Mantener encabezados (Fila 1), borrar todo lo demás
             rows = len(sheet.get_all_values())
@@ -29,25 +25,30 @@ def cleanup_production():
         except Exception as e:
             print(f"❌ Error limpiando Google Sheet: {e}")
     
-    # 2. Limpiar Log Local
-    log_path = 'leads_log.jsonl'
-    if os.path.exists(log_path):
-        with open(log_path, 'w', encoding='utf-8') as f:
-            f.write("")
-        print("✅ Log local (leads_log.jsonl) reiniciado.")
-    
-    # 3. Limpiar archivos temporales
+    # 2. Limpiar archivos temporales. Las bases SQLite (outbox, cola de trabajos, limitador, cachés) y
+    # sus -wal/-shm se conservan: borrarlas con el servicio en marcha perdería entregas y trabajos pendientes
     tmp_dir = '.tmp'
     if os.path.exists(tmp_dir):
-        files = os.listdir(tmp_dir)
-        for f in files:
+        kept = []
+        for f in os.listdir(tmp_dir):
             file_path = os.path.join(tmp_dir, f)
+            if '.sqlite' in f:
+                kept.append(f)
+                continue
             try:
                 if os.path.isfile(file_path):
                     os.unlink(file_path)
             except Exception as e:
                 print(f"⚠️ No se pudo eliminar {f}: {e}")
-        print("✅ Archivos temporales (.tmp) eliminados.")
+        print(f"✅ Archivos temporales (.tmp) eliminados (bases SQLite conservadas: {len(kept)}).")
+
+    # 3. Retención de reportes (archivo gzip por inactividad, eliminación por edad / presupuesto)
+    reports_dir = os.path.join(os.getcwd(), 'reports')
+    if os.path.exists(reports_dir):
+        try:
+            print(f"✅ Retención de reportes aplicada: {report_store.apply_retention(reports_dir)}")
+        except Exception as e:
+            print(f"⚠️ No se pudo aplicar la retención de reportes: {e}")
 
     print("🏁 LIMPIEZA COMPLETADA. KONTIFY ESTÁ EN CERO.")
 
@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import datetime
+import threading
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from ai_providers import stub_diagnostic_text
+
+# Servidores locales que imitan Gemini (generateContent / streamGenerateContent / cachedContents),
+# la API v4 de Sheets (metadata, values:append, values update), el webhook de Slack y /v3/mail/send
+# de SendGrid, para pruebas de carga sin cuota. Un solo puerto, ruteo por path. Cada servicio tiene
+# su perfil: latencia log-normal (mediana + sigma), tasa de 5xx, tasa de 429 aleatorios y cuota por
+# minuto (cubeta de tokens; excedida -> 429 con Retry-After, como la cuota real de escrituras de Sheets).
+# La app apunta aquí con GEMINI_API_ENDPOINT, SHEETS_API_ENDPOINT, SLACK_WEBHOOK_URL y SENDGRID_API_HOST
+# (ver FakeServices.env() o `python tools/fake_services.py --print-env`).
+FAKE_SERVICES_PORT = int(os.getenv("FAKE_SERVICES_PORT", 8765))
+
+DEFAULT_PROFILES = {
+    "gemini": {"latency_ms": 1800, "sigma": 0.35},
+    "sheets": {"latency_ms": 350, "sigma": 0.4, "rpm": 60},
+    "slack": {"latency_ms": 120, "sigma": 0.3},
+    "sendgrid": {"latency_ms": 250, "sigma": 0.3}
+}
+
+# Llaves cortas del CLI: gemini:latency=800,sigma=0.4,errors=0.01,throttle=0.02,rpm=600
+_SPEC_KEYS = {"latency": "latency_ms", "sigma": "sigma", "errors": "error_rate", "throttle": "throttle_rate",
+              "rpm": "rpm", "retry_after": "retry_after"}
+
+class ServiceProfile:
+    """Comportamiento de un servicio falso y sus contadores."""
+
+    def __init__(self, name, latency_ms=0, sigma=0.3, error_rate=0.0, throttle_rate=0.0, rpm=0, retry_after=2):
+        self.name = name
+        self.latency_ms = float(latency_ms)
+        self.sigma = float(sigma)
+        self.error_rate = float(error_rate)
+        self.throttle_rate = float(throttle_rate)
+        self.rpm = float(rpm)
+        self.retry_after = int(retry_after)
+        self._tokens = self.rpm
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def latency(self, rng):
+        """Segundos de latencia: log-normal con mediana latency_ms (colas largas, como los servicios reales)."""
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.latency_ms / 1000
+        return rng.lognormvariate(math.log(self.latency_ms), self.sigma) / 1000
+
+    def decide(self, rng, metered=True):
+        """None (responder normal) o (status, retry_after) para 429/500. `metered`: consume cuota."""
+        with self._lock:
+            self.requests += 1
+            if self.rpm > 0 and metered:
+                now = time.monotonic()
+                self._tokens = min(self.rpm, self._tokens + (now - self._updated) * self.rpm / 60)
+                self._updated = now
+                if self._tokens < 1:
+                    self.throttled += 1
+                    return 429, max(1, math.ceil((1 - self._tokens) * 60 / self.rpm))
+                self._tokens -= 1
+            roll = rng.random()
+            if roll < self.throttle_rate:
+                self.throttled += 1
+                return 429, self.retry_after
+            if roll < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return 500, None
+        return None
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors, "throttled": self.throttled,
+                "latency_ms": self.latency_ms, "rpm": self.rpm}
+
+def parse_profile(spec):
+    """'sheets:latency=300,rpm=60' -> ('sheets', {'latency_ms': 300.0, 'rpm': 60.0})"""
+    name, _, options = spec.partition(":")
+    if name not in DEFAULT_PROFILES:
+        raise ValueError(f"Servicio desconocido: {name} (opciones: {', '.join(DEFAULT_PROFILES)})")
+    values = {}
+    for item in filter(None, options.split(",")):
+        key, _, value = item.partition("=")
+        if key not in _SPEC_KEYS:
+            raise ValueError(f"Opción desconocida para {name}: {key}")
+        values[_SPEC_KEYS[key]] = float(value)
+    return name, values
+
+def _iso(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "KontifyFake/1.0"
+
+    def log_message(self, format, *args):
+        pass # Silencioso: el costo de loguear cada petición distorsiona la latencia medida
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method):
+        path = urlsplit(self.path).path
+        fake = self.server.fake
+        if path == "/__fake/stats":
+            return self._send(200, fake.stats())
+        if path.startswith("/v1beta/"):
+            service, handler = "gemini", self._gemini
+        elif path.startswith("/v4/spreadsheets"):
+            service, handler = "sheets", self._sheets
+        elif path.startswith("/slack/"):
+            service, handler = "slack", self._slack
+        elif path.startswith("/v3/mail/send"):
+            service, handler = "sendgrid", self._sendgrid
+        else:
+            return self._send(404, {"error": {"code": 404, "message": f"Ruta no simulada: {path}", "status": "NOT_FOUND"}})
+
+        profile = fake.profiles[service]
+        body = self._body() if method in ("POST", "PUT") else {}
+        rng = fake.rng()
+        # La cuota de Sheets que importa es la de escrituras (las lecturas de metadata tienen la suya)
+        failure = profile.decide(rng, metered=not (service == "sheets" and method == "GET"))
+        delay = profile.latency(rng)
+        if failure:
+            # Los rechazos llegan rápido (como un 429 real), los 5xx tras la latencia normal
+            time.sleep(delay if failure[0] >= 500 else min(delay, 0.05))
+            return self._failure(service, *failure)
+        return handler(method, path, body, delay)
+
+    def _failure(self, service, status, retry_after):
+        headers = {"Retry-After": str(retry_after)} if retry_after else {}
+        if service == "slack":
+            return self._send(status, b"rate_limited" if status == 429 else b"internal_error", "text/plain", headers)
+        if service == "sendgrid":
+            return self._send(status, {"errors": [{"message": "too many requests" if status == 429 else "internal error"}]}, headers=headers)
+        message = "Resource has been exhausted (e.g. check quota)." if status == 429 else "Internal error encountered."
+        if service == "sheets" and status == 429:
+            message = "Quota exceeded for quota metric 'Write requests' and limit 'Write requests per minute per user'."
+        return self._send(status, {"error": {"code": status, "message": message,
+                                             "status": "RESOURCE_EXHAUSTED" if status == 429 else "INTERNAL"}}, headers=headers)
+
+    # --- Gemini (REST v1beta) ---
+    def _gemini(self, method, path, body, delay):
+        fake = self.server.fake
+        if path.startswith("/v1beta/cachedContents"):
+            time.sleep(delay / 4)
+            if method == "POST":
+                return self._send(200, fake.create_cached_content(body))
+            name = path[len("/v1beta/"):]
+            if name == "cachedContents":
+                return self._send(200, {"cachedContents": list(fake.cached_contents.values())})
+            entry = fake.cached_contents.get(name)
+            if method == "DELETE":
+                fake.cached_contents.pop(name, None)
+                return self._send(200, {})
+            return self._send(200, entry) if entry else self._send(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+        context = fake.cached_contents.get(body.get("cachedContent") or "", {})
+        sop_hash = hashlib.sha256(context.get("displayName", "").encode("utf-8")).hexdigest()
+        text = stub_diagnostic_text(prompt, "fake-gemini", sop_hash, context.get("name", "sin-contexto"))
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4,
+                 "totalTokenCount": (len(prompt) + len(text)) // 4}
+        if ":streamGenerateContent" not in path:
+            time.sleep(delay)
+            return self._send(200, self._candidate(text, usage))
+
+        # Streaming REST: arreglo JSON que se escribe por partes (el SDK lo parsea incrementalmente)
+        parts = [text[i:i + 120] for i in range(0, len(text), 120)]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        time.sleep(delay * 0.4) # Tiempo al primer token
+        for i, part in enumerate(parts):
+            chunk = json.dumps(self._candidate(part, usage if i == len(parts) - 1 else None), ensure_ascii=False)
+            self.wfile.write((("[" if i == 0 else ",") + chunk).encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(delay * 0.6 / len(parts))
+        self.wfile.write(b"]")
+        self.close_connection = True
+
+    @staticmethod
+    def _candidate(text, usage=None):
+        response = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}]}
+        if usage:
+            response["usageMetadata"] = usage
+        return response
+
+    # --- Google Sheets (v4) ---
+    def _sheets(self, method, path, body, delay):
+        time.sleep(delay)
+        fake = self.server.fake
+        parts = path.split("/") # ['', 'v4', 'spreadsheets', id, ...]
+        sheet_id = parts[3] if len(parts) > 3 else "fake"
+        if method == "GET" and len(parts) == 4:
+            return self._send(200, {
+                "spreadsheetId": sheet_id,
+                "properties": {"title": "CRM Kontify (fake)", "locale": "es_MX", "timeZone": "America/Mexico_City"},
+                "sheets": [{"properties": {"sheetId": 0, "title": "Leads", "index": 0, "sheetType": "GRID",
+                                           "gridProperties": {"rowCount": 100000, "columnCount": 26}}}]
+            })
+        rows = body.get("values") or []
+        with fake.lock:
+            fake.sheet_rows += len(rows) if path.endswith(":append") else 0
+            total = fake.sheet_rows
+        updates = {"spreadsheetId": sheet_id, "updatedRange": f"Leads!A{total}", "updatedRows": len(rows),
+                   "updatedColumns": max((len(r) for r in rows), default=0), "updatedCells": sum(len(r) for r in rows)}
+        if path.endswith(":append"):
+            return self._send(200, {"spreadsheetId": sheet_id, "tableRange": "Leads!A1:L1", "updates": updates})
+        return self._send(200, updates)
+
+    # --- Slack / SendGrid ---
+    def _slack(self, method, path, body, delay):
+        time.sleep(delay)
+        return self._send(200, b"ok", "text/plain")
+
+    def _sendgrid(self, method, path, body, delay):
+        time.sleep(delay)
+        return self._send(202, b"", headers={"X-Message-Id": uuid.uuid4().hex})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+class FakeServices:
+    def __init__(self, profiles=None, host="127.0.0.1", port=0, seed=None):
+        self.profiles = {}
+        for name, defaults in DEFAULT_PROFILES.items():
+            options = dict(defaults)
+            options.update((profiles or {}).get(name, {}))
+            self.profiles[name] = ServiceProfile(name, **options)
+        self.host = host
+        self.port = port
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.cached_contents = {}
+        self.sheet_rows = 0
+        self._local = threading.local()
+        self._httpd = None
+        self._thread = None
+
+    def rng(self):
+        # Un generador por hilo del servidor (random.Random no es seguro entre hilos sin candado)
+        rng = getattr(self._local, "rng", None)
+        if rng is None:
+            seed = None if self.seed is None else f"{self.seed}-{threading.get_ident()}"
+            rng = self._local.rng = random.Random(seed)
+        return rng
+
+    def create_cached_content(self, body):
+        now = time.time()
+        ttl = float(str(body.get("ttl", "3600s")).rstrip("s") or 3600)
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        entry = {"name": name, "displayName": body.get("displayName", ""), "model": body.get("model", ""),
+                 "createTime": _iso(now), "updateTime": _iso(now), "expireTime": _iso(now + ttl),
+                 "usageMetadata": {"totalTokenCount": 4096}}
+        with self.lock:
+            self.cached_contents[name] = entry
+        return entry
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def env(self):
+        """Variables para que server.py / worker.py usen estos servicios en lugar de los reales."""
+        return {
+            "GEMINI_API_ENDPOINT": self.url,
+            "GEMINI_API_KEY": "fake-gemini-key",
+            "GEMINI_TRANSPORT": "rest",
+            "KONTIFY_AI_PROVIDER": "gemini",
+            "SHEETS_API_ENDPOINT": self.url,
+            "SLACK_WEBHOOK_URL": f"{self.url}/slack/webhook",
+            "SENDGRID_API_HOST": self.url,
+            "SENDGRID_API_KEY": "SG.fake"
+        }
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self.port = self._httpd.server_port
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-services", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def stats(self):
+        return {"services": {name: p.stats() for name, p in self.profiles.items()},
+                "sheet_rows": self.sheet_rows, "cached_contents": len(self.cached_contents)}
+
+def build_profiles(specs):
+    profiles = {}
+    for spec in specs or []:
+        name, values = parse_profile(spec)
+        profiles.setdefault(name, {}).update(values)
+    return profiles
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gemini/Sheets/Slack/SendGrid falsos para pruebas de carga.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=FAKE_SERVICES_PORT)
+    parser.add_argument("--profile", action="append", default=[],
+                        help="servicio:latency=MS,sigma=S,errors=P,throttle=P,rpm=N,retry_after=S (repetible).")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--print-env", action="store_true", help="Imprime los export para la app y termina de arrancar.")
+    args = parser.parse_args()
+
+    fake = FakeServices(build_profiles(args.profile), args.host, args.port, args.seed).start()
+    if args.print_env:
+        for name, value in fake.env().items():
+            print(f"export {name}={value}")
+    print(f"🧪 Servicios falsos en {fake.url}")
+    for name, profile in fake.profiles.items():
+        print(f"   {name:<9} mediana={profile.latency_ms:g} ms  sigma={profile.sigma:g}  5xx={profile.error_rate:g}"
+              f"  429={profile.throttle_rate:g}  rpm={profile.rpm:g}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,175 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+
+from structured_log import log
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+# Cliente Gemini de larga vida por proceso (worker de gunicorn):
+#   - genai.configure() una sola vez (cada configure descarta los clientes y sus canales gRPC/HTTP)
+#   - handles de GenerativeModel tibios por nombre de modelo / contexto cacheado
+#   - tope de llamadas concurrentes al modelo por proceso
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 8))
+GEMINI_SLOT_TIMEOUT = float(os.getenv("GEMINI_SLOT_TIMEOUT", 30))
+# Variante ASGI: una corrutina en espera no ocupa un hilo, el tope por proceso puede ser mucho mayor
+GEMINI_ASYNC_MAX_CONCURRENCY = int(os.getenv("GEMINI_ASYNC_MAX_CONCURRENCY", 256))
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT") or None # grpc (default del SDK) | rest
+# Endpoint alterno (p. ej. http://127.0.0.1:8765 de tools/fake_services.py para pruebas de carga)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT") or None
+
+class ConcurrencyLimitExceeded(Exception):
+    """No se obtuvo un slot de llamada al modelo dentro del tiempo límite."""
+
+class GeminiClientManager:
+    def __init__(self, max_concurrency=None, slot_timeout=None, async_max_concurrency=None):
+        self.max_concurrency = max_concurrency or GEMINI_MAX_CONCURRENCY
+        self.async_max_concurrency = async_max_concurrency or GEMINI_ASYNC_MAX_CONCURRENCY
+        self.slot_timeout = GEMINI_SLOT_TIMEOUT if slot_timeout is None else slot_timeout
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._async_semaphores = weakref.WeakKeyDictionary() # loop -> asyncio.Semaphore
+        self.transport = None
+        self._lock = threading.Lock()
+        self._configured_pid = None
+        self._api_key = None
+        self._models = {}
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.wait_seconds = 0.0
+        self.rejected = 0
+
+    def ensure_configured(self):
+        """
+        Configura el SDK una vez por proceso. Retorna la API key o None si no está configurada.
+        Si el proceso cambió (fork de gunicorn) se reconfigura: los canales gRPC no sobreviven un fork.
+        """
+        pid = os.getpid()
+        if self._configured_pid == pid:
+            return self._api_key
+
+        with self._lock:
+            if self._configured_pid == pid:
+                return self._api_key
+            load_dotenv()
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key or api_key == "tu_api_key_aqui":
+                return None
+            options = {"api_key": api_key}
+            if GEMINI_TRANSPORT:
+                options["transport"] = GEMINI_TRANSPORT
+            if GEMINI_API_ENDPOINT:
+                options["client_options"] = {"api_endpoint": GEMINI_API_ENDPOINT}
+                if GEMINI_API_ENDPOINT.startswith("http://"):
+                    options["transport"] = "rest" # gRPC exige TLS; el servidor local habla HTTP/JSON
+            genai.configure(**options)
+            self.transport = options.get("transport")
+            self._models = {}
+            self._api_key = api_key
+            self._configured_pid = pid
+            log.info("gemini_configured", "🔌 Cliente Gemini configurado", pid=pid, concurrency=self.max_concurrency, transport=self.transport)
+            return api_key
+
+    def get_model(self, model_name):
+        """Handle reutilizable de GenerativeModel (comparte el cliente/canal del proceso)."""
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = genai.GenerativeModel(model_name)
+                    self._models[model_name] = model
+        return model
+
+    def get_cached_model(self, cached_content):
+        """Handle reutilizable para un CachedContent (clave: nombre del recurso remoto)."""
+        key = f"cached:{cached_content.name}"
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = genai.GenerativeModel.from_cached_content(cached_content)
+                    self._models[key] = model
+        return model
+
+    def drop_model(self, key):
+        self._models.pop(key, None)
+
+    @contextmanager
+    def slot(self, timeout=None):
+        """Limita las llamadas simultáneas al modelo en este proceso."""
+        start = time.perf_counter()
+        if not self._semaphore.acquire(timeout=self.slot_timeout if timeout is None else timeout):
+            with self._stats_lock:
+                self.rejected += 1
+            raise ConcurrencyLimitExceeded(f"Sin slot de IA disponible tras {self.slot_timeout}s")
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.in_flight += 1
+            self.calls += 1
+            self.wait_seconds += waited
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    @property
+    def supports_async(self):
+        """El cliente async del SDK solo habla gRPC (grpc_asyncio); con REST no hay variante async."""
+        return self.transport != "rest"
+
+    @asynccontextmanager
+    async def aslot(self, timeout=None):
+        """slot() para corrutinas: espera en el event loop sin bloquear el hilo."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.async_max_concurrency)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.slot_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            with self._stats_lock:
+                self.rejected += 1
+            raise ConcurrencyLimitExceeded(f"Sin slot de IA disponible tras {self.slot_timeout}s")
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.in_flight += 1
+            self.calls += 1
+            self.wait_seconds += waited
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+            semaphore.release()
+
+    def reset(self):
+        """Olvida configuración y handles (usar en post_fork o al rotar la API key)."""
+        with self._lock:
+            self._configured_pid = None
+            self._api_key = None
+            self.transport = None
+            self._models = {}
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_seconds / self.calls * 1000, 3) if self.calls else 0.0
+            }
+
+client_manager = GeminiClientManager()
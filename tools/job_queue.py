@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import sqlite3
+
+# Cola durable de diagnósticos para el modo asíncrono de /api/submit.
+# Web y worker comparten el archivo SQLite (WAL), por lo que pueden escalarse por separado.
+JOBS_DB_PATH = os.getenv("KONTIFY_JOBS_DB", os.path.join(os.getcwd(), '.tmp', 'jobs.sqlite3'))
+JOB_LEASE_SECONDS = int(os.getenv("KONTIFY_JOB_LEASE_SECONDS", 300))
+JOB_MAX_ATTEMPTS = int(os.getenv("KONTIFY_JOB_MAX_ATTEMPTS", 3))
+# Trabajos terminados se conservan este tiempo para /api/jobs/<id> y luego se borran
+JOB_RETENTION_HOURS = float(os.getenv("KONTIFY_JOB_RETENTION_HOURS", 72))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCESS = "success"
+STATUS_ERROR = "error"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+"""
+
+def _connect(db_path=None):
+    path = db_path or JOBS_DB_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _row_to_job(row):
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+def enqueue_job(job_id, payload, db_path=None):
+    """Registra un trabajo nuevo en estado 'queued'."""
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, status, stage, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, STATUS_QUEUED, STATUS_QUEUED, json.dumps(payload, ensure_ascii=False), now, now)
+        )
+    finally:
+        conn.close()
+    return job_id
+
+def claim_next_job(db_path=None, lease_seconds=None):
+    """
+    Toma el trabajo más antiguo disponible (en cola o con lease vencido) y lo marca 'running'.
+    Retorna None si no hay trabajo pendiente.
+    """
+    lease = lease_seconds if lease_seconds is not None else JOB_LEASE_SECONDS
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_expires < ?) "
+            "ORDER BY created_at LIMIT 1",
+            (STATUS_QUEUED, STATUS_RUNNING, now)
+        ).fetchone()
+        if not row:
+            conn.execute("COMMIT")
+            return None
+
+        attempts = row['attempts'] + 1
+        if attempts > JOB_MAX_ATTEMPTS:
+            # El worker murió demasiadas veces con este trabajo: se cierra como error
+            result = {"status": "error", "message": "Trabajo abandonado tras reintentos.", "status_code": 500}
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, lease_expires = NULL, updated_at = ? WHERE id = ?",
+                (STATUS_ERROR, json.dumps(result), now, row['id'])
+            )
+            conn.execute("COMMIT")
+            return claim_next_job(db_path, lease_seconds)
+
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+            (STATUS_RUNNING, attempts, now + lease, now, row['id'])
+        )
+        conn.execute("COMMIT")
+        job = _row_to_job(row)
+        job['status'] = STATUS_RUNNING
+        job['attempts'] = attempts
+        return job
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+def renew_lease(job_id, attempt, stage=None, db_path=None, lease_seconds=None):
+    """
+    Extiende el lease del trabajo (y opcionalmente su etapa) mientras este intento lo siga poseyendo.
+    Retorna False si el lease ya venció y otro worker lo reclamó: el llamador debe abandonar el trabajo.
+    """
+    lease = lease_seconds if lease_seconds is not None else JOB_LEASE_SECONDS
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET stage = COALESCE(?, stage), lease_expires = ?, updated_at = ? "
+            "WHERE id = ? AND status = ? AND attempts = ?",
+            (stage, now + lease, now, job_id, STATUS_RUNNING, attempt)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def update_job_stage(job_id, stage, attempt, db_path=None):
+    """Registra la etapa actual; cada avance también renueva el lease."""
+    return renew_lease(job_id, attempt, stage=stage, db_path=db_path)
+
+def finish_job(job_id, result, attempt, db_path=None):
+    """
+    Cierra el trabajo con el resultado de process_submission (éxito o error). Retorna False si este
+    intento ya no poseía el trabajo (lease vencido y reclamado por otro worker): el resultado se descarta.
+    """
+    status = STATUS_SUCCESS if result.get('status') == 'success' else STATUS_ERROR
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ? AND attempts = ?",
+            (status, json.dumps(result, ensure_ascii=False), now, job_id, STATUS_RUNNING, attempt)
+        )
+        # Retención: los trabajos terminados más antiguos que JOB_RETENTION_HOURS se borran
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND created_at < ?",
+            (STATUS_SUCCESS, STATUS_ERROR, now - JOB_RETENTION_HOURS * 3600)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def get_job(job_id, db_path=None):
+    conn = _connect(db_path)
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _row_to_job(row) if row else None
+
+def queue_depth(db_path=None):
+    conn = _connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (STATUS_QUEUED, STATUS_RUNNING)).fetchone()[0]
+    finally:
+        conn.close()
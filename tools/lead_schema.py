@@ -0,0 +1,149 @@
+from text_normalize import filename_token
+
+# Validación y normalización del payload de /api/submit en una sola pasada. El resultado es un Lead
+# (objeto con __slots__) que viaja por IA -> CRM -> PDF; antes las respuestas se normalizaban en
+# server.py y otra vez en process_diagnostic.py, y los datos maestros se buscaban llave por llave.
+# Las respuestas se mantienen como dicts {"question", "answer"[, "q_index", "category_id"]}: son la
+# forma canónica que usan el prompt, la llave de caché, el motor local, el PDF y la cola de trabajos.
+MIN_RFC_LENGTH = 12
+MISSING_MASTER_DATA = "Falta de Datos Maestros: RFC y Giro son obligatorios para el diagnóstico estratégico"
+EMPTY_RESPONSES = "BLOQUEO POR PROTOCOLO: Respuestas del cuestionario vacías o inválidas."
+
+class LeadValidationError(Exception):
+    """Payload rechazado por el Protocolo de Blindaje (datos maestros o respuestas)."""
+
+    def __init__(self, message, missing=None):
+        super().__init__(message)
+        self.message = message
+        self.missing = missing or []
+
+class Lead:
+    __slots__ = (
+        "lead_metadata", "responses", "answered", "rfc", "activity", "niche_id",
+        "billing_range", "company_name", "file_token", "extra"
+    )
+
+    def __init__(self, lead_metadata, responses, answered, rfc, activity, niche_id, billing_range, company_name, extra):
+        self.lead_metadata = lead_metadata
+        self.responses = responses
+        self.answered = answered # Respuestas con contenido real (ni vacías ni "N/A")
+        self.rfc = rfc
+        self.activity = activity
+        self.niche_id = niche_id
+        self.billing_range = billing_range
+        self.company_name = company_name
+        self.file_token = filename_token(company_name)
+        self.extra = extra # Otras llaves de primer nivel del payload (se conservan tal cual)
+
+    def to_payload(self):
+        """Forma JSON (cola de trabajos, logs); Lead.from_payload la reconstruye."""
+        payload = dict(self.extra)
+        payload['lead_metadata'] = self.lead_metadata
+        payload['responses'] = self.responses
+        return payload
+
+    @classmethod
+    def from_payload(cls, data):
+        """Lead sin validación estricta (CLI, pruebas, trabajos ya validados al encolar)."""
+        lead_meta = data.get('lead_metadata') or {}
+        responses, answered = normalize_responses(data.get('responses', []))
+        return cls(
+            lead_meta, responses, answered,
+            lead_meta.get('rfc'),
+            lead_meta.get('main_activity') or lead_meta.get('activity'),
+            lead_meta.get('niche_id'),
+            lead_meta.get('billing_range'),
+            lead_meta.get('company_name', 'Lead_Report'),
+            {k: v for k, v in data.items() if k not in ('lead_metadata', 'responses')}
+        )
+
+def as_lead(data):
+    return data if isinstance(data, Lead) else Lead.from_payload(data)
+
+def _normalize_item(item):
+    """Forma libre (q/text/num, a/response/value...) -> dict canónico o None."""
+    q = item.get('question') or item.get('q') or item.get('text')
+    if not q:
+        q_index = item.get('q_index') or item.get('num') or item.get('id')
+        if q_index is not None:
+            q = f"Q{q_index}"
+    a = item.get('answer') or item.get('a') or item.get('response') or item.get('value')
+    if not q and a is None:
+        return None
+    return {
+        "question": str(q).strip() if q else "N/A",
+        "answer": str(a).strip() if a is not None else "N/A"
+    }
+
+def normalize_responses(raw_responses):
+    """(respuestas canónicas, cuántas tienen contenido) en un solo recorrido."""
+    normalized = []
+    answered = 0
+    if not isinstance(raw_responses, list):
+        return normalized, answered
+    append = normalized.append
+    for item in raw_responses:
+        if type(item) is dict:
+            q = item.get('question')
+            a = item.get('answer')
+            # Atajo: forma canónica del frontend {"question": str, "answer": str}
+            if type(q) is str and type(a) is str and q and a:
+                entry = {"question": q.strip(), "answer": a.strip()}
+            else:
+                entry = _normalize_item(item)
+                if entry is None:
+                    continue
+            if item.get('q_index') is not None:
+                entry["q_index"] = item.get('q_index')
+            category = item.get('category_id') or item.get('cat')
+            if category:
+                entry["category_id"] = category
+        elif isinstance(item, str):
+            entry = {"question": item.strip(), "answer": "N/A"}
+        else:
+            continue
+        append(entry)
+        answer = entry["answer"]
+        if answer and answer.upper() != "N/A":
+            answered += 1
+    return normalized, answered
+
+def parse_submission(data):
+    """
+    Middleware de Blindaje: valida datos maestros y normaliza respuestas en una pasada.
+    Retorna un Lead o lanza LeadValidationError.
+    """
+    # Prioridad a lead_metadata estructurado
+    raw_meta = data.get('lead_metadata') or data.get('leadMetadata') or {}
+    if not isinstance(raw_meta, dict):
+        raw_meta = {}
+
+    # RFC: búsqueda robusta y sanitización de guiones y espacios
+    rfc_raw = raw_meta.get('rfc') or raw_meta.get('RFC') or data.get('rfc')
+    rfc = str(rfc_raw).replace('-', '').replace(' ', '').upper() if rfc_raw else None
+    giro = raw_meta.get('main_activity') or raw_meta.get('activity')
+    niche_id = raw_meta.get('niche_id')
+    billing_range = raw_meta.get('billing_range')
+
+    # PROTOCOLO DE BLINDAJE: Abortar si faltan datos críticos o son inválidos
+    missing = []
+    if not rfc or len(rfc.strip()) < MIN_RFC_LENGTH: missing.append("RFC válido (min 12 caracteres)")
+    if not giro: missing.append("Giro / Actividad Principal")
+    if not niche_id: missing.append("Nicho")
+    if not billing_range: missing.append("Rango de Facturación")
+    if missing:
+        raise LeadValidationError(MISSING_MASTER_DATA, missing)
+
+    responses, answered = normalize_responses(data.get('responses', []))
+    if not responses:
+        raise LeadValidationError(EMPTY_RESPONSES)
+
+    company_name = raw_meta.get('company_name', 'Lead_Report')
+    # Campos que notificator / PDF buscan por nombre
+    lead_meta = dict(raw_meta)
+    lead_meta['company'] = company_name
+    lead_meta['rfc'] = rfc
+    lead_meta['activity'] = giro
+
+    extra = {k: v for k, v in data.items() if k not in ('lead_metadata', 'responses')}
+    return Lead(lead_meta, responses, answered, rfc, giro, niche_id, billing_range, company_name, extra)
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import tempfile
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from fake_services import FakeServices, build_profiles
+from bench_pipeline import synthetic_lead, percentile
+from questions_catalog import catalog, NICHE_FILES
+
+# Generador de carga para /api/submit a tasa fija (llegadas de lazo abierto: la latencia se mide desde
+# el instante programado, así una cola en el servidor no se esconde como "menos peticiones").
+# Con --url ataca un servidor ya levantado; con --configs arranca gunicorn por cada configuración
+# (workers x hilos) contra tools/fake_services.py y reporta throughput y latencia de cola por configuración.
+REPO_DIR = os.path.dirname(tools_dir)
+GUNICORN_CONFIG = os.path.join(REPO_DIR, "gunicorn.conf.py")
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _session():
+    local = _session.local
+    if not hasattr(local, "session"):
+        local.session = requests.Session()
+    return local.session
+_session.local = threading.local()
+
+def run_load(url, rpm, duration, concurrency=64, seed=11, timeout=120):
+    """Envía leads sintéticos a rpm peticiones/min durante `duration` segundos."""
+    rng = random.Random(seed)
+    niches = list(NICHE_FILES)
+    questions = {niche: catalog.get(niche).questions for niche in niches}
+    total = max(1, int(rpm * duration / 60))
+    interval = 60.0 / rpm
+    leads = [synthetic_lead(niches[i % len(niches)], questions[niches[i % len(niches)]], rng) for i in range(total)]
+    outcomes = []
+    lock = threading.Lock()
+
+    def _send(scheduled, lead):
+        try:
+            status = _session().post(f"{url}/api/submit", json=lead, timeout=timeout).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        with lock:
+            outcomes.append((time.perf_counter() - scheduled, status))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, lead in enumerate(leads):
+            scheduled = start + i * interval
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(_send, scheduled, lead)
+    wall = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    statuses = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = statuses.get("200", 0)
+    return {
+        "target_rpm": rpm,
+        "sent": total,
+        "statuses": statuses,
+        "throughput_per_min": round(ok / wall * 60, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "seconds": round(wall, 1)
+    }
+
+def _children(pid):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # El nombre del proceso va entre paréntesis y puede tener espacios
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+def tree_memory_mb(pid):
+    """
+    PSS total (MB) del proceso y sus descendientes: a diferencia del RSS, las páginas compartidas
+    por copy-on-write (preload_app) se reparten entre los procesos y no se cuentan N veces.
+    Solo Linux; None si /proc no está disponible.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    total_kb = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        for name, field in (("smaps_rollup", "Pss:"), ("status", "VmRSS:")):
+            try:
+                with open(f"/proc/{current}/{name}") as f:
+                    line = next((l for l in f if l.startswith(field)), None)
+            except OSError:
+                continue
+            if line:
+                total_kb += int(line.split()[1])
+                break
+        pending.extend(_children(current))
+    return round(total_kb / 1024, 1)
+
+def _wait_ready(url, proc, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn terminó al arrancar (código {proc.returncode})")
+        try:
+            if requests.get(f"{url}/health", timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} no respondió /health en {timeout}s")
+
+def run_config(workers, threads, fake, rpm, duration, concurrency, extra_env=None, worker_class=None):
+    """
+    Levanta gunicorn con gunicorn.conf.py (workers x hilos, clase de worker opcional; "asgi" sirve
+    tools/asgi_app.py) apuntando a los servicios falsos, aplica carga y lo detiene. Reporta también la memoria del árbol de procesos.
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="kontify-load-") as workdir:
+        env = dict(os.environ)
+        env.update(fake.env())
+        env.update({
+            # Estado compartido aislado por corrida: limitador, outbox, cola, métricas y reportes
+            "KONTIFY_LIMITER_DB": os.path.join(workdir, "limiter.sqlite3"),
+            "KONTIFY_OUTBOX_DB": os.path.join(workdir, "outbox.sqlite3"),
+            "KONTIFY_JOBS_DB": os.path.join(workdir, "jobs.sqlite3"),
+            "KONTIFY_METRICS_DIR": os.path.join(workdir, "metrics"),
+            "KONTIFY_REPORTS_DIR": os.path.join(workdir, "reports"),
+            "KONTIFY_LOG_LEVEL": "WARNING",
+            "GEMINI_RPM": str(max(rpm * 2, 60)),
+            "GEMINI_BURST": str(max(rpm // 6, 10)),
+            "PYTHONUNBUFFERED": "1"
+        })
+        env.update(extra_env or {})
+        # El worker asgi sirve la variante asyncio (tools/asgi_app.py) y no usa hilos
+        app = "tools.asgi_app:app" if worker_class == "asgi" else "tools.server:app"
+        cmd = [sys.executable, "-m", "gunicorn", "-c", GUNICORN_CONFIG, app, "-w", str(workers),
+               "-b", f"127.0.0.1:{port}", "--log-level", "warning"]
+        if worker_class != "asgi":
+            cmd += ["--threads", str(threads)]
+        if worker_class:
+            cmd += ["-k", worker_class]
+        with open(os.path.join(workdir, "gunicorn.log"), "w") as log_file:
+            proc = subprocess.Popen(cmd, cwd=REPO_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+            try:
+                _wait_ready(url, proc)
+                result = run_load(url, rpm, duration, concurrency)
+                result["memory_mb"] = tree_memory_mb(proc.pid)
+            finally:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+    result.update(workers=workers, threads=threads, worker_class=worker_class or "gthread")
+    return result
+
+def parse_configs(spec):
+    """'2x4,4x2' -> [(2, 4), (4, 2)]"""
+    configs = []
+    for item in spec.split(","):
+        workers, _, threads = item.partition("x")
+        configs.append((int(workers), int(threads or 1)))
+    return configs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga sobre /api/submit contra servicios externos falsos.")
+    parser.add_argument("--url", default=None, help="Servidor ya levantado (omite --configs).")
+    parser.add_argument("--configs", default="1x4,2x4,4x2", help="Configuraciones gunicorn workers x hilos.")
+    parser.add_argument("--rpm", type=int, default=300, help="Peticiones por minuto.")
+    parser.add_argument("--duration", type=float, default=60, help="Segundos de carga por configuración.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Peticiones en vuelo máximas del cliente.")
+    parser.add_argument("--profile", action="append", default=[], help="Perfil de servicio falso (ver fake_services.py).")
+    parser.add_argument("--json", action="store_true", help="Salida JSON.")
+    args = parser.parse_args()
+
+    if args.url:
+        runs = [run_load(args.url.rstrip("/"), args.rpm, args.duration, args.concurrency)]
+        fake_stats = None
+    else:
+        fake = FakeServices(build_profiles(args.profile)).start()
+        try:
+            runs = [run_config(w, t, fake, args.rpm, args.duration, args.concurrency) for w, t in parse_configs(args.configs)]
+            fake_stats = fake.stats()
+        finally:
+            fake.stop()
+
+    if args.json:
+        print(json.dumps({"cores": os.cpu_count(), "runs": runs, "fake_services": fake_stats}, indent=2))
+    else:
+        print(f"📈 Carga /api/submit: {args.rpm} req/min durante {args.duration:g}s ({os.cpu_count()} núcleo(s))")
+        for r in runs:
+            label = f"{r['workers']}x{r['threads']}" if "workers" in r else args.url
+            print(f"   {label:<8} {r['throughput_per_min']:>7}/min  p50={r['p50_ms']:>8} ms  p95={r['p95_ms']:>8} ms"
+                  f"  p99={r['p99_ms']:>8} ms  mem={r.get('memory_mb')} MB  {r['statuses']}")
+        if fake_stats:
+            print("   Servicios falsos: " + ", ".join(
+                f"{name}={s['requests']} ({s['throttled']} x 429, {s['errors']} x 5xx)" for name, s in fake_stats["services"].items()))
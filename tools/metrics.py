@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows: sin candado entre procesos
+    fcntl = None
+
+from structured_log import log
+
+# Métricas del pipeline de submit: histogramas de latencia por etapa (validación, IA, CRM por canal,
+# PDF) y contadores (contingencias, 422, 502...). Cada proceso acumula en memoria (un bisect y tres
+# sumas por observación) y vuelca su snapshot a METRICS_DIR/metrics-<pid>-<inicio>.json cada
+# METRICS_FLUSH_INTERVAL segundos; /metrics suma los snapshots de todos los workers de gunicorn
+# (y del worker de la cola) y responde en formato de texto de Prometheus.
+# El nombre incluye el instante de arranque del proceso: un pid reutilizado no pisa el snapshot del
+# worker muerto. Los snapshots de workers terminados se suman a metrics-archive.json y se borran:
+# los contadores nunca retroceden y el directorio no crece con cada reinicio (max_requests).
+METRICS_ENABLED = os.getenv("KONTIFY_METRICS_ENABLED", "1") == "1"
+METRICS_DIR = os.getenv("KONTIFY_METRICS_DIR", os.path.join(os.getcwd(), '.tmp', 'metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+
+STAGE_HISTOGRAM = "kontify_stage_duration_seconds"
+# Límites (segundos): de validación (ms) a Gemini/Sheets con reintentos (decenas de segundos)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRIC_HELP = {
+    STAGE_HISTOGRAM: "Latencia por etapa del pipeline de submit.",
+    "kontify_submissions_total": "Solicitudes de diagnóstico por ruta y código de respuesta.",
+    "kontify_contingency_fallbacks_total": "Reportes de contingencia generados porque la IA falló.",
+    "kontify_notify_deliveries_total": "Entregas de notificación por canal y resultado."
+}
+
+ARCHIVE_FILE = "metrics-archive.json"
+LOCK_FILE = ".metrics.lock"
+
+def _process_start(pid):
+    """Instante de arranque del proceso (ticks desde el boot, /proc/<pid>/stat) o None fuera de Linux."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+def _is_dead(snapshot):
+    pid = snapshot.get("pid")
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    # Mismo pid, otro proceso: el worker original ya terminó
+    started = snapshot.get("started")
+    return bool(started) and _process_start(pid) not in (None, started)
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, counts=None, total=0.0, count=0):
+        self.counts = counts or [0] * (len(STAGE_BUCKETS) + 1) # Último: +Inf
+        self.sum = total
+        self.count = count
+
+    def observe(self, value):
+        self.counts[bisect_left(STAGE_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def to_dict(self):
+        return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+def _key(name, labels):
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None)))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + (extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _read(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _merge(snapshot, histograms, counters):
+    for name, labels, data in snapshot["histograms"]:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        histogram = Histogram(list(data["counts"]), data["sum"], data["count"])
+        if key in histograms:
+            histograms[key].merge(histogram)
+        else:
+            histograms[key] = histogram
+    for name, labels, value in snapshot["counters"]:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+
+def _to_snapshot(histograms, counters):
+    return {
+        "pid": None,
+        "histograms": [[name, list(labels), h.to_dict()] for (name, labels), h in histograms.items()],
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()]
+    }
+
+class Metrics:
+    def __init__(self, metrics_dir=None, flush_interval=None, enabled=None):
+        self.metrics_dir = metrics_dir or METRICS_DIR
+        self.flush_interval = METRICS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.enabled = METRICS_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._pid = None
+        self._started = None
+        self._instance = None
+        self._histograms = {}
+        self._counters = {}
+        self._last_flush = 0.0
+
+    def _check_pid(self):
+        # Tras un fork el hijo no hereda los conteos del padre (ya están en el snapshot del padre)
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._started = _process_start(self._pid)
+            self._instance = f"{self._pid}-{self._started or uuid.uuid4().hex[:12]}"
+            self._histograms = {}
+            self._counters = {}
+            self._last_flush = time.monotonic()
+
+    def observe(self, stage, seconds, **labels):
+        """Una observación de latencia (segundos) en el histograma de etapas."""
+        if not self.enabled:
+            return
+        labels["stage"] = stage
+        key = _key(STAGE_HISTOGRAM, labels)
+        with self._lock:
+            self._check_pid()
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+        self._maybe_flush()
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._check_pid()
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._maybe_flush()
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            self._check_pid()
+            return {
+                "pid": self._pid,
+                "started": self._started,
+                "instance": self._instance,
+                "histograms": [[name, list(labels), h.to_dict()] for (name, labels), h in self._histograms.items()],
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            }
+
+    def _snapshot_path(self, instance):
+        return os.path.join(self.metrics_dir, f"metrics-{instance}.json")
+
+    @contextmanager
+    def _dir_lock(self):
+        # Un solo proceso a la vez archiva/lee: evita sumar dos veces un snapshot mientras se archiva
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.metrics_dir, LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write(self, path, snapshot):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Vuelca el snapshot del proceso (temporal + rename: /metrics nunca lee un archivo a medias)."""
+        if not self.enabled:
+            return
+        self._last_flush = time.monotonic()
+        snapshot = self.snapshot()
+        if not snapshot["histograms"] and not snapshot["counters"]:
+            return
+        try:
+            os.makedirs(self.metrics_dir, exist_ok=True)
+            self._write(self._snapshot_path(snapshot["instance"]), snapshot)
+        except OSError as e:
+            log.warning("metrics_snapshot_failed", "⚠️ Métricas: no se pudo escribir el snapshot", error=str(e))
+
+    def collect(self):
+        """Suma los snapshots de todos los procesos (el propio, en vivo) y archiva los de workers muertos."""
+        histograms = {}
+        counters = {}
+        own = self.snapshot()
+        _merge(own, histograms, counters)
+        own_name = os.path.basename(self._snapshot_path(own["instance"]))
+        try:
+            names = sorted(n for n in os.listdir(self.metrics_dir)
+                           if n.startswith("metrics-") and n.endswith(".json") and n not in (own_name, ARCHIVE_FILE))
+        except FileNotFoundError:
+            names = []
+        archive_path = os.path.join(self.metrics_dir, ARCHIVE_FILE)
+        if not names and not os.path.exists(archive_path):
+            return histograms, counters
+        with self._dir_lock():
+            archive = _read(archive_path) or _to_snapshot({}, {})
+            dead = []
+            for name in names:
+                path = os.path.join(self.metrics_dir, name)
+                snapshot = _read(path)
+                if snapshot is None:
+                    continue # Worker escribiendo o archivo corrupto: se toma en el siguiente scrape
+                if _is_dead(snapshot):
+                    dead.append((path, snapshot))
+                else:
+                    _merge(snapshot, histograms, counters)
+            if dead:
+                archived_h, archived_c = {}, {}
+                for snapshot in [archive] + [snapshot for _, snapshot in dead]:
+                    _merge(snapshot, archived_h, archived_c)
+                archive = _to_snapshot(archived_h, archived_c)
+                try:
+                    self._write(archive_path, archive)
+                except OSError as e:
+                    # Los snapshots se quedan en disco y se archivan en el siguiente scrape
+                    log.warning("metrics_archive_failed", "⚠️ Métricas: no se pudo archivar snapshots", error=str(e))
+                else:
+                    for path, _ in dead:
+                        try:
+                            os.remove(path)
+                        except FileNotFoundError:
+                            pass
+            _merge(archive, histograms, counters)
+        return histograms, counters
+
+    def render(self):
+        """Formato de texto de Prometheus (version=0.0.4)."""
+        histograms, counters = self.collect()
+        lines = []
+        described = set()
+
+        def _describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), h in sorted(histograms.items()):
+            _describe(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(STAGE_BUCKETS + ("+Inf",), h.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {h.sum:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {h.count}")
+        for (name, labels), value in sorted(counters.items()):
+            _describe(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def clear_snapshots(self):
+        """Borra los snapshots (arranque del master de gunicorn o pruebas)."""
+        try:
+            names = os.listdir(self.metrics_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith("metrics-"):
+                try:
+                    os.remove(os.path.join(self.metrics_dir, name))
+                except FileNotFoundError:
+                    pass
+
+metrics = Metrics()
+# Lo acumulado desde el último volcado no se pierde al terminar el worker
+atexit.register(metrics.flush)
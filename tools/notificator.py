@@ -1,11 +1,21 @@
 import os
 import json
 import requests
-import gspread
 from dotenv import load_dotenv
 import sys
 import io
 import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from outbox import outbox, Channel, OUTBOX_ENABLED, STATUS_DELIVERED
+from sheets_client import sheets_client, SHEETS_HTTP_TIMEOUT
+from sheets_writer import sheets_channel
+from text_normalize import sheets_cells
+from structured_log import log
+from metrics import metrics
+import async_http
 
 # Forzar UTF-8 en salida estándar para Windows
 if sys.stdout.encoding != 'utf-8':
@@ -13,9 +23,73 @@ if sys.stdout.encoding != 'utf-8':
 
 load_dotenv()
 
-def notify_all(diagnostic_data, pdf_url):
-    """Orquestador de notificaciones y registro de leads"""
-    
+# Fan-out en la solicitud: Slack y email se intentan en paralelo al registrarse en el outbox,
+# así la latencia es la del canal más lento (acotada por su timeout) y no la suma de los tres.
+# Lo que no se entregue a tiempo queda en el outbox para el dispatcher.
+NOTIFY_INLINE_DELIVERY = os.getenv("NOTIFY_INLINE_DELIVERY", "1") == "1"
+NOTIFY_POOL_SIZE = int(os.getenv("NOTIFY_POOL_SIZE", 4))
+SLACK_TIMEOUT = float(os.getenv("SLACK_TIMEOUT", 5))
+SENDGRID_TIMEOUT = float(os.getenv("SENDGRID_TIMEOUT", 10))
+CHANNEL_TIMEOUTS = {"slack": SLACK_TIMEOUT, "email": SENDGRID_TIMEOUT}
+# Sin outbox también Sheets se entrega en línea: la espera de la solicitud se acota igual por canal
+INLINE_TIMEOUTS = dict(CHANNEL_TIMEOUTS, sheets=SHEETS_HTTP_TIMEOUT)
+
+_local = {"pid": None}
+_local_lock = threading.Lock()
+
+def _process_resources():
+    """Sesión HTTP keep-alive, cliente SendGrid y pool de hilos por proceso (no sobreviven un fork)."""
+    if _local["pid"] != os.getpid():
+        with _local_lock:
+            if _local["pid"] != os.getpid():
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=NOTIFY_POOL_SIZE * 2)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _local.update(
+                    session=session,
+                    sendgrid=None,
+                    pool=ThreadPoolExecutor(max_workers=NOTIFY_POOL_SIZE, thread_name_prefix="notify"),
+                    pid=os.getpid()
+                )
+    return _local
+
+def _sendgrid_client(api_key):
+    resources = _process_resources()
+    client = resources.get("sendgrid")
+    if client is None or client.api_key != api_key:
+        from sendgrid import SendGridAPIClient
+        # SENDGRID_API_HOST: endpoint alterno (tools/fake_services.py para pruebas de carga)
+        client = SendGridAPIClient(api_key, host=os.getenv("SENDGRID_API_HOST", "https://api.sendgrid.com"))
+        client.client.timeout = SENDGRID_TIMEOUT
+        resources["sendgrid"] = client
+    return client
+
+class ChannelResult:
+    __slots__ = ("status", "elapsed_ms")
+
+    def __init__(self, status, elapsed_ms=None):
+        self.status = status # delivered | queued | retrying | dead | skipped | failed
+        self.elapsed_ms = elapsed_ms
+
+    def to_dict(self):
+        return {"status": self.status, "elapsed_ms": self.elapsed_ms}
+
+class NotificationResult:
+    """Resultado por canal de notify_all. Es verdadero si el lead quedó registrado para el CRM (Sheets)."""
+
+    def __init__(self):
+        self.channels = {}
+
+    def __bool__(self):
+        sheets = self.channels.get("sheets")
+        return bool(sheets) and sheets.status in (STATUS_DELIVERED, "queued")
+
+    def to_dict(self):
+        return {name: result.to_dict() for name, result in self.channels.items()}
+
+def _build_records(diagnostic_data, pdf_url, request_id):
+    """Un registro (canal, llave de idempotencia, payload) por efecto: Slack, Sheets y email."""
     # Prioridad absoluta a lead_metadata en la raíz (Datos reales del formulario)
     lead = diagnostic_data.get('lead_metadata', {})
     
@@ -58,9 +132,14 @@ def notify_all(diagnostic_data, pdf_url):
         if score != 'N/A' and float(score) > 70:
             recommended_service = "Blindaje Gold / PropCo"
     except: pass
+
+    # La URL del PDF incluye el folio de la solicitud: reintentos del mismo lead no duplican efectos
+    records = []
     
     # 1. Notificación Slack
-    send_webhook_notification(lead, score, recommended_service, pdf_url)
+    slack_message = build_webhook_message(lead, score, recommended_service, pdf_url)
+    if slack_message:
+        records.append(("slack", f"slack:{pdf_url}", slack_message))
     
     # 2. Registro en Google Sheets
     lead_data = {
@@ -75,18 +154,168 @@ def notify_all(diagnostic_data, pdf_url):
         "billing": billing
     }
     
-    print(f"📊 Orquestando registro en Sheets para: {company} | RFC: {rfc}")
-    sheets_ok = register_in_sheets(lead_data, score, summary, pdf_url, recommended_service, timestamp)
+    row = build_sheets_row(lead_data, score, summary, pdf_url, recommended_service, timestamp)
+    if row:
+        log.payload("sheets_row", row, request_id, "📊 Fila CRM para Sheets")
+        records.append(("sheets", f"sheets:{pdf_url}", row))
     
     # 3. Email de Cortesía
-    send_courtesy_email(lead, pdf_url)
-    return sheets_ok
+    courtesy_email = build_courtesy_email(lead, pdf_url)
+    if courtesy_email:
+        records.append(("email", f"email:{pdf_url}", courtesy_email))
+    return records, company
+
+def _new_result():
+    result = NotificationResult()
+    for channel in ("slack", "sheets", "email"):
+        result.channels[channel] = ChannelResult("skipped")
+    return result
+
+def _inline_outcome(result, channel, request_id, elapsed_ms=None, error=None):
+    """Resultado de una entrega en línea sin outbox (sin reintentos)."""
+    if error is not None:
+        metrics.inc("kontify_notify_deliveries_total", channel=channel, outcome="failed")
+        log.error("notify_failed", f"❌ Error entregando [{channel}]", request_id, channel=channel, error=str(error))
+        result.channels[channel] = ChannelResult("failed")
+        return
+    result.channels[channel] = ChannelResult(STATUS_DELIVERED, elapsed_ms)
+    metrics.observe("notify_channel", elapsed_ms / 1000, channel=channel)
+    metrics.inc("kontify_notify_deliveries_total", channel=channel, outcome="delivered")
+
+def notify_all(diagnostic_data, pdf_url, request_id=None):
+    """
+    Orquestador de notificaciones y registro de leads.
+    Escribe un registro de outbox por efecto (Slack, Sheets, email) en una sola transacción y regresa;
+    la entrega con reintentos corre en segundo plano. Retorna True si el lead quedó registrado para el CRM.
+    """
+    records, company = _build_records(diagnostic_data, pdf_url, request_id)
+    result = _new_result()
+
+    if not OUTBOX_ENABLED:
+        # Entrega en línea (sin outbox): mismo handler por canal, en paralelo y sin reintentos
+        pool = _process_resources()["pool"]
+        futures = {channel: pool.submit(_timed, outbox.channels[channel].handler, [record]) for channel, _, record in records}
+        if futures:
+            wait(futures.values(), timeout=max(INLINE_TIMEOUTS[c] for c in futures))
+        for channel, future in futures.items():
+            if not future.done():
+                # Handler colgado: la solicitud no lo espera (el hilo del pool termina por su cuenta)
+                _inline_outcome(result, channel, request_id, error=TimeoutError(f"sin respuesta en {INLINE_TIMEOUTS[channel]}s"))
+                continue
+            try:
+                _inline_outcome(result, channel, request_id, elapsed_ms=future.result()[1])
+            except Exception as e:
+                _inline_outcome(result, channel, request_id, error=e)
+        return result
+
+    try:
+        new = outbox.enqueue_many(records)
+    except Exception as e:
+        log.error("outbox_enqueue_failed", "❌ Error Crítico registrando en outbox", request_id, error=str(e))
+        result.channels["sheets"] = ChannelResult("failed")
+        return result
+    outbox.start()
+    log.info("outbox_enqueued", f"📥 Lead [{company}] en outbox", request_id, new=new, records=len(records))
+    for channel, _, _ in records:
+        result.channels[channel] = ChannelResult("queued")
+
+    if NOTIFY_INLINE_DELIVERY:
+        # Sheets se queda en el outbox: su canal agrupa filas en append_rows por cuota
+        pool = _process_resources()["pool"]
+        futures = {
+            channel: pool.submit(_timed, outbox.deliver_key, key)
+            for channel, key, _ in records if channel in CHANNEL_TIMEOUTS
+        }
+        if futures:
+            wait(futures.values(), timeout=max(CHANNEL_TIMEOUTS[c] for c in futures))
+        for channel, future in futures.items():
+            if future.done() and not future.exception():
+                status, elapsed_ms = future.result()
+                result.channels[channel] = ChannelResult("queued" if status == "pending" else status, elapsed_ms)
+    log.info("notified", f"📨 Notificaciones [{company}]", request_id, channels=result.to_dict())
+    return result
+
+def _timed(fn, arg):
+    start = time.perf_counter()
+    value = fn(arg)
+    return value, round((time.perf_counter() - start) * 1000, 1)
+
+# Entregas en línea que siguen en el event loop después de responder (se conserva la referencia)
+_inline_tasks = set()
+
+def _keep_running(task):
+    _inline_tasks.add(task)
+    task.add_done_callback(lambda t: _inline_tasks.discard(t) or t.cancelled() or t.exception())
+
+async def _atimed(awaitable):
+    start = time.perf_counter()
+    value = await awaitable
+    return value, round((time.perf_counter() - start) * 1000, 1)
+
+async def _call_handler(channel, payloads):
+    if channel.async_handler is not None:
+        return await channel.async_handler(payloads)
+    return await asyncio.to_thread(channel.handler, payloads)
+
+async def anotify_all(diagnostic_data, pdf_url, request_id=None):
+    """
+    notify_all() para el event loop (tools/asgi_app.py): mismo outbox y mismo resultado, pero el
+    fan-out en línea de Slack y email va por HTTP async (canales con async_handler) sin ocupar hilos.
+    Sheets se queda en el outbox: su canal agrupa filas en append_rows por cuota.
+    """
+    records, company = _build_records(diagnostic_data, pdf_url, request_id)
+    result = _new_result()
+
+    if not OUTBOX_ENABLED:
+        tasks = {
+            channel: asyncio.ensure_future(_atimed(_call_handler(outbox.channels[channel], [record])))
+            for channel, _, record in records
+        }
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=max(INLINE_TIMEOUTS[c] for c in tasks))
+        for channel, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                _inline_outcome(result, channel, request_id, error=TimeoutError(f"sin respuesta en {INLINE_TIMEOUTS[channel]}s"))
+                continue
+            try:
+                _inline_outcome(result, channel, request_id, elapsed_ms=task.result()[1])
+            except Exception as e:
+                _inline_outcome(result, channel, request_id, error=e)
+        return result
 
-def send_webhook_notification(lead, score, recommended_service, pdf_url):
+    try:
+        new = await asyncio.to_thread(outbox.enqueue_many, records)
+    except Exception as e:
+        log.error("outbox_enqueue_failed", "❌ Error Crítico registrando en outbox", request_id, error=str(e))
+        result.channels["sheets"] = ChannelResult("failed")
+        return result
+    outbox.start()
+    log.info("outbox_enqueued", f"📥 Lead [{company}] en outbox", request_id, new=new, records=len(records))
+    for channel, _, _ in records:
+        result.channels[channel] = ChannelResult("queued")
+
+    if NOTIFY_INLINE_DELIVERY:
+        tasks = {
+            channel: asyncio.ensure_future(_atimed(outbox.adeliver_key(key)))
+            for channel, key, _ in records if channel in CHANNEL_TIMEOUTS
+        }
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=max(CHANNEL_TIMEOUTS[c] for c in tasks))
+        for channel, task in tasks.items():
+            if not task.done():
+                _keep_running(task) # Termina en segundo plano; si falla, el outbox reintenta
+            elif not task.exception():
+                status, elapsed_ms = task.result()
+                result.channels[channel] = ChannelResult("queued" if status == "pending" else status, elapsed_ms)
+    log.info("notified", f"📨 Notificaciones [{company}]", request_id, channels=result.to_dict())
+    return result
+
+def build_webhook_message(lead, score, recommended_service, pdf_url):
     webhook_url = os.getenv("SLACK_WEBHOOK_URL")
     if not webhook_url:
-        print("⚠️ SLACK_WEBHOOK_URL no configurada.")
-        return
+        log.warning("slack_not_configured", "⚠️ SLACK_WEBHOOK_URL no configurada.")
+        return None
 
     niche = lead.get('niche_id', 'Nicho Desconocido').upper()
     company = lead.get('company_name', 'Empresa Desconocida')
@@ -95,159 +324,71 @@ def send_webhook_notification(lead, score, recommended_service, pdf_url):
               f"📊 *Riesgo:* {score}%\n" \
               f"💡 *Recomendación:* {recommended_service}\n" \
               f"📄 *PDF:* {pdf_url}"
-              
-    try:
-        requests.post(webhook_url, json={"text": message})
-        print("✅ Notificación de Webhook enviada.")
-    except Exception as e:
-        print(f"❌ Error enviando Webhook: {e}")
+    return {"text": message}
 
-def register_in_sheets(lead, score, summary, pdf_url, recommended_service, timestamp):
-    sheets_id = os.getenv("GOOGLE_SHEETS_ID", "1zYPKfP1xObqhxkRNmaTjCbjI-jPR1Vec2c9uMHH0sVg")
-    creds_json = os.getenv("GOOGLE_CREDS_JSON")
-    
-    if not creds_json:
-        print("⚠️ Google Sheets no configurado (Faltan credenciales en ENV).")
-        log_lead_locally(lead, score, summary, pdf_url)
-        return False
+def send_webhook_notifications(messages):
+    """Handler del canal Slack: lanza excepción si el webhook no confirma (el outbox reintenta)."""
+    webhook_url = os.getenv("SLACK_WEBHOOK_URL")
+    for message in messages:
+        response = _process_resources()["session"].post(webhook_url, json=message, timeout=SLACK_TIMEOUT)
+        response.raise_for_status()
+        log.info("slack_sent", "✅ Notificación de Webhook enviada.", status=response.status_code)
 
-    try:
-        from google.oauth2.service_account import Credentials
-        scope = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-        
-        import json
-        import re
-        import base64
-
-        creds = None
-        creds_b64 = os.getenv("GOOGLE_CREDS_BASE64")
-        
-        if creds_b64:
-            try:
-                # 1. Intentar decodificar Base64 (Solución Robusta)
-                decoded_json = base64.b64decode(creds_b64).decode('utf-8')
-                info = json.loads(decoded_json)
-                creds = Credentials.from_service_account_info(info, scopes=scope)
-                print(f"🔐 CRM: Credenciales BASE64 cargadas ({info.get('client_email')})")
-            except Exception as b64_err:
-                print(f"⚠️ Fallo al decodificar GOOGLE_CREDS_BASE64: {b64_err}. Intentando fallback...")
-        
-        if not creds and creds_json:
-            try:
-                # 2. Intentar JSON plano con reparación de saltos de línea
-                creds_json_clean = re.sub(r'#.*', '', creds_json).strip()
-                creds_json_clean = creds_json_clean.replace('\\n', '\n').replace('\n', '\n')
-                info = json.loads(creds_json_clean)
-                creds = Credentials.from_service_account_info(info, scopes=scope)
-                print(f"🔐 CRM: Credenciales ENV (JSON) cargadas ({info.get('client_email')})")
-            except Exception as json_err:
-                print(f"⚠️ Fallo al parsear GOOGLE_CREDS_JSON: {json_err}.")
-        
-           if not creds:
-               raise ValueError("No se encontraron credenciales válidas (B64 o ENV JSON)")
-            
-        client = gspread.authorize(creds)
-        print(f"📊 CRM: Conectando a Sheet ID: {sheets_id}...")
-        
-        # Intento de apertura con manejo de errores específico
-        try:
-            spreadsheet = client.open_by_key(sheets_id)
-            sheet = spreadsheet.get_worksheet(0) # Más seguro que .sheet1
-            print(f"✅ CRM: Conectado exitosamente a '{spreadsheet.title}'")
-        except Exception as sheet_err:
-            err_str = str(sheet_err)
-            if "403" in err_str:
-                print("🛑 CRM ERROR 403: Acceso denegado. Verifica permisos de la cuenta de servicio y posibles bloqueos en Render.")
-            elif "invalid_grant" in err_str or "unauthorized" in err_str.lower():
-                print("🛑 CRM ERROR: Token inválido/expirado o cuenta de servicio bloqueada.")
-            print(f"🛑 CRM ERROR: No se pudo abrir la hoja. ¿ID correcto? ¿Compartida con el correo anterior? Error: {sheet_err}")
-            raise sheet_err
-        
-        # Mapeo exacto según PROTOCOLO MAESTRO KONTIFY:
-        # A: Fecha y Hora | B: Empresa | C: Nicho | D: Representante | E: Email | F: Teléfono
-        # G: Score | H: Hallazgo | I: Servicio | J: Link PDF | K: RFC | L: Actividad Principal
-        
-        def safe_str(val):
-            if val is None: return "N/A"
-            s = str(val).strip()
-            # Mantener caracteres latinos (acentos, ñ) pero filtrar basura
-            return "".join(c for c in s if c.isprintable() or c.isspace())
-
-        row = [
-            safe_str(timestamp),                         # A (0)
-            safe_str(lead.get('company', 'N/A')),        # B (1)
-            safe_str(lead.get('niche', 'N/A')),          # C (2)
-            safe_str(f"{lead.get('representative', 'N/A')} ({lead.get('role', 'N/A')})"), # D (3)
-            safe_str(lead.get('email', 'N/A')),          # E (4)
-            safe_str(lead.get('phone', 'N/A')),          # F (5)
-            safe_str(score),                             # G (6)
-            safe_str(summary[:400]),                     # H (7) - Ampliado para más detalle
-            safe_str(recommended_service),               # I (8)
-            safe_str(pdf_url),                           # J (9)
-            safe_str(lead.get('rfc', 'N/A')),            # K (10)
-            safe_str(lead.get('activity', 'N/A'))        # L (11)
-        ]
-        
-        print(f"DATOS ENVIADOS A SHEETS: {json.dumps(row, ensure_ascii=False)}")
-
-        max_retries = 3
-        for attempt in range(1, max_retries + 1):
-            try:
-                sheet.append_row(row, value_input_option='RAW')
-                print(f"✅ Lead [{lead.get('company')}] registrado en Google Sheets (Fila Lote).")
-                return True
-            except Exception as api_err:
-                api_err_str = str(api_err)
-                if "403" in api_err_str:
-                    print(f"🛑 ERROR DE ACCESO (403): La cuenta de servicio {creds.service_account_email} no tiene permisos de EDITOR en el documento o existe bloqueo de red/Render.")
-                if "invalid_grant" in api_err_str or "unauthorized" in api_err_str.lower():
-                    print("🛑 ERROR DE AUTENTICACIÓN: Token inválido/expirado o cuenta de servicio bloqueada.")
-                if attempt < max_retries:
-                    wait_s = 2 * attempt
-                    print(f"⏳ Reintentando Google Sheets en {wait_s}s (intento {attempt}/{max_retries})...")
-                    time.sleep(wait_s)
-                else:
-                    raise api_err
+async def async_send_webhook_notifications(messages):
+    """Variante async del handler de Slack (cliente HTTP del event loop, keep-alive)."""
+    webhook_url = os.getenv("SLACK_WEBHOOK_URL")
+    for message in messages:
+        response = await async_http.client().post(webhook_url, json=message, timeout=SLACK_TIMEOUT)
+        response.raise_for_status()
+        log.info("slack_sent", "✅ Notificación de Webhook enviada.", status=response.status_code)
 
-    except Exception as e:
-        print(f"❌ Error Crítico en Google Sheets: {str(e)}")
-        log_lead_locally(lead, score, summary, pdf_url) # Fallback seguro
-        return False
-
-def log_lead_locally(lead, score, summary, pdf_url):
-    log_path = 'leads_log.jsonl'
-    log_entry = {
-        "timestamp": lead.get('timestamp'),
-        "company": lead.get('company_name'),
-        "score": score,
-        "pdf": pdf_url
-    }
-    with open(log_path, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(log_entry) + '\n')
-    print(f"📝 Lead registrado localmente en {log_path}")
+def build_sheets_row(lead, score, summary, pdf_url, recommended_service, timestamp):
+    if not sheets_client.has_credentials():
+        log.warning("sheets_not_configured", "⚠️ Google Sheets no configurado (Faltan credenciales en ENV).")
+        return None
 
-def send_courtesy_email(lead, pdf_url):
-    """Envío real de email vía SendGrid"""
-    api_key = os.getenv("SENDGRID_API_KEY")
-    sender_email = os.getenv("SENDER_EMAIL", "contacto@mentoresestrategicos.com") # Default
+    # Mapeo exacto según PROTOCOLO MAESTRO KONTIFY:
+    # A: Fecha y Hora | B: Empresa | C: Nicho | D: Representante | E: Email | F: Teléfono
+    # G: Score | H: Hallazgo | I: Servicio | J: Link PDF | K: RFC | L: Actividad Principal
     
-    if not api_key:
-        print("⚠️ SENDGRID_API_KEY no configurada. Saltando envío de email.")
-        return
+    row = sheets_cells([
+        timestamp,                                   # A (0)
+        lead.get('company', 'N/A'),                  # B (1)
+        lead.get('niche', 'N/A'),                    # C (2)
+        f"{lead.get('representative', 'N/A')} ({lead.get('role', 'N/A')})", # D (3)
+        lead.get('email', 'N/A'),                    # E (4)
+        lead.get('phone', 'N/A'),                    # F (5)
+        score,                                       # G (6)
+        summary[:400],                               # H (7) - Ampliado para más detalle
+        recommended_service,                         # I (8)
+        pdf_url,                                     # J (9)
+        lead.get('rfc', 'N/A'),                      # K (10)
+        lead.get('activity', 'N/A')                  # L (11)
+    ]) # Mantener caracteres latinos (acentos, ñ) pero filtrar basura
+    return row
+
+def build_courtesy_email(lead, pdf_url):
+    """Datos del email de cortesía (el envío real vía SendGrid lo hace el canal 'email')."""
+    if not os.getenv("SENDGRID_API_KEY"):
+        log.warning("sendgrid_not_configured", "⚠️ SENDGRID_API_KEY no configurada. Saltando envío de email.")
+        return None
 
     email = lead.get('contact_email') or lead.get('email')
     name = lead.get('contact_name') or lead.get('representative')
     
     if not email:
-        print("⚠️ No se encontró email del lead para enviar cortesía.")
-        return
+        log.warning("courtesy_email_missing", "⚠️ No se encontró email del lead para enviar cortesía.")
+        return None
+    return {"email": email, "name": name, "pdf_url": pdf_url}
 
-    from sendgrid import SendGridAPIClient
+def _courtesy_message(data, sender_email):
     from sendgrid.helpers.mail import Mail
 
-    message = Mail(
+    name = data.get('name')
+    pdf_url = data.get('pdf_url')
+    return Mail(
         from_email=sender_email,
-        to_emails=email,
+        to_emails=data['email'],
         subject='Tu Diagnóstico de Riesgo Kontify está listo 💼',
         html_content=f"""
             <div style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
@@ -262,12 +403,42 @@ def send_courtesy_email(lead, pdf_url):
         """
     )
 
-    try:
-        sg = SendGridAPIClient(api_key)
-        response = sg.send(message)
-        print(f"✅ Email enviado a {email} (Status: {response.status_code})")
-    except Exception as e:
-        print(f"❌ Error enviando email con SendGrid: {e}")
+def send_courtesy_emails(emails):
+    """Envío real de email vía SendGrid (handler del canal 'email')"""
+    api_key = os.getenv("SENDGRID_API_KEY")
+    sender_email = os.getenv("SENDER_EMAIL", "contacto@mentoresestrategicos.com") # Default
+
+    for data in emails:
+        response = _sendgrid_client(api_key).send(_courtesy_message(data, sender_email))
+        if response.status_code >= 400:
+            raise RuntimeError(f"SendGrid respondió {response.status_code}")
+        log.info("courtesy_email_sent", "✅ Email de cortesía enviado", status=response.status_code)
+
+async def async_send_courtesy_emails(emails):
+    """Variante async del canal 'email': el mismo Mail, enviado a /v3/mail/send por el cliente del event loop."""
+    api_key = os.getenv("SENDGRID_API_KEY")
+    sender_email = os.getenv("SENDER_EMAIL", "contacto@mentoresestrategicos.com") # Default
+    host = os.getenv("SENDGRID_API_HOST", "https://api.sendgrid.com")
+
+    for data in emails:
+        response = await async_http.client().post(
+            f"{host.rstrip('/')}/v3/mail/send",
+            json=_courtesy_message(data, sender_email).get(),
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=SENDGRID_TIMEOUT
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(f"SendGrid respondió {response.status_code}")
+        log.info("courtesy_email_sent", "✅ Email de cortesía enviado", status=response.status_code)
+
+def register_channels(box):
+    """Canales de entrega del outbox (el de Sheets agrupa filas en append_rows)."""
+    box.register(Channel("slack", send_webhook_notifications, async_handler=async_send_webhook_notifications))
+    box.register(sheets_channel())
+    box.register(Channel("email", send_courtesy_emails, async_handler=async_send_courtesy_emails))
+    return box
+
+register_channels(outbox)
 
 if __name__ == "__main__":
     # Prueba rápida con datos simulados
@@ -276,3 +447,4 @@ if __name__ == "__main__":
         "diagnostic_payload": {"risk_assessment": {"overall_risk_score": 85}}
     }
     notify_all(dummy_data, "http://localhost:5000/reports/test.pdf")
+    print(f"✅ {outbox.drain()} efecto(s) entregados.")
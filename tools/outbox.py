@@ -0,0 +1,436 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+
+from metrics import metrics
+from structured_log import log
+
+# Outbox transaccional de efectos secundarios (Slack, Google Sheets, email).
+# La solicitud solo inserta un registro por efecto en SQLite (WAL) y regresa; hilos de entrega
+# en cada worker (o `python tools/outbox.py`) los envían con reintentos exponenciales.
+# Cada registro lleva una llave de idempotencia: reenviar el mismo lead no duplica el efecto.
+# Tras OUTBOX_MAX_ATTEMPTS fallos el registro pasa a 'dead' (dead-letter) para revisión manual.
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "1") == "1"
+OUTBOX_DB_PATH = os.getenv("KONTIFY_OUTBOX_DB", os.path.join(os.getcwd(), '.tmp', 'outbox.sqlite3'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_BASE_BACKOFF = float(os.getenv("OUTBOX_BASE_BACKOFF", 2))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", 600))
+OUTBOX_CLAIM_SECONDS = float(os.getenv("OUTBOX_CLAIM_SECONDS", 60))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 0.5))
+# Retención: el payload lleva datos del lead (nombre, email, teléfono, RFC). Los entregados se borran
+# tras OUTBOX_RETENTION_HOURS y los dead-letter tras OUTBOX_DEAD_RETENTION_HOURS (tiempo para revisarlos)
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", 72))
+OUTBOX_DEAD_RETENTION_HOURS = float(os.getenv("OUTBOX_DEAD_RETENTION_HOURS", 720))
+OUTBOX_PRUNE_INTERVAL = float(os.getenv("OUTBOX_PRUNE_INTERVAL", 300))
+
+STATUS_PENDING = "pending"
+STATUS_DELIVERED = "delivered"
+STATUS_DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    idem_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    delivered_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (channel, status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_settled ON outbox (status, delivered_at);
+CREATE TABLE IF NOT EXISTS channels (
+    name TEXT PRIMARY KEY,
+    next_run_at REAL NOT NULL,
+    backoff REAL NOT NULL DEFAULT 0
+);
+"""
+
+class DeferDelivery(Exception):
+    """El canal está saturado (p. ej. cuota de Sheets): pausar el canal sin gastar intentos."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class Channel:
+    """
+    Destino de entrega. handler(payloads) recibe una lista de payloads y debe lanzar excepción si falla.
+    batch_size > 1 agrupa registros; linger es la espera máxima antes de enviar un lote incompleto;
+    min_interval espacía las entregas del canal entre todos los workers (cuotas por minuto).
+    async_handler (opcional) es la variante corrutina de handler para el fan-out en el event loop.
+    """
+
+    def __init__(self, name, handler, batch_size=1, linger=0.0, min_interval=0.0, async_handler=None):
+        self.name = name
+        self.handler = handler
+        self.async_handler = async_handler
+        self.batch_size = batch_size
+        self.linger = linger
+        self.min_interval = min_interval
+
+class Outbox:
+    def __init__(self, db_path=None, max_attempts=None, base_backoff=None, max_backoff=None):
+        self.db_path = db_path or OUTBOX_DB_PATH
+        self.max_attempts = max_attempts or OUTBOX_MAX_ATTEMPTS
+        self.base_backoff = OUTBOX_BASE_BACKOFF if base_backoff is None else base_backoff
+        self.max_backoff = max_backoff or OUTBOX_MAX_BACKOFF
+        self.channels = {}
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.failures = 0
+        self.pruned = 0
+        self._last_prune = 0.0
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def register(self, channel):
+        self.channels[channel.name] = channel
+        return channel
+
+    def enqueue_many(self, records):
+        """
+        Inserta [(canal, llave_idempotencia, payload), ...] en una sola transacción.
+        Retorna cuántos registros son nuevos (los duplicados por llave se ignoran).
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            inserted = 0
+            for channel, idem_key, payload in records:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO outbox (channel, idem_key, payload, status, next_attempt_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (channel, idem_key, json.dumps(payload, ensure_ascii=False), STATUS_PENDING, now, now)
+                )
+                inserted += cur.rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        self._wake.set()
+        return inserted
+
+    def enqueue(self, channel, idem_key, payload):
+        return self.enqueue_many([(channel, idem_key, payload)])
+
+    def _claim(self, conn, channel, now):
+        """Reserva el siguiente lote vencido del canal si su agenda lo permite."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            schedule = conn.execute("SELECT next_run_at FROM channels WHERE name = ?", (channel.name,)).fetchone()
+            if schedule and schedule[0] > now:
+                conn.execute("COMMIT")
+                return []
+            rows = conn.execute(
+                "SELECT id, payload, attempts, created_at FROM outbox "
+                "WHERE channel = ? AND status = ? AND next_attempt_at <= ? AND claimed_until < ? "
+                "ORDER BY id LIMIT ?",
+                (channel.name, STATUS_PENDING, now, now, channel.batch_size)
+            ).fetchall()
+            # Lote incompleto: esperar más registros hasta que el más antiguo cumpla linger
+            if rows and len(rows) < channel.batch_size and now - rows[0]['created_at'] < channel.linger:
+                rows = []
+            if rows:
+                ids = [r['id'] for r in rows]
+                conn.execute(
+                    f"UPDATE outbox SET claimed_until = ? WHERE id IN ({','.join('?' * len(ids))})",
+                    [now + OUTBOX_CLAIM_SECONDS] + ids
+                )
+                if channel.min_interval:
+                    conn.execute(
+                        "INSERT INTO channels (name, next_run_at) VALUES (?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET next_run_at = excluded.next_run_at",
+                        (channel.name, now + channel.min_interval)
+                    )
+            conn.execute("COMMIT")
+            return rows
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _backoff(self, attempts):
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def deliver_channel(self, name):
+        """Entrega un lote del canal. Retorna el número de registros entregados."""
+        channel = self.channels[name]
+        conn = self._connect()
+        try:
+            rows = self._claim(conn, channel, time.time())
+            return self._process(conn, channel, rows)
+        finally:
+            conn.close()
+
+    def _claim_key(self, conn, idem_key):
+        """Reserva un registro puntual. Retorna (fila, None) o (None, estado actual si otro worker ya lo tomó)."""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, channel, payload, attempts, created_at, status, claimed_until FROM outbox WHERE idem_key = ?",
+            (idem_key,)
+        ).fetchone()
+        if row is None or row['status'] != STATUS_PENDING or row['claimed_until'] >= now:
+            conn.execute("COMMIT")
+            return None, (row['status'] if row else None)
+        conn.execute("UPDATE outbox SET claimed_until = ? WHERE id = ?", (now + OUTBOX_CLAIM_SECONDS, row['id']))
+        conn.execute("COMMIT")
+        return row, None
+
+    def _key_status(self, conn, row, delivered):
+        if delivered:
+            return STATUS_DELIVERED
+        status = conn.execute("SELECT status, attempts FROM outbox WHERE id = ?", (row['id'],)).fetchone()
+        if status['status'] == STATUS_DEAD:
+            return STATUS_DEAD
+        return "retrying" if status['attempts'] > row['attempts'] else "deferred"
+
+    def deliver_key(self, idem_key):
+        """
+        Entrega inmediata de un registro puntual (fan-out en la solicitud).
+        Retorna 'delivered', 'retrying', 'dead', 'deferred' o el estado actual si otro worker ya lo tomó.
+        """
+        conn = self._connect()
+        try:
+            row, status = self._claim_key(conn, idem_key)
+            if row is None:
+                return status
+            delivered = self._process(conn, self.channels[row['channel']], [row])
+            return self._key_status(conn, row, delivered)
+        finally:
+            conn.close()
+
+    def _with_connection(self, fn, *args):
+        conn = self._connect()
+        try:
+            return fn(conn, *args)
+        finally:
+            conn.close()
+
+    async def adeliver_key(self, idem_key):
+        """
+        deliver_key() para el event loop: la reserva y el registro del resultado (SQLite) corren en un
+        hilo; el envío usa el async_handler del canal (o su handler en un hilo si no tiene).
+        """
+        row, status = await asyncio.to_thread(self._with_connection, self._claim_key, idem_key)
+        if row is None:
+            return status
+        channel = self.channels[row['channel']]
+        payloads = [json.loads(row['payload'])]
+        start = time.perf_counter()
+        error = None
+        try:
+            if channel.async_handler is not None:
+                await channel.async_handler(payloads)
+            else:
+                await asyncio.to_thread(channel.handler, payloads)
+        except Exception as e:
+            error = e
+
+        def _finish(conn):
+            delivered = self._settle(conn, channel, [row], start, error)
+            return self._key_status(conn, row, delivered)
+        return await asyncio.to_thread(self._with_connection, _finish)
+
+    def _process(self, conn, channel, rows):
+        """Ejecuta el handler sobre filas ya reservadas y registra entrega, reintento o dead-letter."""
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        try:
+            channel.handler([json.loads(r['payload']) for r in rows])
+        except Exception as e:
+            return self._settle(conn, channel, rows, start, e)
+        return self._settle(conn, channel, rows, start)
+
+    def _settle(self, conn, channel, rows, start, error=None):
+        """Registra el resultado de un envío: entrega, pausa del canal, reintento o dead-letter."""
+        name = channel.name
+        ids = [r['id'] for r in rows]
+        placeholders = ','.join('?' * len(ids))
+        if isinstance(error, DeferDelivery):
+            metrics.inc("kontify_notify_deliveries_total", channel=name, outcome="deferred")
+            # Cuota/saturación: se libera el lote y se pausa el canal con backoff creciente
+            previous = conn.execute("SELECT backoff FROM channels WHERE name = ?", (name,)).fetchone()
+            backoff = min(self.max_backoff, max(error.retry_after, (previous[0] * 2) if previous and previous[0] else 0))
+            conn.execute(f"UPDATE outbox SET claimed_until = 0 WHERE id IN ({placeholders})", ids)
+            conn.execute(
+                "INSERT INTO channels (name, next_run_at, backoff) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET next_run_at = excluded.next_run_at, backoff = excluded.backoff",
+                (name, time.time() + backoff, backoff)
+            )
+            log.warning("outbox_channel_paused", f"🚦 OUTBOX [{name}]: canal en pausa", channel=name, backoff_s=round(backoff), error=str(error))
+            return 0
+        if error is not None:
+            self.failures += 1
+            metrics.observe("notify_channel", time.perf_counter() - start, channel=name)
+            metrics.inc("kontify_notify_deliveries_total", channel=name, outcome="failed")
+            now = time.time()
+            for r in rows:
+                attempts = r['attempts'] + 1
+                if attempts >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE outbox SET status = ?, attempts = ?, claimed_until = 0, last_error = ? WHERE id = ?",
+                        (STATUS_DEAD, attempts, str(error)[:500], r['id'])
+                    )
+                    log.error("outbox_dead_letter", f"☠️ OUTBOX [{name}]: registro a dead-letter", channel=name, record=r['id'], attempts=attempts, error=str(error))
+                else:
+                    delay = self._backoff(attempts)
+                    conn.execute(
+                        "UPDATE outbox SET attempts = ?, next_attempt_at = ?, claimed_until = 0, last_error = ? WHERE id = ?",
+                        (attempts, now + delay, str(error)[:500], r['id'])
+                    )
+                    log.warning("outbox_retry", f"⏳ OUTBOX [{name}]: reintento programado", channel=name, record=r['id'], delay_s=round(delay, 1), attempt=attempts, max_attempts=self.max_attempts, error=str(error))
+            return 0
+        conn.execute(
+            f"UPDATE outbox SET status = ?, attempts = attempts + 1, delivered_at = ?, claimed_until = 0, last_error = NULL "
+            f"WHERE id IN ({placeholders})",
+            [STATUS_DELIVERED, time.time()] + ids
+        )
+        conn.execute("UPDATE channels SET backoff = 0 WHERE name = ?", (name,))
+        metrics.observe("notify_channel", time.perf_counter() - start, channel=name)
+        metrics.inc("kontify_notify_deliveries_total", len(rows), channel=name, outcome="delivered")
+        self.delivered += len(rows)
+        return len(rows)
+
+    def prune(self):
+        """Borra entregados y dead-letter más viejos que su retención. Retorna cuántos registros borró."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            deleted = conn.execute(
+                "DELETE FROM outbox WHERE status = ? AND delivered_at < ?",
+                (STATUS_DELIVERED, now - OUTBOX_RETENTION_HOURS * 3600)
+            ).rowcount
+            deleted += conn.execute(
+                "DELETE FROM outbox WHERE status = ? AND created_at < ?",
+                (STATUS_DEAD, now - OUTBOX_DEAD_RETENTION_HOURS * 3600)
+            ).rowcount
+        finally:
+            conn.close()
+        self._last_prune = time.monotonic()
+        if deleted:
+            self.pruned += deleted
+            log.info("outbox_pruned", "🧹 OUTBOX: registros vencidos borrados", records=deleted)
+        return deleted
+
+    def drain(self, max_rounds=None):
+        """Entrega todo lo vencido en todos los canales. Retorna el total entregado."""
+        if time.monotonic() - self._last_prune >= OUTBOX_PRUNE_INTERVAL:
+            self.prune()
+        total = 0
+        rounds = 0
+        while max_rounds is None or rounds < max_rounds:
+            rounds += 1
+            delivered = sum(self.deliver_channel(name) for name in list(self.channels))
+            total += delivered
+            if not delivered:
+                break
+        return total
+
+    def _run(self):
+        while True:
+            self._wake.wait(OUTBOX_POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                log.error("outbox_drain_failed", "❌ OUTBOX: fallo del despachador", error=str(e))
+
+    def start(self):
+        """Arranca el hilo de entrega de este proceso (una vez por pid, seguro tras fork)."""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._wake = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+            self._thread.start()
+
+    def requeue_dead(self, channel=None):
+        """Devuelve los registros dead-letter a la cola (tras corregir credenciales, etc.)."""
+        conn = self._connect()
+        try:
+            query = "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?"
+            params = [STATUS_PENDING, time.time(), STATUS_DEAD]
+            if channel:
+                query += " AND channel = ?"
+                params.append(channel)
+            return conn.execute(query, params).rowcount
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Profundidad por canal/estado, antigüedad del pendiente más viejo y entregas del último minuto."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            channels = {}
+            for row in conn.execute(
+                "SELECT channel, status, COUNT(*) AS n, MIN(created_at) AS oldest FROM outbox GROUP BY channel, status"
+            ):
+                entry = channels.setdefault(row['channel'], {STATUS_PENDING: 0, STATUS_DELIVERED: 0, STATUS_DEAD: 0, "oldest_pending_seconds": 0})
+                entry[row['status']] = row['n']
+                if row['status'] == STATUS_PENDING:
+                    entry["oldest_pending_seconds"] = round(now - row['oldest'], 1)
+            for row in conn.execute(
+                "SELECT channel, COUNT(*) AS n FROM outbox WHERE status = ? AND delivered_at > ? GROUP BY channel",
+                (STATUS_DELIVERED, now - 60)
+            ):
+                channels[row['channel']]["delivered_last_minute"] = row['n']
+        finally:
+            conn.close()
+        return {
+            "channels": channels,
+            "delivered": self.delivered,
+            "failures": self.failures,
+            "pruned": self.pruned
+        }
+
+outbox = Outbox()
+
+if __name__ == "__main__":
+    # Worker de entrega independiente: python tools/outbox.py [--once] [--requeue-dead]
+    import argparse
+    parser = argparse.ArgumentParser(description="Entrega de efectos secundarios pendientes en el outbox.")
+    parser.add_argument("--once", action="store_true", help="Drenar lo vencido y salir.")
+    parser.add_argument("--requeue-dead", action="store_true", help="Reencolar registros dead-letter antes de entregar.")
+    args = parser.parse_args()
+
+    from notificator import register_channels
+    register_channels(outbox)
+    if args.requeue_dead:
+        print(f"♻️ {outbox.requeue_dead()} registro(s) reencolados.")
+    if args.once:
+        print(f"✅ {outbox.drain()} registro(s) entregados.")
+        print(json.dumps(outbox.stats(), indent=2))
+        sys.exit(0)
+    print(f"🚀 OUTBOX worker activo (pid={os.getpid()})")
+    while True:
+        outbox.drain()
+        time.sleep(OUTBOX_POLL_INTERVAL)
@@ -3,10 +3,11 @@ import json
 from fpdf import FPDF
 import datetime
 import math
-import unicodedata
+from text_normalize import pdf_text, pdf_texts
+from pdf_template import PDF_TEMPLATE_ENABLED, get_chrome, progress_arc_ops
 
 class DiagnosticPDF(FPDF):
-    def __init__(self):
+    def __init__(self, use_template=None):
         super().__init__()
         # Usar fuentes core que soportan latin-1 básico por defecto, 
         # fpdf2 maneja mejor Unicode pero para acentos/ñ requerimos fuentes específicas
@@ -17,16 +18,22 @@ class DiagnosticPDF(FPDF):
         self.bg_color = (249, 249, 249)     # Light Gray
         self.danger_color = (220, 53, 69)     # Red
         self.set_auto_page_break(auto=True, margin=25)
+        # Chrome estático precalculado por proceso (ver pdf_template); None = dibujo clásico
+        use_template = PDF_TEMPLATE_ENABLED if use_template is None else use_template
+        self.chrome = get_chrome(self.dark_color, self.bg_color) if use_template else None
 
     def header(self):
-        # Fondo decorativo superior (Big Four Style)
-        self.set_fill_color(*self.dark_color)
-        self.rect(0, 0, 210, 30, 'F')
-        
-        # Logo Kontify (Alineado a la izquierda)
-        self.set_xy(15, 8)
-        self.set_fill_color(193, 255, 114) # Verde Neón
-        self.rect(15, 10, 6, 6, 'F')
+        if self.chrome:
+            # Banda superior + logo neón desde la plantilla
+            self._out(self.chrome.header)
+        else:
+            # Fondo decorativo superior (Big Four Style)
+            self.set_fill_color(*self.dark_color)
+            self.rect(0, 0, 210, 30, 'F')
+            
+            # Logo Kontify (Alineado a la izquierda)
+            self.set_fill_color(193, 255, 114) # Verde Neón
+            self.rect(15, 10, 6, 6, 'F')
         
         self.set_text_color(255, 255, 255)
         self.set_font('helvetica', 'B', 16)
@@ -52,8 +59,11 @@ class DiagnosticPDF(FPDF):
         self.set_text_color(150, 150, 150)
         
         # Línea divisoria
-        self.set_draw_color(230, 230, 230)
-        self.line(15, self.get_y(), 195, self.get_y())
+        if self.chrome:
+            self._out(self.chrome.footer_rule(self.get_y()))
+        else:
+            self.set_draw_color(230, 230, 230)
+            self.line(15, self.get_y(), 195, self.get_y())
         
         # Aviso de Privacidad elegante
         self.set_y(-15)
@@ -66,7 +76,27 @@ class DiagnosticPDF(FPDF):
             score = float(score)
         except:
             score = 0
-            
+
+        if self.chrome:
+            # Arco de fondo cacheado + arco de progreso en un solo trazo
+            self._out(self.chrome.gauge_background(x, y))
+            self._out(progress_arc_ops(x, y, score, self._gauge_color(score)))
+        else:
+            self._draw_gauge_segments(x, y, score)
+
+        # Texto del score
+        self.set_xy(x - 20, y - 5)
+        self.set_text_color(*self.dark_color)
+        self.set_font('helvetica', 'B', 14)
+        self.cell(40, 10, f"{score}%", 0, 0, 'C')
+
+    def _gauge_color(self, score):
+        # Degradado Amarillo -> Naranja -> Rojo
+        if score > 70: return (220, 53, 69) # Red
+        if score > 40: return (255, 165, 0) # Orange
+        return (255, 215, 0) # Gold
+
+    def _draw_gauge_segments(self, x, y, score):
         # Fondo del gauge
         self.set_draw_color(230, 230, 230)
         self.set_line_width(4)
@@ -83,9 +113,7 @@ class DiagnosticPDF(FPDF):
             last_x, last_y = px, py
 
         # Dibujar arco de progreso (Degradado Amarillo -> Naranja -> Rojo)
-        if score > 70: self.set_draw_color(220, 53, 69) # Red
-        elif score > 40: self.set_draw_color(255, 165, 0) # Orange
-        else: self.set_draw_color(255, 215, 0) # Gold
+        self.set_draw_color(*self._gauge_color(score))
         
         score_steps = int((score / 100) * steps)
         for i in range(score_steps + 1):
@@ -96,40 +124,12 @@ class DiagnosticPDF(FPDF):
             else: self.line(last_x, last_y, px, py)
             last_x, last_y = px, py
 
-        # Texto del score
-        self.set_xy(x - 20, y - 5)
-        self.set_text_color(*self.dark_color)
-        self.set_font('helvetica', 'B', 14)
-        self.cell(40, 10, f"{score}%", 0, 0, 'C')
-
-import unicodedata
-
-def safe_text(txt):
-    """
-    Normalización de Texto para fpdf2 (Protocolo PMDS-IA).
-    Permite acentos y 'ñ' para fuentes core (Helvetica/Arial) usando latin-1.
-    """
-    if txt is None: return "N/A"
-    if not isinstance(txt, str): txt = str(txt)
-    
-    # Reemplazo de caracteres Unicode "fancy" que rompen fuentes estándar
-    replacements = {
-        '\u2013': '-', '\u2014': '-', '\u201c': '"', '\u201d': '"',
-        '\u2018': "'", '\u2019': "'", '\u2022': '*', '\u2026': '...',
-        '\u00a0': ' ', '\ufeff': '', '\u200b': ''
-    }
-    for k, v in replacements.items():
-        txt = txt.replace(k, v)
-
-    # Intentar codificar a latin-1 (soporta á, é, í, ó, ú, ñ, ¿, ¡)
-    try:
-        return txt.encode('latin-1', 'replace').decode('latin-1')
-    except:
-        # Fallback a ASCII si hay algo catastrófico
-        return txt.encode('ascii', 'ignore').decode('ascii')
+# Normalización latin-1 compartida (tablas de str.translate precompiladas + caché de etiquetas)
+safe_text = pdf_text
 
-def generate_pdf_final(json_data, output_path):
-    pdf = DiagnosticPDF()
+def build_diagnostic_pdf(json_data, use_template=None):
+    """Arma el documento completo en memoria (sin escribir a disco)."""
+    pdf = DiagnosticPDF(use_template=use_template)
     pdf.alias_nb_pages()
     pdf.add_page()
     
@@ -140,8 +140,11 @@ def generate_pdf_final(json_data, output_path):
     risk = data.get('risk_assessment') or data.get('lead_assessment') or data.get('admin_report', {})
     
     # --- HERO SECTION ---
-    pdf.set_fill_color(*pdf.bg_color)
-    pdf.rect(0, 30, 210, 60, 'F')
+    if pdf.chrome:
+        pdf._out(pdf.chrome.hero)
+    else:
+        pdf.set_fill_color(*pdf.bg_color)
+        pdf.rect(0, 30, 210, 60, 'F')
     
     pdf.set_xy(15, 40)
     pdf.set_text_color(*pdf.primary_color)
@@ -255,13 +258,14 @@ def generate_pdf_final(json_data, output_path):
         pdf.set_font('helvetica', '', 9)
         pdf.set_text_color(50, 50, 50)
         
+        # Normalización en lote: las preguntas del cuestionario se repiten entre reportes (caché)
+        questions = pdf_texts([resp.get('question', 'Pregunta sin texto') for resp in responses])
         for idx, resp in enumerate(responses):
-            q_text = f"{idx+1}. {resp.get('question', 'Pregunta sin texto')}"
             a_text = str(resp.get('answer', 'N/A')).upper()
             
             # Dibujar Pregunta
             pdf.set_font('helvetica', 'B', 9)
-            pdf.multi_cell(0, 5, safe_text(q_text), 0, 'L')
+            pdf.multi_cell(0, 5, f"{idx+1}. {questions[idx]}", 0, 'L')
             
             # Dibujar Respuesta
             pdf.set_font('helvetica', 'B', 9)
@@ -279,8 +283,15 @@ def generate_pdf_final(json_data, output_path):
             
             if pdf.get_y() > 250:
                 pdf.add_page()
-    
-    pdf.output(output_path)
+
+    return pdf
+
+def render_pdf_bytes(json_data, use_template=None):
+    """Reporte renderizado como bytes (para responder directo o escribir después)."""
+    return bytes(build_diagnostic_pdf(json_data, use_template).output())
+
+def generate_pdf_final(json_data, output_path):
+    build_diagnostic_pdf(json_data).output(output_path)
     print(f"✅ PDF Executivo Big Four generado exitosamente en: {output_path}")
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import os
+import re
+import sys
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Agregar el directorio /tools al path (los procesos del pool importan este módulo por nombre)
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from metrics import metrics
+from structured_log import log
+
+# Servicio de render de PDF fuera del worker web: procesos dedicados que ya importaron fpdf2 y
+# renderizaron un reporte de calentamiento. El trabajo CPU-bound (gauge, multi_cell por respuesta)
+# deja de retener el GIL del proceso que atiende solicitudes.
+PDF_POOL_ENABLED = os.getenv("PDF_POOL_ENABLED", "1") == "1"
+# Procesos de render para todo el host. Cada worker web (gunicorn) tiene su propio pool, así que el
+# presupuesto se reparte: con N workers web cada pool recibe max(1, PDF_HOST_WORKERS // N) procesos y el
+# total del host es N * max(1, PDF_HOST_WORKERS // N) (p. ej. 4 núcleos y 4 workers web: 4 procesos, no 16;
+# con más workers web que PDF_HOST_WORKERS el mínimo es uno por worker). PDF_POOL_WORKERS fija el tamaño
+# por pool y desactiva el reparto.
+PDF_HOST_WORKERS = int(os.getenv("PDF_HOST_WORKERS", min(os.cpu_count() or 1, 4)))
+PDF_POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", 0)) or None
+# Renders que pueden esperar detrás de los que ya corren; más allá se rechaza (backpressure)
+PDF_QUEUE_MAX = int(os.getenv("PDF_QUEUE_MAX", 16))
+PDF_QUEUE_WAIT = float(os.getenv("PDF_QUEUE_WAIT", 5))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", 60))
+# spawn: los procesos no heredan hilos/locks del worker web (seguro también en Windows)
+PDF_POOL_START_METHOD = os.getenv("PDF_POOL_START_METHOD", "spawn")
+
+WARMUP_DOC = {
+    "lead_metadata": {"company_name": "Warmup", "rfc": "XAXX010101000", "main_activity": "N/A",
+                      "financial_data": {"sales": "1M", "profit": "0", "assets": "0", "liabilities": "0"}},
+    "risk_assessment": {"overall_risk_score": 50},
+    "sales_pitch": "N/A",
+    "markdown_content": "- N/A",
+    "responses": [{"question": "¿Pregunta?", "answer": "SÍ"}]
+}
+
+class RenderQueueFull(Exception):
+    """No hubo lugar en la cola de render dentro del tiempo de espera."""
+
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _warm_worker():
+    import pdf_generator_v2
+    pdf_generator_v2.render_pdf_bytes(WARMUP_DOC)
+
+def _render(json_data, output_path):
+    """Se ejecuta dentro del proceso del pool."""
+    from pdf_generator_v2 import render_pdf_bytes, generate_pdf_final
+    if output_path:
+        generate_pdf_final(json_data, output_path)
+        return output_path
+    return render_pdf_bytes(json_data)
+
+def count_pages(pdf_bytes):
+    return len(re.findall(rb"/Type /Page\b", pdf_bytes))
+
+def pool_size_for(web_workers):
+    """Procesos de render por worker web para no pasar de PDF_HOST_WORKERS en el host (ver arriba)."""
+    if PDF_POOL_WORKERS:
+        return PDF_POOL_WORKERS
+    return max(1, PDF_HOST_WORKERS // max(1, web_workers or 1))
+
+class PDFRenderService:
+    def __init__(self, workers=None, max_queue=None, queue_wait=None, start_method=None):
+        self.workers = workers or pool_size_for(1)
+        self.max_queue = PDF_QUEUE_MAX if max_queue is None else max_queue
+        self.queue_wait = PDF_QUEUE_WAIT if queue_wait is None else queue_wait
+        self.start_method = start_method or PDF_POOL_START_METHOD
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self.rendered = 0
+        self.rejected = 0
+        self._stats_lock = threading.Lock() # _done corre en el hilo de callbacks del pool
+
+    def resize(self, workers):
+        """Ajusta el tamaño del pool antes de arrancarlo (post_fork, según el número de workers web)."""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                return
+            self.workers = workers
+            self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+
+    def start(self):
+        """Crea el pool del proceso actual y precalienta todos sus workers."""
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_warm_worker
+                )
+                self._pid = os.getpid()
+                # Forzar el arranque de los procesos ahora y no en la primera solicitud
+                for future in [self._executor.submit(int, 0) for _ in range(self.workers)]:
+                    future.result()
+                log.info("pdf_pool_ready", "🖨️ Pool de PDF listo", workers=self.workers, max_queue=self.max_queue)
+        return self._executor
+
+    def submit(self, json_data, output_path=None):
+        """
+        Encola un render. Retorna un Future con los bytes del PDF (o la ruta si se pasa output_path).
+        Lanza RenderQueueFull si la cola está llena más de queue_wait segundos.
+        """
+        if not self._slots.acquire(timeout=self.queue_wait):
+            with self._stats_lock:
+                self.rejected += 1
+            raise RenderQueueFull("Cola de render de PDF llena")
+        try:
+            future = self.start().submit(_render, json_data, output_path)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self._slots.release()
+        if not future.cancelled() and future.exception() is None:
+            with self._stats_lock:
+                self.rendered += 1
+
+    def render(self, json_data, output_path=None, timeout=None):
+        """Render síncrono a través del pool (o en línea si el pool está deshabilitado)."""
+        with metrics.timer("generate_pdf"):
+            if not PDF_POOL_ENABLED:
+                return _render(json_data, output_path)
+            return self.submit(json_data, output_path).result(timeout=timeout or PDF_RENDER_TIMEOUT)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self):
+        with self._stats_lock:
+            rendered, rejected = self.rendered, self.rejected
+        return {
+            "enabled": PDF_POOL_ENABLED,
+            "workers": self.workers,
+            "running": self._executor is not None and self._pid == os.getpid(),
+            "rendered": rendered,
+            "rejected": rejected
+        }
+
+pdf_service = PDFRenderService()
@@ -0,0 +1,96 @@
+import os
+import math
+import threading
+
+# Capa de plantilla para el "chrome" estático del reporte (banda del header, logo neón, fondo hero,
+# arco de fondo del gauge y línea del footer). Se serializa una sola vez por proceso a operadores
+# PDF ya calculados y cada página solo los anexa a su content stream; el contenido del lead
+# (textos, arco de progreso) se sigue dibujando encima con la API de fpdf2.
+# fpdf2 no expone form XObjects para contenido propio: el fragmento cacheado cumple el mismo papel
+# (se calcula una vez y se reutiliza) y va envuelto en q/Q para no alterar el estado que fpdf2 rastrea.
+PDF_TEMPLATE_ENABLED = os.getenv("PDF_TEMPLATE_ENABLED", "1") == "1"
+
+# Geometría de la página A4 en mm y factor de fpdf2 (pt por mm)
+PAGE_H = 297.0
+K = 72 / 25.4
+
+GAUGE_RADIUS = 15
+GAUGE_STEPS = 50
+
+# Tabla trigonométrica del semicírculo superior (π..2π), compartida por el arco de fondo y el de progreso
+_ARC_TABLE = [
+    (math.cos(math.pi + (i / GAUGE_STEPS) * math.pi), math.sin(math.pi + (i / GAUGE_STEPS) * math.pi))
+    for i in range(GAUGE_STEPS + 1)
+]
+
+def _pt(x, y):
+    return f"{x * K:.2f} {(PAGE_H - y) * K:.2f}"
+
+def _fill_rect(x, y, w, h, rgb):
+    return (
+        f"{rgb[0] / 255:.3f} {rgb[1] / 255:.3f} {rgb[2] / 255:.3f} rg "
+        f"{x * K:.2f} {(PAGE_H - y) * K:.2f} {w * K:.2f} {-h * K:.2f} re f"
+    )
+
+def _stroke_path(points, rgb, line_width):
+    ops = [f"{line_width * K:.2f} w", f"{rgb[0] / 255:.3f} {rgb[1] / 255:.3f} {rgb[2] / 255:.3f} RG"]
+    ops.append(f"{_pt(*points[0])} m")
+    ops.extend(f"{_pt(*p)} l" for p in points[1:])
+    ops.append("S")
+    return ops
+
+def _wrap(ops):
+    return ("q\n" + "\n".join(ops) + "\nQ").encode("latin-1")
+
+def arc_points(x, y, steps, r=GAUGE_RADIUS):
+    """Puntos del arco del gauge hasta `steps` (de GAUGE_STEPS) con la tabla precalculada."""
+    return [(x + r * c, y + r * s) for c, s in _ARC_TABLE[:steps + 1]]
+
+def progress_arc_ops(x, y, score, rgb):
+    """Arco de progreso del lead como un solo trazo (antes: un `line` por segmento)."""
+    score_steps = int((score / 100) * GAUGE_STEPS)
+    if score_steps < 1:
+        return b""
+    return _wrap(_stroke_path(arc_points(x, y, score_steps), rgb, 4))
+
+class ReportChrome:
+    """Fragmentos de content stream del chrome estático, listos para anexar a cada página."""
+
+    def __init__(self, dark_color, bg_color):
+        self.header = _wrap([
+            _fill_rect(0, 0, 210, 30, dark_color),     # Fondo decorativo superior (Big Four Style)
+            _fill_rect(15, 10, 6, 6, (193, 255, 114)),  # Logo Kontify (Verde Neón)
+        ])
+        self.hero = _wrap([_fill_rect(0, 30, 210, 60, bg_color)])
+        self._gauges = {}
+        self._footer_rules = {}
+        self._lock = threading.Lock()
+
+    def gauge_background(self, x, y):
+        ops = self._gauges.get((x, y))
+        if ops is None:
+            with self._lock:
+                ops = self._gauges.setdefault((x, y), _wrap(_stroke_path(arc_points(x, y, GAUGE_STEPS), (230, 230, 230), 4)))
+        return ops
+
+    def footer_rule(self, y):
+        ops = self._footer_rules.get(y)
+        if ops is None:
+            with self._lock:
+                ops = self._footer_rules.setdefault(y, _wrap([
+                    f"{0.2 * K:.2f} w", "0.902 0.902 0.902 RG",
+                    f"{_pt(15, y)} m", f"{_pt(195, y)} l", "S"
+                ]))
+        return ops
+
+_chrome = None
+_chrome_lock = threading.Lock()
+
+def get_chrome(dark_color, bg_color):
+    """Chrome del proceso (se construye en la primera página y se reutiliza en todos los reportes)."""
+    global _chrome
+    if _chrome is None:
+        with _chrome_lock:
+            if _chrome is None:
+                _chrome = ReportChrome(dark_color, bg_color)
+    return _chrome
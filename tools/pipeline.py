@@ -0,0 +1,214 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from process_diagnostic import run_diagnostic, arun_diagnostic
+from pdf_service import pdf_service, RenderQueueFull
+from notificator import notify_all, anotify_all
+from report_store import report_store, PDF_RENDER_MODE
+from risk_engine import score_lead, build_local_diagnostic
+from lead_schema import as_lead
+from structured_log import log
+from metrics import metrics
+
+REPORTS_DIR = os.getenv("KONTIFY_REPORTS_DIR", os.path.join(os.getcwd(), 'reports'))
+
+# Etapas reportadas por el pipeline (modo síncrono, worker y /api/jobs/<id>)
+STAGE_VALIDATED = "validated"
+STAGE_AI_SCORING = "ai_scoring"
+STAGE_CRM_SYNC = "crm_sync"
+STAGE_CRM_SYNCED = "crm_synced"
+STAGE_PDF_RENDER = "pdf_render"
+STAGE_PDF_READY = "pdf_ready"
+
+def _contingency_result(request_id, error, rfc, giro, responses, lead_meta):
+    """Reporte de continuidad cuando la IA no responde o responde inválido (score del motor local)."""
+    summary = f"Fallo IA en solicitud {request_id}: {error}"
+    local = score_lead(lead_meta.get('niche_id', 'holding'), responses)
+    if local:
+        result = build_local_diagnostic(local, rfc, giro, summary)
+        result["risk_assessment"]["hallazgos_tecnicos"].insert(0, "IA no respondió o respondió inválido: score calculado por el motor local.")
+    else:
+        result = {
+            "risk_assessment": {
+                "overall_risk_score": 55,
+                "risk_level": "VULNERABILIDAD DETECTADA",
+                "critical_finding": "Fallo IA: salida de contingencia activada.",
+                "hallazgos_tecnicos": [
+                    "IA no respondió o respondió inválido.",
+                    "Se generó un reporte mínimo para continuidad operativa.",
+                    f"RFC Detectado: {rfc} - VALIDADO",
+                    f"Giro Detectado: {giro} - REGISTRADO"
+                ]
+            },
+            "sales_pitch": "Se requiere reintento de diagnóstico con conectividad estable.",
+            "markdown_content": "### CONTINGENCIA PMDS-IA\n- Se activó salida mínima por error en IA.\n- Verificar credenciales y salud de la API.",
+            "admin_report": {"summary": summary}
+        }
+    result["responses"] = responses
+    result["lead_metadata"] = lead_meta
+    return result
+
+def _diagnostic_outcome(diagnostic_result, request_id, lead):
+    """
+    Retorna (diagnóstico, None) o (None, respuesta de error) para 422 y 429.
+    Cualquier otro fallo de la IA se convierte en reporte de contingencia.
+    """
+    if isinstance(diagnostic_result, dict) and diagnostic_result.get("error"):
+        status_code = int(diagnostic_result.get("status_code", 500))
+        log.warning("ai_failed", "⚠️ IA Falló", request_id, error=diagnostic_result.get('error'), status_code=status_code)
+        if status_code == 422:
+            return None, {"status": "error", "message": diagnostic_result.get("error"), "status_code": 422}
+        if status_code == 429:
+            # Backpressure: mejor un 429 rápido que un reporte de contingencia
+            return None, {
+                "status": "error",
+                "message": diagnostic_result.get("error"),
+                "status_code": 429,
+                "retry_after": diagnostic_result.get("retry_after", 5)
+            }
+        metrics.inc("kontify_contingency_fallbacks_total")
+        return _contingency_result(request_id, diagnostic_result.get('error'), lead.rfc, lead.activity, lead.responses, lead.lead_metadata), None
+    diagnostic_result['responses'] = lead.responses
+    diagnostic_result['lead_metadata'] = lead.lead_metadata
+    return diagnostic_result, None
+
+def _store_and_render(pdf_filename, diagnostic_result, request_id, stage, on_throttled=None):
+    """
+    Pasos 3 y 4: registro del diagnóstico y PDF. Retorna la respuesta final del pipeline.
+    on_throttled(retry_after), si existe, espera ante cola de render llena y retorna True para
+    reintentar solo el render (la IA y el CRM ya se hicieron).
+    """
+    # 3. Guardar el diagnóstico en el almacén (direccionado por contenido; reenvíos idénticos se deduplican)
+    try:
+        report_store.save_record(REPORTS_DIR, request_id, pdf_filename, diagnostic_result)
+    except Exception as record_err:
+        log.error("report_record_failed", "❌ Error guardando diagnóstico", request_id, error=str(record_err))
+        return {"status": "error", "message": "Error al generar documento.", "status_code": 500}
+
+    # 4. Generar PDF (modo lazy: se renderiza en la primera descarga)
+    while PDF_RENDER_MODE != "lazy":
+        stage(STAGE_PDF_RENDER)
+        try:
+            # Render en el pool de procesos a memoria; la escritura a disco va en segundo plano
+            report_store.fetch(REPORTS_DIR, pdf_filename)
+            break
+        except RenderQueueFull as queue_err:
+            log.warning("pdf_queue_full", f"🚦 {str(queue_err)}", request_id)
+            if on_throttled and on_throttled(queue_err.retry_after):
+                continue
+            return {
+                "status": "error",
+                "message": "Alta demanda: intente de nuevo en unos segundos.",
+                "status_code": 429,
+                "retry_after": queue_err.retry_after,
+                "stage": STAGE_PDF_RENDER # El CRM ya se sincronizó: no repetir el pipeline completo
+            }
+        except Exception as pdf_err:
+            log.error("pdf_failed", "❌ Error PDF", request_id, error=str(pdf_err))
+            return {"status": "error", "message": "Error al generar documento.", "status_code": 500}
+
+    stage(STAGE_PDF_READY)
+    return {"status": "success", "report_url": f"/reports/{pdf_filename}"}
+
+def process_submission(lead, request_id, host_url, company_name=None, on_stage=None, on_partial=None, on_throttled=None):
+    """
+    Ejecuta IA -> CRM -> PDF para un Lead ya validado (o su forma JSON, desde la cola de trabajos).
+    on_stage recibe cada etapa; on_partial, los campos del diagnóstico mientras el modelo genera;
+    on_throttled (tools.worker) permite reintentar solo el render si su cola está llena.
+    Retorna {"status": "success", "report_url": ...} o {"status": "error", "message": ..., "status_code": ...}.
+    """
+    def _stage(stage):
+        if on_stage:
+            on_stage(stage)
+
+    lead = as_lead(lead)
+    company_name = company_name or lead.file_token
+
+    # 1. PROCESAMIENTO IA (PMDS-IA)
+    _stage(STAGE_AI_SCORING)
+    log.payload("payload_for_gemini", lead.to_payload(), request_id)
+    with metrics.timer("run_diagnostic"):
+        diagnostic_result = run_diagnostic(lead, on_partial=on_partial, request_id=request_id)
+    diagnostic_result, error = _diagnostic_outcome(diagnostic_result, request_id, lead)
+    if error:
+        return error
+
+    # 2. Sincronizar CRM ANTES de generar PDF (Sync-First)
+    _stage(STAGE_CRM_SYNC)
+    pdf_filename = f"KONTIFY_{company_name}_{request_id}.pdf"
+    try:
+        full_pdf_url = f"{host_url}/reports/{pdf_filename}"
+        log.info("crm_sync_started", "📊 Iniciando sincronización CRM", request_id)
+        with metrics.timer("notify_all"):
+            notification = notify_all(diagnostic_result, full_pdf_url, request_id=request_id)
+        if not notification:
+            log.error("crm_sync_failed", "🛑 CRM Sync falló. Abortando PDF.", request_id)
+            return {"status": "error", "message": "Error sincronizando CRM.", "status_code": 502}
+        log.info("crm_synced", "✅ Sincronización CRM completada.", request_id)
+        _stage(STAGE_CRM_SYNCED)
+    except Exception as notify_err:
+        log.error("crm_sync_failed", "⚠️ Error Registro", request_id, error=str(notify_err))
+        return {"status": "error", "message": "Error sincronizando CRM.", "status_code": 502}
+
+    return _store_and_render(pdf_filename, diagnostic_result, request_id, _stage, on_throttled)
+
+_render = {"pid": None, "executor": None}
+_render_lock = threading.Lock()
+
+def _render_executor():
+    """
+    Hilos que esperan al pool de PDF desde el event loop (uno por render en curso o en cola, así la
+    contrapresión de pdf_service —RenderQueueFull— se conserva). No sobreviven un fork.
+    """
+    if _render["pid"] != os.getpid():
+        with _render_lock:
+            if _render["pid"] != os.getpid():
+                _render.update(
+                    executor=ThreadPoolExecutor(max_workers=pdf_service.workers + pdf_service.max_queue, thread_name_prefix="render"),
+                    pid=os.getpid()
+                )
+    return _render["executor"]
+
+async def aprocess_submission(lead, request_id, host_url, company_name=None, on_stage=None, on_partial=None):
+    """
+    process_submission() para el event loop (tools/asgi_app.py): la IA y las notificaciones son
+    corrutinas; el registro y el PDF (CPU en el pool de procesos) corren en un executor.
+    on_stage puede llamarse desde un hilo de ese executor.
+    """
+    def _stage(stage):
+        if on_stage:
+            on_stage(stage)
+
+    lead = as_lead(lead)
+    company_name = company_name or lead.file_token
+
+    # 1. PROCESAMIENTO IA (PMDS-IA)
+    _stage(STAGE_AI_SCORING)
+    log.payload("payload_for_gemini", lead.to_payload(), request_id)
+    with metrics.timer("run_diagnostic"):
+        diagnostic_result = await arun_diagnostic(lead, on_partial=on_partial, request_id=request_id)
+    diagnostic_result, error = _diagnostic_outcome(diagnostic_result, request_id, lead)
+    if error:
+        return error
+
+    # 2. Sincronizar CRM ANTES de generar PDF (Sync-First)
+    _stage(STAGE_CRM_SYNC)
+    pdf_filename = f"KONTIFY_{company_name}_{request_id}.pdf"
+    try:
+        full_pdf_url = f"{host_url}/reports/{pdf_filename}"
+        log.info("crm_sync_started", "📊 Iniciando sincronización CRM", request_id)
+        with metrics.timer("notify_all"):
+            notification = await anotify_all(diagnostic_result, full_pdf_url, request_id=request_id)
+        if not notification:
+            log.error("crm_sync_failed", "🛑 CRM Sync falló. Abortando PDF.", request_id)
+            return {"status": "error", "message": "Error sincronizando CRM.", "status_code": 502}
+        log.info("crm_synced", "✅ Sincronización CRM completada.", request_id)
+        _stage(STAGE_CRM_SYNCED)
+    except Exception as notify_err:
+        log.error("crm_sync_failed", "⚠️ Error Registro", request_id, error=str(notify_err))
+        return {"status": "error", "message": "Error sincronizando CRM.", "status_code": 502}
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_render_executor(), _store_and_render, pdf_filename, diagnostic_result, request_id, _stage)
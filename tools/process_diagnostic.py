@@ -1,7 +1,7 @@
 import os
-import json
 import sys
-from dotenv import load_dotenv
+import json
+import asyncio
 
 try:
     import google.generativeai as genai
@@ -9,159 +9,205 @@ except ImportError:
     print("Error: Librería 'google-generativeai' no instalada.")
     sys.exit(1)
 
-def _normalize_responses(raw_responses):
-    normalized = []
-    if isinstance(raw_responses, list):
-        for item in raw_responses:
-            if isinstance(item, dict):
-                q = item.get('question') or item.get('q') or item.get('text')
-                if not q:
-                    q_index = item.get('q_index') or item.get('num') or item.get('id')
-                    if q_index is not None:
-                        q = f"Q{q_index}"
-                a = item.get('answer') or item.get('a') or item.get('response') or item.get('value')
-
-                if q or a is not None:
-                    entry = {
-                        "question": str(q).strip() if q else "N/A",
-                        "answer": str(a).strip() if a is not None else "N/A"
-                    }
-                    if item.get('q_index') is not None:
-                        entry["q_index"] = item.get('q_index')
-                    if item.get('category_id') or item.get('cat'):
-                        entry["category_id"] = item.get('category_id') or item.get('cat')
-                    normalized.append(entry)
-            elif isinstance(item, str):
-                normalized.append({"question": item.strip(), "answer": "N/A"})
-    return normalized
-
-def run_diagnostic(input_data):
-    load_dotenv()
-    api_key = os.getenv("GEMINI_API_KEY")
-    
-    if not api_key or api_key == "tu_api_key_aqui":
-        return {"error": "GEMINI_API_KEY no configurada"}
+from ai_providers import get_provider, iterate_in_thread
+from gemini_client import client_manager, ConcurrencyLimitExceeded
+from rate_limiter import admission, AdmissionRejected
+from stream_parser import DiagnosticStreamParser, strip_code_fences
+from result_cache import result_cache, diagnostic_cache_key, DIAGNOSTIC_CACHE_ENABLED
+from prompt_builder import get_prompt_prefix, build_lead_prompt
+from risk_engine import score_lead, build_local_diagnostic
+from lead_schema import as_lead
+from structured_log import log
+
+# "fallback": la IA diagnostica y el motor local corrige/valida su score; "fast": solo motor local
+LOCAL_SCORING_MODE = os.getenv("KONTIFY_LOCAL_SCORING", "fallback").lower()
+# Diferencia (puntos) entre score IA y local a partir de la cual se marca el diagnóstico para revisión
+SCORE_DIVERGENCE_THRESHOLD = int(os.getenv("KONTIFY_SCORE_DIVERGENCE", 35))
+
+class _ModelCall:
+    """Lo que run_diagnostic / arun_diagnostic necesitan para llamar al modelo y validar su respuesta."""
+    __slots__ = ("provider", "prefix", "prompt", "local", "cache_key")
 
-    genai.configure(api_key=api_key)
+    def __init__(self, provider, prefix, prompt, local, cache_key):
+        self.provider = provider
+        self.prefix = prefix
+        self.prompt = prompt
+        self.local = local
+        self.cache_key = cache_key
+
+def _prepare_diagnostic(input_data, on_partial, request_id):
+    """
+    Todo lo previo a la llamada al modelo (validación, motor local, caché, prompt).
+    Retorna (resultado, None) si el modelo no hace falta o (None, _ModelCall).
+    """
+    provider = get_provider()
+    # Configuración del SDK una sola vez por worker (cliente y canales reutilizados)
+    if provider.requires_api_key and not client_manager.ensure_configured():
+        return {"error": "GEMINI_API_KEY no configurada"}, None
     
-    lead_meta = input_data.get('lead_metadata', {})
-    niche_id = lead_meta.get('niche_id', 'holding')
-    main_activity = lead_meta.get('main_activity') or lead_meta.get('activity')
-    rfc = lead_meta.get('rfc')
+    # Lead ya normalizado por el servidor; un dict (CLI, pruebas) se normaliza aquí una sola vez
+    lead = as_lead(input_data)
+    lead_meta = lead.lead_metadata
+    niche_id = lead.niche_id or 'holding'
+    main_activity = lead.activity
+    rfc = lead.rfc
 
     if not rfc or not str(rfc).strip() or not main_activity or not str(main_activity).strip():
-        return {"error": "Falta de Datos Maestros: RFC y/o Giro vacíos. Diagnóstico abortado antes de Gemini."}
+        return {"error": "Falta de Datos Maestros: RFC y/o Giro vacíos. Diagnóstico abortado antes de Gemini."}, None
 
-    responses = _normalize_responses(input_data.get('responses', []))
+    responses = lead.responses
     if not responses:
-        return {"error": "Respuestas vacías o inválidas. El diagnóstico no puede continuar."}
+        return {"error": "Respuestas vacías o inválidas. El diagnóstico no puede continuar."}, None
 
-    filled = [r for r in responses if str(r.get("answer", "")).strip() and str(r.get("answer", "")).strip().upper() != "N/A"]
-    if len(filled) < 10:
+    if lead.answered < 10:
         return {
             "error": "ERROR DE CAPTURA: El cuestionario llegó vacío al servidor",
             "status_code": 422
-        }
+        }, None
     
-    sop_path = f'architecture/{niche_id}_sop.md'
-    if not os.path.exists(sop_path):
-        sop_path = 'architecture/holding_sop.md' # Fallback
-        
-    with open(sop_path, 'r', encoding='utf-8') as f:
-        sop_content = f.read()
+    # Score determinista local (microsegundos): fast path, respaldo y verificación del score IA
+    local = score_lead(niche_id, responses)
+    if LOCAL_SCORING_MODE == "fast" and local:
+        return build_local_diagnostic(local, rfc, main_activity, "Diagnóstico por motor local (modo fast)."), None
 
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    # Prompt evolucionado bajo PROTOCOLO MAESTRO IA SEGURO (PMDS-IA)
-    company_name_str = lead_meta.get('company_name', 'Lead')
-    prompt = f"""
-    ROL: Senior Auditor & Strategic Risk Consultant (Big Four Style).
-    OBJETIVO: Realizar un Diagnóstico de Robustez Corporativa para [{company_name_str}] en el nicho [{niche_id}].
-    
-    METODOLOGÍA (Ponderación Técnica):
-     1. Evalúa los vectores de riesgo definidos en el SOP: {sop_content}
-    2. Cruza con las respuestas reales (pueden ser SÍ/NO o MULTIOPCIÓN). Total respuestas: {len(responses)}. Datos: {json.dumps(responses, ensure_ascii=False)}
-         - Si la respuesta es de opción múltiple (ej. "SAPI", "Régimen de Coordinados"), úsala tal cual.
-         - No conviertas opciones múltiples a binario.
-    3. Analiza el impacto financiero: {json.dumps(lead_meta.get('financial_data', {}), ensure_ascii=False)} | Rango: {lead_meta.get('billing_range', 'N/A')}.
-    4. Considera la Actividad Principal: {main_activity}
-    5. RFC (para trazabilidad y contexto fiscal): {rfc}
-    
-    REGLA DE CÁLCULO DE RIESGO:
-    - 0-30%: Vigilancia Preventiva (Controles sólidos).
-    - 31-70%: Vulnerabilidad Moderada (Deficiencias en procesos secundarios).
-    - 71-100%: RIESGO CRÍTICO (Fallas en blindaje de activos, cumplimiento fiscal o gobernanza).
-    
-    INSTRUCCIONES ESTRÉCTAMENTE JSON:
-    Retorna un JSON válido con esta estructura:
-    {{
-      "risk_assessment": {{
-        "overall_risk_score": 0-100,
-        "risk_level": "Nivel de riesgo",
-        "critical_finding": "Hallazgo principal del diagnóstico",
-        "hallazgos_tecnicos": [
-           "Hallazgo 1 basado en SOP",
-           "Hallazgo 2 basado en SOP"
-        ]
-      }},
-      "sales_pitch": "Texto persuasivo de 2 frases sobre la urgencia de corrección.",
-      "markdown_content": "### Análisis de Vulnerabilidad\\nContenido detallado en formato Markdown sin incluir el título principal.",
-      "admin_report": {{
-          "summary": "Resumen técnico para el CRM"
-      }}
-    }}
+    # Prompt evolucionado bajo PROTOCOLO MAESTRO IA SEGURO (PMDS-IA):
+    # prefijo estático por nicho (SOP) cacheado + delta del lead
+    prefix = get_prompt_prefix(niche_id)
+
+    # Reenvío del mismo cuestionario (refresh / reintento): se reutiliza el diagnóstico previo
+    cache_key = None
+    if DIAGNOSTIC_CACHE_ENABLED:
+        cache_key = diagnostic_cache_key(
+            niche_id, responses, lead_meta.get('financial_data', {}),
+            lead_meta.get('billing_range'), rfc, prefix.sop_hash
+        )
+        cached_result = result_cache.get(cache_key)
+        if cached_result is not None:
+            log.info("diagnostic_cache_hit", "♻️ Diagnóstico servido desde caché", request_id, cache_key=cache_key[:12])
+            if on_partial:
+                for partial in DiagnosticStreamParser().feed(json.dumps(cached_result, ensure_ascii=False)):
+                    on_partial(partial)
+            return cached_result, None
+
+    prompt = build_lead_prompt(lead_meta, responses, niche_id, main_activity, rfc)
+
+    # Antes: last_payload.json reescrito en cada solicitud; ahora solo una muestra va al log
+    log.payload("gemini_prompt", {
+        "niche_id": niche_id,
+        "main_activity": main_activity,
+        "rfc": rfc,
+        "prompt_prefix": {"sop_path": prefix.sop_path, "sop_hash": prefix.sop_hash},
+        "prompt": prompt
+    }, request_id)
+    return None, _ModelCall(provider, prefix, prompt, local, cache_key)
+
+def _finish_diagnostic(call, text, request_id):
+    """Valida la respuesta del modelo, la contrasta con el motor local y la guarda en caché."""
+    local = call.local
+    # Extracción robusta de JSON
+    diagnostic_result = json.loads(strip_code_fences(text))
     
-    IMPORTANTE: Si el cliente es 'Constructora Peña', analiza sus respuestas con RIGOR técnico. No uses mocks.
-    """
+    # Validación de campos mínimos para evitar reportes vacíos (score faltante o 0 -> motor local)
+    fallback_score = local['overall_risk_score'] if local else 50
+    if 'risk_assessment' not in diagnostic_result:
+        diagnostic_result['risk_assessment'] = {"overall_risk_score": fallback_score, "risk_level": "VULNERABILIDAD DETECTADA"}
+    if 'overall_risk_score' not in diagnostic_result['risk_assessment']:
+        diagnostic_result['risk_assessment']['overall_risk_score'] = fallback_score
+    else:
+        try:
+            if float(diagnostic_result['risk_assessment'].get('overall_risk_score', 0)) == 0:
+                diagnostic_result['risk_assessment']['overall_risk_score'] = fallback_score
+        except Exception:
+            diagnostic_result['risk_assessment']['overall_risk_score'] = fallback_score
 
-    try:
-        last_payload = {
-            "lead_metadata": lead_meta,
-            "responses": responses,
-            "niche_id": niche_id,
-            "main_activity": main_activity,
-            "rfc": rfc,
-            "prompt": prompt
+    if local:
+        ai_score = float(diagnostic_result['risk_assessment']['overall_risk_score'])
+        delta = abs(ai_score - local['overall_risk_score'])
+        diagnostic_result['score_check'] = {
+            "local_score": local['overall_risk_score'],
+            "delta": round(delta, 1),
+            "divergent": delta > SCORE_DIVERGENCE_THRESHOLD,
+            "categories": local['categories']
         }
-        with open('last_payload.json', 'w', encoding='utf-8') as f:
-            json.dump(last_payload, f, indent=2, ensure_ascii=False)
+        if delta > SCORE_DIVERGENCE_THRESHOLD:
+            log.warning("score_divergence", "⚠️ Score IA diverge del motor local", request_id, ai_score=ai_score, local_score=local['overall_risk_score'], delta=round(delta, 1))
+
+    if call.cache_key:
+        result_cache.set(call.cache_key, diagnostic_result)
+    return diagnostic_result
 
+def _model_error(e, request_id):
+    if isinstance(e, AdmissionRejected):
+        log.warning("ai_saturated", f"🚦 IA saturada: {str(e)}", request_id, retry_after=e.retry_after)
+        return {"error": "Alta demanda: intente de nuevo en unos segundos.", "status_code": 429, "retry_after": e.retry_after}
+    if isinstance(e, ConcurrencyLimitExceeded):
+        log.warning("ai_saturated", f"🚦 IA saturada: {str(e)}", request_id)
+        return {"error": "Alta demanda: intente de nuevo en unos segundos.", "status_code": 429, "retry_after": 5}
+    log.error("ai_failed", "❌ Error en IA", request_id, error=str(e))
+    return {"error": f"Error en procesamiento de IA: {str(e)}"}
+
+def run_diagnostic(input_data, on_partial=None, request_id=None):
+    """
+    Diagnóstico PMDS-IA de un lead. Si se pasa on_partial, el modelo se consume en streaming
+    y on_partial recibe cada campo del JSON ({"field", "value"}) en cuanto termina de llegar.
+    """
+    result, call = _prepare_diagnostic(input_data, on_partial, request_id)
+    if call is None:
+        return result
+
+    try:
         # Configuración de generación para forzar JSON
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                candidate_count=1,
-                max_output_tokens=1000,
-                temperature=0.2 # Más determinista
-            )
-        )
-        
-        text = response.text.strip()
-        
-        # Extracción robusta de JSON
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
-            
-        diagnostic_result = json.loads(text)
-        
-        # Validación de campos mínimos para evitar reportes vacíos
-        if 'risk_assessment' not in diagnostic_result:
-            diagnostic_result['risk_assessment'] = {"overall_risk_score": 50, "risk_level": "VULNERABILIDAD DETECTADA"}
-        if 'overall_risk_score' not in diagnostic_result['risk_assessment']:
-            diagnostic_result['risk_assessment']['overall_risk_score'] = 50
-        else:
-            try:
-                if float(diagnostic_result['risk_assessment'].get('overall_risk_score', 0)) == 0:
-                    diagnostic_result['risk_assessment']['overall_risk_score'] = 50
-            except Exception:
-                diagnostic_result['risk_assessment']['overall_risk_score'] = 50
-            
-        return diagnostic_result
+        # Tope por proceso primero y después la admisión global (RPM / en vuelo / cola acotada):
+        # el lease global solo se toma cuando este proceso ya puede llamar al modelo
+        with client_manager.slot(), admission.admit():
+            if on_partial:
+                parser = DiagnosticStreamParser()
+                for chunk in call.provider.generate_stream(call.prefix, call.prompt, max_output_tokens=1000, temperature=0.2):
+                    for partial in parser.feed(chunk):
+                        on_partial(partial)
+                text = parser.text
+            else:
+                text = call.provider.generate(
+                    call.prefix,
+                    call.prompt,
+                    max_output_tokens=1000,
+                    temperature=0.2 # Más determinista
+                )
+        return _finish_diagnostic(call, text, request_id)
+    except Exception as e:
+        return _model_error(e, request_id)
+
+async def arun_diagnostic(input_data, on_partial=None, request_id=None):
+    """
+    run_diagnostic() para el event loop (tools/asgi_app.py): la espera de admisión y la llamada al
+    modelo son corrutinas, así una solicitud en vuelo no ocupa un hilo. Lo previo y lo posterior
+    (caché local, motor de reglas, validación del JSON) es CPU de microsegundos y corre en el loop.
+    """
+    result, call = _prepare_diagnostic(input_data, on_partial, request_id)
+    if call is None:
+        return result
+
+    provider = call.provider
+    try:
+        async with client_manager.aslot(), admission.aadmit():
+            if on_partial:
+                parser = DiagnosticStreamParser()
+                if hasattr(provider, "agenerate_stream"):
+                    chunks = provider.agenerate_stream(call.prefix, call.prompt, max_output_tokens=1000, temperature=0.2)
+                else:
+                    # Proveedor inyectado sin variante async (pruebas): su generador corre en un hilo
+                    chunks = iterate_in_thread(provider.generate_stream, call.prefix, call.prompt, 1000, 0.2)
+                async for chunk in chunks:
+                    for partial in parser.feed(chunk):
+                        on_partial(partial)
+                text = parser.text
+            elif hasattr(provider, "agenerate"):
+                text = await provider.agenerate(call.prefix, call.prompt, max_output_tokens=1000, temperature=0.2)
+            else:
+                text = await asyncio.to_thread(provider.generate, call.prefix, call.prompt, 1000, 0.2)
+        return _finish_diagnostic(call, text, request_id)
     except Exception as e:
-        print(f"❌ Error en IA: {str(e)}")
-        return {"error": f"Error en procesamiento de IA: {str(e)}"}
+        return _model_error(e, request_id)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
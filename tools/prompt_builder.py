@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+import threading
+
+from structured_log import log
+
+# Ensamblado del prompt PMDS-IA en dos partes:
+#   - Prefijo estático por nicho (rol, SOP, reglas de cálculo y formato JSON): se renderiza una vez
+#     y se invalida cuando cambia el hash del SOP.
+#   - Delta del lead (empresa, respuestas, finanzas, giro, RFC): lo único que cambia por solicitud.
+ARCHITECTURE_DIR = 'architecture'
+DEFAULT_NICHE = 'holding'
+
+_PREFIX_TEMPLATE = """
+    ROL: Senior Auditor & Strategic Risk Consultant (Big Four Style).
+    OBJETIVO: Realizar un Diagnóstico de Robustez Corporativa para el nicho [{niche_id}].
+
+    METODOLOGÍA (Ponderación Técnica):
+    1. Evalúa los vectores de riesgo definidos en el SOP: {sop_content}
+    2. Cruza con las respuestas reales del lead (pueden ser SÍ/NO o MULTIOPCIÓN).
+         - Si la respuesta es de opción múltiple (ej. "SAPI", "Régimen de Coordinados"), úsala tal cual.
+         - No conviertas opciones múltiples a binario.
+    3. Analiza el impacto financiero y el rango de facturación del lead.
+    4. Considera la Actividad Principal del lead.
+    5. Usa el RFC para trazabilidad y contexto fiscal.
+
+    REGLA DE CÁLCULO DE RIESGO:
+    - 0-30%: Vigilancia Preventiva (Controles sólidos).
+    - 31-70%: Vulnerabilidad Moderada (Deficiencias en procesos secundarios).
+    - 71-100%: RIESGO CRÍTICO (Fallas en blindaje de activos, cumplimiento fiscal o gobernanza).
+
+    INSTRUCCIONES ESTRÉCTAMENTE JSON:
+    Retorna un JSON válido con esta estructura:
+    {{
+      "risk_assessment": {{
+        "overall_risk_score": 0-100,
+        "risk_level": "Nivel de riesgo",
+        "critical_finding": "Hallazgo principal del diagnóstico",
+        "hallazgos_tecnicos": [
+           "Hallazgo 1 basado en SOP",
+           "Hallazgo 2 basado en SOP"
+        ]
+      }},
+      "sales_pitch": "Texto persuasivo de 2 frases sobre la urgencia de corrección.",
+      "markdown_content": "### Análisis de Vulnerabilidad\\nContenido detallado en formato Markdown sin incluir el título principal.",
+      "admin_report": {{
+          "summary": "Resumen técnico para el CRM"
+      }}
+    }}
+
+    IMPORTANTE: Si el cliente es 'Constructora Peña', analiza sus respuestas con RIGOR técnico. No uses mocks.
+    """
+
+_DELTA_TEMPLATE = """
+    DATOS DEL LEAD:
+    - Empresa: [{company_name}] | Nicho: [{niche_id}]
+    - Respuestas reales. Total respuestas: {total}. Datos: {responses}
+    - Impacto financiero: {financial_data} | Rango: {billing_range}.
+    - Actividad Principal: {main_activity}
+    - RFC (para trazabilidad y contexto fiscal): {rfc}
+    """
+
+class PromptPrefix:
+    """Parte estática del prompt de un nicho, identificada por el hash de su SOP."""
+    __slots__ = ('niche_id', 'sop_path', 'sop_hash', 'text', '_stat')
+
+    def __init__(self, niche_id, sop_path, sop_hash, text, stat):
+        self.niche_id = niche_id
+        self.sop_path = sop_path
+        self.sop_hash = sop_hash
+        self.text = text
+        self._stat = stat
+
+    @property
+    def cache_key(self):
+        return f"{self.niche_id}-{self.sop_hash[:16]}"
+
+_prefixes = {}
+_lock = threading.Lock()
+
+def _resolve_sop_path(niche_id):
+    sop_path = os.path.join(ARCHITECTURE_DIR, f'{niche_id}_sop.md')
+    if not os.path.exists(sop_path):
+        sop_path = os.path.join(ARCHITECTURE_DIR, f'{DEFAULT_NICHE}_sop.md') # Fallback
+    return sop_path
+
+def get_prompt_prefix(niche_id):
+    """
+    Retorna el PromptPrefix del nicho. Solo se vuelve a leer y hashear el SOP
+    cuando cambia su (mtime, tamaño); solo se re-renderiza cuando cambia el hash.
+    """
+    sop_path = _resolve_sop_path(niche_id)
+    st = os.stat(sop_path)
+    stat_key = (sop_path, st.st_mtime_ns, st.st_size)
+
+    cached = _prefixes.get(niche_id)
+    if cached is not None and cached._stat == stat_key:
+        return cached
+
+    with _lock:
+        cached = _prefixes.get(niche_id)
+        if cached is not None and cached._stat == stat_key:
+            return cached
+
+        with open(sop_path, 'r', encoding='utf-8') as f:
+            sop_content = f.read()
+        sop_hash = hashlib.sha256(sop_content.encode('utf-8')).hexdigest()
+
+        if cached is not None and cached.sop_hash == sop_hash and cached.sop_path == sop_path:
+            # Solo cambió el mtime (touch / redeploy): se conserva el prefijo ya renderizado
+            cached._stat = stat_key
+            return cached
+
+        prefix = PromptPrefix(
+            niche_id,
+            sop_path,
+            sop_hash,
+            _PREFIX_TEMPLATE.format(niche_id=niche_id, sop_content=sop_content),
+            stat_key
+        )
+        _prefixes[niche_id] = prefix
+        log.info("prompt_prefix_compiled", "🧩 Prefijo de prompt compilado", niche=niche_id, sop=sop_hash[:12])
+        return prefix
+
+def build_lead_prompt(lead_meta, responses, niche_id, main_activity, rfc):
+    """Parte variable del prompt: solo los datos de este lead."""
+    return _DELTA_TEMPLATE.format(
+        company_name=lead_meta.get('company_name', 'Lead'),
+        niche_id=niche_id,
+        total=len(responses),
+        responses=json.dumps(responses, ensure_ascii=False),
+        financial_data=json.dumps(lead_meta.get('financial_data', {}), ensure_ascii=False),
+        billing_range=lead_meta.get('billing_range', 'N/A'),
+        main_activity=main_activity,
+        rfc=rfc
+    )
+
+def clear_prompt_cache():
+    with _lock:
+        _prefixes.clear()
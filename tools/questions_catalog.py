@@ -0,0 +1,156 @@
+import os
+import re
+import gzip
+import json
+import time
+import hashlib
+import threading
+from types import MappingProxyType
+
+# Catálogo compilado de cuestionarios por nicho.
+# Se parsea una sola vez y solo se reconstruye cuando cambia el mtime de algún *_diagnostico.md.
+NICHE_FILES = {
+    "holding": "holding_grupo_diagnostico.md",
+    "constructora": "constructora_diagnostico.md",
+    "autotransporte": "autotransporte_diagnostico.md",
+    "comercializadora": "comercializadora_diagnostico.md",
+    "manufactura": "manufactura_transformacion_diagnostico.md"
+}
+
+# Segundos mínimos entre revisiones de mtime (0 = revisar en cada petición)
+CATALOG_CHECK_INTERVAL = float(os.getenv("QUESTIONS_CHECK_INTERVAL", 2))
+
+_CATEGORY_RE = re.compile(r'##\s+\w*\.?\s*([^(]+)')
+_QUESTION_RE = re.compile(r'^(\d+)\.\s+(.+)$')
+_BRACKET_RE = re.compile(r'\[([^\]]+)\]')
+_OPTIONS_PREFIX_RE = re.compile(r'^\s*OPTIONS?\s*:\s*', flags=re.IGNORECASE)
+
+class CatalogEntry:
+    """Cuestionario de un nicho, pre-serializado (JSON y gzip) con su ETag fuerte."""
+    __slots__ = ('questions', 'body', 'body_gzip', 'etag')
+
+    def __init__(self, questions):
+        self.questions = questions
+        self.body = json.dumps(questions, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.body_gzip = gzip.compress(self.body, compresslevel=9, mtime=0)
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+def _looks_like_options(opt_raw):
+    return "OPTIONS" in opt_raw.upper() or "|" in opt_raw
+
+def _parse_options_raw(opt_raw):
+    opt_raw = _OPTIONS_PREFIX_RE.sub('', opt_raw).strip()
+    if not opt_raw:
+        return []
+    return [o.strip() for o in opt_raw.split('|') if o.strip()]
+
+def parse_questionnaire(content):
+    """Convierte el markdown de un cuestionario en la lista de preguntas que consume el landing."""
+    questions = []
+    current_category = "General"
+    lines = content.split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i].strip()
+
+        # Detectar Categoría
+        cat_match = _CATEGORY_RE.search(line)
+        if cat_match:
+            current_category = cat_match.group(1).strip()
+            i += 1
+            continue
+
+        # Detectar Pregunta: 1. ¿Pregunta?
+        q_match = _QUESTION_RE.search(line)
+        if q_match:
+            num = q_match.group(1)
+            full_text = q_match.group(2).strip()
+            options = []
+
+            # REGLA 1: Opciones en la MISMA línea finalizando en [ ... ]
+            opt_same_line = _BRACKET_RE.search(full_text)
+            if opt_same_line and _looks_like_options(opt_same_line.group(1)):
+                options = _parse_options_raw(opt_same_line.group(1))
+                full_text = full_text.replace(opt_same_line.group(0), '').strip()
+            elif i + 1 < len(lines):
+                # REGLA 2: Opciones en la SIGUIENTE línea ([OPTIONS: ...] o simplemente [ ... ])
+                opt_next_line = _BRACKET_RE.search(lines[i + 1].strip())
+                if opt_next_line and _looks_like_options(opt_next_line.group(1)):
+                    options = _parse_options_raw(opt_next_line.group(1))
+                    i += 1 # Consumimos la línea de opciones
+
+            questions.append({
+                "q": full_text,
+                "num": num,
+                "cat": current_category,
+                "options": options
+            })
+        i += 1
+    return questions
+
+def _resolve_path(filename, base_dir=None):
+    # Mismo orden de búsqueda que antes: cwd y, si corremos desde /tools/, el directorio superior
+    base_dir = base_dir or os.getcwd()
+    for candidate in (os.path.join(base_dir, filename), os.path.join(os.path.dirname(base_dir), filename)):
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+class QuestionsCatalog:
+    """Catálogo inmutable de cuestionarios; se reemplaza completo cuando cambia algún archivo."""
+
+    def __init__(self, base_dir=None, check_interval=None):
+        self.base_dir = base_dir
+        self.check_interval = CATALOG_CHECK_INTERVAL if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._entries = MappingProxyType({})
+        self._bulk = None
+        self._signature = None
+        self._paths = {}
+        self._last_check = 0.0
+
+    def _stat_signature(self):
+        signature = []
+        for niche_id, filename in NICHE_FILES.items():
+            path = self._paths.get(niche_id) or _resolve_path(filename, self.base_dir)
+            self._paths[niche_id] = path
+            try:
+                signature.append((niche_id, os.stat(path).st_mtime_ns) if path else (niche_id, None))
+            except OSError:
+                self._paths[niche_id] = None
+                signature.append((niche_id, None))
+        return tuple(signature)
+
+    def _build(self, signature):
+        entries = {}
+        for niche_id, mtime in signature:
+            if mtime is None:
+                continue
+            with open(self._paths[niche_id], 'r', encoding='utf-8') as f:
+                entries[niche_id] = CatalogEntry(tuple(parse_questionnaire(f.read())))
+        self._entries = MappingProxyType(entries)
+        self._bulk = CatalogEntry({niche_id: entry.questions for niche_id, entry in entries.items()})
+        self._signature = signature
+        print(f"📚 Catálogo de cuestionarios compilado: {', '.join(f'{k}={len(v.questions)}' for k, v in entries.items())}")
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._signature is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            signature = self._stat_signature()
+            if force or signature != self._signature:
+                self._build(signature)
+
+    def get(self, niche_id):
+        """Retorna el CatalogEntry del nicho o None si el archivo no existe."""
+        self.refresh()
+        return self._entries.get(niche_id)
+
+    def bulk(self):
+        """CatalogEntry con todos los nichos en un solo payload."""
+        self.refresh()
+        return self._bulk
+
+catalog = QuestionsCatalog()
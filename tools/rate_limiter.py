@@ -0,0 +1,289 @@
+import os
+import math
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+from structured_log import log
+
+# Control de admisión global a Gemini, compartido por todos los workers vía SQLite:
+#   - token bucket de solicitudes por minuto (GEMINI_RPM)
+#   - tope de llamadas en vuelo (GEMINI_MAX_IN_FLIGHT)
+#   - cola FIFO acotada (GEMINI_QUEUE_MAX) con tiempo máximo de espera (GEMINI_QUEUE_WAIT)
+# Si la cola está llena o vence el plazo, se rechaza de inmediato con un Retry-After estimado.
+RATE_LIMIT_ENABLED = os.getenv("GEMINI_RATE_LIMIT_ENABLED", "1") == "1"
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", 60))
+GEMINI_BURST = float(os.getenv("GEMINI_BURST", 10))
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", 16))
+GEMINI_QUEUE_MAX = int(os.getenv("GEMINI_QUEUE_MAX", 32))
+GEMINI_QUEUE_WAIT = float(os.getenv("GEMINI_QUEUE_WAIT", 10))
+# Un lease en vuelo de un worker caído se libera solo después de este tiempo. Mientras la llamada
+# sigue viva (streaming, reintentos del SDK) admit()/aadmit() lo renuevan cada tercio de este plazo
+GEMINI_LEASE_SECONDS = float(os.getenv("GEMINI_LEASE_SECONDS", 120))
+LIMITER_DB_PATH = os.getenv("KONTIFY_LIMITER_DB", os.path.join(os.getcwd(), '.tmp', 'limiter.sqlite3'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    id TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS waiters (
+    id TEXT PRIMARY KEY,
+    enqueued_at REAL NOT NULL,
+    deadline REAL NOT NULL
+);
+"""
+
+class AdmissionRejected(Exception):
+    """La solicitud no pudo ser admitida; retry_after en segundos."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+class AdmissionController:
+    def __init__(self, db_path=None, rpm=None, burst=None, max_in_flight=None, max_queue=None, max_wait=None, lease_seconds=None):
+        self.db_path = db_path or LIMITER_DB_PATH
+        self.rate = (rpm or GEMINI_RPM) / 60.0 # tokens por segundo
+        self.burst = burst or GEMINI_BURST
+        self.max_in_flight = max_in_flight or GEMINI_MAX_IN_FLIGHT
+        self.max_queue = GEMINI_QUEUE_MAX if max_queue is None else max_queue
+        self.max_wait = GEMINI_QUEUE_WAIT if max_wait is None else max_wait
+        self.lease_seconds = lease_seconds or GEMINI_LEASE_SECONDS
+        self.admitted = 0
+        self.rejected = 0
+        self._stats_lock = threading.Lock() # acquire() corre en muchos hilos a la vez
+        self._held = set()
+        self._held_pid = None
+        self._held_lock = threading.Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _try_admit(self, conn, waiter_id, now, deadline=None):
+        """
+        Intenta tomar un token y un lugar en vuelo dentro de una transacción exclusiva.
+        Retorna (lease_id, None) si admite o (None, segundos_estimados) si debe esperar.
+        Con deadline (primer intento) el waiter se forma en la misma transacción que revisa el
+        tope de la cola, así workers concurrentes no pueden exceder max_queue.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+            conn.execute("DELETE FROM waiters WHERE deadline < ?", (now,))
+
+            row = conn.execute("SELECT tokens, updated_at FROM bucket WHERE id = 1").fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+            in_flight = conn.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+
+            # FIFO: solo el primero de la cola (o un recién llegado con la cola vacía) puede entrar
+            head = conn.execute("SELECT id FROM waiters ORDER BY enqueued_at, id LIMIT 1").fetchone()
+            my_turn = head is None or head[0] == waiter_id
+
+            if my_turn and tokens >= 1 and in_flight < self.max_in_flight:
+                lease_id = uuid.uuid4().hex
+                conn.execute("INSERT OR REPLACE INTO bucket (id, tokens, updated_at) VALUES (1, ?, ?)", (tokens - 1, now))
+                conn.execute("INSERT INTO leases (id, expires_at) VALUES (?, ?)", (lease_id, now + self.lease_seconds))
+                if waiter_id:
+                    conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+                conn.execute("COMMIT")
+                return lease_id, None
+
+            conn.execute("INSERT OR REPLACE INTO bucket (id, tokens, updated_at) VALUES (1, ?, ?)", (tokens, now))
+            waiting = conn.execute("SELECT COUNT(*) FROM waiters").fetchone()[0]
+            if deadline is not None:
+                if waiting >= self.max_queue:
+                    conn.execute("COMMIT")
+                    raise AdmissionRejected("Cola de IA llena.", self._estimate_wait(tokens, waiting))
+                conn.execute("INSERT INTO waiters (id, enqueued_at, deadline) VALUES (?, ?, ?)", (waiter_id, now, deadline))
+            conn.execute("COMMIT")
+            return None, self._estimate_wait(tokens, waiting)
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def _count(self, admitted):
+        with self._stats_lock:
+            if admitted:
+                self.admitted += 1
+            else:
+                self.rejected += 1
+
+    def _estimate_wait(self, tokens, waiting):
+        # Tiempo hasta que el bucket libere un token por cada solicitud formada delante
+        return max(0.0, (waiting + 1 - tokens) / self.rate)
+
+    def acquire(self, max_wait=None):
+        """Bloquea hasta ser admitido (FIFO) o lanza AdmissionRejected. Retorna el id del lease."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.time() + max_wait
+        conn = self._connect()
+        waiter_id = uuid.uuid4().hex
+        try:
+            lease_id, wait = self._try_admit(conn, waiter_id, time.time(), deadline)
+            if lease_id:
+                waiter_id = None
+                self._count(True)
+                return lease_id
+
+            while True:
+                now = time.time()
+                if now >= deadline:
+                    raise AdmissionRejected("Tiempo de espera de IA agotado.", wait)
+                time.sleep(min(max(wait, 0.02), 0.25, deadline - now))
+                lease_id, wait = self._try_admit(conn, waiter_id, time.time())
+                if lease_id:
+                    waiter_id = None
+                    self._count(True)
+                    return lease_id
+        except AdmissionRejected:
+            self._count(False)
+            raise
+        finally:
+            if waiter_id:
+                conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+            conn.close()
+
+    def _attempt(self, waiter_id, deadline=None):
+        """Un intento con conexión propia (variante async: cada intento corre en un hilo del executor)."""
+        conn = self._connect()
+        try:
+            return self._try_admit(conn, waiter_id, time.time(), deadline)
+        finally:
+            conn.close()
+
+    def _drop_waiter(self, waiter_id):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+        finally:
+            conn.close()
+
+    async def aacquire(self, max_wait=None):
+        """acquire() para corrutinas: la espera en la cola es asyncio.sleep, no un hilo dormido."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.time() + max_wait
+        waiter_id = uuid.uuid4().hex
+        try:
+            lease_id, wait = await asyncio.to_thread(self._attempt, waiter_id, deadline)
+            while not lease_id:
+                now = time.time()
+                if now >= deadline:
+                    raise AdmissionRejected("Tiempo de espera de IA agotado.", wait)
+                await asyncio.sleep(min(max(wait, 0.02), 0.25, deadline - now))
+                lease_id, wait = await asyncio.to_thread(self._attempt, waiter_id)
+            waiter_id = None
+            self._count(True)
+            return lease_id
+        except AdmissionRejected:
+            self._count(False)
+            raise
+        finally:
+            if waiter_id:
+                await asyncio.to_thread(self._drop_waiter, waiter_id)
+
+    def release(self, lease_id):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM leases WHERE id = ?", (lease_id,))
+        finally:
+            conn.close()
+
+    def renew(self, lease_ids):
+        """Extiende los leases en vuelo indicados. Retorna cuántos seguían vigentes."""
+        if not lease_ids:
+            return 0
+        conn = self._connect()
+        try:
+            return conn.execute(
+                f"UPDATE leases SET expires_at = ? WHERE id IN ({','.join('?' * len(lease_ids))})",
+                [time.time() + self.lease_seconds] + list(lease_ids)
+            ).rowcount
+        finally:
+            conn.close()
+
+    def _renew_held(self):
+        # Un hilo por proceso renueva en un solo UPDATE los leases de todas las llamadas en curso
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._held_lock:
+                lease_ids = list(self._held)
+            try:
+                renewed = self.renew(lease_ids)
+            except sqlite3.Error as e:
+                log.warning("admission_lease_renew_failed", "⚠️ No se pudieron renovar los leases de IA", error=str(e))
+                continue
+            if renewed < len(lease_ids):
+                log.warning("admission_lease_lost", "⚠️ Leases de IA vencidos antes de renovarse", held=len(lease_ids), renewed=renewed)
+
+    def _hold(self, lease_id):
+        with self._held_lock:
+            if self._held_pid != os.getpid():
+                # Tras un fork los leases del padre no son de este proceso ni su hilo sobrevive
+                self._held = set()
+                self._held_pid = os.getpid()
+                threading.Thread(target=self._renew_held, name="admission-lease", daemon=True).start()
+            self._held.add(lease_id)
+
+    def _unhold(self, lease_id):
+        with self._held_lock:
+            self._held.discard(lease_id)
+
+    @contextmanager
+    def admit(self, max_wait=None):
+        if not RATE_LIMIT_ENABLED:
+            yield
+            return
+        lease_id = self.acquire(max_wait)
+        self._hold(lease_id)
+        try:
+            yield
+        finally:
+            self._unhold(lease_id)
+            self.release(lease_id)
+
+    @asynccontextmanager
+    async def aadmit(self, max_wait=None):
+        if not RATE_LIMIT_ENABLED:
+            yield
+            return
+        lease_id = await self.aacquire(max_wait)
+        self._hold(lease_id)
+        try:
+            yield
+        finally:
+            self._unhold(lease_id)
+            await asyncio.to_thread(self.release, lease_id)
+
+    def stats(self):
+        now = time.time()
+        conn = self._connect()
+        try:
+            in_flight = conn.execute("SELECT COUNT(*) FROM leases WHERE expires_at >= ?", (now,)).fetchone()[0]
+            waiting = conn.execute("SELECT COUNT(*) FROM waiters WHERE deadline >= ?", (now,)).fetchone()[0]
+        finally:
+            conn.close()
+        with self._stats_lock:
+            admitted, rejected = self.admitted, self.rejected
+        return {
+            "rpm": round(self.rate * 60, 2),
+            "in_flight": in_flight,
+            "waiting": waiting,
+            "admitted": admitted,
+            "rejected": rejected
+        }
+
+admission = AdmissionController()
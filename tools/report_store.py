@@ -0,0 +1,479 @@
+import os
+import sys
+import json
+import gzip
+import time
+import shutil
+import sqlite3
+import hashlib
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Agregar el directorio /tools al path para importaciones internas
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from pdf_service import pdf_service, PDF_RENDER_TIMEOUT
+from structured_log import log
+
+# Almacén de reportes direccionado por contenido. En lugar de un directorio plano que crece sin fin:
+#   reports/records/ab/cd/<digest>.json   diagnóstico final (fuente del PDF)
+#   reports/objects/ab/cd/<digest>.pdf    PDF renderizado (nivel caliente)
+#   reports/archive/ab/cd/<digest>.pdf.gz PDF comprimido (nivel archivo)
+#   reports/index.sqlite                  request_id / nombre público -> digest, tamaños y accesos
+# El digest es el hash del diagnóstico canónico: el mismo reporte regenerado (reenvío, refresh)
+# apunta al mismo objeto y no se vuelve a renderizar ni a guardar.
+# "eager" = render durante el submit (comportamiento clásico), "lazy" = render en la primera descarga
+PDF_RENDER_MODE = os.getenv("KONTIFY_PDF_MODE", "eager").lower()
+# Render a memoria y persistencia en segundo plano (0 = escribir a disco antes de responder)
+PDF_WRITE_BEHIND = os.getenv("PDF_WRITE_BEHIND", "1") == "1"
+# Retención: a archivo (gzip) tras N días sin acceso; eliminación por edad o por presupuesto de bytes
+REPORTS_ARCHIVE_AFTER_DAYS = float(os.getenv("REPORTS_ARCHIVE_AFTER_DAYS", 30))
+REPORTS_MAX_AGE_DAYS = float(os.getenv("REPORTS_MAX_AGE_DAYS", 365))
+REPORTS_MAX_BYTES = int(os.getenv("REPORTS_MAX_BYTES", 2 * 1024 ** 3)) # 0 = sin límite
+# Segundos tras los cuales un candado de render de otro proceso se considera abandonado
+RENDER_LOCK_STALE = float(os.getenv("PDF_RENDER_LOCK_STALE", PDF_RENDER_TIMEOUT + 30))
+RENDER_LOCK_POLL = 0.1
+
+TIER_PENDING = "pending" # solo el diagnóstico, el PDF aún no se renderiza
+TIER_HOT = "hot"
+TIER_ARCHIVE = "archive"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    request_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    digest TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_digest ON reports (digest);
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    tier TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_access ON objects (tier, last_access);
+"""
+
+def report_digest(diagnostic_result):
+    """Hash estable del diagnóstico final (lo que determina el contenido del PDF)."""
+    material = json.dumps(diagnostic_result, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class ReportBlob:
+    """PDF listo para servir: en disco (path) o en memoria (data) mientras se escribe."""
+    __slots__ = ("digest", "path", "data")
+
+    def __init__(self, digest, path=None, data=None):
+        self.digest = digest
+        self.path = path
+        self.data = data
+
+def _valid_filename(filename):
+    return bool(filename) and os.path.basename(filename) == filename and filename.endswith(".pdf")
+
+def _shard(reports_dir, tier_dir, digest, suffix):
+    return os.path.join(reports_dir, tier_dir, digest[:2], digest[2:4], f"{digest}{suffix}")
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class ReportStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {} # digest -> Future del render en curso en este proceso
+        self._pending = {} # digest -> (bytes, Future) de escrituras diferidas aún no en disco
+        self._executor = None
+        self._pid = None
+        self._ready_dbs = set()
+        self.records_saved = 0
+        self.deduplicated = 0
+        self.renders = 0
+        self.coalesced = 0
+        self.restored = 0
+
+    # --- Rutas e índice ---
+
+    def record_path(self, reports_dir, digest):
+        return _shard(reports_dir, "records", digest, ".json")
+
+    def object_path(self, reports_dir, digest):
+        return _shard(reports_dir, "objects", digest, ".pdf")
+
+    def archive_path(self, reports_dir, digest):
+        return _shard(reports_dir, "archive", digest, ".pdf.gz")
+
+    def _connect(self, reports_dir):
+        db_path = os.path.join(reports_dir, "index.sqlite")
+        if db_path not in self._ready_dbs:
+            os.makedirs(reports_dir, exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+        if db_path not in self._ready_dbs:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._ready_dbs.add(db_path)
+        return conn
+
+    def lookup(self, reports_dir, request_id=None, filename=None):
+        """(digest, filename, tier) de un reporte por request_id o por nombre público; None si no existe."""
+        conn = self._connect(reports_dir)
+        try:
+            column, value = ("request_id", request_id) if request_id else ("filename", filename)
+            return conn.execute(
+                f"SELECT r.digest, r.filename, o.tier FROM reports r JOIN objects o ON o.digest = r.digest WHERE r.{column} = ?",
+                (value,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    # --- Escritura ---
+
+    def save_record(self, reports_dir, request_id, filename, diagnostic_result):
+        """
+        Registra el reporte de request_id bajo `filename` y persiste su diagnóstico si es nuevo.
+        Retorna el digest; un diagnóstico idéntico ya guardado se reutiliza (sin escribir ni renderizar).
+        """
+        digest = report_digest(diagnostic_result)
+        now = time.time()
+        conn = self._connect(reports_dir)
+        try:
+            known = conn.execute("SELECT 1 FROM objects WHERE digest = ?", (digest,)).fetchone()
+            if known:
+                self.deduplicated += 1
+            else:
+                _write_atomic(self.record_path(reports_dir, digest), json.dumps(diagnostic_result, ensure_ascii=False).encode("utf-8"))
+                conn.execute(
+                    "INSERT OR IGNORE INTO objects (digest, tier, size, created_at, last_access) VALUES (?, ?, 0, ?, ?)",
+                    (digest, TIER_PENDING, now, now)
+                )
+                self.records_saved += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (request_id, filename, digest, created_at) VALUES (?, ?, ?, ?)",
+                (request_id, filename, digest, now)
+            )
+        finally:
+            conn.close()
+        return digest
+
+    def load_record(self, reports_dir, digest):
+        try:
+            with open(self.record_path(reports_dir, digest), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    # --- Lectura / render bajo demanda ---
+
+    def fetch(self, reports_dir, filename, timeout=None):
+        """
+        ReportBlob del reporte `filename`: en disco (path) o recién renderizado en memoria (data) mientras
+        se persiste en segundo plano. Restaura del archivo o renderiza desde el diagnóstico si hace falta.
+        None si el reporte no existe.
+        Las solicitudes concurrentes del mismo objeto comparten un solo render (en el proceso y
+        entre workers vía candado en disco). Propaga RenderQueueFull del pool.
+        """
+        if not _valid_filename(filename):
+            return None
+        row = self.lookup(reports_dir, filename=filename)
+        if row is None:
+            # Reportes anteriores al almacén (directorio plano)
+            legacy_path = os.path.join(reports_dir, filename)
+            return ReportBlob(None, path=legacy_path) if os.path.isfile(legacy_path) else None
+
+        digest, _, tier = row
+        pending = self._pending.get(digest)
+        if pending is not None:
+            return ReportBlob(digest, data=pending[0])
+        pdf_path = self.object_path(reports_dir, digest)
+        if tier == TIER_HOT and os.path.exists(pdf_path):
+            self._touch(reports_dir, digest)
+            return ReportBlob(digest, path=pdf_path)
+        timeout = timeout or PDF_RENDER_TIMEOUT
+
+        with self._lock:
+            future = self._inflight.get(digest)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[digest] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result(timeout=timeout)
+
+        try:
+            future.set_result(self._materialize(reports_dir, digest, pdf_path, timeout))
+        except BaseException as err:
+            future.set_exception(err)
+        finally:
+            with self._lock:
+                self._inflight.pop(digest, None)
+        return future.result()
+
+    def ensure_pdf(self, reports_dir, filename, timeout=None):
+        """Ruta del PDF en disco (espera la escritura diferida si la hay); None si el reporte no existe."""
+        blob = self.fetch(reports_dir, filename, timeout)
+        if blob is None:
+            return None
+        if blob.path is None:
+            pending = self._pending.get(blob.digest)
+            if pending is not None:
+                pending[1].result(timeout=timeout or PDF_RENDER_TIMEOUT)
+            return self.object_path(reports_dir, blob.digest)
+        return blob.path
+
+    def _materialize(self, reports_dir, digest, pdf_path, timeout):
+        lock_path = f"{pdf_path}.rendering"
+        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        deadline = time.time() + timeout
+        while True:
+            if os.path.exists(pdf_path):
+                self._set_tier(reports_dir, digest, TIER_HOT, os.path.getsize(pdf_path))
+                return ReportBlob(digest, path=pdf_path)
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                # Otro worker ya lo está generando: esperar su archivo (o reclamar un candado abandonado)
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > RENDER_LOCK_STALE:
+                        _remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"Render de {digest[:12]} en otro proceso excedió {timeout}s")
+                time.sleep(RENDER_LOCK_POLL)
+
+        release_lock = True
+        try:
+            os.close(fd)
+            if os.path.exists(pdf_path):
+                self._set_tier(reports_dir, digest, TIER_HOT, os.path.getsize(pdf_path))
+                return ReportBlob(digest, path=pdf_path)
+            archive_path = self.archive_path(reports_dir, digest)
+            if os.path.exists(archive_path):
+                # Temporal + rename: nadie sirve un PDF a medio escribir
+                tmp_path = f"{pdf_path}.{os.getpid()}.tmp"
+                with gzip.open(archive_path, "rb") as src, open(tmp_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(tmp_path, pdf_path)
+                _remove(archive_path)
+                self.restored += 1
+                self._set_tier(reports_dir, digest, TIER_HOT, os.path.getsize(pdf_path))
+                return ReportBlob(digest, path=pdf_path)
+
+            record = self.load_record(reports_dir, digest)
+            if record is None:
+                return None
+            data = pdf_service.render(record, timeout=timeout) # Bytes en memoria, sin pasar por disco
+            self.renders += 1
+            log.info("report_rendered", "🖨️ Reporte renderizado", digest=digest[:12], bytes=len(data))
+            if not PDF_WRITE_BEHIND:
+                self._persist(reports_dir, digest, pdf_path, data)
+                return ReportBlob(digest, path=pdf_path)
+            # Escritura diferida: se responde con los bytes y el candado se libera al terminar de escribir,
+            # así otro worker no renderiza una versión distinta (folio/fecha) del mismo objeto
+            writer = self._writer()
+            written = Future()
+            self._pending[digest] = (data, written)
+            writer.submit(self._write_behind, reports_dir, digest, pdf_path, data, lock_path, written)
+            release_lock = False
+            return ReportBlob(digest, data=data)
+        finally:
+            if release_lock:
+                _remove(lock_path)
+
+    def _persist(self, reports_dir, digest, pdf_path, data):
+        _write_atomic(pdf_path, data)
+        self._set_tier(reports_dir, digest, TIER_HOT, len(data))
+
+    def _write_behind(self, reports_dir, digest, pdf_path, data, lock_path, written):
+        try:
+            self._persist(reports_dir, digest, pdf_path, data)
+            written.set_result(pdf_path)
+        except Exception as e:
+            log.error("report_write_failed", "⚠️ Escritura diferida falló", digest=digest[:12], error=str(e))
+            written.set_exception(e)
+        finally:
+            self._pending.pop(digest, None)
+            _remove(lock_path)
+
+    def _writer(self):
+        # Los hilos no sobreviven un fork: un escritor por proceso
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report-writer")
+                self._pid = os.getpid()
+                self._pending = {}
+            return self._executor
+
+    def flush(self, timeout=None):
+        """Espera las escrituras diferidas pendientes (apagado ordenado / pruebas)."""
+        for _, written in list(self._pending.values()):
+            written.result(timeout=timeout or PDF_RENDER_TIMEOUT)
+
+    def _touch(self, reports_dir, digest):
+        conn = self._connect(reports_dir)
+        try:
+            conn.execute("UPDATE objects SET last_access = ? WHERE digest = ?", (time.time(), digest))
+        finally:
+            conn.close()
+
+    def _set_tier(self, reports_dir, digest, tier, size):
+        conn = self._connect(reports_dir)
+        try:
+            conn.execute(
+                "UPDATE objects SET tier = ?, size = ?, last_access = ? WHERE digest = ?",
+                (tier, size, time.time(), digest)
+            )
+        finally:
+            conn.close()
+
+    # --- Retención ---
+
+    def _evict(self, conn, reports_dir, digest):
+        for path in (self.object_path(reports_dir, digest), self.archive_path(reports_dir, digest), self.record_path(reports_dir, digest)):
+            _remove(path)
+        conn.execute("DELETE FROM reports WHERE digest = ?", (digest,))
+        conn.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+
+    def apply_retention(self, reports_dir, archive_after_days=None, max_age_days=None, max_bytes=None):
+        """
+        1. PDFs sin acceso en archive_after_days -> nivel archivo (gzip).
+        2. Reportes con más de max_age_days -> eliminados (índice, PDF y diagnóstico).
+        3. Si el total supera max_bytes -> se eliminan los de acceso más antiguo hasta entrar en presupuesto.
+        """
+        archive_after_days = REPORTS_ARCHIVE_AFTER_DAYS if archive_after_days is None else archive_after_days
+        max_age_days = REPORTS_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        max_bytes = REPORTS_MAX_BYTES if max_bytes is None else max_bytes
+        now = time.time()
+        summary = {"archived": 0, "expired": 0, "evicted_for_size": 0, "bytes_freed": 0}
+
+        conn = self._connect(reports_dir)
+        try:
+            cold = conn.execute(
+                "SELECT digest, size FROM objects WHERE tier = ? AND last_access < ?",
+                (TIER_HOT, now - archive_after_days * 86400)
+            ).fetchall()
+            for digest, size in cold:
+                pdf_path = self.object_path(reports_dir, digest)
+                archive_path = self.archive_path(reports_dir, digest)
+                os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+                try:
+                    with open(pdf_path, "rb") as src, gzip.open(f"{archive_path}.tmp", "wb", compresslevel=9) as dst:
+                        shutil.copyfileobj(src, dst)
+                except FileNotFoundError:
+                    continue
+                os.replace(f"{archive_path}.tmp", archive_path)
+                _remove(pdf_path)
+                archived_size = os.path.getsize(archive_path)
+                conn.execute("UPDATE objects SET tier = ?, size = ? WHERE digest = ?", (TIER_ARCHIVE, archived_size, digest))
+                summary["archived"] += 1
+                summary["bytes_freed"] += max(size - archived_size, 0)
+
+            if max_age_days:
+                expired = conn.execute(
+                    "SELECT digest, size FROM objects WHERE created_at < ?", (now - max_age_days * 86400,)
+                ).fetchall()
+                for digest, size in expired:
+                    self._evict(conn, reports_dir, digest)
+                    summary["expired"] += 1
+                    summary["bytes_freed"] += size
+
+            if max_bytes:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+                if total > max_bytes:
+                    for digest, size in conn.execute("SELECT digest, size FROM objects ORDER BY last_access").fetchall():
+                        if total <= max_bytes:
+                            break
+                        self._evict(conn, reports_dir, digest)
+                        total -= size
+                        summary["evicted_for_size"] += 1
+                        summary["bytes_freed"] += size
+        finally:
+            conn.close()
+        return summary
+
+    def import_legacy(self, reports_dir):
+        """Mueve los PDFs del directorio plano (KONTIFY_<empresa>_<id>.pdf) al almacén."""
+        imported = 0
+        conn = self._connect(reports_dir)
+        try:
+            for filename in sorted(os.listdir(reports_dir)):
+                legacy_path = os.path.join(reports_dir, filename)
+                if not filename.endswith(".pdf") or not os.path.isfile(legacy_path):
+                    continue
+                with open(legacy_path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest() # Sin diagnóstico: hash de los bytes
+                pdf_path = self.object_path(reports_dir, digest)
+                os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+                os.replace(legacy_path, pdf_path)
+                created_at = os.path.getmtime(pdf_path)
+                conn.execute(
+                    "INSERT OR REPLACE INTO objects (digest, tier, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (digest, TIER_HOT, os.path.getsize(pdf_path), created_at, created_at)
+                )
+                request_id = filename[:-4].rsplit("_", 1)[-1]
+                conn.execute(
+                    "INSERT OR REPLACE INTO reports (request_id, filename, digest, created_at) VALUES (?, ?, ?, ?)",
+                    (request_id, filename, digest, created_at)
+                )
+                imported += 1
+        finally:
+            conn.close()
+        return imported
+
+    def stats(self, reports_dir=None):
+        stats = {
+            "mode": PDF_RENDER_MODE,
+            "records_saved": self.records_saved,
+            "deduplicated": self.deduplicated,
+            "renders": self.renders,
+            "restored": self.restored,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+            "pending_writes": len(self._pending),
+            "write_behind": PDF_WRITE_BEHIND
+        }
+        if reports_dir:
+            conn = self._connect(reports_dir)
+            try:
+                stats["tiers"] = {
+                    tier: {"objects": count, "bytes": size}
+                    for tier, count, size in conn.execute("SELECT tier, COUNT(*), COALESCE(SUM(size), 0) FROM objects GROUP BY tier")
+                }
+                stats["reports"] = conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+            finally:
+                conn.close()
+        return stats
+
+report_store = ReportStore()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento del almacén de reportes PDF.")
+    parser.add_argument("--dir", default=os.path.join(os.getcwd(), 'reports'))
+    parser.add_argument("--import-legacy", action="store_true", help="Mueve los PDFs del directorio plano al almacén.")
+    parser.add_argument("--retention", action="store_true", help="Aplica archivo/eliminación por edad y presupuesto.")
+    args = parser.parse_args()
+
+    if args.import_legacy:
+        print(f"📦 {report_store.import_legacy(args.dir)} reportes importados al almacén")
+    if args.retention:
+        print(f"🗄️ Retención: {json.dumps(report_store.apply_retention(args.dir))}")
+    print(json.dumps(report_store.stats(args.dir), indent=2))
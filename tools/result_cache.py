@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from structured_log import log
+
+# Caché de diagnósticos direccionada por contenido: el mismo cuestionario reenviado
+# (refresh, reintento por red) no vuelve a pagar una llamada a Gemini.
+DIAGNOSTIC_CACHE_ENABLED = os.getenv("DIAGNOSTIC_CACHE_ENABLED", "1") == "1"
+DIAGNOSTIC_CACHE_MAX_ENTRIES = int(os.getenv("DIAGNOSTIC_CACHE_MAX_ENTRIES", 512))
+DIAGNOSTIC_CACHE_TTL = int(os.getenv("DIAGNOSTIC_CACHE_TTL", 6 * 3600))
+# Nivel en disco compartido por todos los workers de gunicorn (vacío = solo memoria)
+DIAGNOSTIC_CACHE_DB = os.getenv("DIAGNOSTIC_CACHE_DB", "")
+# Los contadores compartidos de aciertos se acumulan en memoria y se escriben cada N segundos
+# (como metrics.py): get() no abre una transacción de escritura por consulta
+DIAGNOSTIC_CACHE_STATS_FLUSH = float(os.getenv("DIAGNOSTIC_CACHE_STATS_FLUSH", 5))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS diagnostic_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS diagnostic_cache_stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def diagnostic_cache_key(niche_id, responses, financial_data, billing_range, rfc, sop_version):
+    """Hash estable de todo lo que influye en el diagnóstico (respuestas ya normalizadas)."""
+    material = json.dumps(
+        [niche_id, responses, financial_data or {}, billing_range, rfc, sop_version],
+        ensure_ascii=False, sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    """LRU + TTL en memoria con un nivel opcional en SQLite compartido entre procesos."""
+
+    def __init__(self, max_entries=None, ttl=None, db_path=None):
+        self.max_entries = max_entries or DIAGNOSTIC_CACHE_MAX_ENTRIES
+        self.ttl = ttl or DIAGNOSTIC_CACHE_TTL
+        self.db_path = DIAGNOSTIC_CACHE_DB if db_path is None else db_path
+        self._entries = OrderedDict() # key -> (expira_en, json)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._pending = {} # name -> incremento aún no escrito en diagnostic_cache_stats
+        self._pending_pid = os.getpid()
+        self._last_flush = time.monotonic()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _bump_shared(self, name):
+        if not self.db_path:
+            return
+        with self._lock:
+            if self._pending_pid != os.getpid():
+                # Tras un fork el hijo no hereda los pendientes del padre
+                self._pending, self._pending_pid = {}, os.getpid()
+            self._pending[name] = self._pending.get(name, 0) + 1
+            due = time.monotonic() - self._last_flush >= DIAGNOSTIC_CACHE_STATS_FLUSH
+        if due:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Escribe los contadores acumulados en el nivel compartido (una transacción)."""
+        with self._lock:
+            pending = self._pending if self._pending_pid == os.getpid() else {}
+            self._pending, self._pending_pid = {}, os.getpid()
+            self._last_flush = time.monotonic()
+        if not pending or not self.db_path:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO diagnostic_cache_stats (name, value) VALUES (?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", list(pending.items())
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            log.warning("result_cache_disk_unavailable", "⚠️ Caché de diagnósticos (disco) no disponible", error=str(e))
+
+    def _remember(self, key, expires_at, value):
+        # Llamar con self._lock tomado
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Retorna una copia nueva del diagnóstico cacheado o None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                value = entry[1]
+            else:
+                if entry:
+                    del self._entries[key]
+                value = None
+
+        if value is not None:
+            self._bump_shared("hits")
+            return json.loads(value)
+
+        if self.db_path:
+            try:
+                conn = self._connect()
+                try:
+                    row = conn.execute(
+                        "SELECT value, expires_at FROM diagnostic_cache WHERE key = ? AND expires_at > ?", (key, now)
+                    ).fetchone()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                log.warning("result_cache_disk_unavailable", "⚠️ Caché de diagnósticos (disco) no disponible", error=str(e))
+                row = None
+            if row:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, row[1], row[0])
+                self._bump_shared("hits")
+                return json.loads(row[0])
+
+        with self._lock:
+            self.misses += 1
+        self._bump_shared("misses")
+        return None
+
+    def set(self, key, result):
+        value = json.dumps(result, ensure_ascii=False)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+        if self.db_path:
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO diagnostic_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, value, expires_at)
+                    )
+                    conn.execute("DELETE FROM diagnostic_cache WHERE expires_at < ?", (time.time(),))
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                log.warning("result_cache_disk_unavailable", "⚠️ Caché de diagnósticos (disco) no disponible", error=str(e))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "model_calls_saved": self.memory_hits + self.disk_hits
+            }
+        if self.db_path:
+            self.flush_stats()
+            try:
+                conn = self._connect()
+                try:
+                    shared = dict(conn.execute("SELECT name, value FROM diagnostic_cache_stats").fetchall())
+                finally:
+                    conn.close()
+                stats["shared"] = {"hits": shared.get("hits", 0), "misses": shared.get("misses", 0)}
+            except sqlite3.Error:
+                pass
+        return stats
+
+result_cache = ResultCache()
@@ -0,0 +1,252 @@
+import os
+import re
+import sys
+import json
+import threading
+import unicodedata
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from questions_catalog import catalog as questions_catalog, parse_questionnaire
+from prompt_builder import get_prompt_prefix
+
+# Motor local y determinista de riesgo por nicho.
+# Cada nicho se compila a una matriz de pesos W (opciones x vectores de riesgo): las filas son todas
+# las (pregunta, opción) del cuestionario y las columnas los vectores del SOP (sus secciones).
+# Un lead se codifica como vector one-hot de respuestas y su score es (x @ W) / (x @ A).
+ENGINE_VERSION = "local-v1"
+
+# Peso por vector de riesgo según la REGLA DE CÁLCULO del prompt:
+# fallas de blindaje, cumplimiento fiscal o gobernanza pesan más; estrategia/expansión pesa menos.
+_VECTOR_WEIGHTS = (
+    (('blindaje', 'fiscal', 'sat', 'gobernanza', 'cumplimiento', 'aduan', 'seguridad social'), 1.5),
+    (('estrategia', 'expansion', 'tecnologia', 'cierre'), 0.5),
+)
+
+# Riesgo por opción de respuesta (0 = control sólido, 1 = exposición total)
+_HIGH_RISK = re.compile(r'\b(no|sin|ninguno|ninguna|efectivo|verbal|misma empresa|persona fisica|a nombre de socios|solo verbal)\b')
+_MID_RISK = re.compile(r'\b(en proceso|borrador|mixto|informales?|parcial|en creacion|a veces|depende)\b')
+
+@lru_cache(maxsize=4096)
+def _fold(text):
+    """Minúsculas sin acentos ni signos, para comparar respuestas y opciones."""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+def _option_risk(option):
+    folded = _fold(option)
+    if folded in ('si', 'yes'):
+        return 0.0
+    if folded == 'no' or _HIGH_RISK.search(folded):
+        return 1.0
+    if _MID_RISK.search(folded):
+        return 0.5
+    return 0.25
+
+def _vector_weight(name):
+    folded = _fold(name)
+    for keywords, weight in _VECTOR_WEIGHTS:
+        if any(k in folded for k in keywords):
+            return weight
+    return 1.0
+
+def _risk_level(score):
+    if score > 70:
+        return "RIESGO CRÍTICO"
+    if score > 30:
+        return "VULNERABILIDAD MODERADA"
+    return "VIGILANCIA PREVENTIVA"
+
+class NicheScoringModel:
+    """Matriz de pesos compilada de un nicho. Inmutable una vez construida."""
+
+    def __init__(self, niche_id, questions, vectors_by_num):
+        self.niche_id = niche_id
+        self.vectors = []
+        vector_index = {}
+        self.question_nums = []
+        self.option_offsets = {}   # num -> (offset, {opción_normalizada: índice})
+        self.text_to_num = {}
+        rows = []
+
+        for q in questions:
+            vector = vectors_by_num.get(q['num'], q['cat'])
+            if vector not in vector_index:
+                vector_index[vector] = len(self.vectors)
+                self.vectors.append(vector)
+            options = q['options'] or ['SÍ', 'NO']
+            offset = len(rows)
+            self.option_offsets[q['num']] = (offset, {_fold(o): i for i, o in enumerate(options)})
+            self.text_to_num[_fold(q['q'])] = q['num']
+            self.question_nums.append(q['num'])
+            for option in options:
+                rows.append((vector_index[vector], _option_risk(option)))
+
+        self.size = len(rows)
+        self.W = np.zeros((self.size, len(self.vectors)))
+        self.A = np.zeros((self.size, len(self.vectors)))
+        for row, (k, risk) in enumerate(rows):
+            self.W[row, k] = risk
+            self.A[row, k] = 1.0
+        self.vector_weights = np.array([_vector_weight(v) for v in self.vectors])
+
+    def _resolve(self, response):
+        num = None
+        for key in ('q_index', 'num', 'id'):
+            if response.get(key) is not None:
+                num = str(response[key])
+                break
+        if num not in self.option_offsets:
+            num = self.text_to_num.get(_fold(str(response.get('question') or response.get('q') or '')))
+        if num is None:
+            return None
+        offset, options = self.option_offsets[num]
+        answer = _fold(str(response.get('answer', '')))
+        if answer in options:
+            return offset + options[answer]
+        # Respuesta con texto adicional ("NO, en proceso"): opción como palabra(s) completas al inicio
+        for option, idx in options.items():
+            if option and answer.startswith(option + ' '):
+                return offset + idx
+        return None
+
+    def encode(self, responses):
+        """Vector one-hot (float) de las respuestas reconocidas."""
+        x = np.zeros(self.size)
+        for response in responses:
+            if isinstance(response, dict):
+                idx = self._resolve(response)
+                if idx is not None:
+                    x[idx] = 1.0
+        return x
+
+    def score_matrix(self, X):
+        """X: (N, opciones). Retorna (scores_globales (N,), scores_por_vector (N, K), respondidas (N, K))."""
+        risk = X @ self.W
+        answered = X @ self.A
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per_vector = np.where(answered > 0, risk / answered, 0.0) * 100
+        weighted_answered = answered @ self.vector_weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            overall = np.where(weighted_answered > 0, (risk @ self.vector_weights) / weighted_answered, np.nan) * 100
+        return overall, per_vector, answered
+
+_models = {}
+_lock = threading.Lock()
+
+def get_model(niche_id):
+    """Modelo del nicho; se recompila si cambia el cuestionario (ETag) o el SOP (hash)."""
+    if np is None:
+        return None
+    entry = questions_catalog.get(niche_id)
+    if entry is None:
+        return None
+    prefix = get_prompt_prefix(niche_id)
+    version = (entry.etag, prefix.sop_hash)
+    cached = _models.get(niche_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    with _lock:
+        cached = _models.get(niche_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        # Vectores de riesgo = secciones del SOP del nicho (por número de pregunta)
+        with open(prefix.sop_path, 'r', encoding='utf-8') as f:
+            sop_questions = parse_questionnaire(f.read())
+        vectors_by_num = {q['num']: q['cat'] for q in sop_questions}
+        model = NicheScoringModel(niche_id, entry.questions, vectors_by_num)
+        _models[niche_id] = (version, model)
+        return model
+
+def score_lead(niche_id, responses):
+    """
+    Score local de un lead: {"overall_risk_score", "risk_level", "categories", "answered", "engine"}.
+    Retorna None si NumPy no está disponible, el nicho no existe o ninguna respuesta es reconocible.
+    """
+    model = get_model(niche_id)
+    if model is None:
+        return None
+    overall, per_vector, answered = model.score_matrix(model.encode(responses)[None, :])
+    if np.isnan(overall[0]):
+        return None
+    return {
+        "overall_risk_score": int(round(overall[0])),
+        "risk_level": _risk_level(overall[0]),
+        "categories": [
+            {"category": name, "score": int(round(per_vector[0, k])), "answered": int(answered[0, k])}
+            for k, name in enumerate(model.vectors) if answered[0, k] > 0
+        ],
+        "answered": int(answered[0].sum()),
+        "engine": ENGINE_VERSION
+    }
+
+def build_local_diagnostic(local, rfc, giro, reason):
+    """Diagnóstico completo (mismo contrato que el de la IA) a partir del score local."""
+    worst = sorted(local['categories'], key=lambda c: c['score'], reverse=True)
+    return {
+        "risk_assessment": {
+            "overall_risk_score": local['overall_risk_score'],
+            "risk_level": local['risk_level'],
+            "critical_finding": f"Mayor exposición en {worst[0]['category']} ({worst[0]['score']}/100)." if worst else reason,
+            "hallazgos_tecnicos": [f"{c['category']}: riesgo {c['score']}/100" for c in worst] + [
+                f"RFC Detectado: {rfc} - VALIDADO",
+                f"Giro Detectado: {giro} - REGISTRADO"
+            ]
+        },
+        "sales_pitch": "Se recomienda una sesión de diagnóstico profundo para priorizar los vectores de mayor riesgo.",
+        "markdown_content": "### SCORE LOCAL PMDS\n" + "\n".join(f"- {c['category']}: {c['score']}/100" for c in worst),
+        "admin_report": {"summary": reason},
+        "local_score": local
+    }
+
+def score_batch(niche_id, responses_list):
+    """Scores globales (array N) de muchos leads del mismo nicho en una sola multiplicación de matrices."""
+    model = get_model(niche_id)
+    if model is None:
+        return None
+    X = np.zeros((len(responses_list), model.size))
+    for i, responses in enumerate(responses_list):
+        X[i] = model.encode(responses)
+    overall, _, _ = model.score_matrix(X)
+    return overall
+
+if __name__ == "__main__":
+    # Re-score por lotes de leads almacenados: JSONL de payloads o la cola de trabajos SQLite
+    import argparse
+    parser = argparse.ArgumentParser(description="Score local por lotes de leads almacenados.")
+    parser.add_argument("source", help="Archivo .jsonl de payloads (lead_metadata + responses) o base .sqlite3 de la cola de trabajos.")
+    args = parser.parse_args()
+
+    payloads = []
+    if args.source.endswith(('.sqlite3', '.db')):
+        from job_queue import _connect
+        conn = _connect(args.source)
+        for (raw,) in conn.execute("SELECT payload FROM jobs"):
+            payloads.append(json.loads(raw).get('data_for_ai', {}))
+        conn.close()
+    else:
+        with open(args.source, 'r', encoding='utf-8') as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+
+    by_niche = {}
+    for payload in payloads:
+        niche_id = (payload.get('lead_metadata') or {}).get('niche_id', 'holding')
+        by_niche.setdefault(niche_id, []).append(payload)
+
+    for niche_id, items in by_niche.items():
+        scores = score_batch(niche_id, [p.get('responses', []) for p in items])
+        if scores is None:
+            print(f"⚠️ Nicho sin modelo: {niche_id}", file=sys.stderr)
+            continue
+        for payload, score in zip(items, scores):
+            meta = payload.get('lead_metadata') or {}
+            print(json.dumps({
+                "company": meta.get('company_name'),
+                "rfc": meta.get('rfc'),
+                "niche_id": niche_id,
+                "local_score": None if np.isnan(score) else int(round(score))
+            }, ensure_ascii=False))
@@ -1,9 +1,14 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, make_response, send_from_directory, send_file
 from flask_cors import CORS
 import os
+import io
 import json
 import uuid
 import sys
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuración de la Aplicación
 app = Flask(__name__)
@@ -15,25 +20,68 @@ tools_dir = os.path.dirname(os.path.abspath(__file__))
 if tools_dir not in sys.path:
     sys.path.append(tools_dir)
 
-from process_diagnostic import run_diagnostic
-from pdf_generator_v2 import generate_pdf_final
-from notificator import notify_all
-from sheets_connection_test import run_boot_test
+from pipeline import process_submission, REPORTS_DIR
+from job_queue import enqueue_job, get_job, STATUS_SUCCESS, STATUS_ERROR
+from result_cache import result_cache
+from rate_limiter import admission
+from outbox import outbox
+from pdf_service import pdf_service, RenderQueueFull
+from report_store import report_store
+from lead_schema import parse_submission, LeadValidationError
+from sheets_client import sheets_client
+from questions_catalog import catalog as questions_catalog, NICHE_FILES
+from boot import BOOT_HOOKS, load_shared_assets, start_process_services, boot_check
+from structured_log import log
+from metrics import metrics
 
-# Asegurar que las carpetas existan
-os.makedirs('.tmp', exist_ok=True)
-REPORTS_DIR = os.path.join(os.getcwd(), 'reports')
-os.makedirs(REPORTS_DIR, exist_ok=True)
+# Modo de /api/submit: "sync" (pipeline en la petición) o "async" (cola + tools.worker)
+SUBMIT_MODE = os.getenv("KONTIFY_SUBMIT_MODE", "sync").lower()
+QUESTIONS_MAX_AGE = int(os.getenv("QUESTIONS_MAX_AGE", 300))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 10))
+# Pipelines de /api/submit/stream en vuelo por proceso (modo sync); al tope se responde 429
+SSE_MAX_PIPELINES = int(os.getenv("SSE_MAX_PIPELINES", 16))
+# Modo async: cada cuánto el stream consulta la etapa del trabajo y cuánto espera antes de
+# devolver el estado 'accepted' para que el cliente siga consultando /api/jobs/<id>
+SSE_JOB_POLL_SECONDS = float(os.getenv("SSE_JOB_POLL_SECONDS", 1))
+SSE_JOB_WAIT_SECONDS = float(os.getenv("SSE_JOB_WAIT_SECONDS", 600))
+REPORTS_MAX_AGE = int(os.getenv("REPORTS_MAX_AGE", 3600))
 
-try:
-    run_boot_test()
-    print("✅ BOOT-TEST: Google Sheets conectado y A1 actualizado.")
-except Exception as e:
-    print(f"🛑 CRITICAL ERROR: ERROR DE CREDENCIALES GOOGLE: {e}")
+# Activos de solo lectura al importar (con preload_app, en el master). Los recursos por proceso y la
+# prueba de Sheets los arrancan los hooks de gunicorn.conf.py; sin él (passenger, python tools/server.py), aquí.
+load_shared_assets()
+if not BOOT_HOOKS:
+    start_process_services()
+    boot_check()
 
 @app.route('/health')
 def health():
-    return jsonify({"status": "ok", "service": "kontify-brain"}), 200
+    return jsonify({
+        "status": "ok",
+        "service": "kontify-brain",
+        "diagnostic_cache": result_cache.stats(),
+        "gemini_admission": admission.stats(),
+        "outbox": outbox.stats(),
+        "pdf_pool": pdf_service.stats(),
+        "reports": report_store.stats(REPORTS_DIR),
+        "sheets_client": sheets_client.stats(),
+        "log": log.stats()
+    }), 200
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Histogramas por etapa y contadores, sumados entre todos los workers (ver metrics.py)."""
+    metrics.flush()
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+_SUBMIT_ROUTES = {"submit_quiz": "submit", "submit_quiz_stream": "stream"}
+
+@app.after_request
+def _count_submission(response):
+    # El stream siempre responde 200: su resultado real se cuenta al terminar el pipeline
+    route = _SUBMIT_ROUTES.get(request.endpoint)
+    if route == "submit" or (route == "stream" and response.status_code != 200):
+        metrics.inc("kontify_submissions_total", route=route, status=response.status_code)
+    return response
 
 @app.route('/')
 def serve_index():
@@ -41,31 +89,20 @@ def serve_index():
     public_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../public'))
     return send_from_directory(public_dir, 'index.html')
 
-def _normalize_responses(raw_responses):
-    normalized = []
-    if isinstance(raw_responses, list):
-        for item in raw_responses:
-            if isinstance(item, dict):
-                q = item.get('question') or item.get('q') or item.get('text')
-                if not q:
-                    q_index = item.get('q_index') or item.get('num') or item.get('id')
-                    if q_index is not None:
-                        q = f"Q{q_index}"
-                a = item.get('answer') or item.get('a') or item.get('response') or item.get('value')
-
-                if q or a is not None:
-                    entry = {
-                        "question": str(q).strip() if q else "N/A",
-                        "answer": str(a).strip() if a is not None else "N/A"
-                    }
-                    if item.get('q_index') is not None:
-                        entry["q_index"] = item.get('q_index')
-                    if item.get('category_id') or item.get('cat'):
-                        entry["category_id"] = item.get('category_id') or item.get('cat')
-                    normalized.append(entry)
-            elif isinstance(item, str):
-                normalized.append({"question": item.strip(), "answer": "N/A"})
-    return normalized
+def _prepare_submission(data, request_id):
+    """
+    Middleware de Blindaje (validación y normalización en una pasada, ver lead_schema).
+    Retorna (lead, None) o (None, mensaje_de_error).
+    """
+    try:
+        with metrics.timer("validation"):
+            lead = parse_submission(data)
+    except LeadValidationError as err:
+        log.error("validation_error", err.message, request_id, error="VALIDATION_ERROR", missing=err.missing)
+        return None, err.message
+
+    log.info("lead_validated", "🔍 Datos validados", request_id, company=lead.company_name, rfc=lead.rfc, activity=lead.activity)
+    return lead, None
 
 @app.route('/api/submit', methods=['POST'])
 def submit_quiz():
@@ -74,239 +111,301 @@ def submit_quiz():
         data = request.json
         if not data:
             return jsonify({"status": "error", "message": "Solicitud JSON vacía.", "requestId": request_id}), 400
-            
-        # 1. EXTRACCIÓN Y VALIDACIÓN DE DATOS MAESTROS (Middleware de Blindaje)
-        # Prioridad a lead_metadata estructurado
-        lead_meta = data.get('lead_metadata') or data.get('leadMetadata', {})
-        
-        # RFC Validation: Búsqueda robusta y sanitización
-        rfc_raw = None
-        for key in ['rfc', 'RFC']:
-            rfc_raw = lead_meta.get(key)
-            if rfc_raw: break
-        if not rfc_raw: rfc_raw = data.get('rfc')
-        
-        # Sanitización de guiones y espacios
-        rfc = str(rfc_raw).replace('-', '').replace(' ', '').upper() if rfc_raw else None
-            
-        # Giro (Actividad Principal)
-        giro = lead_meta.get('main_activity') or lead_meta.get('activity')
-        
-        niche_id = lead_meta.get('niche_id')
-        billing_range = lead_meta.get('billing_range')
-
-        # PROTOCOLO DE BLINDAJE: Abortar si faltan datos críticos o son inválidos
-        missing = []
-        if not rfc or len(str(rfc).strip()) < 12: missing.append("RFC válido (min 12 caracteres)")
-        if not giro: missing.append("Giro / Actividad Principal")
-        if not niche_id: missing.append("Nicho")
-        if not billing_range: missing.append("Rango de Facturación")
-        
-        if missing:
-            error_msg = "Falta de Datos Maestros: RFC y Giro son obligatorios para el diagnóstico estratégico"
-            log_entry = {
-                "level": "error",
-                "requestId": request_id,
-                "error": "VALIDATION_ERROR",
-                "message": error_msg,
-                "missing": missing
-            }
-            print(json.dumps(log_entry, ensure_ascii=False))
+
+        lead, error_msg = _prepare_submission(data, request_id)
+        if error_msg:
             return jsonify({
                 "status": "error", 
                 "message": error_msg, 
                 "requestId": request_id
             }), 400
 
-        # Normalización de nombre para PDF y Trazabilidad
-        company_name_raw = lead_meta.get('company_name', 'Lead_Report')
-        company_name = "".join(c for c in str(company_name_raw) if c.isalnum() or c == ' ').strip().replace(' ', '_')
-        
-        # EL PASO MÁS IMPORTANTE: Normalizar campos para Notificator y PDF
-        lead_meta['company'] = company_name_raw # notificator busca 'company'
-        lead_meta['rfc'] = rfc                  # notificator busca 'rfc'
-        lead_meta['activity'] = giro            # notificator busca 'activity'
-        
-        print(f"[{request_id}] 🧪 KONTIFY ENGINE v2.2.1 (MODO PRODUCCIÓN ACTIVO)")
-        print(f"[{request_id}] 🔍 Validando Datos: Empresa={company_name_raw}, RFC={rfc}, Giro={giro}")
-
-        # 2. PROCESAMIENTO IA (PMDS-IA)
-        responses = _normalize_responses(data.get('responses', []))
-        if not responses:
-            error_msg = "BLOQUEO POR PROTOCOLO: Respuestas del cuestionario vacías o inválidas."
-            print(f"[{request_id}] 🛑 ERROR DE VALIDACIÓN: {error_msg}")
+        host_url = request.host_url.rstrip('/')
+
+        # MODO ASÍNCRONO: encolar y responder de inmediato (el worker drena la cola)
+        if SUBMIT_MODE == "async":
+            return jsonify(_enqueue_submission(lead, request_id, host_url)), 202
+
+        result = process_submission(lead, request_id, host_url, lead.file_token)
+        if result.get("status") != "success":
+            status_code = result.get("status_code", 500)
+            headers = {"Retry-After": str(result.get("retry_after", 5))} if status_code == 429 else {}
             return jsonify({
                 "status": "error",
-                "message": error_msg,
+                "message": result.get("message"),
                 "requestId": request_id
-            }), 400
-
-        data_for_ai = dict(data)
-        data_for_ai['responses'] = responses
-        data_for_ai['lead_metadata'] = lead_meta
-
-        print(json.dumps({"requestId": request_id, "payload_for_gemini": data_for_ai}, ensure_ascii=False))
-        diagnostic_result = run_diagnostic(data_for_ai)
-        if isinstance(diagnostic_result, dict) and diagnostic_result.get("error"):
-            status_code = int(diagnostic_result.get("status_code", 500))
-            print(f"[{request_id}] ⚠️ IA Falló: {diagnostic_result.get('error')}")
-            if status_code == 422:
-                return jsonify({
-                    "status": "error",
-                    "message": diagnostic_result.get("error"),
-                    "requestId": request_id
-                }), 422
-            diagnostic_result = {
-                "risk_assessment": {
-                    "overall_risk_score": 55,
-                    "risk_level": "VULNERABILIDAD DETECTADA",
-                    "critical_finding": "Fallo IA: salida de contingencia activada.",
-                    "hallazgos_tecnicos": [
-                        "IA no respondió o respondió inválido.",
-                        "Se generó un reporte mínimo para continuidad operativa.",
-                        f"RFC Detectado: {rfc} - VALIDADO",
-                        f"Giro Detectado: {giro} - REGISTRADO"
-                    ]
-                },
-                "sales_pitch": "Se requiere reintento de diagnóstico con conectividad estable.",
-                "markdown_content": "### CONTINGENCIA PMDS-IA\n- Se activó salida mínima por error en IA.\n- Verificar credenciales y salud de la API.",
-                "admin_report": {
-                    "summary": f"Fallo IA en solicitud {request_id}: {diagnostic_result.get('error')}"
-                },
-                "responses": responses,
-                "lead_metadata": lead_meta
-            }
-        else:
-            diagnostic_result['responses'] = responses
-            diagnostic_result['lead_metadata'] = lead_meta
-        
-        # 2. Sincronizar CRM ANTES de generar PDF (Sync-First)
-        try:
-            host_url = request.host_url.rstrip('/')
-            pdf_filename = f"KONTIFY_{company_name}_{request_id}.pdf"
-            full_pdf_url = f"{host_url}/reports/{pdf_filename}"
-            print(f"[{request_id}] 📊 Iniciando sincronización CRM...")
-            sheets_ok = notify_all(diagnostic_result, full_pdf_url)
-            if not sheets_ok:
-                print(f"[{request_id}] 🛑 CRM Sync falló. Abortando PDF.")
-                return jsonify({"status": "error", "message": "Error sincronizando CRM.", "requestId": request_id}), 502
-            print(f"[{request_id}] ✅ Sincronización CRM completada.")
-        except Exception as notify_err:
-            print(f"[{request_id}] ⚠️ Error Registro: {str(notify_err)}")
-            return jsonify({"status": "error", "message": "Error sincronizando CRM.", "requestId": request_id}), 502
-
-        # 3. Generar PDF
-        pdf_path = os.path.join(REPORTS_DIR, pdf_filename)
-        
-        try:
-            generate_pdf_final(diagnostic_result, pdf_path)
-        except Exception as pdf_err:
-            print(f"[{request_id}] ❌ Error PDF: {str(pdf_err)}")
-            return jsonify({"status": "error", "message": "Error al generar documento.", "requestId": request_id}), 500
+            }), status_code, headers
         
+        # El cliente puede pedir el PDF en la misma respuesta (bytes aún en memoria, sin releer de disco)
+        if _wants_pdf():
+            response = _report_response(os.path.basename(result["report_url"]))
+            response.headers["X-Request-Id"] = request_id
+            response.headers["Content-Location"] = result["report_url"]
+            return response
+
         return jsonify({
             "status": "success",
             "version": "2.2.1",
-            "report_url": f"/reports/{pdf_filename}",
+            "report_url": result["report_url"],
             "requestId": request_id
         })
     except Exception as e:
-        print(f"[{request_id}] 🛑 Error Crítico: {str(e)}")
+        log.error("critical_error", "🛑 Error Crítico", request_id, error=str(e))
         return jsonify({"status": "error", "message": "Fallo interno de sistema.", "requestId": request_id}), 500
 
+def _enqueue_submission(lead, request_id, host_url):
+    """Encola el lead para tools.worker (modo async). Retorna el cuerpo de la respuesta 202."""
+    enqueue_job(request_id, {
+        "data_for_ai": lead.to_payload(),
+        "company_name": lead.file_token,
+        "host_url": host_url
+    })
+    log.info("job_enqueued", "📥 Diagnóstico encolado para el worker.", request_id)
+    return {
+        "status": "accepted",
+        "version": "2.2.1",
+        "jobId": request_id,
+        "status_url": f"/api/jobs/{request_id}",
+        "requestId": request_id
+    }
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _stream_result(result, request_id):
+    """Cuerpo del evento 'result' (el mismo de /api/submit) a partir del resultado del pipeline."""
+    if result.get("status") == "success":
+        return {"status": "success", "version": "2.2.1", "report_url": result["report_url"], "requestId": request_id}
+    body = {"status": "error", "message": result.get("message"), "status_code": result.get("status_code", 500), "requestId": request_id}
+    if result.get("retry_after"):
+        body["retry_after"] = result["retry_after"]
+    return body
+
+def _job_poll(request_id, stage):
+    """
+    Un vistazo al trabajo encolado. Retorna (evento, etapa): 'result' si terminó, 'stage' si avanzó
+    de etapa o None si sigue igual.
+    """
+    job = get_job(request_id)
+    if job and job['status'] in (STATUS_SUCCESS, STATUS_ERROR):
+        return ("result", _stream_result(job['result'] or {}, request_id)), stage
+    if job and job['stage'] != stage:
+        return ("stage", {"stage": job['stage'], "requestId": request_id}), job['stage']
+    return None, stage
+
+def _job_stream(request_id, accepted):
+    """Modo async: las etapas del trabajo las escribe tools.worker en job_queue; el stream las sigue."""
+    deadline = time.monotonic() + SSE_JOB_WAIT_SECONDS
+    last_event = time.monotonic()
+    stage = None
+    while time.monotonic() < deadline:
+        event, stage = _job_poll(request_id, stage)
+        if event:
+            yield _sse(*event)
+            if event[0] == "result":
+                return
+            last_event = time.monotonic()
+        elif time.monotonic() - last_event >= SSE_HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            last_event = time.monotonic()
+        time.sleep(SSE_JOB_POLL_SECONDS)
+    # El trabajo sigue en la cola: el cliente continúa con status_url
+    yield _sse("result", accepted)
+
+_pipelines = {"pid": None, "executor": None, "slots": None}
+_pipelines_lock = threading.Lock()
+
+def _pipeline_executor():
+    """Hilos para los pipelines de /api/submit/stream (modo sync), acotados a SSE_MAX_PIPELINES por proceso."""
+    if _pipelines["pid"] != os.getpid():
+        with _pipelines_lock:
+            if _pipelines["pid"] != os.getpid():
+                _pipelines.update(
+                    executor=ThreadPoolExecutor(max_workers=SSE_MAX_PIPELINES, thread_name_prefix="sse"),
+                    slots=threading.BoundedSemaphore(SSE_MAX_PIPELINES),
+                    pid=os.getpid()
+                )
+    return _pipelines["executor"], _pipelines["slots"]
+
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no" # Evita que un proxy acumule el stream
+}
+
+@app.route('/api/submit/stream', methods=['POST'])
+def submit_quiz_stream():
+    """
+    Variante de /api/submit con Server-Sent Events: emite 'stage' (validated, ai_scoring,
+    crm_synced, pdf_ready...), 'partial' (campos del diagnóstico conforme el modelo los genera)
+    y al final 'result' con el mismo cuerpo que /api/submit.
+    En modo async el pipeline lo corre tools.worker: el stream sigue las etapas del trabajo (sin
+    'partial') y, si no termina en SSE_JOB_WAIT_SECONDS, 'result' trae el cuerpo 202 con status_url.
+    """
+    request_id = str(uuid.uuid4())[:8]
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"status": "error", "message": "Solicitud JSON vacía.", "requestId": request_id}), 400
+
+    lead, error_msg = _prepare_submission(data, request_id)
+    if error_msg:
+        return jsonify({"status": "error", "message": error_msg, "requestId": request_id}), 400
+
+    host_url = request.host_url.rstrip('/')
+
+    if SUBMIT_MODE == "async":
+        accepted = _enqueue_submission(lead, request_id, host_url)
+        metrics.inc("kontify_submissions_total", route="stream", status=202)
+
+        def _queued():
+            yield _sse("stage", {"stage": "validated", "requestId": request_id})
+            yield from _job_stream(request_id, accepted)
+
+        return Response(_queued(), mimetype='text/event-stream', headers=_SSE_HEADERS)
+
+    executor, slots = _pipeline_executor()
+    if not slots.acquire(blocking=False):
+        log.warning("stream_saturated", "🚦 Pipelines de stream al tope", request_id, max_pipelines=SSE_MAX_PIPELINES)
+        return jsonify({
+            "status": "error",
+            "message": "Alta demanda: intente de nuevo en unos segundos.",
+            "requestId": request_id
+        }), 429, {"Retry-After": "5"}
+
+    events = queue.Queue()
+
+    def _run_pipeline():
+        # El pipeline corre en su propio hilo: si el navegador se desconecta, el lead se procesa igual
+        try:
+            result = process_submission(
+                lead, request_id, host_url, lead.file_token,
+                on_stage=lambda stage: events.put(("stage", {"stage": stage, "requestId": request_id})),
+                on_partial=lambda partial: events.put(("partial", partial))
+            )
+        except Exception as e:
+            log.error("critical_error", "🛑 Error Crítico", request_id, error=str(e))
+            result = {"status": "error", "message": "Fallo interno de sistema.", "status_code": 500}
+        finally:
+            slots.release()
+
+        metrics.inc("kontify_submissions_total", route="stream", status=result.get("status_code", 200))
+        events.put(("result", _stream_result(result, request_id)))
+        events.put(None)
+
+    executor.submit(_run_pipeline)
+
+    def _stream():
+        yield _sse("stage", {"stage": "validated", "requestId": request_id})
+        while True:
+            try:
+                item = events.get(timeout=SSE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if item is None:
+                break
+            yield _sse(*item)
+
+    return Response(_stream(), mimetype='text/event-stream', headers=_SSE_HEADERS)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = get_job(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Trabajo no encontrado.", "requestId": job_id}), 404
+
+    body = {
+        "jobId": job_id,
+        "status": job['status'],
+        "stage": job['stage'],
+        "requestId": job_id
+    }
+    result = job.get('result') or {}
+    if result.get('report_url'):
+        body['report_url'] = result['report_url']
+    if result.get('status') == 'error':
+        body['message'] = result.get('message')
+        body['status_code'] = result.get('status_code', 500)
+    return jsonify(body), 200
+
+def _catalog_response(entry):
+    """Respuesta pre-serializada con ETag fuerte, 304 y gzip si el cliente lo acepta."""
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+    # Cada representación (identidad / gzip) lleva su propio ETag fuerte
+    etag = f"{entry.etag}-gz" if use_gzip else entry.etag
+
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={QUESTIONS_MAX_AGE}",
+        "Vary": "Accept-Encoding"
+    }
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+
+    body = entry.body
+    if use_gzip:
+        body = entry.body_gzip
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, status=200, mimetype='application/json', headers=headers)
+
+@app.route('/api/questions', methods=['GET'])
+def get_all_questions():
+    try:
+        return _catalog_response(questions_catalog.bulk())
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/questions/<niche_id>', methods=['GET'])
 def get_questions(niche_id):
-    mapping = {
-        "holding": "holding_grupo_diagnostico.md",
-        "constructora": "constructora_diagnostico.md",
-        "autotransporte": "autotransporte_diagnostico.md",
-        "comercializadora": "comercializadora_diagnostico.md",
-        "manufactura": "manufactura_transformacion_diagnostico.md"
-    }
-    
-    filename = mapping.get(niche_id)
-    if not filename:
+    if niche_id not in NICHE_FILES:
         return jsonify({"error": "Nicho no encontrado"}), 404
-    
-    base_dir = os.getcwd()
-    file_path = os.path.join(base_dir, filename)
-    
-    # Intento 2: Buscar en el directorio superior si estamos en /tools/
-    if not os.path.exists(file_path):
-        file_path = os.path.join(os.path.dirname(base_dir), filename)
-    
-    if not os.path.exists(file_path):
-        return jsonify({"error": "Archivo de diagnóstico no encontrado"}), 404
-        
-    import re
-    def _looks_like_options(opt_raw):
-        opt_raw_upper = opt_raw.upper()
-        return "OPTIONS" in opt_raw_upper or "|" in opt_raw
-
-    def _parse_options_raw(opt_raw):
-        opt_raw = re.sub(r'^\s*OPTIONS?\s*:\s*', '', opt_raw, flags=re.IGNORECASE).strip()
-        if not opt_raw:
-            return []
-        return [o.strip() for o in opt_raw.split('|') if o.strip()]
-    questions = []
-    current_category = "General"
-    
+
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
-        lines = content.split('\n')
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # Detectar Categoría
-            cat_match = re.search(r'##\s+\w*\.?\s*([^(]+)', line)
-            if cat_match:
-                current_category = cat_match.group(1).strip()
-                i += 1
-                continue
-            
-            # Detectar Pregunta: 1. ¿Pregunta?
-            q_match = re.search(r'^(\d+)\.\s+(.+)$', line)
-            if q_match:
-                num = q_match.group(1)
-                full_text = q_match.group(2).strip()
-                options = []
-                
-                # REGLA 1: Opciones en la MISMA línea finalizando en [ ... ]
-                # Ejemplo: 1. ¿Pregunta? [SÍ | NO] o 1. ¿Pregunta? [A | B]
-                opt_same_line = re.search(r'\[([^\]]+)\]', full_text)
-                if opt_same_line and _looks_like_options(opt_same_line.group(1)):
-                    opt_raw = opt_same_line.group(1)
-                    options = _parse_options_raw(opt_raw)
-                    full_text = full_text.replace(opt_same_line.group(0), '').strip()
-                else:
-                    # REGLA 2: Opciones en la SIGUIENTE línea
-                    # Verificamos si existe la siguiente línea y si tiene el tag [OPTIONS: ...] o simplemente [ ... ]
-                    if i + 1 < len(lines):
-                        next_line = lines[i+1].strip()
-                        opt_next_line = re.search(r'\[([^\]]+)\]', next_line)
-                        if opt_next_line and _looks_like_options(opt_next_line.group(1)):
-                            opt_raw = opt_next_line.group(1)
-                            options = _parse_options_raw(opt_raw)
-                            i += 1 # Consumimos la línea de opciones
-                
-                questions.append({
-                    "q": full_text,
-                    "num": num,
-                    "cat": current_category,
-                    "options": options
-                })
-            i += 1
-                
-        return jsonify(questions)
+        entry = questions_catalog.get(niche_id)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    if entry is None:
+        return jsonify({"error": "Archivo de diagnóstico no encontrado"}), 404
+    return _catalog_response(entry)
+
+def _wants_pdf():
+    if request.args.get('format') == 'pdf':
+        return True
+    # Con "*/*" gana JSON (primero en la lista); solo un Accept explícito pide el PDF
+    return request.accept_mimetypes.best_match(['application/json', 'application/pdf']) == 'application/pdf'
+
+def _report_response(filename):
+    """
+    PDF del almacén con ETag (digest del diagnóstico), Last-Modified, 304 y Range (206) vía send_file.
+    Recién renderizado se sirve desde memoria mientras la escritura a disco termina en segundo plano.
+    """
+    # Reportes diferidos (KONTIFY_PDF_MODE=lazy) o archivados se renderizan/restauran aquí la primera vez
+    try:
+        blob = report_store.fetch(REPORTS_DIR, filename)
+    except RenderQueueFull as queue_err:
+        return make_response(jsonify({"status": "error", "message": "Alta demanda: intente de nuevo en unos segundos."}), 429, {"Retry-After": str(queue_err.retry_after)})
+    except Exception as e:
+        log.error("pdf_on_demand_failed", "❌ Error PDF bajo demanda", filename=filename, error=str(e))
+        return make_response(jsonify({"status": "error", "message": "Error al generar documento."}), 500)
+    if blob is None:
+        return make_response(jsonify({"status": "error", "message": "Reporte no encontrado."}), 404)
+
+    source = blob.path if blob.path else io.BytesIO(blob.data)
+    response = send_file(
+        source,
+        mimetype='application/pdf',
+        download_name=filename,
+        conditional=True,
+        etag=blob.digest or True,
+        last_modified=os.path.getmtime(blob.path) if blob.path else None,
+        max_age=REPORTS_MAX_AGE
+    )
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
 @app.route('/reports/<path:path>')
 def serve_reports(path):
-    return send_from_directory(REPORTS_DIR, path)
+    return _report_response(path)
 
 @app.route('/<path:path>')
 def serve_static(path):
@@ -317,8 +416,8 @@ import logging
 
 # Configuración de Logs para Producción
 if os.getenv("FLASK_ENV") == "production":
-    log = logging.getLogger('werkzeug')
-    log.setLevel(logging.ERROR)
+    werkzeug_log = logging.getLogger('werkzeug')
+    werkzeug_log.setLevel(logging.ERROR)
     app.logger.setLevel(logging.ERROR)
 
 if __name__ == '__main__':
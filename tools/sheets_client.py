@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import time
+import base64
+import hashlib
+import datetime
+import threading
+from dotenv import load_dotenv
+
+import gspread
+import requests
+
+from structured_log import log
+
+# Credenciales, cliente gspread y handles de hoja de larga vida por proceso (worker de gunicorn).
+# Antes cada lead repetía decodificación de credenciales, authorize, open_by_key y get_worksheet;
+# aquí se construyen una vez, el token OAuth se renueva antes de vencer y solo se reconecta
+# ante errores de autenticación o 404 (hoja/ID inexistente).
+SHEETS_SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+DEFAULT_SHEETS_ID = "1zYPKfP1xObqhxkRNmaTjCbjI-jPR1Vec2c9uMHH0sVg"
+# Segundos antes del vencimiento del token en que se renueva de forma proactiva
+SHEETS_TOKEN_REFRESH_MARGIN = float(os.getenv("SHEETS_TOKEN_REFRESH_MARGIN", 300))
+GOOGLE_CREDS_FILE = os.getenv("GOOGLE_CREDS_FILE", "google_creds.json")
+SHEETS_HTTP_TIMEOUT = float(os.getenv("SHEETS_HTTP_TIMEOUT", 15))
+# Endpoint alterno de la API de Sheets (tools/fake_services.py): sin cuenta de servicio ni OAuth
+SHEETS_API_ENDPOINT = (os.getenv("SHEETS_API_ENDPOINT") or "").rstrip('/') or None
+_GOOGLE_API_BASES = ("https://sheets.googleapis.com", "https://www.googleapis.com")
+
+def _is_reconnect_error(err):
+    """Errores que invalidan el cliente cacheado: token/credencial inválidos o recurso 404."""
+    if isinstance(err, gspread.exceptions.SpreadsheetNotFound):
+        return True
+    status = getattr(getattr(err, 'response', None), 'status_code', None)
+    if status in (401, 404):
+        return True
+    text = str(err)
+    return "invalid_grant" in text or "unauthorized" in text.lower() or "UNAUTHENTICATED" in text or "RefreshError" in type(err).__name__
+
+class _EndpointSession(requests.Session):
+    """Sesión de gspread que redirige las URLs de Google a SHEETS_API_ENDPOINT."""
+
+    def __init__(self, endpoint):
+        super().__init__()
+        self.endpoint = endpoint
+
+    def request(self, method, url, *args, **kwargs):
+        for base in _GOOGLE_API_BASES:
+            if url.startswith(base):
+                url = self.endpoint + url[len(base):]
+                break
+        return super().request(method, url, *args, **kwargs)
+
+class SheetsClientCache:
+    def __init__(self, refresh_margin=None):
+        self.refresh_margin = SHEETS_TOKEN_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self._lock = threading.RLock()
+        self._pid = None
+        self._fingerprint = None
+        self._creds = None
+        self._client = None
+        self._worksheets = {}
+        self.connects = 0
+        self.token_refreshes = 0
+        self.reconnects = 0
+
+    def _credential_source(self):
+        """(origen, info) de la cuenta de servicio: BASE64 -> JSON plano -> archivo local."""
+        creds_b64 = os.getenv("GOOGLE_CREDS_BASE64")
+        creds_json = os.getenv("GOOGLE_CREDS_JSON")
+        if creds_b64:
+            try:
+                # 1. Intentar decodificar Base64 (Solución Robusta)
+                return "BASE64", json.loads(base64.b64decode(creds_b64).decode('utf-8'))
+            except Exception as b64_err:
+                log.warning("sheets_creds_invalid", "⚠️ Fallo al decodificar GOOGLE_CREDS_BASE64. Intentando fallback...", source="BASE64", error=str(b64_err))
+        if creds_json:
+            try:
+                # 2. Intentar JSON plano con reparación de saltos de línea
+                creds_json_clean = re.sub(r'#.*', '', creds_json).strip()
+                creds_json_clean = creds_json_clean.replace('\\n', '\n')
+                return "ENV (JSON)", json.loads(creds_json_clean)
+            except Exception as json_err:
+                log.warning("sheets_creds_invalid", "⚠️ Fallo al parsear GOOGLE_CREDS_JSON.", source="JSON", error=str(json_err))
+        if os.path.exists(GOOGLE_CREDS_FILE):
+            with open(GOOGLE_CREDS_FILE, 'r', encoding='utf-8') as f:
+                return GOOGLE_CREDS_FILE, json.load(f)
+        return None, None
+
+    def has_credentials(self):
+        if SHEETS_API_ENDPOINT:
+            return True
+        load_dotenv()
+        return bool(os.getenv("GOOGLE_CREDS_BASE64") or os.getenv("GOOGLE_CREDS_JSON") or os.path.exists(GOOGLE_CREDS_FILE))
+
+    def _check_process(self):
+        # Sesiones HTTP no sobreviven un fork: cada worker arma las suyas
+        if self._pid != os.getpid():
+            load_dotenv()
+            self._pid = os.getpid()
+            self._creds = None
+            self._client = None
+            self._worksheets = {}
+
+    def credentials(self):
+        """Credenciales de cuenta de servicio (una vez por proceso; se rearman si cambian las variables)."""
+        from google.oauth2.service_account import Credentials
+        with self._lock:
+            self._check_process()
+            fingerprint = hashlib.sha256(
+                f"{os.getenv('GOOGLE_CREDS_BASE64')}|{os.getenv('GOOGLE_CREDS_JSON')}".encode('utf-8')
+            ).hexdigest()
+            if self._creds is not None and fingerprint == self._fingerprint:
+                return self._creds
+            if SHEETS_API_ENDPOINT:
+                from google.auth.credentials import AnonymousCredentials
+                self._creds = AnonymousCredentials()
+                self._fingerprint = fingerprint
+                log.info("sheets_creds_loaded", "🔐 CRM: endpoint alterno (sin credenciales)", endpoint=SHEETS_API_ENDPOINT)
+                return self._creds
+            source, info = self._credential_source()
+            if not info:
+                raise ValueError("No se encontraron credenciales válidas (B64 o ENV JSON)")
+            self._creds = Credentials.from_service_account_info(info, scopes=SHEETS_SCOPES)
+            self._fingerprint = fingerprint
+            self._client = None
+            self._worksheets = {}
+            log.info("sheets_creds_loaded", "🔐 CRM: Credenciales cargadas", source=source, client_email=info.get('client_email'))
+            return self._creds
+
+    def _refresh_if_needed(self):
+        """Renueva el token OAuth antes de que venza (evita el 401 + reintento en la escritura)."""
+        creds = self._creds
+        expiry = getattr(creds, 'expiry', None) # google-auth la maneja como datetime UTC sin zona
+        if creds.token and expiry:
+            remaining = expiry.replace(tzinfo=datetime.timezone.utc).timestamp() - time.time()
+            if remaining > self.refresh_margin:
+                return
+        from google.auth.transport.requests import Request
+        creds.refresh(Request())
+        self.token_refreshes += 1
+
+    def client(self):
+        """Cliente gspread reutilizable con token vigente."""
+        with self._lock:
+            creds = self.credentials()
+            if self._client is None:
+                if SHEETS_API_ENDPOINT:
+                    self._client = gspread.Client(auth=creds, session=_EndpointSession(SHEETS_API_ENDPOINT))
+                else:
+                    self._client = gspread.authorize(creds)
+                self._client.set_timeout(SHEETS_HTTP_TIMEOUT)
+                self.connects += 1
+            if not SHEETS_API_ENDPOINT:
+                self._refresh_if_needed()
+            return self._client
+
+    def worksheet(self, sheet_id=None, index=0):
+        """Handle cacheado de la hoja `index` del documento (por defecto el CRM de GOOGLE_SHEETS_ID)."""
+        sheet_id = sheet_id or os.getenv("GOOGLE_SHEETS_ID", DEFAULT_SHEETS_ID)
+        with self._lock:
+            client = self.client()
+            key = (sheet_id, index)
+            sheet = self._worksheets.get(key)
+            if sheet is not None:
+                return sheet
+            log.info("sheets_connecting", "📊 CRM: Conectando a Sheet", sheet_id=sheet_id)
+            try:
+                spreadsheet = client.open_by_key(sheet_id)
+                sheet = spreadsheet.get_worksheet(index) # Más seguro que .sheet1
+                log.info("sheets_connected", "✅ CRM: Conectado exitosamente", sheet_id=sheet_id, title=spreadsheet.title)
+            except Exception as sheet_err:
+                err_str = str(sheet_err)
+                hint = "¿ID correcto? ¿Compartida con la cuenta de servicio?"
+                if "403" in err_str:
+                    hint = "Acceso denegado. Verifica permisos de la cuenta de servicio y posibles bloqueos en Render."
+                elif "invalid_grant" in err_str or "unauthorized" in err_str.lower():
+                    hint = "Token inválido/expirado o cuenta de servicio bloqueada."
+                log.error("sheets_open_failed", f"🛑 CRM ERROR: No se pudo abrir la hoja. {hint}", sheet_id=sheet_id, error=err_str)
+                raise sheet_err
+            self._worksheets[key] = sheet
+            return sheet
+
+    def invalidate_if_stale(self, err):
+        """Descarta cliente y handles solo si el error es de autenticación o 404. Retorna True si invalidó."""
+        if not _is_reconnect_error(err):
+            return False
+        with self._lock:
+            self._creds = None
+            self._client = None
+            self._worksheets = {}
+            self.reconnects += 1
+        log.warning("sheets_reconnect", "🔄 CRM: cliente de Sheets invalidado, se reconectará.", error=str(err)[:120])
+        return True
+
+    def run(self, fn, sheet_id=None, index=0):
+        """Ejecuta fn(worksheet); ante error de auth/404 reconecta y reintenta una sola vez."""
+        try:
+            return fn(self.worksheet(sheet_id, index))
+        except Exception as err:
+            if not self.invalidate_if_stale(err):
+                raise
+            return fn(self.worksheet(sheet_id, index))
+
+    def reset(self):
+        with self._lock:
+            self._pid = None
+            self._check_process()
+
+    def stats(self):
+        return {
+            "connected": self._client is not None and self._pid == os.getpid(),
+            "worksheets": len(self._worksheets),
+            "connects": self.connects,
+            "token_refreshes": self.token_refreshes,
+            "reconnects": self.reconnects
+        }
+
+sheets_client = SheetsClientCache()
@@ -0,0 +1,47 @@
+import os
+
+from sheets_client import sheets_client
+from outbox import Channel, DeferDelivery
+from structured_log import log
+
+# Canal de Google Sheets del outbox: las filas del CRM se acumulan como registros 'sheets'
+# y salen en un único append_rows por lote (SHEETS_BATCH_SIZE) o al cumplirse SHEETS_FLUSH_INTERVAL,
+# espaciando las escrituras entre todos los workers según la cuota por minuto.
+SHEETS_BATCH_SIZE = int(os.getenv("SHEETS_BATCH_SIZE", 50))
+SHEETS_FLUSH_INTERVAL = float(os.getenv("SHEETS_FLUSH_INTERVAL", 2.0))
+# Cuota de Sheets: 60 escrituras/min por cuenta de servicio; se deja margen para otros procesos
+SHEETS_WRITES_PER_MINUTE = float(os.getenv("SHEETS_WRITES_PER_MINUTE", 50))
+
+def _is_quota_error(err):
+    text = str(err)
+    return "429" in text or "RATE_LIMIT_EXCEEDED" in text or "Quota exceeded" in text
+
+def open_worksheet():
+    """Hoja principal del CRM desde el cliente cacheado del proceso."""
+    return sheets_client.worksheet()
+
+def make_append_rows_handler(open_sheet=None):
+    """Handler del canal: un append_rows con todas las filas del lote."""
+    open_sheet = open_sheet or open_worksheet
+
+    def append_rows(rows):
+        try:
+            open_sheet().append_rows(rows, value_input_option='RAW')
+        except Exception as api_err:
+            # Token inválido u hoja 404: el siguiente lote reconecta; cualquier otro error conserva el cliente
+            sheets_client.invalidate_if_stale(api_err)
+            if _is_quota_error(api_err):
+                raise DeferDelivery("cuota de escritura de Sheets agotada", retry_after=60.0 / SHEETS_WRITES_PER_MINUTE * 2)
+            raise
+        log.info("sheets_rows_appended", "✅ Leads registrados en Google Sheets (append_rows).", rows=len(rows))
+
+    return append_rows
+
+def sheets_channel(open_sheet=None, batch_size=None, flush_interval=None, writes_per_minute=None):
+    return Channel(
+        "sheets",
+        make_append_rows_handler(open_sheet),
+        batch_size=batch_size or SHEETS_BATCH_SIZE,
+        linger=SHEETS_FLUSH_INTERVAL if flush_interval is None else flush_interval,
+        min_interval=60.0 / (writes_per_minute or SHEETS_WRITES_PER_MINUTE)
+    )
@@ -0,0 +1,169 @@
+import json
+
+# Parser incremental del JSON de diagnóstico: recibe los fragmentos de texto tal como
+# llegan del modelo y emite cada valor escalar en cuanto termina de llegar, sin esperar
+# el documento completo. El resultado final se sigue validando con json.loads.
+
+# Campos que interesan al navegador mientras el modelo sigue generando
+_PARTIAL_FIELDS = {
+    ('risk_assessment', 'overall_risk_score'): 'overall_risk_score',
+    ('risk_assessment', 'risk_level'): 'risk_level',
+    ('risk_assessment', 'critical_finding'): 'critical_finding',
+    ('risk_assessment', 'hallazgos_tecnicos'): 'hallazgo',
+    ('sales_pitch',): 'sales_pitch',
+}
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+def strip_code_fences(text):
+    """Extracción robusta de JSON envuelto en ```json ... ``` (misma regla que run_diagnostic)."""
+    text = text.strip()
+    if "```json" in text:
+        return text.split("```json")[1].split("```")[0].strip()
+    if "```" in text:
+        return text.split("```")[1].split("```")[0].strip()
+    return text
+
+class IncrementalJSONParser:
+    """
+    Tokenizador JSON tolerante a fragmentos arbitrarios.
+    feed() retorna la lista de (ruta, valor) de los escalares completados en ese fragmento;
+    la ruta es una tupla de llaves / índices, p. ej. ('risk_assessment', 'hallazgos_tecnicos', 0).
+    """
+
+    def __init__(self):
+        self._stack = []          # [['obj', llave_actual] | ['arr', índice]]
+        self._expect_key = False
+        self._in_string = False
+        self._escape = None       # None | '' | dígitos hex de \uXXXX
+        self._buf = []
+        self._scalar = []
+        self._started = False
+        self.done = False
+
+    def _path(self):
+        path = []
+        for frame in self._stack:
+            if frame[1] is not None:
+                path.append(frame[1])
+        return tuple(path)
+
+    def _value_done(self, events, value):
+        events.append((self._path(), value))
+        self._after_value()
+
+    def _after_value(self):
+        # El índice de los arreglos avanza con la coma; al cerrar la raíz el documento terminó
+        if not self._stack:
+            self.done = True
+
+    def _flush_scalar(self, events):
+        if not self._scalar:
+            return
+        raw = ''.join(self._scalar).strip()
+        self._scalar = []
+        if not raw:
+            return
+        if raw == 'true':
+            value = True
+        elif raw == 'false':
+            value = False
+        elif raw == 'null':
+            value = None
+        else:
+            try:
+                value = int(raw)
+            except ValueError:
+                try:
+                    value = float(raw)
+                except ValueError:
+                    value = raw
+        self._value_done(events, value)
+
+    def feed(self, chunk):
+        events = []
+        for ch in chunk:
+            if self.done:
+                break
+            if self._in_string:
+                if self._escape is not None:
+                    if self._escape == '' and ch != 'u':
+                        self._buf.append(_ESCAPES.get(ch, ch))
+                        self._escape = None
+                    elif self._escape == '':
+                        self._escape = 'u'
+                    else:
+                        self._escape += ch
+                        if len(self._escape) == 5:
+                            self._buf.append(chr(int(self._escape[1:], 16)))
+                            self._escape = None
+                    continue
+                if ch == '\\':
+                    self._escape = ''
+                elif ch == '"':
+                    self._in_string = False
+                    text = ''.join(self._buf)
+                    self._buf = []
+                    if self._expect_key:
+                        self._stack[-1][1] = text
+                    else:
+                        self._value_done(events, text)
+                else:
+                    self._buf.append(ch)
+                continue
+
+            if not self._started:
+                # Ignorar todo lo previo al primer '{' (texto o cercas ```json)
+                if ch != '{':
+                    continue
+                self._started = True
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._stack.append(['obj', None])
+                self._expect_key = True
+            elif ch == '[':
+                self._stack.append(['arr', 0])
+                self._expect_key = False
+            elif ch in '}]':
+                self._flush_scalar(events)
+                self._stack.pop()
+                self._expect_key = False
+                self._after_value()
+            elif ch == ':':
+                self._expect_key = False
+            elif ch == ',':
+                self._flush_scalar(events)
+                if self._stack[-1][0] == 'arr':
+                    self._stack[-1][1] += 1
+                else:
+                    self._stack[-1][1] = None
+                    self._expect_key = True
+            elif not ch.isspace() or self._scalar:
+                self._scalar.append(ch)
+        return events
+
+class DiagnosticStreamParser:
+    """Acumula el texto del modelo y traduce el avance del JSON a eventos parciales del diagnóstico."""
+
+    def __init__(self):
+        self._parser = IncrementalJSONParser()
+        self._chunks = []
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        partials = []
+        for path, value in self._parser.feed(chunk):
+            field = _PARTIAL_FIELDS.get(path) or _PARTIAL_FIELDS.get(path[:-1])
+            if field:
+                partials.append({"field": field, "value": value})
+        return partials
+
+    @property
+    def text(self):
+        return ''.join(self._chunks)
+
+    def result(self):
+        """Documento completo validado (lanza ValueError si el JSON final es inválido)."""
+        return json.loads(strip_code_fences(self.text))
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Logging estructurado fuera del camino de la solicitud: el hilo que atiende solo arma un LogRecord
+# y lo encola (sin bloquear); el formateo a JSON y la escritura a stdout ocurren en un hilo propio.
+# Una línea JSON compacta por evento, con requestId. Los payloads completos (lead, prompt, fila CRM)
+# se registran solo para una muestra de solicitudes y truncados.
+LOG_LEVEL = os.getenv("KONTIFY_LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", 10000))
+# Fracción de solicitudes cuyo payload se registra (decisión estable por requestId: todo o nada)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.05))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", 2000))
+
+class JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": getattr(record, "event", record.name)
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["requestId"] = request_id
+        message = record.getMessage()
+        if message:
+            entry["msg"] = message
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, ensure_ascii=False, default=str, separators=(',', ':'))
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Encola sin formatear (eso lo hace el listener) y descarta si la cola está llena."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def truncate(text, max_chars=None):
+    max_chars = LOG_PAYLOAD_MAX_CHARS if max_chars is None else max_chars
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...(+{len(text) - max_chars} chars)"
+
+class LogPipeline:
+    def __init__(self, stream=None, level=None, max_queue=None, sample_rate=None, max_chars=None):
+        self.stream = stream
+        self.level = getattr(logging, level or LOG_LEVEL, logging.INFO)
+        self.max_queue = max_queue or LOG_QUEUE_MAX
+        self.sample_rate = LOG_PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.max_chars = LOG_PAYLOAD_MAX_CHARS if max_chars is None else max_chars
+        self.logger = logging.getLogger(f"kontify.{id(self)}")
+        self.logger.setLevel(self.level)
+        self.logger.propagate = False
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._handler = None
+        self._listener = None
+        self._atexit_registered = False
+        self.payloads_logged = 0
+        self.payloads_skipped = 0
+
+    def _ensure_started(self):
+        # El hilo del listener no sobrevive un fork: cada worker arranca el suyo
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.max_queue)
+            output = logging.StreamHandler(self.stream or sys.stdout)
+            output.setFormatter(JsonLineFormatter())
+            if self._handler is not None:
+                self.logger.removeHandler(self._handler)
+            self._handler = _NonBlockingQueueHandler(self._queue)
+            self.logger.addHandler(self._handler)
+            self._listener = QueueListener(self._queue, output, respect_handler_level=False)
+            self._listener.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+            self._pid = os.getpid()
+
+    def event(self, event, msg="", request_id=None, level=logging.INFO, **fields):
+        """Evento compacto: {"ts", "level", "event", "requestId", "msg", ...fields}."""
+        if not self.logger.isEnabledFor(level):
+            return
+        self._ensure_started()
+        self.logger.log(level, msg, extra={"event": event, "request_id": request_id, "fields": fields})
+
+    def info(self, event, msg="", request_id=None, **fields):
+        self.event(event, msg, request_id, logging.INFO, **fields)
+
+    def warning(self, event, msg="", request_id=None, **fields):
+        self.event(event, msg, request_id, logging.WARNING, **fields)
+
+    def error(self, event, msg="", request_id=None, **fields):
+        self.event(event, msg, request_id, logging.ERROR, **fields)
+
+    def sampled(self, request_id=None):
+        """¿Se registran los payloads de esta solicitud? Estable por requestId."""
+        if self.sample_rate >= 1:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        if request_id is None:
+            return random.random() < self.sample_rate
+        bucket = int(hashlib.sha1(str(request_id).encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+        return bucket < self.sample_rate
+
+    def payload(self, event, payload, request_id=None, msg=""):
+        """Payload completo solo si la solicitud está en la muestra; serializado y truncado."""
+        if not self.logger.isEnabledFor(logging.INFO) or not self.sampled(request_id):
+            self.payloads_skipped += 1
+            return
+        # Se serializa aquí (solo para la muestra) para no registrar un objeto que el pipeline siga mutando
+        text = truncate(json.dumps(payload, ensure_ascii=False, default=str, separators=(',', ':')), self.max_chars)
+        self.payloads_logged += 1
+        self.event(event, msg, request_id, logging.INFO, payload=text)
+
+    def flush(self):
+        """Espera a que el listener escriba todo lo encolado (pruebas / apagado)."""
+        if self._queue is not None and self._pid == os.getpid():
+            self._queue.join()
+
+    def stop(self):
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                # El centinela de parada usa put_nowait: primero se vacía la cola
+                self._queue.join()
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "dropped": self._handler.dropped if self._handler is not None else 0,
+            "payload_sample_rate": self.sample_rate,
+            "payloads_logged": self.payloads_logged,
+            "payloads_skipped": self.payloads_skipped
+        }
+
+log = LogPipeline()
@@ -0,0 +1,79 @@
+import re
+from functools import lru_cache
+
+# Normalización de texto compartida por PDF (latin-1 para fuentes core), CRM (celdas de Sheets)
+# y nombres de archivo. Tablas de str.translate compiladas una vez, atajos para el caso común
+# (texto ya limpio) y caché para las etiquetas que se repiten en cada reporte (preguntas, títulos).
+# Solo se cachean textos cortos: los hallazgos/pitch largos son únicos por lead.
+TEXT_CACHE_MAX_LEN = 256
+TEXT_CACHE_SIZE = 4096
+
+# Caracteres Unicode "fancy" que rompen las fuentes estándar de fpdf2
+_PDF_TABLE = str.maketrans({
+    '\u2013': '-', '\u2014': '-', '\u201c': '"', '\u201d': '"',
+    '\u2018': "'", '\u2019': "'", '\u2022': '*', '\u2026': '...',
+    '\u00a0': ' ', '\ufeff': '', '\u200b': ''
+})
+
+# str.translate con dict es por carácter: solo se aplica si alguno de esos caracteres aparece
+_PDF_FANCY = re.compile('[' + ''.join(chr(cp) for cp in _PDF_TABLE) + ']')
+
+# Caracteres no imprimibles (excepto espacios en blanco) del plano básico; se arma en el primer uso
+_CELL_TABLE = None
+
+# Todo lo que no es alfanumérico ni espacio (\w incluye '_', que también se descarta)
+_FILENAME_STRIP = re.compile(r'[^\w ]|_')
+
+def _pdf_text(txt):
+    if txt.isascii():
+        return txt
+    if _PDF_FANCY.search(txt):
+        txt = txt.translate(_PDF_TABLE)
+    # Latin-1 soporta á, é, í, ó, ú, ñ, ¿, ¡; el resto se vuelve '?'
+    return txt.encode('latin-1', 'replace').decode('latin-1')
+
+_pdf_text_cached = lru_cache(maxsize=TEXT_CACHE_SIZE)(_pdf_text)
+
+def pdf_text(txt):
+    """
+    Normalización de Texto para fpdf2 (Protocolo PMDS-IA).
+    Permite acentos y 'ñ' para fuentes core (Helvetica/Arial) usando latin-1.
+    """
+    if txt is None: return "N/A"
+    if not isinstance(txt, str): txt = str(txt)
+    if len(txt) <= TEXT_CACHE_MAX_LEN:
+        return _pdf_text_cached(txt)
+    return _pdf_text(txt)
+
+def pdf_texts(items):
+    """pdf_text para una lista (preguntas/respuestas de un reporte)."""
+    return [pdf_text(item) for item in items]
+
+def _cell_table():
+    global _CELL_TABLE
+    if _CELL_TABLE is None:
+        _CELL_TABLE = {cp: None for cp in range(0x10000) if not chr(cp).isprintable() and not chr(cp).isspace()}
+    return _CELL_TABLE
+
+def sheets_cell(val):
+    """Celda para Sheets: mantiene caracteres latinos (acentos, ñ) pero filtra caracteres de control."""
+    if val is None: return "N/A"
+    s = str(val).strip()
+    if s.isprintable():
+        return s
+    s = s.translate(_cell_table())
+    if s.isascii() or all(ord(c) < 0x10000 for c in s):
+        return s
+    # Fuera del plano básico (emoji, etc.): filtro carácter por carácter
+    return "".join(c for c in s if c.isprintable() or c.isspace())
+
+def sheets_cells(values):
+    return [sheets_cell(v) for v in values]
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _filename_token(name):
+    return _FILENAME_STRIP.sub('', name).strip().replace(' ', '_')
+
+def filename_token(name):
+    """Nombre de empresa apto para archivo: solo alfanuméricos, espacios -> '_'."""
+    return _filename_token(str(name))
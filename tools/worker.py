@@ -0,0 +1,123 @@
+import os
+import sys
+import time
+import signal
+import threading
+import argparse
+
+# Agregar el directorio /tools al path para importaciones internas (python -m tools.worker)
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+if tools_dir not in sys.path:
+    sys.path.append(tools_dir)
+
+from job_queue import claim_next_job, update_job_stage, renew_lease, finish_job, JOB_LEASE_SECONDS
+from pipeline import process_submission, REPORTS_DIR, STAGE_PDF_RENDER
+from structured_log import log
+from metrics import metrics
+
+WORKER_THROTTLE_RETRIES = int(os.getenv("KONTIFY_WORKER_THROTTLE_RETRIES", 10))
+
+_running = True
+
+def _stop(signum, frame):
+    global _running
+    print(f"🛑 WORKER: señal {signum} recibida, terminando después del trabajo actual...")
+    _running = False
+
+class _LeaseHeartbeat:
+    """
+    Renueva el lease del trabajo cada tercio de JOB_LEASE_SECONDS mientras el worker lo procesa
+    (una llamada a Gemini lenta o las esperas por 429 no deben dejar que otro worker lo reclame).
+    """
+    def __init__(self, job_id, attempt):
+        self.job_id = job_id
+        self.attempt = attempt
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job_id}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(JOB_LEASE_SECONDS / 3):
+            try:
+                if not renew_lease(self.job_id, self.attempt):
+                    self.lost = True
+                    return
+            except Exception as e:
+                log.warning("job_lease_renew_failed", "⚠️ WORKER: no se pudo renovar el lease", self.job_id, error=str(e))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def run_job(job):
+    """Ejecuta un trabajo reclamado de la cola y guarda su resultado."""
+    job_id = job['id']
+    attempt = job['attempts']
+    payload = job['payload']
+    log.info("job_started", "⚙️ WORKER: procesando diagnóstico", job_id, attempt=attempt)
+    retries = 0
+
+    def _wait_throttled(retry_after):
+        # En el worker nadie espera la respuesta: ante 429 se respeta Retry-After y se reintenta
+        nonlocal retries
+        if retries >= WORKER_THROTTLE_RETRIES or not _running or heartbeat.lost:
+            return False
+        retries += 1
+        log.warning("job_throttled", "🚦 Capacidad saturada, reintento", job_id, retry_after=retry_after)
+        update_job_stage(job_id, "throttled", attempt)
+        time.sleep(retry_after)
+        return True
+
+    with _LeaseHeartbeat(job_id, attempt) as heartbeat:
+        while True:
+            try:
+                result = process_submission(
+                    payload['data_for_ai'],
+                    job_id,
+                    payload['host_url'],
+                    payload['company_name'],
+                    on_stage=lambda stage: update_job_stage(job_id, stage, attempt),
+                    on_throttled=_wait_throttled
+                )
+            except Exception as e:
+                log.error("critical_error", "🛑 Error Crítico", job_id, error=str(e))
+                result = {"status": "error", "message": "Fallo interno de sistema.", "status_code": 500}
+            # Solo el 429 de admisión a la IA (antes del CRM) repite el pipeline; el del render ya se
+            # reintentó dentro de process_submission sin volver a notificar
+            if result.get("status_code") != 429 or result.get("stage") == STAGE_PDF_RENDER:
+                break
+            if not _wait_throttled(result.get("retry_after", 5)):
+                break
+    if not finish_job(job_id, result, attempt):
+        # Otro worker retomó el trabajo (lease vencido): su resultado es el que cuenta
+        log.warning("job_lease_lost", "⚠️ WORKER: el trabajo fue reclamado por otro worker", job_id, attempt=attempt)
+        return result
+    metrics.inc("kontify_submissions_total", route="worker", status=result.get("status_code", 200))
+    return result
+
+def run_worker(poll_interval=1.0, once=False):
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    print(f"🚀 KONTIFY WORKER activo (pid={os.getpid()})")
+    while _running:
+        job = claim_next_job()
+        if job:
+            run_job(job)
+            continue
+        if once:
+            break
+        time.sleep(poll_interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker de diagnósticos asíncronos (cola SQLite).")
+    parser.add_argument("--poll", type=float, default=float(os.getenv("KONTIFY_WORKER_POLL", 1.0)),
+                        help="Segundos entre consultas cuando la cola está vacía.")
+    parser.add_argument("--once", action="store_true", help="Drenar la cola y salir.")
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    run_worker(poll_interval=args.poll, once=args.once)